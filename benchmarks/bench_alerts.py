@@ -0,0 +1,139 @@
+"""
+Бенчмарк оповещений о детекциях (utils.alerts.alert_moduls). Поток кадров досмотра, где запрещённые предметы есть
+в доле --threat-rate сумок, обрабатывается детектором дважды: без шины оповещений и с шиной, которая отправляет
+события во все три приёмника сразу - локальный сокет, webhook заглушки (AlertReceiver) и файловую очередь.
+
+Выводятся время обработки кадра в обоих прогонах (публикация не должна замедлять инференс) и для каждого приёмника
+число доставленных событий и сквозная задержка от детекции до приёма (медиана, 99-й перцентиль, максимум) в сравнении
+с целевой --target-ms. Файловая очередь опрашивается потребителем каждые --poll-ms, и этот интервал входит в её
+задержку. Прогон завершается с кодом 1, если событие потеряно или 99-й перцентиль задержки превышает цель.
+
+Запуск: python -m benchmarks.bench_alerts [--model PATH] [--frames 600] [--threat-rate 0.1] [--fps 30]
+                                          [--target-ms 250] [--output res.json]
+"""
+import argparse
+import json
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+from config import CLASS_LIST, ALERT_MAX_BATCH, ALERT_MAX_WAIT_MS
+from utils.neural_network.neuralnet_moduls import RealTimeObjectDetection
+from utils.alerts.alert_moduls import AlertBus, AlertReceiver, SocketSink, WebhookSink, FileQueueSink, drain
+from benchmarks.standin_model import ensure_standin_model
+from benchmarks.bench_cascade import make_frames
+
+
+def process(detector, net, output_layers, frames, fps):
+    """
+    Обрабатывает кадры с частотой не выше fps (0 - без ограничения) и возвращает время обработки каждого кадра.
+    """
+    durations = []
+    start = time.perf_counter()
+    for i, frame in enumerate(frames):
+        if fps:
+            delay = start + i / fps - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        begin = time.perf_counter()
+        detector.get_detected_frame(net, output_layers, frame)
+        durations.append(time.perf_counter() - begin)
+    return np.array(durations)
+
+
+def poll_file_queue(directory, events, stop, poll):
+    while not stop.is_set():
+        for event in drain(directory):
+            events.put(('file', time.time(), event))
+        time.sleep(poll)
+    for event in drain(directory):
+        events.put(('file', time.time(), event))
+
+
+def latency_summary(latencies, target):
+    latencies = np.array(latencies) if latencies else np.zeros(1)
+    return {'p50_ms': float(np.median(latencies)) * 1000, 'p99_ms': float(np.percentile(latencies, 99)) * 1000,
+            'max_ms': float(latencies.max()) * 1000, 'late': int((latencies * 1000 > target).sum())}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Задержка оповещений о детекциях')
+    parser.add_argument('--model', default=None, help='Путь к ONNX-модели (по умолчанию заглушка)')
+    parser.add_argument('--frames', type=int, default=600)
+    parser.add_argument('--threat-rate', type=float, default=0.1)
+    parser.add_argument('--fps', type=float, default=30.0, help='Частота кадров источника; 0 - без ограничения')
+    parser.add_argument('--classes', nargs='+', default=list(CLASS_LIST), help='Классы, о которых оповещать')
+    parser.add_argument('--max-batch', type=int, default=ALERT_MAX_BATCH)
+    parser.add_argument('--max-wait-ms', type=float, default=ALERT_MAX_WAIT_MS)
+    parser.add_argument('--target-ms', type=float, default=250.0)
+    parser.add_argument('--poll-ms', type=float, default=10.0, help='Период опроса файловой очереди, мс')
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args(argv)
+
+    model = args.model or ensure_standin_model()
+    frames, threats = make_frames(args.frames, args.threat_rate)
+    detector = RealTimeObjectDetection(model, remote_url=None, workers=0, screening_model_path=None)
+    detector.alert_source = 'bench'
+    net, output_layers = detector._build_model()
+    detector.get_detected_frame(net, output_layers, frames[0])
+
+    detector.alerts = None
+    baseline = process(detector, net, output_layers, frames, args.fps)
+
+    receiver = AlertReceiver(('127.0.0.1', 0), ('127.0.0.1', 0)).start()
+    with tempfile.TemporaryDirectory() as directory:
+        sink_options = {'latency_target_ms': args.target_ms}
+        sinks = [SocketSink('127.0.0.1', int(receiver.tcp_url.rsplit(':', 1)[1]), **sink_options),
+                 WebhookSink(receiver.http_url, **sink_options), FileQueueSink(directory, **sink_options)]
+        # Без паузы между событиями одного класса: каждая детекция даёт событие
+        detector.alerts = AlertBus(sinks, CLASS_LIST, args.classes, detector.CONFIDENCE_THRESHOLD, cooldown=0,
+                                   max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+        stop = threading.Event()
+        poller = threading.Thread(target=poll_file_queue,
+                                  args=(directory, receiver.events, stop, args.poll_ms / 1000), daemon=True)
+        poller.start()
+        with_alerts = process(detector, net, output_layers, frames, args.fps)
+        detector.alerts.close()
+        stop.set()
+        poller.join()
+    receiver.stop()
+
+    latencies = {'socket': [], 'webhook': [], 'file': []}
+    thumbnails = 0
+    while True:
+        try:
+            kind, received, event = receiver.events.get_nowait()
+        except queue.Empty:
+            break
+        latencies[kind].append(received - event['detected_at'])
+        thumbnails += bool(event['thumbnail'])
+    published = detector.alerts.published
+    sinks = {kind: {'delivered': len(values), **latency_summary(values, args.target_ms)}
+             for kind, values in latencies.items()}
+    passed = all(sink['delivered'] == published and sink['p99_ms'] <= args.target_ms for sink in sinks.values())
+
+    print(f'Ядер процессора: {os.cpu_count()}, кадров {args.frames} (с предметами {sum(threats)}), '
+          f'источник {args.fps:g} кадр/с, событий {published}, с миниатюрой {thumbnails}')
+    for name, durations in (('без оповещений', baseline), ('с оповещениями', with_alerts)):
+        print(f'{name:>15}: кадр {durations.mean() * 1000:.2f} мс, 99% {np.percentile(durations, 99) * 1000:.2f} мс')
+    for kind, sink in sinks.items():
+        print(f'{kind:>15}: доставлено {sink["delivered"]}/{published}, задержка медиана {sink["p50_ms"]:.1f} мс, '
+              f'99% {sink["p99_ms"]:.1f} мс, максимум {sink["max_ms"]:.1f} мс, дольше {args.target_ms:g} мс: '
+              f'{sink["late"]}')
+    print('норма' if passed else f'событие потеряно или задержка больше {args.target_ms:g} мс')
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'cpu_count': os.cpu_count(), 'frames': args.frames, 'threat_frames': sum(threats),
+                       'source_fps': args.fps, 'target_ms': args.target_ms, 'published': published,
+                       'frame_ms': {'baseline': float(baseline.mean() * 1000),
+                                    'alerts': float(with_alerts.mean() * 1000)},
+                       'sinks': sinks, 'passed': passed}, f, indent=2)
+    return 0 if passed else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
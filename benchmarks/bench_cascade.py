@@ -0,0 +1,128 @@
+"""
+Бенчмарк каскада детекции (utils.neural_network.cascade_moduls): частота кадров полной модели на каждом кадре и
+каскада с отсеивающей моделью низкого разрешения, доля кадров, переданных полной модели, и полнота каскада
+относительно полной модели (доля её боксов, найденных каскадом с IoU не ниже --iou и тем же классом).
+
+Поток кадров моделирует досмотр, где запрещённые предметы есть в малой доле сумок (--threat-rate). По умолчанию
+обе модели - ONNX-заглушки 640x640 и 320x320; кадры квадратные, чтобы чёрные поля letterbox не считались металлом.
+
+Запуск: python -m benchmarks.bench_cascade [--model PATH] [--screening-model PATH] [--frames 400]
+                                           [--threat-rate 0.05] [--modes frame region] [--output res.json]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import cv2
+import numpy as np
+from config import SCREENING_SIZE
+from utils.neural_network.neuralnet_moduls import RealTimeObjectDetection
+from utils.neural_network.cascade_moduls import CASCADE_MODES
+from benchmarks.standin_model import ensure_standin_model, write_standin_model
+from benchmarks.synthetic import xray_like_image
+
+SCREENING_STANDIN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data',
+                                      f'standin_yolo_{SCREENING_SIZE[0]}.onnx')
+
+
+def ensure_screening_model(path=SCREENING_STANDIN_PATH, size=SCREENING_SIZE, full_side=640):
+    """
+    Отсеивающая заглушка: ячейка сетки уменьшена во столько же раз, что и вход, поэтому ячейка покрывает ту же
+    область кадра, что и у полной заглушки, и тонкие металлические предметы не усредняются с фоном.
+    """
+    if not os.path.isfile(path):
+        write_standin_model(path, size, cell=max(32 * size[0] // full_side, 1))
+    return path
+
+
+def make_frames(count, threat_rate, side=640, seed=0):
+    rng = np.random.default_rng(seed)
+    frames, threats = [], []
+    for i in range(count):
+        threat = bool(rng.random() < threat_rate)
+        image = xray_like_image(side, side, seed=i, n_metal=3 if threat else 0)
+        frames.append(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+        threats.append(threat)
+    return frames, threats
+
+
+def iou(a, b):
+    x0, y0 = max(a[0], b[0]), max(a[1], b[1])
+    x1, y1 = min(a[0] + a[2], b[0] + b[2]), min(a[1] + a[3], b[1] + b[3])
+    inter = max(x1 - x0, 0) * max(y1 - y0, 0)
+    union = a[2] * a[3] + b[2] * b[3] - inter
+    return inter / union if union > 0 else 0.0
+
+
+def matched(reference, found, threshold):
+    """
+    Число боксов reference, которым жадно сопоставлен бокс того же класса из found с IoU не ниже threshold.
+    """
+    used, hits = set(), 0
+    for class_id, _, box in reference:
+        candidates = [(iou(box, other), j) for j, (other_class, _, other) in enumerate(found)
+                      if j not in used and other_class == class_id]
+        if candidates:
+            best, j = max(candidates)
+            if best >= threshold:
+                used.add(j)
+                hits += 1
+    return hits
+
+
+def run(detector, frames):
+    net, output_layers = detector._build_model()
+    detector.get_detected_frame(net, output_layers, frames[0])
+    if hasattr(net, 'frames'):
+        net.frames = net.escalated = net.regions = 0
+    metas = []
+    start = time.perf_counter()
+    for frame in frames:
+        metas.append(detector.get_detected_frame(net, output_layers, frame)[1])
+    return len(frames) / (time.perf_counter() - start), metas, net
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Каскад из отсеивающей и полной модели')
+    parser.add_argument('--model', default=None, help='Полная ONNX-модель (по умолчанию заглушка)')
+    parser.add_argument('--screening-model', default=None, help='Отсеивающая ONNX-модель (по умолчанию заглушка)')
+    parser.add_argument('--frames', type=int, default=400)
+    parser.add_argument('--threat-rate', type=float, default=0.05)
+    parser.add_argument('--modes', nargs='+', default=list(CASCADE_MODES), choices=CASCADE_MODES)
+    parser.add_argument('--iou', type=float, default=0.5)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args(argv)
+
+    model = args.model or ensure_standin_model()
+    screening_model = args.screening_model or ensure_screening_model()
+    frames, threats = make_frames(args.frames, args.threat_rate)
+
+    full = RealTimeObjectDetection(model, remote_url=None, workers=0, screening_model_path=None)
+    full_fps, reference, _ = run(full, frames)
+    total = sum(len(meta) for meta in reference)
+    results = {'full': {'fps': full_fps, 'escalation_rate': 1.0, 'recall': 1.0}}
+    for mode in args.modes:
+        detector = RealTimeObjectDetection(model, remote_url=None, workers=0, screening_model_path=screening_model)
+        net, output_layers = detector._build_model()
+        net.mode = mode
+        detector._build_model = lambda: (net, output_layers)
+        fps, metas, net = run(detector, frames)
+        hits = sum(matched(ref, found, args.iou) for ref, found in zip(reference, metas))
+        missed_frames = sum(1 for ref, found in zip(reference, metas) if ref and not found)
+        results[f'cascade_{mode}'] = {'fps': fps, 'escalation_rate': net.escalation_rate,
+                                      'recall': hits / total if total else 1.0, 'missed_frames': missed_frames}
+
+    print(f'Кадров: {args.frames}, с угрозой: {sum(threats)}, боксов полной модели: {total}')
+    for name, result in results.items():
+        print(f'{name:>15}: {result["fps"]:7.1f} кадр/с (x{result["fps"] / full_fps:.2f}), '
+              f'передано полной модели {result["escalation_rate"]:6.1%}, полнота {result["recall"]:6.1%}')
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'frames': args.frames, 'threat_rate': args.threat_rate, 'results': results}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,102 @@
+"""
+Бенчмарк декодирования видео на CPU для распространённых кодеков.
+
+Для каждого кодека синтетическое видео декодируется тремя способами: cv2.VideoCapture по умолчанию, FFmpeg с
+заданным числом потоков декодера и FFmpeg с чтением в кольцевой буфер в отдельном потоке (PrefetchingCapture).
+Параметр --work-ms имитирует инференс на каждом кадре: при чтении с предвыборкой декодирование перекрывается с
+ним, и итоговая частота кадров ограничивается только более медленным из двух этапов.
+
+Запуск: python -m benchmarks.bench_decode [--frames 300] [--work-ms 10] [--output decode.json]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import cv2
+from utils.video.video_moduls import CaptureOptions, open_capture
+from benchmarks.synthetic import write_video
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+CODECS = (('MJPG', 'avi'), ('XVID', 'avi'), ('mp4v', 'mp4'), ('avc1', 'mp4'), ('VP80', 'webm'))
+
+
+def _busy_work(frame, work_ms):
+    if work_ms <= 0:
+        return
+    deadline = time.perf_counter() + work_ms / 1000
+    while time.perf_counter() < deadline:
+        cv2.GaussianBlur(frame[:64, :64], (5, 5), 0)
+
+
+def decode_fps(path, options=None, work_ms=0.0, max_frames=None):
+    capture = open_capture(path, options) if options is not None else cv2.VideoCapture(path)
+    if not capture.isOpened():
+        return None
+    frames = 0
+    start = time.perf_counter()
+    while max_frames is None or frames < max_frames:
+        ret, frame = capture.read()
+        if not ret:
+            break
+        _busy_work(frame, work_ms)
+        frames += 1
+    elapsed = time.perf_counter() - start
+    capture.release()
+    return {'frames': frames, 'seconds': elapsed, 'fps': frames / elapsed if elapsed else 0.0}
+
+
+def setup_decode(args):
+    """
+    Набор для benchmarks.run_benchmarks: чтение одного кадра из видео через PrefetchingCapture.
+    """
+    capture = open_capture(args.video, CaptureOptions(threads=os.cpu_count() or 0))
+
+    def step():
+        ret, _ = capture.read()
+        if not ret:
+            capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            capture.read()
+
+    return step
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Бенчмарк декодирования видео на CPU')
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--threads', type=int, default=os.cpu_count() or 0)
+    parser.add_argument('--prefetch', type=int, default=8)
+    parser.add_argument('--work-ms', type=float, default=0.0, help='Имитация инференса на каждом кадре, мс')
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args(argv)
+
+    modes = {'default': None,
+             'ffmpeg_threads': CaptureOptions('ffmpeg', args.threads, 'none', 0),
+             'ffmpeg_prefetch': CaptureOptions('ffmpeg', args.threads, 'none', args.prefetch)}
+    results = {'frames': args.frames, 'size': [args.width, args.height], 'work_ms': args.work_ms, 'codecs': {}}
+    for fourcc, extension in CODECS:
+        path = os.path.join(DATA_DIR, f'decode_{fourcc}_{args.width}x{args.height}_{args.frames}.{extension}')
+        try:
+            write_video(path, args.frames, args.width, args.height, fourcc=fourcc)
+        except IOError:
+            print(f'{fourcc:>5}: кодировщик недоступен в этой сборке OpenCV, пропущен')
+            continue
+        codec_results = {}
+        for mode, options in modes.items():
+            result = decode_fps(path, options, args.work_ms)
+            if result is None or result['frames'] == 0:
+                continue
+            codec_results[mode] = result
+            print(f"{fourcc:>5} {mode:>16}: {result['fps']:8.1f} кадр/с ({result['frames']} кадров)")
+        results['codecs'][fourcc] = codec_results
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,126 @@
+"""
+Бенчмарк экспорта таблицы детекций: прежний CSV (байты JPEG в каждой строке, как в ImageGUIDetect._save_table_csv)
+против Parquet и Arrow IPC из utils.database.columnar_moduls с изображением в отдельном столбце или рядом с
+таблицей по хешу. Для каждого формата замеряются размер на диске, время записи и чтения и проверяется, что
+прочитанная таблица совпадает с исходной.
+
+Запуск: python -m benchmarks.bench_export [--images 20] [--detections 15] [--repeat 3] [--output export.json]
+"""
+import argparse
+import ast
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import cv2
+import numpy as np
+import pandas as pd
+from config import CLASS_LIST
+from utils.database.columnar_moduls import write_detections, read_detections, sidecar_dir, META_COLUMNS
+from benchmarks.synthetic import xray_like_image
+
+
+def make_table(n_images, n_detections, seed=0):
+    """
+    Таблица в формате ImageGUIDetect._make_full_df: n_images снимков по n_detections детекций на каждом.
+    """
+    rng = np.random.default_rng(seed)
+    frames = []
+    for i in range(n_images):
+        _, jpeg = cv2.imencode('.jpg', xray_like_image(640, 640, seed=seed + i))
+        xy = rng.integers(0, 560, (n_detections, 2))
+        wh = rng.integers(20, 80, (n_detections, 2))
+        frames.append(pd.DataFrame({'image': [jpeg.tobytes()] * n_detections,
+                                    'class_obj': [CLASS_LIST[c] for c in rng.integers(0, len(CLASS_LIST),
+                                                                                      n_detections)],
+                                    'confidence': rng.uniform(0.5, 1.0, n_detections).astype(np.float32),
+                                    'x_min': xy[:, 0], 'y_min': xy[:, 1],
+                                    'x_max': wh[:, 0], 'y_max': wh[:, 1]}))
+    return pd.concat(frames, ignore_index=True)
+
+
+def _size(path):
+    size = os.path.getsize(path)
+    directory = sidecar_dir(path)
+    if os.path.isdir(directory):
+        size += sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+    return size
+
+
+def _same(original, restored):
+    if len(original) != len(restored) or list(original['image']) != [bytes(b) for b in restored['image']]:
+        return False
+    for name in META_COLUMNS:
+        if name == 'confidence':
+            if not np.allclose(original[name].to_numpy(), restored[name].to_numpy(), atol=1e-6):
+                return False
+        elif list(original[name]) != list(restored[name]):
+            return False
+    return True
+
+
+def _read_csv(path):
+    # Байты изображения после to_csv превращаются в строковое представление bytes и требуют обратного разбора
+    df = pd.read_csv(path, index_col=0)
+    df['image'] = [ast.literal_eval(value) for value in df['image']]
+    return df
+
+
+def bench_formats(table, repeat, directory):
+    formats = {
+        'csv': ('table.csv', lambda p: table.to_csv(p), _read_csv),
+        'parquet_blob': ('table_blob.parquet', lambda p: write_detections(p, table, 'blob'), read_detections),
+        'parquet_sidecar': ('table_sidecar.parquet', lambda p: write_detections(p, table, 'sidecar'),
+                            read_detections),
+        'arrow_blob': ('table_blob.arrow', lambda p: write_detections(p, table, 'blob'), read_detections),
+    }
+    results = {}
+    for name, (filename, write, read) in formats.items():
+        path = os.path.join(directory, filename)
+        write_times, read_times = [], []
+        for _ in range(repeat):
+            if os.path.isdir(sidecar_dir(path)):
+                shutil.rmtree(sidecar_dir(path))
+            start = time.perf_counter()
+            write(path)
+            write_times.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            restored = read(path)
+            read_times.append(time.perf_counter() - start)
+        results[name] = {'bytes': _size(path), 'write_ms': min(write_times) * 1000,
+                         'read_ms': min(read_times) * 1000, 'roundtrip_ok': _same(table, restored)}
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Бенчмарк экспорта таблицы детекций: CSV против Parquet/Arrow')
+    parser.add_argument('--images', type=int, default=20)
+    parser.add_argument('--detections', type=int, default=15, help='Число детекций на снимке')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args(argv)
+
+    table = make_table(args.images, args.detections)
+    directory = tempfile.mkdtemp(prefix='bench_export_')
+    try:
+        results = bench_formats(table, args.repeat, directory)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    csv_bytes = results['csv']['bytes']
+    print(f'{len(table)} строк, {args.images} снимков')
+    for name, value in results.items():
+        print(f"{name:>16}: {value['bytes'] / 1024:10.1f} КБ (x{csv_bytes / value['bytes']:5.1f} меньше CSV), "
+              f"запись {value['write_ms']:8.1f} мс, чтение {value['read_ms']:8.1f} мс, "
+              f"совпадение: {value['roundtrip_ok']}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
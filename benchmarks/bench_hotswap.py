@@ -0,0 +1,100 @@
+"""
+Замена модели без остановки потока (utils.neural_network.hotswap_moduls). Живой поток из воспроизводимого источника
+(utils.video.replay_moduls) с частотой --fps обрабатывается --seconds секунд дважды: без замен (базовый прогон) и
+с --swaps заменами модели, равномерно распределёнными по прогону (модели чередуются: вторая заглушка, исходная, ...).
+Для каждой замены выводятся время загрузки, прогрева и проверки на контрольных снимках, время самой замены
+и промежуток между последним кадром старой модели и первым кадром новой в сравнении с обычным интервалом. Для обоих
+прогонов выводятся максимальный и 99-й перцентиль интервала между кадрами и число кадров, которые детекция
+не успела обработать.
+
+Запуск: python -m benchmarks.bench_hotswap [--model PATH] [--fps 30] [--seconds 20] [--swaps 3] [--output res.json]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+from utils.neural_network.neuralnet_moduls import RealTimeObjectDetection
+from utils.neural_network.hotswap_moduls import HotSwapModel
+from utils.video.replay_moduls import replay_url
+from benchmarks.standin_model import ensure_standin_model
+from benchmarks.synthetic import write_video, xray_like_image
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+
+def run(args, source, models, swaps):
+    detector = RealTimeObjectDetection(models[0], remote_url=None, workers=0)
+    net, output_layers = detector._build_model()
+    net = HotSwapModel(detector, net, output_layers)
+    references = [xray_like_image(640, 480, seed=i) for i in range(4)]
+    capture = detector.load_capture(source)
+    schedule = [args.seconds * (i + 1) / (swaps + 1) for i in range(swaps)]
+    stamps, reports = [], []
+    start = time.perf_counter()
+    try:
+        while time.perf_counter() - start < args.seconds:
+            if schedule and time.perf_counter() - start >= schedule[0] and not net.busy:
+                schedule.pop(0)
+                net.load(models[(len(reports) + 1) % len(models)], images=references)
+                reports.append(None)
+            frame = detector.get_frame(capture, time.time())
+            if frame is None:
+                continue
+            detector.get_detected_frame(net, output_layers, frame)
+            stamps.append(time.perf_counter())
+            status = net.status
+            if reports and reports[-1] is None and status.get('frame_gap') is not None:
+                reports[-1] = dict(status)
+        net.wait()
+        return np.array(stamps), [report for report in reports if report is not None], capture.dropped
+    finally:
+        capture.release()
+
+
+def summary(stamps, skipped):
+    intervals = np.diff(stamps) if len(stamps) > 1 else np.zeros(1)
+    return {'frames': len(stamps), 'median_interval': float(np.median(intervals)),
+            'p99_interval': float(np.percentile(intervals, 99)), 'max_interval': float(intervals.max()),
+            'skipped': skipped}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Замена модели без остановки живого потока')
+    parser.add_argument('--model', default=None, help='Путь к ONNX-модели (по умолчанию заглушка)')
+    parser.add_argument('--fps', type=float, default=30.0)
+    parser.add_argument('--seconds', type=float, default=20.0)
+    parser.add_argument('--swaps', type=int, default=3)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args(argv)
+
+    model = args.model or ensure_standin_model()
+    # Вторая модель - отдельный файл, чтобы замена действительно загружала и проверяла модель с диска
+    models = [model, ensure_standin_model(os.path.join(DATA_DIR, 'standin_swap.onnx'))]
+    video = write_video(os.path.join(DATA_DIR, 'belt_0.avi'))
+
+    baseline = summary(*run(args, replay_url(video, args.fps), models, 0)[::2])
+    stamps, reports, skipped = run(args, replay_url(video, args.fps), models, args.swaps)
+    swapped = summary(stamps, skipped)
+
+    print(f'Ядер процессора: {os.cpu_count()}, источник {args.fps:g} кадр/с, {args.seconds:g} с, замен {len(reports)}')
+    for report in reports:
+        print(f'{os.path.basename(report["model_path"])}: загрузка {report["load_time"] * 1000:.0f} мс, прогрев '
+              f'{report["warmup_time"] * 1000:.0f} мс, проверка {report["latency"] * 1000:.1f} мс/снимок, замена '
+              f'{report["swap_time"] * 1e6:.1f} мкс, промежуток между моделями {report["frame_gap"] * 1000:.1f} мс '
+              f'(обычный интервал {(report["frame_interval"] or 0) * 1000:.1f} мс)')
+    for name, result in (('без замен', baseline), ('с заменами', swapped)):
+        print(f'{name:>10}: {result["frames"]} кадров, интервал медиана {result["median_interval"] * 1000:.1f} мс, '
+              f'99% {result["p99_interval"] * 1000:.1f} мс, максимум {result["max_interval"] * 1000:.1f} мс, '
+              f'не успели обработать {result["skipped"]}')
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'cpu_count': os.cpu_count(), 'source_fps': args.fps, 'seconds': args.seconds,
+                       'baseline': baseline, 'swapped': swapped, 'swaps': reports}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,121 @@
+"""
+Нагрузочный прогон живого режима без камеры: одна или несколько камер заменяются воспроизводимыми источниками
+(utils.video.replay_moduls) с частотой --fps, дрожанием --jitter и потерями --drop, и детекция работает --seconds
+секунд, как в графическом интерфейсе. Для каждой камеры выводятся устойчивая частота обработанных кадров (средняя
+и минимальная по окнам --window секунд), кадры, пропущенные из-за того, что детекция не успевает (буфер источника
+переполнен), кадры, потерянные самой камерой, и кадры, которые источник не успел выдать вовремя (декодирование
+не успевает за --fps * --speed).
+
+С --cameras 1 используется RealTimeObjectDetection (вкладка живого потока), иначе MultiCameraDetection.
+
+Запуск: python -m benchmarks.bench_live [--model PATH] [--source VIDEO|DIR] [--cameras 1] [--fps 30] [--speed 1]
+                                        [--jitter 0.005] [--drop 0.01] [--seconds 30] [--workers 0] [--output res.json]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+from utils.neural_network.neuralnet_moduls import RealTimeObjectDetection
+from utils.neural_network.multicam_moduls import MultiCameraDetection
+from utils.video.replay_moduls import replay_url
+from benchmarks.standin_model import ensure_standin_model
+from benchmarks.synthetic import write_video
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+
+def run_live(args, source):
+    detector = RealTimeObjectDetection(args.model, remote_url=None, workers=args.workers)
+    net, output_layers = detector._build_model()
+    capture = detector.load_capture(source)
+    times = [[]]
+    deadline = time.perf_counter() + args.seconds
+    try:
+        while time.perf_counter() < deadline:
+            frame = detector.get_frame(capture, time.time())
+            if frame is None:
+                continue
+            detector.get_detected_frame(net, output_layers, frame)
+            times[0].append(time.perf_counter())
+        return times, [capture]
+    finally:
+        capture.release()
+        detector.release_model(net)
+
+
+def run_multicam(args, sources):
+    detector = MultiCameraDetection(sources, args.model, batch_size=len(sources), remote_url=None,
+                                    workers=args.workers)
+    net, output_layers, captures = detector.init_model()
+    times = [[] for _ in sources]
+    deadline = time.perf_counter() + args.seconds
+    try:
+        while time.perf_counter() < deadline:
+            results = detector.get_detected_frames(net, output_layers, captures)
+            now = time.perf_counter()
+            for camera_id in results:
+                times[camera_id].append(now)
+            if not results:
+                time.sleep(0.001)
+        return times, captures
+    finally:
+        detector.release(captures)
+        detector.release_model(net)
+
+
+def window_fps(stamps, start, seconds, window):
+    counts = np.histogram(stamps, bins=np.arange(start, start + seconds + 1e-9, window))[0]
+    return counts / window
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Нагрузочный прогон живого режима на воспроизводимых источниках')
+    parser.add_argument('--model', default=None, help='Путь к ONNX-модели (по умолчанию заглушка)')
+    parser.add_argument('--source', default=None, help='Видео или папка с изображениями (по умолчанию синтетическое)')
+    parser.add_argument('--cameras', type=int, default=1)
+    parser.add_argument('--fps', type=float, default=30.0)
+    parser.add_argument('--speed', type=float, default=1.0, help='Ускорение относительно реального времени')
+    parser.add_argument('--jitter', type=float, default=0.005, help='Дрожание прихода кадров, с')
+    parser.add_argument('--drop', type=float, default=0.01, help='Доля кадров, теряемых камерой')
+    parser.add_argument('--seconds', type=float, default=30.0)
+    parser.add_argument('--window', type=float, default=5.0, help='Окно для минимальной частоты кадров, с')
+    parser.add_argument('--workers', type=int, default=0)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args(argv)
+
+    args.model = args.model or ensure_standin_model()
+    path = args.source or write_video(os.path.join(DATA_DIR, 'belt_0.avi'))
+    sources = [replay_url(path, args.fps, args.speed, args.jitter, args.drop, seed=i) for i in range(args.cameras)]
+
+    start = time.perf_counter()
+    if args.cameras == 1:
+        times, captures = run_live(args, sources[0])
+    else:
+        times, captures = run_multicam(args, sources)
+    elapsed = time.perf_counter() - start
+
+    cameras = []
+    for stamps, capture in zip(times, captures):
+        windows = window_fps(stamps, start, min(args.seconds, elapsed), args.window)
+        cameras.append({'frames': len(stamps), 'fps': len(stamps) / elapsed,
+                        'min_window_fps': float(windows.min()) if windows.size else 0.0,
+                        'skipped': capture.dropped, 'lost': capture.capture.lost, 'late': capture.capture.late})
+
+    print(f'Ядер процессора: {os.cpu_count()}, камер: {args.cameras}, источник {args.fps * args.speed:g} кадр/с, '
+          f'{elapsed:.0f} с')
+    for i, camera in enumerate(cameras):
+        print(f'камера {i}: {camera["fps"]:6.1f} кадр/с (минимум за {args.window:g} с: '
+              f'{camera["min_window_fps"]:5.1f}), не успели обработать {camera["skipped"]}, '
+              f'потеряно камерой {camera["lost"]}, выдано источником с опозданием {camera["late"]}')
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'cpu_count': os.cpu_count(), 'source_fps': args.fps * args.speed, 'seconds': elapsed,
+                       'cameras': cameras}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,44 @@
+"""
+Набор для benchmarks.run_benchmarks: несколько камер, обрабатываемых одной моделью с пакетным прямым проходом.
+
+По умолчанию камерами служат копии видеофайла, которые читаются без ограничения частоты. С флагом --streams
+каждая камера - отдельный локальный MJPEG-поток (benchmarks.stream_standin) с частотой 30 кадров/с, как у
+настоящей камеры досмотра; тогда пропускная способность не может превысить 30 * --cameras кадров/с. С --replay FPS
+камеры - воспроизводимые источники utils.video.replay_moduls с этой частотой, дрожанием --jitter и потерями --drop,
+без HTTP-сервера.
+"""
+import atexit
+import time
+import cv2
+from utils.neural_network.multicam_moduls import MultiCameraDetection
+from utils.video.replay_moduls import replay_url
+from benchmarks.stream_standin import MJPEGStreamServer
+
+
+def setup_multicam(args):
+    if args.replay:
+        sources = [replay_url(args.video, args.replay, jitter=args.jitter, drop=args.drop, seed=i)
+                   for i in range(args.cameras)]
+    elif args.streams:
+        servers = [MJPEGStreamServer(args.video, 30.0) for _ in range(args.cameras)]
+        sources = [server.start() for server in servers]
+        for server in servers:
+            atexit.register(server.stop)
+    else:
+        sources = [args.video] * args.cameras
+    detector = MultiCameraDetection(sources, args.model, size=args.size, batch_size=args.cameras)
+    net, output_layers, captures = detector.init_model()
+    atexit.register(detector.release, captures)
+
+    def step():
+        # Шаг ждёт, пока хотя бы одна камера даст кадр, как цикл _update в графическом интерфейсе
+        while True:
+            processed = len(detector.get_detected_frames(net, output_layers, captures))
+            for capture in captures:
+                if capture.exhausted():
+                    capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            if processed:
+                return processed
+            time.sleep(0.001)
+
+    return step
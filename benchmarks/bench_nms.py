@@ -0,0 +1,140 @@
+"""
+Бенчмарк не максимального подавления: cv2.dnn.NMSBoxes (со списками боксов, как раньше в _wrap_detection) против
+NumPy-реализации utils.neural_network.nms_moduls без учёта классов, с учётом классов и Soft-NMS.
+
+Кандидаты генерируются скоплениями вокруг случайных центров, как выход детектора на загруженном снимке.
+Для режима без учёта классов дополнительно проверяется, что набор оставленных боксов совпадает с NMSBoxes.
+Отдельно замеряется весь разбор выхода YOLOv7 (1, 25200, 5 + классы) с заданным числом строк выше порога:
+прежний построчный цикл с NMSBoxes против векторного RealTimeObjectDetection._wrap_detection.
+
+Запуск: python -m benchmarks.bench_nms [--counts 100 1000 10000] [--repeat 20] [--output nms.json]
+"""
+import argparse
+import json
+import sys
+import time
+import cv2
+import numpy as np
+from config import CLASS_LIST
+from utils.neural_network.nms_moduls import nms
+from utils.neural_network.neuralnet_moduls import RealTimeObjectDetection
+
+YOLO_ROWS = 25200
+
+
+def make_candidates(count, seed=0, size=640, clusters=None):
+    rng = np.random.default_rng(seed)
+    clusters = clusters or max(1, count // 20)
+    centers = rng.uniform(0, size, (clusters, 2))
+    owner = rng.integers(0, clusters, count)
+    wh = rng.uniform(20, 120, (count, 2))
+    xy = centers[owner] + rng.normal(0, 8, (count, 2)) - wh / 2
+    boxes = np.hstack([xy, wh]).astype(np.int64)
+    scores = rng.uniform(0.5, 1.0, count).astype(np.float32)
+    class_ids = rng.integers(0, len(CLASS_LIST), count)
+    return boxes, scores, class_ids
+
+
+def make_output(count, seed=0, size=640, confidence=0.6):
+    """
+    Выход сети формы (1, YOLO_ROWS, 5 + классы), в котором ровно count строк имеют уверенность не ниже confidence.
+    """
+    rng = np.random.default_rng(seed)
+    boxes, scores, _ = make_candidates(count, seed, size)
+    output = np.zeros((1, YOLO_ROWS, 5 + len(CLASS_LIST)), np.float32)
+    output[0, :, 4] = rng.uniform(0, confidence * 0.9, YOLO_ROWS)
+    output[0, :, 5:] = rng.uniform(0, 1, (YOLO_ROWS, len(CLASS_LIST)))
+    rows = rng.choice(YOLO_ROWS, count, replace=False)
+    output[0, rows, 0] = boxes[:, 0] + boxes[:, 2] / 2
+    output[0, rows, 1] = boxes[:, 1] + boxes[:, 3] / 2
+    output[0, rows, 2:4] = boxes[:, 2:]
+    output[0, rows, 4] = scores
+    return output
+
+
+def legacy_wrap_detection(output_data, size, score_threshold, nms_threshold, confidence_threshold):
+    """
+    Прежний _wrap_detection: построчный цикл по выходу сети и cv2.dnn.NMSBoxes без учёта классов.
+    """
+    class_ids, confidences, boxes = [], [], []
+    for r in range(output_data.shape[1]):
+        row = output_data[0, r]
+        confidence = row[4]
+        if confidence >= confidence_threshold:
+            class_ids.append(np.argmax(row[5:]))
+            confidences.append(confidence)
+            x, y, w, h = row[0].tolist(), row[1].tolist(), row[2].tolist(), row[3].tolist()
+            boxes.append(np.array([int(x - 0.5 * w), int(y - 0.5 * h), int(w), int(h)]))
+    indexes = cv2.dnn.NMSBoxes(boxes, confidences, score_threshold, nms_threshold)
+    return [class_ids[i] for i in indexes], [confidences[i] for i in indexes], [boxes[i] for i in indexes]
+
+
+def _time(function, repeat):
+    function()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+
+def bench_count(count, repeat, score_threshold=0.6, iou_threshold=0.55, seed=0):
+    boxes, scores, class_ids = make_candidates(count, seed)
+
+    def nmsboxes():
+        # Как в прежнем _wrap_detection: списки np.array и float
+        box_list = [np.array(box) for box in boxes]
+        score_list = [float(score) for score in scores]
+        return np.asarray(cv2.dnn.NMSBoxes(box_list, score_list, score_threshold, iou_threshold)).reshape(-1)
+
+    modes = {'cv2_nmsboxes': nmsboxes,
+             'numpy_agnostic': lambda: nms(boxes, scores, score_threshold, iou_threshold)[0],
+             'numpy_per_class': lambda: nms(boxes, scores, score_threshold, iou_threshold, class_ids)[0],
+             'numpy_soft': lambda: nms(boxes, scores, score_threshold, iou_threshold, class_ids, 'soft')[0]}
+    if hasattr(cv2.dnn, 'NMSBoxesBatched'):
+        modes['cv2_nmsboxes_batched'] = lambda: np.asarray(cv2.dnn.NMSBoxesBatched(
+            [np.array(box) for box in boxes], [float(s) for s in scores], [int(c) for c in class_ids],
+            score_threshold, iou_threshold)).reshape(-1)
+
+    results, kept = {}, {}
+    for name, function in modes.items():
+        ms, keep = _time(function, repeat)
+        results[name] = {'ms': ms, 'kept': int(len(keep))}
+        kept[name] = set(int(i) for i in keep)
+    results['agnostic_matches_cv2'] = kept['numpy_agnostic'] == kept['cv2_nmsboxes']
+
+    output = make_output(count, seed)
+    image = np.zeros((640, 640, 3), np.uint8)
+    detector = RealTimeObjectDetection('', score_threshold=score_threshold, nms_threshold=iou_threshold,
+                                       confidence_threshold=0.6, size=(640, 640), remote_url=None)
+    wrap_modes = {'wrap_legacy': lambda: legacy_wrap_detection(output, detector.SIZE, score_threshold,
+                                                               iou_threshold, 0.6)[0],
+                  'wrap_numpy_per_class': lambda: detector._wrap_detection(image, output)[0]}
+    for name, function in wrap_modes.items():
+        ms, keep = _time(function, max(1, repeat // 4))
+        results[name] = {'ms': ms, 'kept': len(keep)}
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Бенчмарк NMS: cv2.dnn.NMSBoxes против NumPy')
+    parser.add_argument('--counts', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args(argv)
+
+    results = {}
+    for count in args.counts:
+        repeat = max(1, args.repeat * 1000 // max(count, 1000))
+        results[count] = bench_count(count, repeat)
+        line = ', '.join(f"{name} {value['ms']:.2f} мс ({value['kept']})"
+                         for name, value in results[count].items() if isinstance(value, dict))
+        print(f'{count:>6} кандидатов: {line}; совпадение с NMSBoxes: {results[count]["agnostic_matches_cv2"]}')
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,98 @@
+"""
+Бенчмарк буфера предыстории (utils.video.prebuffer_moduls): поток кадров 720p и 1080p подаётся в буфер с частотой
+--fps, и для каждого разрешения замеряются занятая буфером память, прирост памяти процесса (RSS), процессорное время
+на сжатие (в долях одного ядра сверх той же подачи кадров без буфера), число пропущенных кадров и время сохранения
+клипа. Для сравнения выводится объём тех же секунд потока без сжатия.
+
+Запуск: python -m benchmarks.bench_prebuffer [--seconds 15] [--fps 30] [--buffer-seconds 10] [--quality 80]
+                                             [--output res.json]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import cv2
+import numpy as np
+import psutil
+from utils.video.prebuffer_moduls import PreEventBuffer
+from benchmarks.synthetic import xray_like_image
+
+RESOLUTIONS = {'720p': (1280, 720), '1080p': (1920, 1080)}
+
+
+def make_frames(width, height, count=30):
+    """
+    Кадры ленты досмотра: сумка сдвигается от кадра к кадру, поэтому JPEG не сжимает одинаковые кадры.
+    """
+    bag = cv2.cvtColor(xray_like_image(width, height, seed=0), cv2.COLOR_BGR2RGB)
+    return [np.roll(bag, i * width // count, axis=1) for i in range(count)]
+
+
+def feed(frames, seconds, fps, buffer=None):
+    """
+    Подаёт кадры с частотой fps в течение seconds секунд и возвращает процессорное время процесса.
+    """
+    process = psutil.Process()
+    cpu = process.cpu_times()
+    start = time.perf_counter()
+    for i in range(int(seconds * fps)):
+        if buffer is not None:
+            buffer.push(frames[i % len(frames)])
+        delay = start + (i + 1) / fps - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+    end = process.cpu_times()
+    return (end.user + end.system) - (cpu.user + cpu.system)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Память и процессорное время буфера предыстории')
+    parser.add_argument('--seconds', type=float, default=15.0, help='Длительность подачи кадров')
+    parser.add_argument('--fps', type=float, default=30.0)
+    parser.add_argument('--buffer-seconds', type=float, default=10.0)
+    parser.add_argument('--quality', type=int, default=80)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args(argv)
+
+    process = psutil.Process()
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name, (width, height) in RESOLUTIONS.items():
+            frames = make_frames(width, height)
+            idle_cpu = feed(frames, args.seconds, args.fps)
+            rss = process.memory_info().rss
+            buffer = PreEventBuffer(args.buffer_seconds, args.quality, directory=directory)
+            cpu = feed(frames, args.seconds, args.fps, buffer)
+            stats = buffer.stats()
+            grown = (process.memory_info().rss - rss) / 2 ** 20
+
+            start = time.perf_counter()
+            path = buffer.trigger('benchmark')
+            while buffer.clips == 0 and time.perf_counter() - start < 60:
+                time.sleep(0.01)
+            clip_seconds = time.perf_counter() - start
+            buffer.close()
+
+            raw_mb = width * height * 3 * args.fps * args.buffer_seconds / 2 ** 20
+            results[name] = {'buffer_mb': stats['mb'], 'raw_mb': raw_mb, 'rss_growth_mb': grown,
+                             'cpu_cores': (cpu - idle_cpu) / args.seconds, 'frames': stats['frames'],
+                             'buffered_seconds': stats['seconds'], 'dropped': stats['dropped'],
+                             'clip_seconds': clip_seconds, 'clip_mb': os.path.getsize(path) / 2 ** 20}
+
+    print(f'Ядер процессора: {os.cpu_count()}, {args.fps:g} кадр/с, буфер {args.buffer_seconds:g} с, '
+          f'JPEG {args.quality}')
+    for name, result in results.items():
+        print(f'{name:>6}: буфер {result["buffer_mb"]:6.1f} МБ (без сжатия {result["raw_mb"]:7.1f} МБ), '
+              f'прирост RSS {result["rss_growth_mb"]:6.1f} МБ, сжатие {result["cpu_cores"]:5.1%} ядра, '
+              f'пропущено {result["dropped"]}, клип {result["clip_seconds"]:.2f} с')
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'cpu_count': os.cpu_count(), 'fps': args.fps, 'results': results}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
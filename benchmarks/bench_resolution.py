@@ -0,0 +1,46 @@
+"""
+Бенчмарк разрешения входа сети: для каждого размера из INPUT_SIZES замеряется частота кадров детекции
+(letterbox, прямой проход, NMS) и выбирается наибольший размер, при котором достигается целевая частота.
+
+По умолчанию используется ONNX-заглушка с динамическими высотой и шириной входа; для реальной модели нужен экспорт
+YOLOv7 с dynamic axes (иначе поддерживается только размер экспорта).
+
+Запуск: python -m benchmarks.bench_resolution [--model PATH] [--target-fps 25] [--frames 50] [--output res.json]
+"""
+import argparse
+import json
+import sys
+from config import INPUT_SIZES, AUTOTUNE_TARGET_FPS
+from utils.neural_network.neuralnet_moduls import RealTimeObjectDetection
+from benchmarks.standin_model import ensure_standin_model, DYNAMIC_STANDIN_MODEL_PATH
+from benchmarks.synthetic import xray_like_image
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Подбор разрешения входа сети под целевую частоту кадров')
+    parser.add_argument('--model', default=None, help='Путь к ONNX-модели (по умолчанию динамическая заглушка)')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(INPUT_SIZES))
+    parser.add_argument('--target-fps', type=float, default=AUTOTUNE_TARGET_FPS)
+    parser.add_argument('--frames', type=int, default=50)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args(argv)
+
+    model = args.model or ensure_standin_model(DYNAMIC_STANDIN_MODEL_PATH, dynamic=True)
+    detector = RealTimeObjectDetection(model, remote_url=None)
+    net, output_layers = detector._build_model()
+    size, results = detector.autotune_size(net, output_layers, args.target_fps, args.sizes, args.frames,
+                                           xray_like_image())
+    for candidate, fps in results.items():
+        mark = '*' if candidate == size else ' '
+        print(f'{mark} {candidate[0]:>4}x{candidate[1]:<4}: {fps:8.1f} кадр/с')
+    print(f'Выбрано {size[0]}x{size[1]} при цели {args.target_fps} кадр/с')
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'target_fps': args.target_fps, 'selected': list(size),
+                       'fps': {f'{s[0]}x{s[1]}': fps for s, fps in results.items()}}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""
+Бенчмарк распределителя потоков (utils.threads.threads_moduls): несколько вкладок (живой поток, видео, скриншот)
+одновременно обрабатывают кадры своими детекторами, для каждого кадра замеряется задержка полного цикла
+(letterbox, прямой проход, NMS). Сравниваются 50-й и 99-й перцентили задержки без распределителя (каждый детектор
+запускает OpenCV на всех ядрах) и с ним. Вкладки моделируются потоками одного процесса.
+
+Запуск: python -m benchmarks.bench_threads [--model PATH] [--tabs 3] [--seconds 10] [--pinning] [--output res.json]
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import cv2
+import numpy as np
+from utils.neural_network.neuralnet_moduls import RealTimeObjectDetection
+from utils.threads.threads_moduls import governor
+from benchmarks.standin_model import ensure_standin_model
+from benchmarks.synthetic import xray_like_image
+
+
+def run_tabs(model, frames, tabs, seconds):
+    detectors = [RealTimeObjectDetection(model, remote_url=None, workers=0) for _ in range(tabs)]
+    models = [detector._build_model() for detector in detectors]
+    for detector, (net, output_layers) in zip(detectors, models):
+        detector.get_detected_frame(net, output_layers, frames[0])
+
+    latencies = [[] for _ in range(tabs)]
+    start_event = threading.Event()
+    deadline = [0.0]
+
+    def tab(i):
+        detector, (net, output_layers) = detectors[i], models[i]
+        start_event.wait()
+        n = 0
+        while time.perf_counter() < deadline[0]:
+            start = time.perf_counter()
+            detector.get_detected_frame(net, output_layers, frames[(n + i) % len(frames)])
+            latencies[i].append(time.perf_counter() - start)
+            n += 1
+
+    threads = [threading.Thread(target=tab, args=(i,)) for i in range(tabs)]
+    for thread in threads:
+        thread.start()
+    deadline[0] = time.perf_counter() + seconds
+    start_event.set()
+    for thread in threads:
+        thread.join()
+    for detector in detectors:
+        governor.release(detector)
+    return np.concatenate([np.asarray(values) for values in latencies]) * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Задержка кадров при одновременной работе нескольких вкладок')
+    parser.add_argument('--model', default=None, help='Путь к ONNX-модели (по умолчанию заглушка)')
+    parser.add_argument('--tabs', type=int, default=3)
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--pinning', action='store_true', help='Привязывать потоки к выделенным ядрам')
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args(argv)
+
+    model = args.model or ensure_standin_model()
+    frames = [cv2.cvtColor(xray_like_image(seed=seed), cv2.COLOR_BGR2RGB) for seed in range(8)]
+    results = {}
+    for name, enabled in (('без распределителя', False), ('с распределителем', True)):
+        governor.configure(enabled=enabled, pinning=args.pinning)
+        latencies = run_tabs(model, frames, args.tabs, args.seconds)
+        results[name] = {'frames': int(latencies.size),
+                         'fps': latencies.size / args.seconds,
+                         'p50_ms': float(np.percentile(latencies, 50)),
+                         'p99_ms': float(np.percentile(latencies, 99))}
+
+    print(f'Ядер процессора: {os.cpu_count()}, вкладок: {args.tabs}')
+    for name, result in results.items():
+        print(f'{name:>20}: {result["fps"]:7.1f} кадр/с, p50 {result["p50_ms"]:7.2f} мс, '
+              f'p99 {result["p99_ms"]:7.2f} мс')
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'cpu_count': os.cpu_count(), 'tabs': args.tabs, 'results': results}, f, indent=2,
+                      ensure_ascii=False)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,81 @@
+"""
+Бенчмарк экспорта видео с детекциями (utils.video.export_moduls): скорость последовательного экспорта (кадр
+декодируется, обрабатывается моделью и кодируется в одном потоке) и конвейерного VideoExporter, в котором три этапа
+выполняются параллельно. Скорость сравнивается со скоростью воспроизведения исходного видео.
+
+Запуск: python -m benchmarks.bench_video_export [--model PATH] [--video PATH] [--frames 300] [--only-detections]
+                                                [--output res.json]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import cv2
+from config import EXPORT_FOURCC
+from utils.neural_network.neuralnet_moduls import VideoObjectDetection
+from utils.video.export_moduls import VideoExporter, original_boxes
+from benchmarks.standin_model import ensure_standin_model
+from benchmarks.synthetic import write_video
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+
+def export_serial(detector, video, output):
+    net, output_layers = detector._build_model()
+    capture = cv2.VideoCapture(video)
+    fps = capture.get(cv2.CAP_PROP_FPS) or 25.0
+    size = (int(capture.get(cv2.CAP_PROP_FRAME_WIDTH)), int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    writer = cv2.VideoWriter(output, cv2.VideoWriter_fourcc(*EXPORT_FOURCC), fps, size)
+    frames = 0
+    start = time.perf_counter()
+    while True:
+        ret, frame = capture.read()
+        if not ret:
+            break
+        image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        class_ids, confidences, boxes = detector._infer(detector._format_yolo(image), net, output_layers)
+        meta = list(zip(class_ids, confidences, original_boxes(boxes, image.shape, detector.SIZE)))
+        writer.write(cv2.cvtColor(detector.renderer.render(image, meta), cv2.COLOR_RGB2BGR))
+        frames += 1
+    elapsed = time.perf_counter() - start
+    capture.release()
+    writer.release()
+    return {'frames': frames, 'fps': frames / elapsed, 'realtime': frames / elapsed / fps}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Последовательный и конвейерный экспорт видео с детекциями')
+    parser.add_argument('--model', default=None, help='Путь к ONNX-модели (по умолчанию заглушка)')
+    parser.add_argument('--video', default=None, help='Исходное видео (по умолчанию синтетическое)')
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--only-detections', action='store_true')
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args(argv)
+
+    model = args.model or ensure_standin_model()
+    video = args.video or write_video(os.path.join(DATA_DIR, f'export_{args.frames}.avi'), frames=args.frames)
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        results['последовательно'] = export_serial(VideoObjectDetection(model, remote_url=None, workers=0), video,
+                                                    os.path.join(directory, 'serial.mp4'))
+        exporter = VideoExporter(VideoObjectDetection(model, remote_url=None, workers=0), video,
+                                 os.path.join(directory, 'pipelined.mp4'), only_detections=args.only_detections)
+        stats = exporter.run()
+        results['конвейер'] = {'frames': stats['frames'], 'fps': stats['fps'], 'realtime': stats['realtime'],
+                               'written': stats['written']}
+
+    print(f'Ядер процессора: {os.cpu_count()}, видео: {video}')
+    for name, result in results.items():
+        print(f'{name:>16}: {result["fps"]:7.1f} кадр/с (x{result["realtime"]:.2f} от скорости воспроизведения)')
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'cpu_count': os.cpu_count(), 'video': video, 'results': results}, f, indent=2,
+                      ensure_ascii=False)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
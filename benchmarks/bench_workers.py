@@ -0,0 +1,83 @@
+"""
+Бенчмарк процессов детекции: частота кадров полного цикла (letterbox, детекция, отрисовка боксов) в процессе
+интерфейса (0 процессов) и в пуле DetectionWorkerPool с разным числом процессов. В режиме пула кадры отправляются
+в свободные ячейки буфера и забираются по готовности, как в MultiCameraDetection, поэтому процесс интерфейса
+готовит следующие кадры, пока процессы считают.
+
+Ускорение ограничено числом ядер: на машине с N ядрами больше N процессов не дают прироста.
+
+Запуск: python -m benchmarks.bench_workers [--model PATH] [--workers 0 1 2 4 8] [--frames 200] [--output res.json]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import cv2
+from config import WORKER_COUNTS
+from utils.neural_network.neuralnet_moduls import RealTimeObjectDetection
+from utils.neural_network.workers_moduls import DetectionWorkerPool
+from benchmarks.standin_model import ensure_standin_model
+from benchmarks.synthetic import xray_like_image
+
+
+def bench_in_process(detector, frames, count):
+    net, output_layers = detector._build_model()
+    detector.get_detected_frame(net, output_layers, frames[0])
+    start = time.perf_counter()
+    for i in range(count):
+        detector.get_detected_frame(net, output_layers, frames[i % len(frames)])
+    return count / (time.perf_counter() - start)
+
+
+def bench_pool(detector, frames, count, workers):
+    with DetectionWorkerPool(detector, workers) as pool:
+        pool.detect(detector._format_yolo(frames[0]))
+        submitted, done = {}, 0
+        start = time.perf_counter()
+        sent = 0
+        while done < count:
+            while sent < count and pool.pending < pool.slots:
+                img = detector._format_yolo(frames[sent % len(frames)])
+                submitted[pool.submit(img)] = img
+                sent += 1
+            for seq, _, meta in pool.collect(timeout=1.0):
+                detector._draw(submitted.pop(seq), meta)
+                done += 1
+        return count / (time.perf_counter() - start)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Частота кадров детекции в процессах детекции')
+    parser.add_argument('--model', default=None, help='Путь к ONNX-модели (по умолчанию заглушка)')
+    parser.add_argument('--workers', type=int, nargs='+', default=list(WORKER_COUNTS))
+    parser.add_argument('--frames', type=int, default=200)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args(argv)
+
+    model = args.model or ensure_standin_model()
+    detector = RealTimeObjectDetection(model, remote_url=None, workers=0)
+    frames = [cv2.cvtColor(xray_like_image(seed=seed), cv2.COLOR_BGR2RGB) for seed in range(8)]
+
+    results = {}
+    for workers in args.workers:
+        if workers == 0:
+            results[workers] = bench_in_process(detector, frames, args.frames)
+        else:
+            results[workers] = bench_pool(detector, frames, args.frames, workers)
+    baseline = results.get(0)
+    print(f'Ядер процессора: {os.cpu_count()}')
+    for workers, fps in results.items():
+        name = 'в процессе интерфейса' if workers == 0 else f'процессов: {workers}'
+        speedup = f' (x{fps / baseline:.2f})' if baseline else ''
+        print(f'{name:>22}: {fps:8.1f} кадр/с{speedup}')
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'cpu_count': os.cpu_count(), 'fps': {str(workers): fps for workers, fps in results.items()}},
+                      f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
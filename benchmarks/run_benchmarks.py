@@ -0,0 +1,313 @@
+"""
+Воспроизводимый бенчмарк конвейера детекции без графического интерфейса.
+
+Прогоняет RealTimeObjectDetection, ImageObjectDetection и VideoObjectDetection на ONNX-заглушке YOLOv7
+(или на реальной модели через --model) и синтетических рентгеновских снимках/видео (или записанных данных через
+--images/--video). Для каждого набора измеряются задержки этапов (p50/p95/p99), пропускная способность и пиковое
+потребление памяти (RSS). Результат сохраняется в JSON и сравнивается с сохранённым baseline.
+
+Запуск из корня репозитория:
+    python -m benchmarks.run_benchmarks                         # все наборы, результат в benchmarks/results
+    python -m benchmarks.run_benchmarks --save-baseline         # сохранить результат как baseline
+    python -m benchmarks.run_benchmarks --threshold 0.15        # код возврата 1 при регрессии больше 15%
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import threading
+import time
+import cv2
+import numpy as np
+import psutil
+from config import SIZE
+from utils.metrics.metrics_moduls import monitor
+from utils.neural_network.neuralnet_moduls import RealTimeObjectDetection, ImageObjectDetection, \
+    VideoObjectDetection
+from utils.video.replay_moduls import replay_url
+from benchmarks.standin_model import ensure_standin_model
+from benchmarks.synthetic import write_images, write_video
+from benchmarks.bench_decode import setup_decode
+from benchmarks.bench_multicam import setup_multicam
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(BENCHMARKS_DIR, 'data')
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, 'results')
+BASELINE_PATH = os.path.join(BENCHMARKS_DIR, 'baseline.json')
+
+
+class PeakRSS:
+
+    def __init__(self, interval=0.01):
+        """
+        Контекстный менеджер, который в фоновом потоке опрашивает RSS текущего процесса и запоминает максимум.
+        :param interval: Период опроса в секундах.
+        """
+        self.interval = interval
+        self.process = psutil.Process()
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.process.memory_info().rss)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = self.process.memory_info().rss
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.process.memory_info().rss)
+
+    @property
+    def peak_mb(self):
+        return self.peak / 2 ** 20
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+# Наборы бенчмарков. Каждый набор подготавливает детектор и возвращает функцию обработки одного кадра.
+
+def _video_frames(detector, capture):
+    def next_frame():
+        frame = detector.get_frame(capture, time.time())
+        if frame is None:
+            capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            frame = detector.get_frame(capture, time.time())
+        return frame
+
+    return next_frame
+
+
+def setup_realtime(args):
+    detector = RealTimeObjectDetection(args.model, size=args.size)
+    net, output_layers = detector._build_model()
+    # Вместо веб-камеры используется видеофайл, который читается через тот же cv2.VideoCapture, или воспроизводимый
+    # источник с частотой камеры
+    if args.replay:
+        capture = detector.load_capture(replay_url(args.video, args.replay, jitter=args.jitter, drop=args.drop,
+                                                   seed=args.seed))
+    else:
+        capture = cv2.VideoCapture(args.video)
+    next_frame = _video_frames(detector, capture)
+
+    def step():
+        detector.get_detected_frame(net, output_layers, next_frame())
+
+    return step
+
+
+def setup_image(args):
+    detector = ImageObjectDetection(args.model, size=args.size)
+    net, output_layers = detector.init_model()
+    images = [detector.load_capture(path) for path in args.images]
+    counter = iter(range(sys.maxsize))
+
+    def step():
+        detector.get_detected_frame(images[next(counter) % len(images)], net, output_layers)
+
+    return step
+
+
+def setup_video(args):
+    detector = VideoObjectDetection(args.model, size=args.size)
+    net, output_layers = detector.init_model()
+    next_frame = _video_frames(detector, detector.load_capture(args.video))
+
+    def step():
+        detector.get_detected_frame(net, output_layers, next_frame())
+
+    return step
+
+
+def setup_render(args):
+    """
+    Только этап вывода в Tk (FrameDisplay) без детекции. Требует графического дисплея, иначе набор пропускается.
+    """
+    import tkinter as tk
+    from utils.neural_network.neuralnet_gui import FrameDisplay
+
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        return None
+    root.withdraw()
+    display = FrameDisplay(tk.Label(root))
+    detector = RealTimeObjectDetection(args.model, size=args.size)
+    next_frame = _video_frames(detector, cv2.VideoCapture(args.video))
+    frames = [next_frame() for _ in range(30)]
+    counter = iter(range(sys.maxsize))
+
+    def step():
+        display.show(frames[next(counter) % len(frames)])
+        root.update_idletasks()
+
+    return step
+
+
+SUITES = {
+    'realtime': setup_realtime,
+    'image': setup_image,
+    'video': setup_video,
+    'render': setup_render,
+    'decode': setup_decode,
+    'multicam': setup_multicam,
+}
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+
+def run_suite(setup, args):
+    with PeakRSS() as rss:
+        step = setup(args)
+        if step is None:
+            return None
+        for _ in range(args.warmup):
+            step()
+        monitor.reset()
+        frames = 0
+        start = time.perf_counter()
+        for _ in range(args.frames):
+            # Набор может вернуть количество обработанных за шаг кадров (например, пакет с нескольких камер)
+            processed = step()
+            frames += 1 if processed is None else processed
+        elapsed = time.perf_counter() - start
+
+    stages = {}
+    for stage, stats in monitor.snapshot().items():
+        if stats['count']:
+            stages[stage] = {'count': stats['count'],
+                             'p50_ms': stats['p50'] * 1000,
+                             'p95_ms': stats['p95'] * 1000,
+                             'p99_ms': stats['p99'] * 1000,
+                             'mean_ms': stats['mean'] * 1000,
+                             'fps': stats['fps']}
+    return {'frames': frames,
+            'seconds': elapsed,
+            'throughput_fps': frames / elapsed if elapsed else 0.0,
+            'peak_rss_mb': rss.peak_mb,
+            'stages': stages}
+
+
+def environment(args):
+    return {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'opencv': cv2.__version__,
+            'numpy': np.__version__,
+            'model': os.path.basename(args.model),
+            'size': list(args.size),
+            'frames': args.frames,
+            'warmup': args.warmup,
+            'seed': args.seed}
+
+
+def _tracked_metrics(suite_result):
+    """
+    Метрики, по которым ищется регрессия: (имя, значение, True если больше — лучше).
+    """
+    yield 'throughput_fps', suite_result['throughput_fps'], True
+    yield 'peak_rss_mb', suite_result['peak_rss_mb'], False
+    for stage, stats in suite_result['stages'].items():
+        yield f'{stage}.p50_ms', stats['p50_ms'], False
+        yield f'{stage}.p95_ms', stats['p95_ms'], False
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for suite, suite_result in results['suites'].items():
+        base_suite = baseline.get('suites', {}).get(suite)
+        if base_suite is None:
+            continue
+        base_metrics = {name: value for name, value, _ in _tracked_metrics(base_suite)}
+        for name, value, higher_is_better in _tracked_metrics(suite_result):
+            base = base_metrics.get(name)
+            if not base:
+                continue
+            change = (value - base) / base
+            if (-change if higher_is_better else change) > threshold:
+                regressions.append(f'{suite}.{name}: {base:.3f} -> {value:.3f} ({change:+.1%})')
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Бенчмарк конвейера детекции запрещённых предметов')
+    parser.add_argument('--suites', nargs='+', choices=list(SUITES), default=list(SUITES))
+    parser.add_argument('--frames', type=int, default=200, help='Количество измеряемых кадров на набор')
+    parser.add_argument('--warmup', type=int, default=10, help='Количество кадров прогрева')
+    parser.add_argument('--model', default=None, help='Путь к ONNX-модели (по умолчанию заглушка YOLOv7)')
+    parser.add_argument('--size', type=int, nargs=2, default=SIZE, metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument('--images', default=None, help='Папка с записанными изображениями')
+    parser.add_argument('--video', default=None, help='Записанный видеофайл')
+    parser.add_argument('--cameras', type=int, default=4, help='Количество камер в наборе multicam')
+    parser.add_argument('--streams', action='store_true', help='Камеры набора multicam - локальные MJPEG-потоки')
+    parser.add_argument('--replay', type=float, default=None, metavar='FPS',
+                        help='Камеры наборов realtime и multicam - воспроизводимые источники с частотой FPS')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Дрожание кадров источников --replay, с')
+    parser.add_argument('--drop', type=float, default=0.0, help='Доля кадров, теряемых источниками --replay')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help='Путь к JSON с результатами')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='Путь к JSON с baseline')
+    parser.add_argument('--threshold', type=float, default=0.1, help='Допустимое относительное ухудшение')
+    parser.add_argument('--save-baseline', action='store_true', help='Сохранить результат как baseline')
+    args = parser.parse_args(argv)
+
+    args.size = tuple(args.size)
+    np.random.seed(args.seed)
+    if args.model is None:
+        args.model = ensure_standin_model(size=args.size)
+    if args.images is None:
+        args.images = write_images(os.path.join(DATA_DIR, 'images'), seed=args.seed)
+    else:
+        args.images = sorted(os.path.join(args.images, name) for name in os.listdir(args.images)
+                             if name.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp')))
+    if args.video is None:
+        args.video = write_video(os.path.join(DATA_DIR, f'belt_{args.seed}.avi'), seed=args.seed)
+    if args.output is None:
+        args.output = os.path.join(RESULTS_DIR, time.strftime('bench_%Y%m%d_%H%M%S.json'))
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = {'environment': environment(args), 'suites': {}}
+    for name in args.suites:
+        suite = run_suite(SUITES[name], args)
+        if suite is None:
+            print(f'{name:>10}: пропущен, окружение не поддерживает этот набор')
+            continue
+        results['suites'][name] = suite
+        print(f"{name:>10}: {suite['throughput_fps']:8.1f} кадр/с, пик RSS {suite['peak_rss_mb']:.0f} МБ")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f'Результаты сохранены в {args.output}')
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f'Baseline сохранён в {args.baseline}')
+        return 0
+    if not os.path.isfile(args.baseline):
+        print('Baseline не найден, сравнение пропущено')
+        return 0
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold)
+    for line in regressions:
+        print(f'РЕГРЕССИЯ {line}')
+    if not regressions:
+        print(f'Регрессий относительно baseline нет (порог {args.threshold:.0%})')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
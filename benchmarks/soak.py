@@ -0,0 +1,197 @@
+"""
+Длительный прогон (soak) для проверки, что память процесса не растёт за смену. Тысячи циклов открытия источника,
+детекции и закрытия повторяются подряд, и после прогрева RSS процесса опрашивается каждые --sample циклов. Прогон
+завершается с кодом 1, если RSS вырос больше чем на --max-growth МБ.
+
+Циклы детектора (без графического интерфейса) на каждом шаге создают детекторы живого потока, видео и изображения,
+загружают модель, открывают воспроизводимый источник (utils.video.replay_moduls) и видеофайл, обрабатывают несколько
+кадров и всё освобождают. С флагом --gui те же действия выполняются через вкладки интерфейса: пауза живого потока,
+скриншот с детекцией в окне скриншота (через раз окно закрывается), открытие следующего видео и повторная детекция
+на изображении. Для --gui нужен дисплей; на сервере без него прогон запускается через xvfb-run.
+
+Запуск: python -m benchmarks.soak [--model PATH] [--cycles 2000] [--gui] [--sample 100] [--max-growth 20]
+                                  [--output res.json]
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import cv2
+import numpy as np
+import psutil
+from utils.neural_network.neuralnet_moduls import RealTimeObjectDetection, ImageObjectDetection, \
+    VideoObjectDetection
+from utils.video.replay_moduls import replay_url
+from utils.video.prebuffer_moduls import PreEventBuffer
+from benchmarks.standin_model import ensure_standin_model
+from benchmarks.synthetic import write_video, xray_like_image
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+
+def detector_cycle(args, video, image):
+    """
+    Открытие, детекция и закрытие без интерфейса: живой поток из воспроизводимого источника, видео и изображение.
+    """
+    live = RealTimeObjectDetection(args.model, remote_url=None, workers=0)
+    net, output_layers = live._build_model()
+    capture = live.load_capture(replay_url(video, speed=100.0))
+    for _ in range(args.frames):
+        frame = live.get_frame(capture, time.time())
+        if frame is not None:
+            live.get_detected_frame(net, output_layers, frame)
+    capture.release()
+
+    video_detector = VideoObjectDetection(args.model, remote_url=None, workers=0)
+    capture = video_detector.load_capture(video)
+    for _ in range(args.frames):
+        frame = video_detector.get_frame(capture, time.time())
+        if frame is not None:
+            video_detector.get_detected_frame(net, output_layers, frame)
+    capture.release()
+
+    image_detector = ImageObjectDetection(args.model, remote_url=None, workers=0)
+    image_detector.get_detected_frame(image, net, output_layers)
+    live.release_model(net)
+
+
+class GUICycle:
+
+    def __init__(self, args, video, directory):
+        """
+        Вкладки живого потока, видео и изображения в скрытом окне Tk с загруженными моделями, как после
+        подтверждения настроек модели. Диалоги выбора файлов пропускаются: источники задаются напрямую.
+        """
+        import tkinter as tk
+        import customtkinter as ctk
+        from utils.database.database_gui import DatabaseMenu
+        from utils.neural_network.neuralnet_gui import RealTimeGUIDetect, VideoGUIDetect, ImageGUIDetect
+
+        self.root = tk.Tk()
+        self.video = video
+        menu = DatabaseMenu(self.root, tk.Menu(self.root))
+
+        self.live = RealTimeGUIDetect(self._tab(tk), menu)
+        self.live()
+        RealTimeObjectDetection.__init__(self.live, args.model, remote_url=None, workers=0)
+        self.live.net, self.live.output_layers = self.live._build_model()
+        self.live.capture = self.live.load_capture(replay_url(video))
+        self.live.width, self.live.height = self.live.capture.get(cv2.CAP_PROP_FRAME_WIDTH), \
+                                            self.live.capture.get(cv2.CAP_PROP_FRAME_HEIGHT)
+        self.live.prebuffer = PreEventBuffer(directory=directory)
+        self.live.stop_display_but = ctk.CTkButton(self.live.frame_buts, text='Остановить поток',
+                                                   command=self.live._stop_display)
+        self.live.stop_display_but.pack(side=ctk.BOTTOM, pady=5)
+        self.live._create_widgets_and_start_display()
+
+        self.video_tab = VideoGUIDetect(self._tab(tk), menu)
+        self.video_tab()
+        VideoObjectDetection.__init__(self.video_tab, args.model, remote_url=None, workers=0)
+        self.video_tab.net, self.video_tab.output_layers = self.video_tab._build_model()
+
+        self.image_tab = ImageGUIDetect(self._tab(tk), menu)
+        ImageObjectDetection.__init__(self.image_tab, args.model, remote_url=None, workers=0)
+        self.image_tab.net, self.image_tab.output_layers = self.image_tab._build_model()
+        self.image_tab.capture = xray_like_image(640, 480)
+        self.image_tab.source = 'soak'
+        self.image_tab.initialfilename = 'soak'
+
+    def _tab(self, tk):
+        frame = tk.Frame(self.root)
+        frame.pack()
+        return frame
+
+    def pump(self, seconds):
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            self.root.update()
+            time.sleep(0.002)
+
+    def __call__(self, i):
+        self.pump(0.05)
+        while getattr(self.live, 'frame', None) is None:
+            self.pump(0.01)
+        self.live._stop_display()
+        self.live._apply_model()
+        self.root.update()
+        if i % 2:
+            self.live._close_screenshot()
+        self.live._continue_display()
+
+        self.video_tab._open_video(self.video)
+        self.pump(0.02)
+
+        self.image_tab.create_image_panel()
+        self.root.update()
+
+    def close(self):
+        self.live._close_screenshot()
+        self.live.win.after_cancel(self.live.performance_control)
+        self.live.capture.release()
+        self.live.prebuffer.close()
+        self.video_tab._clear_display()
+        self.video_tab.capture.release()
+        self.root.destroy()
+
+
+def soak(step, cycles, sample, warmup):
+    process = psutil.Process()
+    samples = []
+    start = time.perf_counter()
+    for i in range(cycles):
+        step(i)
+        if (i + 1) % sample == 0:
+            gc.collect()
+            samples.append((i + 1, process.memory_info().rss / 2 ** 20))
+    elapsed = time.perf_counter() - start
+    measured = [(cycle, rss) for cycle, rss in samples if cycle > warmup] or samples
+    cycles_axis, rss = np.array(measured).T
+    slope = float(np.polyfit(cycles_axis, rss, 1)[0]) * 1024 if len(measured) > 1 else 0.0
+    return {'cycles': cycles, 'seconds': elapsed, 'rss_start_mb': float(rss[0]), 'rss_end_mb': float(rss[-1]),
+            'rss_max_mb': float(rss.max()), 'growth_mb': float(rss[-1] - rss[0]), 'slope_kb_per_cycle': slope,
+            'samples': samples}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Проверка отсутствия роста памяти за длительную работу')
+    parser.add_argument('--model', default=None, help='Путь к ONNX-модели (по умолчанию заглушка)')
+    parser.add_argument('--cycles', type=int, default=2000)
+    parser.add_argument('--frames', type=int, default=3, help='Кадров на цикл детектора')
+    parser.add_argument('--gui', action='store_true', help='Циклы через вкладки интерфейса (нужен дисплей)')
+    parser.add_argument('--sample', type=int, default=100, help='Период опроса RSS в циклах')
+    parser.add_argument('--warmup', type=float, default=0.1, help='Доля циклов прогрева, не входящих в проверку')
+    parser.add_argument('--max-growth', type=float, default=20.0, help='Допустимый рост RSS после прогрева, МБ')
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args(argv)
+
+    args.model = args.model or ensure_standin_model()
+    video = write_video(os.path.join(DATA_DIR, 'soak.avi'), frames=60, width=640, height=480)
+    warmup = int(args.cycles * args.warmup)
+    with tempfile.TemporaryDirectory() as directory:
+        if args.gui:
+            step = GUICycle(args, video, directory)
+            try:
+                result = soak(step, args.cycles, args.sample, warmup)
+            finally:
+                step.close()
+        else:
+            image = xray_like_image(640, 480)
+            result = soak(lambda i: detector_cycle(args, video, image), args.cycles, args.sample, warmup)
+
+    passed = result['growth_mb'] <= args.max_growth
+    print(f'{"Интерфейс" if args.gui else "Детекторы"}: {result["cycles"]} циклов за {result["seconds"]:.0f} с, '
+          f'RSS {result["rss_start_mb"]:.1f} -> {result["rss_end_mb"]:.1f} МБ (максимум {result["rss_max_mb"]:.1f}), '
+          f'рост {result["growth_mb"]:+.1f} МБ, наклон {result["slope_kb_per_cycle"]:+.2f} КБ/цикл - '
+          f'{"норма" if passed else f"больше допустимых {args.max_growth:g} МБ"}')
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'gui': args.gui, 'max_growth_mb': args.max_growth, 'passed': passed, **result}, f, indent=2)
+    return 0 if passed else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
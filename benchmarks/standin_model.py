@@ -0,0 +1,163 @@
+"""
+Генерация маленькой ONNX-модели, заменяющей YOLOv7 в бенчмарках.
+
+Модель имеет тот же интерфейс, что и экспорт YOLOv7: вход images формы (batch, 3, H, W) и выход output формы
+(batch, N, 5 + len(CLASS_LIST)) в пикселях входного изображения; размер пакета динамический. Сеть считает средний
+уровень яркости в ячейках сетки, поэтому тёмные (металлические) области рентгеновского снимка дают высокую
+уверенность. Файл собирается вручную кодированием protobuf, чтобы не тянуть пакет onnx в зависимости приложения.
+С флагом --dynamic высота и ширина входа тоже динамические, как у экспорта YOLOv7 с dynamic axes.
+
+Запуск: python -m benchmarks.standin_model [--size 640 640] [--cell 32] [--dynamic]
+                                           [--output benchmarks/data/standin_yolo.onnx]
+"""
+import argparse
+import os
+import struct
+from config import CLASS_LIST, SIZE
+
+STANDIN_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'standin_yolo.onnx')
+DYNAMIC_STANDIN_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data',
+                                          'standin_yolo_dynamic.onnx')
+
+_FLOAT, _INT64 = 1, 7
+_ATTR_INTS = 7
+
+
+def _varint(value):
+    value &= (1 << 64) - 1
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _key(field, wire_type):
+    return _varint((field << 3) | wire_type)
+
+
+def _int(field, value):
+    return _key(field, 0) + _varint(value)
+
+
+def _bytes(field, value):
+    if isinstance(value, str):
+        value = value.encode('utf-8')
+    return _key(field, 2) + _varint(len(value)) + value
+
+
+def _tensor(name, dims, values, data_type=_FLOAT):
+    fmt = '<%d%s' % (len(values), 'f' if data_type == _FLOAT else 'q')
+    return b''.join(_int(1, d) for d in dims) + _int(2, data_type) + _bytes(8, name) + \
+        _bytes(9, struct.pack(fmt, *values))
+
+
+def _attr_ints(name, values):
+    return _bytes(1, name) + b''.join(_int(8, v) for v in values) + _int(20, _ATTR_INTS)
+
+
+def _node(op_type, inputs, outputs, name, attributes=()):
+    return b''.join(_bytes(1, i) for i in inputs) + b''.join(_bytes(2, o) for o in outputs) + \
+        _bytes(3, name) + _bytes(4, op_type) + b''.join(_bytes(5, a) for a in attributes)
+
+
+def _value_info(name, dims):
+    # Строковые размеры записываются как dim_param, то есть как динамические оси
+    shape = b''.join(_bytes(1, _bytes(2, d) if isinstance(d, str) else _int(1, d)) for d in dims)
+    tensor_type = _int(1, _FLOAT) + _bytes(2, shape)
+    return _bytes(1, name) + _bytes(2, _bytes(1, tensor_type))
+
+
+def build_standin_model(size=SIZE, cell=32, num_classes=len(CLASS_LIST), dynamic=False):
+    assert isinstance(size, list | tuple) and len(size) == 2, "size должен иметь тип list или tuple из 2 элементов"
+    assert size[0] % cell == 0 and size[1] % cell == 0, "Размеры size должны делиться на cell"
+
+    width, height = size
+    grid_w, grid_h = width // cell, height // cell
+    rows, channels = grid_w * grid_h, 5 + num_classes
+
+    # Свёртка 1x1 по средней яркости ячейки: x, y, w, h, уверенность и оценки классов
+    weights, bias = [], []
+    for c in range(channels):
+        if c == 4:
+            weights += [-8.0, -8.0, -8.0]
+            bias.append(6.0)
+        elif c >= 5:
+            k = c - 5
+            weights += [(-1.0) ** k * (k + 1), (-1.0) ** (k + 1) * 0.5, 1.0 - 0.3 * k]
+            bias.append(0.0)
+        else:
+            weights += [0.0, 0.0, 0.0]
+            bias.append(0.0)
+
+    scale = [float(cell), float(cell), 4.0 * cell, 4.0 * cell] + [1.0] * (channels - 4)
+    offsets = []
+    for r in range(rows):
+        gy, gx = divmod(r, grid_w)
+        offsets += [float(gx * cell), float(gy * cell), 0.0, 0.0] + [0.0] * (channels - 4)
+    if dynamic:
+        # С динамическими высотой и шириной число строк выхода заранее неизвестно, поэтому сетка смещений не
+        # добавляется: координаты боксов определяются только яркостью ячейки и попадают в любой вход от 256 пикселей
+        scale[0], scale[1] = float(8 * cell), float(8 * cell)
+
+    nodes = [
+        _node('AveragePool', ['images'], ['pooled'], 'pool',
+              [_attr_ints('kernel_shape', [cell, cell]), _attr_ints('strides', [cell, cell])]),
+        _node('Conv', ['pooled', 'head_w', 'head_b'], ['head'], 'head', [_attr_ints('kernel_shape', [1, 1])]),
+        _node('Reshape', ['head', 'head_shape'], ['flat'], 'flat'),
+        _node('Transpose', ['flat'], ['rows'], 'rows', [_attr_ints('perm', [0, 2, 1])]),
+        _node('Sigmoid', ['rows'], ['activated'], 'activated'),
+        _node('Mul', ['activated', 'scale'], ['scaled' if not dynamic else 'output'], 'scaled'),
+    ]
+    if not dynamic:
+        nodes.append(_node('Add', ['scaled', 'offsets'], ['output'], 'output'))
+    initializers = [
+        _tensor('head_w', [channels, 3, 1, 1], weights),
+        _tensor('head_b', [channels], bias),
+        _tensor('head_shape', [3], [0, channels, -1 if dynamic else rows], _INT64),
+        _tensor('scale', [1, 1, channels], scale),
+    ]
+    if not dynamic:
+        initializers.append(_tensor('offsets', [1, rows, channels], offsets))
+    input_dims = ['batch', 3, 'height', 'width'] if dynamic else ['batch', 3, height, width]
+    graph = b''.join(_bytes(1, n) for n in nodes) + _bytes(2, 'baggage_standin') + \
+        b''.join(_bytes(5, t) for t in initializers) + \
+        _bytes(11, _value_info('images', input_dims)) + \
+        _bytes(12, _value_info('output', ['batch', 'rows' if dynamic else rows, channels]))
+    opset = _bytes(1, '') + _int(2, 11)
+    return _int(1, 7) + _bytes(2, 'baggage_detection_benchmarks') + _bytes(7, graph) + _bytes(8, opset)
+
+
+def write_standin_model(path=STANDIN_MODEL_PATH, size=SIZE, cell=32, dynamic=False):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(build_standin_model(size, cell, dynamic=dynamic))
+    return path
+
+
+def standin_model_path(size=SIZE):
+    # Заглушка с размером входа по умолчанию хранится в репозитории, для других размеров кэшируется отдельный файл
+    if tuple(size) == tuple(SIZE):
+        return STANDIN_MODEL_PATH
+    return os.path.join(os.path.dirname(STANDIN_MODEL_PATH), f'standin_yolo_{size[0]}x{size[1]}.onnx')
+
+
+def ensure_standin_model(path=None, size=SIZE, dynamic=False):
+    path = path or standin_model_path(size)
+    if not os.path.isfile(path):
+        write_standin_model(path, size, dynamic=dynamic)
+    return path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Генерация ONNX-заглушки YOLOv7 для бенчмарков')
+    parser.add_argument('--size', type=int, nargs=2, default=SIZE, metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument('--cell', type=int, default=32)
+    parser.add_argument('--output', default=STANDIN_MODEL_PATH)
+    parser.add_argument('--dynamic', action='store_true', help='Динамические высота и ширина входа')
+    args = parser.parse_args()
+    print(write_standin_model(args.output, tuple(args.size), args.cell, args.dynamic))
@@ -0,0 +1,113 @@
+"""
+Локальная замена сетевой камеры досмотра для тестов и бенчмарков без оборудования.
+
+Сервер раздаёт видеофайл по HTTP как поток MJPEG (multipart/x-mixed-replace) с заданной частотой кадров.
+OpenCV открывает такой поток через FFmpeg так же, как RTSP-камеру: cv2.VideoCapture('http://127.0.0.1:PORT/stream.mjpg').
+Поднимать RTSP-сервер для этого не нужно, а код приложения одинаково работает с обоими видами URL.
+
+Запуск: python -m benchmarks.stream_standin VIDEO [--fps 30] [--port 8554]
+"""
+import argparse
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import cv2
+
+BOUNDARY = 'baggageframe'
+
+
+class MJPEGStreamServer:
+
+    def __init__(self, video_path, fps=30.0, host='127.0.0.1', port=0, loop=True, quality=85):
+        """
+        Класс, раздающий видеофайл по HTTP как бесконечный поток MJPEG с частотой fps.
+        :param video_path: Путь к видеофайлу, кадры которого раздаются.
+        :param fps: Частота кадров потока.
+        :param host: Адрес сервера.
+        :param port: Порт сервера (0 - выбрать свободный).
+        :param loop: Начинать видео сначала после последнего кадра.
+        :param quality: Качество JPEG.
+        """
+        capture = cv2.VideoCapture(video_path)
+        self.frames = []
+        while True:
+            ret, frame = capture.read()
+            if not ret:
+                break
+            self.frames.append(cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes())
+        capture.release()
+        if not self.frames:
+            raise IOError(f'Невозможно прочитать видео {video_path}')
+
+        self.fps = fps
+        self.host = host
+        self.port = port
+        self.loop = loop
+        self.httpd = None
+        self.thread = None
+
+    @property
+    def url(self):
+        return f'http://{self.host}:{self.port}/stream.mjpg'
+
+    def start(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/stream.mjpg':
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', f'multipart/x-mixed-replace; boundary={BOUNDARY}')
+                self.end_headers()
+                period = 1 / server.fps
+                next_time = time.perf_counter()
+                index = 0
+                try:
+                    while server.httpd is not None:
+                        data = server.frames[index]
+                        self.wfile.write(f'--{BOUNDARY}\r\nContent-Type: image/jpeg\r\n'
+                                         f'Content-Length: {len(data)}\r\n\r\n'.encode('ascii') + data + b'\r\n')
+                        index += 1
+                        if index == len(server.frames):
+                            if not server.loop:
+                                break
+                            index = 0
+                        next_time += period
+                        time.sleep(max(0.0, next_time - time.perf_counter()))
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self.url
+
+    def stop(self):
+        if self.httpd is not None:
+            httpd, self.httpd = self.httpd, None
+            httpd.shutdown()
+            httpd.server_close()
+            self.thread.join()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Локальный MJPEG-поток, заменяющий камеру досмотра')
+    parser.add_argument('video')
+    parser.add_argument('--fps', type=float, default=30.0)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8554)
+    args = parser.parse_args()
+    standin = MJPEGStreamServer(args.video, args.fps, args.host, args.port)
+    print(standin.start())
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        standin.stop()
@@ -0,0 +1,113 @@
+"""
+Генерация синтетических входных данных, похожих на рентгеновские снимки багажа: светлый фон с шумом,
+полупрозрачные органические предметы оранжевого оттенка и тёмно-синие металлические силуэты.
+Все генераторы детерминированы при фиксированном seed, поэтому результаты бенчмарков воспроизводимы.
+"""
+import os
+import cv2
+import numpy as np
+
+XRAY_ORGANIC = (60, 140, 230)
+XRAY_METAL = (90, 30, 10)
+
+
+def xray_like_image(width=1280, height=720, seed=0, n_items=8, n_metal=3):
+    return xray_labelled_image(width, height, seed, n_items, n_metal)[0]
+
+
+def xray_labelled_image(width=1280, height=720, seed=0, n_items=8, n_metal=3):
+    """
+    Снимок, как у xray_like_image, и боксы металлических предметов (left, top, width, height) в пикселях.
+    """
+    assert isinstance(width, int) and isinstance(height, int), "width и height должны иметь тип int"
+
+    rng = np.random.default_rng(seed)
+    img = np.full((height, width, 3), 235, np.uint8)
+    noise = rng.normal(0, 6, (height, width, 1))
+    img = np.clip(img + noise, 0, 255).astype(np.uint8)
+
+    # Корпус чемодана
+    margin_x, margin_y = width // 12, height // 10
+    cv2.rectangle(img, (margin_x, margin_y), (width - margin_x, height - margin_y), (150, 170, 190), 6)
+
+    overlay = img.copy()
+    for _ in range(n_items):
+        x, y = int(rng.integers(margin_x, width - margin_x)), int(rng.integers(margin_y, height - margin_y))
+        axes = (int(rng.integers(width // 30, width // 8)), int(rng.integers(height // 30, height // 8)))
+        color = tuple(int(c + rng.integers(-25, 25)) for c in XRAY_ORGANIC)
+        cv2.ellipse(overlay, (x, y), axes, float(rng.uniform(0, 180)), 0, 360, color, -1)
+    img = cv2.addWeighted(overlay, 0.55, img, 0.45, 0)
+
+    boxes = []
+    for _ in range(n_metal):
+        cx, cy = int(rng.integers(margin_x * 2, width - margin_x * 2)), \
+                 int(rng.integers(margin_y * 2, height - margin_y * 2))
+        length, thickness = int(rng.integers(width // 14, width // 6)), int(rng.integers(6, 18))
+        angle = rng.uniform(0, np.pi)
+        dx, dy = int(np.cos(angle) * length / 2), int(np.sin(angle) * length / 2)
+        cv2.line(img, (cx - dx, cy - dy), (cx + dx, cy + dy), XRAY_METAL, thickness)
+        cv2.circle(img, (cx - dx, cy - dy), thickness * 2, XRAY_METAL, -1)
+        xs = (cx - dx - 2 * thickness, cx - dx + 2 * thickness, cx + dx - thickness // 2, cx + dx + thickness // 2)
+        ys = (cy - dy - 2 * thickness, cy - dy + 2 * thickness, cy + dy - thickness // 2, cy + dy + thickness // 2)
+        x0, y0 = max(min(xs), 0), max(min(ys), 0)
+        x1, y1 = min(max(xs), width), min(max(ys), height)
+        boxes.append((x0, y0, x1 - x0, y1 - y0))
+    return cv2.GaussianBlur(img, (3, 3), 0), boxes
+
+
+def write_images(directory, count=16, width=1280, height=720, seed=0):
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f'xray_{seed}_{i:04d}.jpg')
+        if not os.path.isfile(path):
+            cv2.imwrite(path, xray_like_image(width, height, seed + i))
+        paths.append(path)
+    return paths
+
+
+def write_labelled_dataset(directory, count=32, width=1280, height=720, seed=0, class_id=0, clean_rate=0.25):
+    """
+    Размеченный набор в формате YOLO: images/*.jpg и labels/*.txt со строками "класс cx cy w h" в долях размера
+    снимка. Доля clean_rate снимков не содержит металлических предметов и имеет пустую разметку.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(os.path.join(directory, 'images'), exist_ok=True)
+    os.makedirs(os.path.join(directory, 'labels'), exist_ok=True)
+    for i in range(count):
+        name = f'xray_{seed}_{i:04d}'
+        image_path = os.path.join(directory, 'images', name + '.jpg')
+        if os.path.isfile(image_path):
+            continue
+        image, boxes = xray_labelled_image(width, height, seed + i, n_metal=0 if rng.random() < clean_rate else 3)
+        cv2.imwrite(image_path, image)
+        with open(os.path.join(directory, 'labels', name + '.txt'), 'w', encoding='utf-8') as f:
+            for x, y, w, h in boxes:
+                f.write(f'{class_id} {(x + w / 2) / width:.6f} {(y + h / 2) / height:.6f} {w / width:.6f} '
+                        f'{h / height:.6f}\n')
+    return directory
+
+
+def write_video(path, frames=120, width=1280, height=720, fps=30, seed=0, fourcc='MJPG'):
+    """
+    Видео ленты досмотра: каждые несколько секунд в кадр въезжает новый чемодан и движется по ленте.
+    """
+    if os.path.isfile(path):
+        return path
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*fourcc), fps, (width, height))
+    if not writer.isOpened():
+        raise IOError(f'Невозможно создать видео {path}')
+    bag_period = fps * 4
+    bags = [xray_like_image(width, height, seed + i) for i in range(frames // bag_period + 2)]
+    belt = np.full((height, width, 3), 235, np.uint8)
+    for i in range(frames):
+        bag = bags[i // bag_period]
+        shift = int((i % bag_period) / bag_period * width * 2) - width
+        frame = belt.copy()
+        left, right = max(0, shift), min(width, width + shift)
+        if right > left:
+            frame[:, left:right] = bag[:, left - shift:right - shift]
+        writer.write(frame)
+    writer.release()
+    return path
@@ -1,3 +1,102 @@
 YOLOv7_PATH = 'YOUR_PATH'
 SIZE = (640, 640)
+INPUT_SIZES = (320, 416, 512, 640)
+AUTOTUNE_TARGET_FPS = 25.0
+AUTOTUNE_FRAMES = 20
+
+NMS_PER_CLASS = True
+NMS_METHOD = 'hard'
+SOFT_NMS_SIGMA = 0.5
 CLASS_LIST = ('Gun', 'Knife', 'Wrench', 'Pliers', 'Scissors')
+DISPLAY_MAX_SIZE = (960, 720)
+OVERLAY_HEADLESS = False
+OVERLAY_CONFIDENCE_STEP = 0.01
+OVERLAY_MAX_BUFFERS = 64
+
+CAPTURE_BACKEND = 'ffmpeg'
+CAPTURE_THREADS = 0
+CAPTURE_HW_ACCELERATION = 'any'
+CAPTURE_PREFETCH = 8
+REPLAY_FPS = 30.0
+
+EXPORT_FOURCC = 'mp4v'
+EXPORT_QUEUE_SIZE = 16
+EXPORT_SEGMENT_PADDING = 1.0
+
+PREBUFFER_SECONDS = 10.0
+PREBUFFER_QUALITY = 80
+PREBUFFER_MAX_MB = 64
+PREBUFFER_DIR = 'saved_data/clips'
+PREBUFFER_COOLDOWN = 5.0
+
+LIVE_SOURCE = 0
+CAMERA_SOURCES = (0,)
+CAMERA_BATCH_SIZE = 4
+
+DETECTION_WORKERS = 0
+WORKER_COUNTS = (0, 1, 2, 4, 8)
+WORKER_MAX_DETECTIONS = 300
+WORKER_START_TIMEOUT = 60.0
+
+SCREENING_MODEL_PATH = None
+SCREENING_SIZE = (320, 320)
+SCREENING_THRESHOLD = 0.25
+CASCADE_MODE = 'frame'
+CASCADE_REGION_MARGIN = 0.15
+CASCADE_REGION_MAX_FRACTION = 0.5
+
+HOTSWAP_REFERENCE_DIR = 'saved_data/reference'
+HOTSWAP_WARMUP = 3
+
+ALERT_SINKS = ()
+ALERT_CLASSES = ('Gun',)
+ALERT_MIN_CONFIDENCE = 0.6
+ALERT_COOLDOWN = 2.0
+ALERT_MAX_BATCH = 16
+ALERT_MAX_WAIT_MS = 10.0
+ALERT_QUEUE_SIZE = 256
+ALERT_LATENCY_TARGET_MS = 250.0
+ALERT_THUMBNAIL_SIZE = 128
+ALERT_TIMEOUT = 2.0
+
+THREAD_GOVERNOR = True
+THREAD_BUDGET = 0
+THREAD_RESERVED = 1
+THREAD_PINNING = False
+
+DETECTION_SERVER_URL = None
+SERVER_HOST = '127.0.0.1'
+SERVER_PORT = 8765
+SERVER_MAX_BATCH = 8
+SERVER_MAX_WAIT_MS = 5.0
+SERVER_MAX_PENDING = 64
+SERVER_MAX_CONCURRENCY = 32
+
+IMAGE_STORE_DIR = 'saved_data/store'
+IMAGE_STORE_FORMAT = 'jpeg'
+IMAGE_STORE_QUALITY = 95
+TABLES_DIR = 'saved_data/tables'
+QUERY_CHUNK_SIZE = 1000
+QUERY_MAX_ROWS = 10000
+IMPORT_CHUNK_SIZE = 5000
+COLUMNAR_ROW_GROUP_SIZE = 1000
+DB_PARTITIONED = True
+DB_PARTITION_MONTHS_AHEAD = 2
+DB_RETENTION_DAYS = None
+IMAGE_OFFLOAD_DAYS = None
+IMAGE_ARCHIVE_DIR = 'saved_data/archive'
+
+EVAL_CACHE_DIR = 'saved_data/eval_cache'
+EVAL_JOBS = 0
+
+METRICS_WINDOW = 1000
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = 9464
+
+LOG_PATH = './logger/logger.log'
+LOG_LEVEL = 'DEBUG'
+LOG_LEVELS = {'PIL': 'WARNING', 'sqlalchemy': 'WARNING'}
+LOG_JSON = False
+LOG_MAX_BYTES = 10 * 2 ** 20
+LOG_BACKUP_COUNT = 5
+LOG_RATE_INTERVAL = 5.0
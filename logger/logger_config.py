@@ -1,12 +1,146 @@
+import atexit
+import json
 import logging
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from config import LOG_PATH, LOG_LEVEL, LOG_LEVELS, LOG_JSON, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_RATE_INTERVAL
 
-logging.basicConfig(
-    level=logging.DEBUG,
-    format="%(asctime)s - [%(levelname)s] - (%(filename)s).%(funcName)s(%(lineno)d) - %(message)s",
-    filename='./logger/logger.log',
-    filemode='a',
-    # filemode='w',
-    datefmt='%d-%b-%y %H:%M:%S'
-)
+LOG_FORMAT = "%(asctime)s - [%(levelname)s] - (%(filename)s).%(funcName)s(%(lineno)d) - %(message)s"
+LOG_DATEFMT = '%d-%b-%y %H:%M:%S'
 
+# Запущенные QueueListener: stop_listener останавливает каждый один раз
+_running_listeners = set()
+_listeners_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record):
+        entry = {'time': self.formatTime(record, LOG_DATEFMT),
+                 'level': record.levelname,
+                 'logger': record.name,
+                 'file': record.filename,
+                 'func': record.funcName,
+                 'line': record.lineno,
+                 'thread': record.threadName,
+                 'message': record.getMessage()}
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class RateLimiter:
+
+    def __init__(self, interval=LOG_RATE_INTERVAL):
+        """
+        Класс, ограничивающий частоту сообщений, которые пишутся на каждом кадре. Вызов limiter(key) возвращает
+        количество событий с ключом key с момента последнего разрешённого сообщения, если с того момента прошло
+        не меньше interval секунд, и 0 в противном случае. Проверка не создаёт LogRecord и ничего не форматирует.
+        :param interval: Минимальный интервал между сообщениями с одним ключом в секундах.
+        """
+        assert isinstance(interval, int | float) and interval >= 0, \
+            "interval должен иметь тип int или float и быть неотрицательным"
+
+        self.interval = interval
+        self._state = {}
+
+    def __call__(self, key):
+        now = time.monotonic()
+        state = self._state.get(key)
+        if state is None:
+            self._state[key] = [now, 0]
+            return 1
+        state[1] += 1
+        if now - state[0] >= self.interval:
+            count, state[0], state[1] = state[1], now, 0
+            return count
+        return 0
+
+
+def setup_logging(path=LOG_PATH, level=LOG_LEVEL, levels=LOG_LEVELS, json_format=LOG_JSON,
+                  max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT):
+    """
+    Настраивает асинхронное логирование: потоки приложения только кладут записи в очередь через QueueHandler,
+    а запись в файл с ротацией по размеру выполняет QueueListener в отдельном потоке.
+    :param path: Путь к файлу логов.
+    :param level: Уровень корневого логгера.
+    :param levels: Словарь {имя логгера: уровень} для отдельных модулей и библиотек.
+    :param json_format: Писать логи в формате JSON Lines вместо текстового формата.
+    :param max_bytes: Размер файла, после которого он ротируется.
+    :param backup_count: Количество хранимых старых файлов логов.
+    """
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    file_handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+    file_handler.setFormatter(JsonFormatter() if json_format else logging.Formatter(LOG_FORMAT, LOG_DATEFMT))
+
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+    _install_queue_handler(log_queue, level, levels)
+    _start_listener(listener)
+    return listener
+
+
+def _start_listener(listener):
+    listener.start()
+    with _listeners_lock:
+        _running_listeners.add(listener)
+    atexit.register(stop_listener, listener)
+
+
+def _install_queue_handler(log_queue, level, levels):
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(QueueHandler(log_queue))
+    root.setLevel(level)
+    for name, module_level in levels.items():
+        logging.getLogger(name).setLevel(module_level)
+
+
+def process_log_queue():
+    """
+    Очередь, через которую дочерние процессы (процессы детекции, перебор порогов оценки) передают записи логов
+    в файл главного процесса. Сами процессы файл не открывают: несколько процессов, ротирующих один файл, портят его,
+    а в Windows переименование при ротации не удаётся. Очередь передаётся процессу при запуске и подключается в нём
+    через setup_process_logging.
+    """
+    global _process_queue
+    with _process_lock:
+        if _process_queue is None:
+            _process_queue = mp.get_context('spawn').Queue()
+            process_listener = QueueListener(_process_queue, *listener.handlers, respect_handler_level=True)
+            _start_listener(process_listener)
+        return _process_queue
+
+
+def setup_process_logging(log_queue, level=LOG_LEVEL, levels=LOG_LEVELS):
+    """
+    Направляет логи дочернего процесса в очередь log_queue, полученную от process_log_queue главного процесса.
+    """
+    _install_queue_handler(log_queue, level, levels)
+
+
+def stop_listener(listener):
+    # QueueListener.stop нельзя вызывать повторно, а при выходе он вызывается ещё и через atexit
+    with _listeners_lock:
+        if listener not in _running_listeners:
+            return
+        _running_listeners.discard(listener)
+    listener.stop()
+
+
+def get_logger(name):
+    return logging.getLogger(name)
+
+
+# Процессы, запущенные через spawn, заново импортируют модуль; файл логов открывает только главный процесс
+listener = setup_logging() if mp.current_process().name == 'MainProcess' else None
+_process_queue = None
+_process_lock = threading.Lock()
 logger = logging.getLogger('baggage_logger')
+frame_log_limiter = RateLimiter()
@@ -1,5 +1,6 @@
-from utils.neural_network.neuralnet_gui import RealTimeGUIDetect, VideoGUIDetect, ImageGUIDetect
+from utils.neural_network.neuralnet_gui import RealTimeGUIDetect, VideoGUIDetect, ImageGUIDetect, MultiCameraGUIDetect
 from utils.database.database_gui import DatabaseMenu
+from utils.metrics.metrics_gui import MetricsMenu
 import tkinter as tk
 from utils.utils import center
 import customtkinter as ctk
@@ -22,14 +23,19 @@ root.config(menu=mainmenu)
 db_menu = DatabaseMenu(root, mainmenu)
 db_menu()
 
+metrics_menu = MetricsMenu(root, mainmenu)
+metrics_menu()
+
 tabControl = ctk.CTkTabview(root)
 tab_realtime = tabControl.add('Детекция в реальном времени')
 tab_video = tabControl.add('Видеодетекция')
 tab_image = tabControl.add('Фотодетекция')
+tab_multicam = tabControl.add('Мультикамера')
 tabControl.pack(expand=1, fill="both", pady=10)
 
 RealTimeGUIDetect(tab_realtime, db_menu)()
 VideoGUIDetect(tab_video, db_menu)()
 ImageGUIDetect(tab_image, db_menu)()
+MultiCameraGUIDetect(tab_multicam, db_menu)()
 
 root.mainloop()
@@ -0,0 +1,71 @@
+"""
+Проверка продолжения прерванного импорта архивов детекций (utils.database.import_moduls) на SQLite.
+
+Запуск: python -m unittest tests.test_import_moduls
+"""
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+import pandas as pd
+from sqlalchemy import MetaData, create_engine, func, select
+from utils.database.columnar_moduls import write_detections
+from utils.database.database_moduls import detection_table
+from utils.database.image_store_moduls import ImageStore
+from utils.database.import_moduls import ArchiveImporter
+
+ROWS = 2500
+CHUNKSIZE = 700
+STOP_AT = 1400
+
+
+class ResumeImportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = ImageStore(os.path.join(self.directory.name, 'store'))
+        digest = self.store.put_bytes(b'image')
+        start = datetime(2024, 1, 1)
+        self.dataframe = pd.DataFrame({'image_hash': [digest] * ROWS,
+                                       'class_obj': ['knife'] * ROWS,
+                                       'confidence': [0.5] * ROWS,
+                                       'x_min': list(range(ROWS)), 'y_min': [0] * ROWS,
+                                       'x_max': [10] * ROWS, 'y_max': [10] * ROWS,
+                                       'detected_at': [start + timedelta(seconds=i) for i in range(ROWS)]})
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _resume(self, name):
+        path = write_detections(os.path.join(self.directory.name, name), self.dataframe, store=self.store)
+        engine = create_engine(f'sqlite:///{os.path.join(self.directory.name, "db.sqlite")}')
+        table = detection_table('detections', MetaData())
+        table.create(engine)
+
+        def stop(rows_done, fraction):
+            if rows_done >= STOP_AT:
+                importer.stop()
+
+        importer = ArchiveImporter(engine, 'detections', path, store=self.store, chunksize=CHUNKSIZE, progress=stop)
+        first = importer.run()
+        importer = ArchiveImporter(engine, 'detections', path, store=self.store, chunksize=CHUNKSIZE)
+        second = importer.run()
+
+        with engine.connect() as conn:
+            count = conn.execute(select(func.count()).select_from(table)).scalar()
+            x_min = [row[0] for row in conn.execute(select(table.c.x_min).order_by(table.c.x_min))]
+        engine.dispose()
+        self.assertTrue(STOP_AT <= first < ROWS)
+        self.assertEqual(first + second, ROWS)
+        self.assertEqual(count, ROWS)
+        self.assertEqual(x_min, list(range(ROWS)))
+
+    def test_parquet(self):
+        self._resume('detections.parquet')
+
+    def test_arrow(self):
+        self._resume('detections.arrow')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,542 @@
+"""
+Оповещения о детекциях опасных классов. Детектор публикует детекции кадра в AlertBus сразу после инференса; шина
+только отбирает детекции по классу и уверенности и кладёт их в очередь, не блокируя обработку кадров. Фоновый поток
+собирает события в пакеты (пакет уходит, когда набрано max_batch событий или с первого события прошло max_wait_ms),
+кодирует миниатюры и передаёт пакет приёмникам. У каждого приёмника свой поток доставки, поэтому медленный или
+недоступный приёмник не задерживает остальные.
+
+Приёмники задаются адресами (ALERT_SINKS):
+    tcp://HOST:PORT      локальный сокет, каждое событие - строка JSON
+    http://HOST:PORT/PATH  webhook, POST {"events": [...]}
+    file://DIR           файловая очередь: каждый пакет - файл DIR/<время>_<номер>.json, который потребитель
+                         забирает и удаляет (drain)
+
+Событие: {"id", "class_id", "class_obj", "confidence", "box": [x, y, w, h], "source", "detected_at",
+"thumbnail": JPEG в base64 или null}.
+
+Приём для проверки: python -m utils.alerts.alert_moduls listen [--tcp 127.0.0.1:8766] [--http 127.0.0.1:8767]
+                    python -m utils.alerts.alert_moduls drain DIR
+"""
+import argparse
+import atexit
+import base64
+import http.client
+import json
+import os
+import queue
+import socket
+import sys
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+import cv2
+from logger.logger_config import get_logger, frame_log_limiter
+from utils.metrics.metrics_moduls import monitor
+from config import CLASS_LIST, ALERT_SINKS, ALERT_CLASSES, ALERT_MIN_CONFIDENCE, ALERT_COOLDOWN, ALERT_MAX_BATCH, \
+    ALERT_MAX_WAIT_MS, ALERT_QUEUE_SIZE, ALERT_LATENCY_TARGET_MS, ALERT_THUMBNAIL_SIZE, ALERT_TIMEOUT
+
+logger = get_logger(__name__)
+
+# Сколько пакетов может ждать доставки в очереди одного приёмника
+SINK_QUEUE_BATCHES = 64
+
+
+def encode_thumbnail(crop, size=ALERT_THUMBNAIL_SIZE, quality=80):
+    """
+    Миниатюра вырезанного бокса (RGB) в JPEG base64 с длинной стороной не больше size.
+    """
+    if crop is None or not crop.size:
+        return None
+    scale = size / max(crop.shape[:2])
+    if scale < 1:
+        crop = cv2.resize(crop, (max(1, round(crop.shape[1] * scale)), max(1, round(crop.shape[0] * scale))),
+                          interpolation=cv2.INTER_AREA)
+    ok, data = cv2.imencode('.jpg', cv2.cvtColor(crop, cv2.COLOR_RGB2BGR), [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return base64.b64encode(data.tobytes()).decode('ascii') if ok else None
+
+
+class AlertSink(ABC):
+    name = 'sink'
+
+    def __init__(self, timeout=ALERT_TIMEOUT, latency_target_ms=ALERT_LATENCY_TARGET_MS):
+        """
+        Базовый класс приёмника оповещений. Пакеты доставляются в отдельном потоке методом send, который
+        определяют наследники; при ошибке доставка повторяется один раз, затем пакет считается потерянным.
+        :param timeout: Таймаут соединения и отправки, с.
+        :param latency_target_ms: Целевая задержка от публикации до доставки; события, доставленные позже,
+        учитываются в stats()['late'].
+        """
+        self.timeout = timeout
+        self.latency_target = latency_target_ms / 1000
+        self.delivered = 0
+        self.failed = 0
+        self.dropped = 0
+        self.late = 0
+        self._queue = queue.Queue(maxsize=SINK_QUEUE_BATCHES)
+        self._thread = None
+
+    @abstractmethod
+    def send(self, events):
+        """
+        Доставляет пакет событий; при ошибке вызывает исключение.
+        """
+
+    def reset(self):
+        """
+        Закрывает соединение после ошибки, чтобы повтор открыл новое.
+        """
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._worker, daemon=True)
+            self._thread.start()
+
+    def submit(self, batch):
+        """
+        Ставит пакет [(время публикации perf_counter, событие)] в очередь доставки, не блокируя.
+        """
+        try:
+            self._queue.put_nowait(batch)
+        except queue.Full:
+            self.dropped += len(batch)
+            if frame_log_limiter(f'alert_sink_full_{id(self)}'):
+                logger.warning(f'Приёмник оповещений {self} не успевает, пропущено событий: {self.dropped}')
+
+    def _deliver(self, events):
+        for attempt in range(2):
+            try:
+                self.send(events)
+                return True
+            except Exception as exc:
+                self.reset()
+                if attempt:
+                    self.failed += len(events)
+                    if frame_log_limiter(f'alert_sink_error_{id(self)}'):
+                        logger.error(f'Не удалось доставить {len(events)} оповещений в {self}: {exc}')
+        return False
+
+    def _worker(self):
+        while True:
+            batch = self._queue.get()
+            if batch is None:
+                break
+            if not self._deliver([event for _, event in batch]):
+                continue
+            now = time.perf_counter()
+            late = 0
+            for published, _ in batch:
+                latency = now - published
+                monitor.observe(f'alert_{self.name}', latency)
+                late += latency > self.latency_target
+            self.delivered += len(batch)
+            self.late += late
+            if late and frame_log_limiter(f'alert_sink_late_{id(self)}'):
+                logger.warning(f'Оповещения в {self} доставляются дольше {self.latency_target * 1000:.0f} мс '
+                               f'(событий с опозданием: {self.late})')
+
+    def close(self, timeout=None):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+        self.reset()
+
+    def stats(self):
+        latency = monitor.histogram(f'alert_{self.name}').snapshot()
+        return {'sink': str(self), 'delivered': self.delivered, 'failed': self.failed, 'dropped': self.dropped,
+                'late': self.late, 'pending': self._queue.qsize(), 'p50': latency['p50'], 'p95': latency['p95'],
+                'p99': latency['p99']}
+
+
+class SocketSink(AlertSink):
+    name = 'socket'
+
+    def __init__(self, host, port, **kwargs):
+        """
+        Приёмник - TCP-сокет: каждое событие отправляется строкой JSON. Соединение переиспользуется.
+        """
+        super().__init__(**kwargs)
+        self.host = host
+        self.port = port
+        self._socket = None
+
+    def __str__(self):
+        return f'tcp://{self.host}:{self.port}'
+
+    def send(self, events):
+        if self._socket is None:
+            self._socket = socket.create_connection((self.host, self.port), self.timeout)
+            self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._socket.sendall(b''.join(json.dumps(event).encode('utf-8') + b'\n' for event in events))
+
+    def reset(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+
+class WebhookSink(AlertSink):
+    name = 'webhook'
+
+    def __init__(self, url, **kwargs):
+        """
+        Приёмник - webhook: пакет отправляется одним запросом POST {"events": [...]}. Соединение переиспользуется.
+        """
+        assert isinstance(url, str) and url.startswith('http://'), "url должен иметь тип str и начинаться с http://"
+
+        super().__init__(**kwargs)
+        parts = urlsplit(url)
+        self.url = url
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.path = parts.path or '/'
+        self._connection = None
+
+    def __str__(self):
+        return self.url
+
+    def send(self, events):
+        if self._connection is None:
+            self._connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        body = json.dumps({'events': events}).encode('utf-8')
+        self._connection.request('POST', self.path, body=body, headers={'Content-Type': 'application/json'})
+        response = self._connection.getresponse()
+        data = response.read()
+        if not 200 <= response.status < 300:
+            raise IOError(f'webhook вернул ошибку {response.status}: {data[:200]!r}')
+
+    def reset(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+class FileQueueSink(AlertSink):
+    name = 'file'
+
+    def __init__(self, directory, **kwargs):
+        """
+        Приёмник - файловая очередь: каждый пакет записывается во временный файл и переименовывается, поэтому
+        потребитель видит только целые файлы. Файлы упорядочены по имени.
+        """
+        super().__init__(**kwargs)
+        self.directory = directory
+        self._sequence = 0
+
+    def __str__(self):
+        return f'file://{self.directory}'
+
+    def send(self, events):
+        os.makedirs(self.directory, exist_ok=True)
+        self._sequence += 1
+        name = f'{time.time_ns()}_{self._sequence:06d}.json'
+        temporary = os.path.join(self.directory, '.' + name)
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump({'events': events}, f, ensure_ascii=False)
+        os.replace(temporary, os.path.join(self.directory, name))
+
+
+def drain(directory):
+    """
+    Забирает события из файловой очереди directory по порядку, удаляя прочитанные файлы.
+    """
+    if not os.path.isdir(directory):
+        return
+    for name in sorted(os.listdir(directory)):
+        if name.startswith('.') or not name.endswith('.json'):
+            continue
+        path = os.path.join(directory, name)
+        with open(path, encoding='utf-8') as f:
+            events = json.load(f)['events']
+        os.remove(path)
+        yield from events
+
+
+def sink_from_url(url, **kwargs):
+    """
+    Приёмник по адресу tcp://HOST:PORT, http://HOST:PORT/PATH или file://DIR.
+    """
+    if url.startswith('tcp://'):
+        parts = urlsplit(url)
+        return SocketSink(parts.hostname, parts.port, **kwargs)
+    if url.startswith('http://'):
+        return WebhookSink(url, **kwargs)
+    if url.startswith('file://'):
+        return FileQueueSink(url[len('file://'):], **kwargs)
+    raise ValueError(f'Неизвестный приёмник оповещений {url}: ожидается tcp://, http:// или file://')
+
+
+class AlertBus:
+
+    def __init__(self,
+                 sinks,
+                 class_list=CLASS_LIST,
+                 classes=ALERT_CLASSES,
+                 min_confidence=ALERT_MIN_CONFIDENCE,
+                 cooldown=ALERT_COOLDOWN,
+                 max_batch=ALERT_MAX_BATCH,
+                 max_wait_ms=ALERT_MAX_WAIT_MS,
+                 queue_size=ALERT_QUEUE_SIZE,
+                 thumbnail_size=ALERT_THUMBNAIL_SIZE):
+        """
+        Класс шины оповещений о детекциях.
+        :param sinks: Список приёмников (AlertSink).
+        :param class_list: Список классов детектора (для имени класса в событии).
+        :param classes: Имена классов, о которых отправляются оповещения.
+        :param min_confidence: Минимальная уверенность детекции для оповещения.
+        :param cooldown: Минимальный интервал между оповещениями об одном классе из одного источника, с: объект
+        виден на многих кадрах подряд, и без него каждый кадр давал бы новое событие.
+        :param max_batch: Максимальное число событий в пакете.
+        :param max_wait_ms: Сколько ждать добора пакета после первого события, мс.
+        :param queue_size: Максимальное число событий, ожидающих отправки; при переполнении новые пропускаются.
+        :param thumbnail_size: Длинная сторона миниатюры, пикселей.
+        """
+        assert isinstance(sinks, list | tuple) and sinks, "sinks должен иметь тип list или tuple и быть непустым"
+        assert all(isinstance(sink, AlertSink) for sink in sinks), "Элементы sinks должны иметь тип AlertSink"
+        assert isinstance(max_batch, int) and max_batch > 0, "max_batch должен иметь тип int и быть больше 0"
+        assert isinstance(max_wait_ms, int | float) and max_wait_ms >= 0, \
+            "max_wait_ms должен иметь тип int или float и быть неотрицательным"
+        assert cooldown >= 0, "cooldown должен быть неотрицательным"
+
+        self.sinks = list(sinks)
+        self.class_list = class_list
+        self.class_ids = {i for i, name in enumerate(class_list) if name in classes}
+        self.min_confidence = min_confidence
+        self.cooldown = cooldown
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.thumbnail_size = thumbnail_size
+        self.published = 0
+        self.suppressed = 0
+        self.dropped = 0
+        self._last = {}
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        # Потоки запускаются при первом событии: процессы детекции создают детекторы, но ничего не публикуют
+        with self._lock:
+            if self._thread is None:
+                for sink in self.sinks:
+                    sink.start()
+                self._thread = threading.Thread(target=self._dispatch, daemon=True)
+                self._thread.start()
+
+    def publish(self, frame, meta, source=None):
+        """
+        Отбирает детекции кадра для оповещения и ставит их в очередь. Возвращает число поставленных событий.
+        Вызывается в потоке обработки кадров, поэтому ничего не кодирует и не ждёт.
+        :param frame: Кадр RGB, на котором найдены детекции (из него вырезаются миниатюры).
+        :param meta: Детекции [(class_id, confidence, box)] с боксами (x, y, w, h).
+        :param source: Имя источника (камера, видео или изображение).
+        """
+        hits = [(class_id, confidence, box) for class_id, confidence, box in meta or ()
+                if class_id in self.class_ids and confidence >= self.min_confidence]
+        if not hits:
+            return 0
+        if self._thread is None:
+            self._start()
+        now = time.time()
+        queued = 0
+        for class_id, confidence, box in hits:
+            key = (source, class_id)
+            if now - self._last.get(key, float('-inf')) < self.cooldown:
+                self.suppressed += 1
+                continue
+            x, y, w, h = (int(v) for v in box)
+            # Копия только бокса: кадр после возврата может быть переиспользован
+            crop = frame[max(y, 0):max(y + h, 0), max(x, 0):max(x + w, 0)].copy()
+            event = {'id': uuid.uuid4().hex, 'class_id': int(class_id), 'class_obj': self.class_list[class_id],
+                     'confidence': float(confidence), 'box': [x, y, w, h],
+                     'source': None if source is None else str(source), 'detected_at': now}
+            try:
+                self._queue.put_nowait((time.perf_counter(), event, crop))
+            except queue.Full:
+                self.dropped += 1
+                if frame_log_limiter('alert_queue_full'):
+                    logger.warning(f'Очередь оповещений переполнена, пропущено событий: {self.dropped}')
+                continue
+            self._last[key] = now
+            queued += 1
+        self.published += queued
+        return queued
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch and batch[-1] is not None:
+            timeout = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _dispatch(self):
+        while True:
+            batch = self._collect()
+            stop = batch[-1] is None
+            items = [item for item in batch if item is not None]
+            if items:
+                ready = []
+                for published, event, crop in items:
+                    event['thumbnail'] = encode_thumbnail(crop, self.thumbnail_size)
+                    ready.append((published, event))
+                for sink in self.sinks:
+                    sink.submit(ready)
+            if stop:
+                break
+
+    def close(self, timeout=5.0):
+        """
+        Отправляет события, оставшиеся в очереди, и останавливает потоки.
+        """
+        with self._lock:
+            if self._thread is not None:
+                self._queue.put(None)
+                self._thread.join(timeout)
+                self._thread = None
+        for sink in self.sinks:
+            sink.close(timeout)
+
+    def stats(self):
+        return {'published': self.published, 'suppressed': self.suppressed, 'dropped': self.dropped,
+                'pending': self._queue.qsize(), 'sinks': [sink.stats() for sink in self.sinks]}
+
+
+_bus = None
+_bus_lock = threading.Lock()
+
+
+def get_alert_bus():
+    """
+    Общая шина оповещений процесса с приёмниками из ALERT_SINKS или None, если приёмники не заданы.
+    """
+    global _bus
+    if not ALERT_SINKS:
+        return None
+    with _bus_lock:
+        if _bus is None:
+            _bus = AlertBus([sink_from_url(url) for url in ALERT_SINKS])
+            atexit.register(_bus.close)
+        return _bus
+
+
+class AlertReceiver:
+
+    def __init__(self, tcp_address=None, http_address=None):
+        """
+        Класс приёмной стороны для проверки оповещений и бенчмарка: принимает события по TCP и/или через webhook
+        и складывает их в очередь self.events вместе со временем приёма.
+        :param tcp_address: (host, port) для сокета или None.
+        :param http_address: (host, port) для webhook или None.
+        """
+        self.events = queue.Queue()
+        self._tcp_address = tcp_address
+        self._http_address = http_address
+        self._listener = None
+        self.httpd = None
+        self._threads = []
+
+    @property
+    def tcp_url(self):
+        return f'tcp://{self._tcp_address[0]}:{self._listener.getsockname()[1]}' if self._listener else None
+
+    @property
+    def http_url(self):
+        return f'http://{self._http_address[0]}:{self.httpd.server_address[1]}/alerts' if self.httpd else None
+
+    def _receive(self, kind, event):
+        self.events.put((kind, time.time(), event))
+
+    def _accept(self):
+        while True:
+            try:
+                connection, _ = self._listener.accept()
+            except OSError:
+                return
+            thread = threading.Thread(target=self._read, args=(connection,), daemon=True)
+            thread.start()
+
+    def _read(self, connection):
+        with connection, connection.makefile('rb') as stream:
+            for line in stream:
+                self._receive('socket', json.loads(line))
+
+    def start(self):
+        if self._tcp_address:
+            self._listener = socket.create_server(self._tcp_address)
+            self._threads.append(threading.Thread(target=self._accept, daemon=True))
+        if self._http_address:
+            receiver = self
+
+            class Handler(BaseHTTPRequestHandler):
+                protocol_version = 'HTTP/1.1'
+
+                def do_POST(self):
+                    body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                    for event in json.loads(body)['events']:
+                        receiver._receive('webhook', event)
+                    self.send_response(204)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+
+                def log_message(self, format, *args):
+                    pass
+
+            self.httpd = ThreadingHTTPServer(self._http_address, Handler)
+            self.httpd.daemon_threads = True
+            self._threads.append(threading.Thread(target=self.httpd.serve_forever, daemon=True))
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+        self._threads = []
+
+
+def _address(value):
+    host, port = value.rsplit(':', 1)
+    return host, int(port)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Приём оповещений о детекциях')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    listen = subparsers.add_parser('listen', help='Печатать события, приходящие по сокету и через webhook')
+    listen.add_argument('--tcp', type=_address, default=None, metavar='HOST:PORT')
+    listen.add_argument('--http', type=_address, default=None, metavar='HOST:PORT')
+    drain_parser = subparsers.add_parser('drain', help='Забрать события из файловой очереди')
+    drain_parser.add_argument('directory')
+    args = parser.parse_args(argv)
+
+    if args.command == 'drain':
+        for event in drain(args.directory):
+            print(json.dumps({**event, 'thumbnail': bool(event.get('thumbnail'))}, ensure_ascii=False))
+        return 0
+
+    receiver = AlertReceiver(args.tcp, args.http).start()
+    print(f'Приём оповещений: {receiver.tcp_url or ""} {receiver.http_url or ""}'.strip())
+    try:
+        while True:
+            kind, received, event = receiver.events.get()
+            print(f'{kind}: {event["class_obj"]} {event["confidence"]:.2f} {event["box"]} из {event["source"]}, '
+                  f'задержка {(received - event["detected_at"]) * 1000:.1f} мс')
+    except KeyboardInterrupt:
+        receiver.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,230 @@
+import hashlib
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+from config import COLUMNAR_ROW_GROUP_SIZE
+from utils.database.image_store_moduls import ImageStore
+from utils.database.query_moduls import DetectionQuery
+from logger.logger_config import get_logger
+
+logger = get_logger(__name__)
+
+META_COLUMNS = ('class_obj', 'confidence', 'x_min', 'y_min', 'x_max', 'y_max')
+IMAGE_STORAGES = ('blob', 'sidecar', 'store')
+SIDECAR_SUFFIX = '_images'
+
+DETECTION_SCHEMA = pa.schema([
+    ('image_hash', pa.string()),
+    ('class_obj', pa.dictionary(pa.int8(), pa.string())),
+    ('confidence', pa.float32()),
+    ('x_min', pa.int32()),
+    ('y_min', pa.int32()),
+    ('x_max', pa.int32()),
+    ('y_max', pa.int32()),
+])
+# Столбцы, которые записываются, если есть в таблице
+OPTIONAL_FIELDS = (pa.field('detected_at', pa.timestamp('ms')),
+                   pa.field('source', pa.dictionary(pa.int32(), pa.string())))
+
+
+def image_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def sidecar_dir(path):
+    return os.path.splitext(path)[0] + SIDECAR_SUFFIX
+
+
+def is_arrow_file(path):
+    return os.path.splitext(path)[1].lower() in ('.arrow', '.feather', '.ipc')
+
+
+def _storage(dataframe, images):
+    if images is None:
+        images = 'blob' if 'image' in dataframe else 'store'
+    assert images in IMAGE_STORAGES, f"images должен быть одним из {IMAGE_STORAGES}"
+    return images
+
+
+def stored_images(path):
+    """
+    Способ хранения изображений таблицы ("blob", "sidecar" или "store") по метаданным схемы без чтения данных.
+    """
+    if is_arrow_file(path):
+        with pa.memory_map(path) as source:
+            schema = pa.ipc.open_file(source).schema
+    else:
+        schema = pq.read_schema(path)
+    return (schema.metadata or {}).get(b'images', b'blob').decode()
+
+
+def detections_to_arrow(dataframe, images=None, store=None):
+    """
+    Переводит таблицу детекций в pyarrow.Table с типизированными столбцами. Таблица содержит столбцы META_COLUMNS
+    и либо столбец image с байтами изображения (как раньше в ImageGUIDetect), либо столбец image_hash со ссылкой
+    на изображение в хранилище ImageStore (как в ImageGUIDetect сейчас). Изображение строки заменяется SHA-256
+    хешем; при images="blob" байты изображения записываются в столбец image только в первой строке с этим хешем,
+    при images="store" таблица хранит только хеши.
+    Возвращает таблицу и словарь {хеш: байты изображения} (пустой при images="store").
+    """
+    assert isinstance(dataframe, pd.DataFrame), "dataframe должен иметь тип pd.DataFrame"
+    images = _storage(dataframe, images)
+
+    blobs = {}
+    hashes = []
+    if 'image' in dataframe:
+        for data in dataframe['image']:
+            data = bytes(data)
+            digest = image_hash(data)
+            blobs.setdefault(digest, data)
+            hashes.append(digest)
+    else:
+        hashes = [str(digest) for digest in dataframe['image_hash']]
+        if images != 'store':
+            store = store or ImageStore()
+            blobs = {digest: store.get_bytes(digest) for digest in set(hashes)}
+    if images == 'store':
+        blobs = {}
+
+    columns = {'image_hash': hashes}
+    for name in META_COLUMNS:
+        columns[name] = dataframe[name].to_numpy()
+    schema = DETECTION_SCHEMA
+    for field in OPTIONAL_FIELDS:
+        if field.name in dataframe:
+            columns[field.name] = dataframe[field.name].tolist()
+            schema = schema.append(field)
+    table = pa.Table.from_pydict(columns, schema=schema)
+    if images == 'blob':
+        seen = set()
+        image_column = []
+        for digest in hashes:
+            image_column.append(blobs[digest] if digest not in seen else None)
+            seen.add(digest)
+        table = table.append_column(pa.field('image', pa.binary()), pa.array(image_column, pa.binary()))
+    return table, blobs
+
+
+def write_detections(path, dataframe, images=None, compression='zstd', store=None):
+    """
+    Сохраняет таблицу детекций в Parquet (.parquet) или Arrow IPC (.arrow, .feather) со сжатием.
+    При images="sidecar" изображения сохраняются рядом с таблицей в папку <имя>_images/<хеш>.jpg,
+    при images="store" таблица ссылается на изображения хранилища store; в обоих случаях таблица хранит только хеши.
+    По умолчанию images="blob" для таблицы со столбцом image и "store" для таблицы со столбцом image_hash.
+    """
+    images = _storage(dataframe, images)
+    table, blobs = detections_to_arrow(dataframe, images, store)
+    if images == 'sidecar':
+        directory = sidecar_dir(path)
+        os.makedirs(directory, exist_ok=True)
+        for digest, data in blobs.items():
+            image_path = os.path.join(directory, digest + '.jpg')
+            if not os.path.isfile(image_path):
+                with open(image_path, 'wb') as f:
+                    f.write(data)
+    table = table.replace_schema_metadata({'images': images})
+    if is_arrow_file(path):
+        feather.write_feather(table, path, compression=compression if compression in ('zstd', 'lz4') else None,
+                              chunksize=COLUMNAR_ROW_GROUP_SIZE)
+    else:
+        # Небольшие группы строк позволяют читать таблицу частями с постоянным расходом памяти
+        pq.write_table(table, path, compression=compression, row_group_size=COLUMNAR_ROW_GROUP_SIZE)
+    n_images = len(set(table.column('image_hash').to_pylist()))
+    logger.info(f'Таблица детекций сохранена в {path}: {table.num_rows} строк, {n_images} изображений')
+    return path
+
+
+def _read_table(path, query=None):
+    if is_arrow_file(path):
+        table = feather.read_table(path)
+        if query is not None and query.arrow_filter(table.column_names) is not None:
+            table = table.filter(query.arrow_filter(table.column_names))
+        return table
+    if query is None:
+        return pq.read_table(path)
+    # Фильтр передаётся в читатель Parquet и по статистике групп строк пропускает неподходящие
+    return pq.read_table(path, filters=query.arrow_filter(pq.read_schema(path).names))
+
+
+def _read_images(path, hashes):
+    columns = ['image_hash', 'image']
+    wanted = pc.field('image_hash').isin(sorted(hashes))
+    if is_arrow_file(path):
+        return feather.read_table(path, columns=columns).filter(wanted)
+    return pq.read_table(path, columns=columns, filters=wanted)
+
+
+def read_detections(path, load_images=True, store=None, query=None):
+    """
+    Читает таблицу детекций, сохранённую write_detections. Возвращает pd.DataFrame со столбцом image с байтами
+    изображения в каждой строке и столбцами META_COLUMNS (при load_images=False вместо столбца image возвращается
+    image_hash). Изображения таблиц, ссылающихся на хранилище, читаются из store.
+    :param query: Экземпляр DetectionQuery - фильтры применяются при чтении, сортировка и limit - к результату.
+    """
+    assert query is None or isinstance(query, DetectionQuery), "query должен иметь тип DetectionQuery"
+
+    table = _read_table(path, query)
+    storage = (table.schema.metadata or {}).get(b'images', b'blob').decode()
+
+    dataframe = pd.DataFrame({name: table.column(name).to_numpy() if name != 'class_obj'
+                              else table.column(name).to_pandas().astype(str) for name in META_COLUMNS})
+    for field in OPTIONAL_FIELDS:
+        if field.name in table.column_names:
+            column = table.column(field.name).to_pandas()
+            dataframe[field.name] = column.astype(str) if field.name == 'source' else column
+    hashes = table.column('image_hash').to_pylist()
+    if not load_images:
+        dataframe.insert(0, 'image_hash', hashes)
+        return _order(dataframe, query)
+
+    if storage == 'blob':
+        # Байты изображения хранятся только в первой строке с этим хешем, которая могла не пройти фильтр
+        image_table = table if query is None else _read_images(path, set(hashes))
+        blobs = {digest: data for digest, data in zip(image_table.column('image_hash').to_pylist(),
+                                                      image_table.column('image').to_pylist()) if data is not None}
+    elif storage == 'store':
+        store = store or ImageStore()
+        blobs = {digest: store.get_bytes(digest) for digest in set(hashes)}
+    else:
+        directory = sidecar_dir(path)
+        blobs = {}
+        for digest in set(hashes):
+            with open(os.path.join(directory, digest + '.jpg'), 'rb') as f:
+                blobs[digest] = f.read()
+    dataframe.insert(0, 'image', [blobs[digest] for digest in hashes])
+    return _order(dataframe, query)
+
+
+def _order(dataframe, query):
+    if query is None:
+        return dataframe
+    if query.order_by in dataframe:
+        dataframe = dataframe.sort_values(query.order_by, ascending=not query.descending, kind='stable')
+    if query.limit is not None:
+        dataframe = dataframe.head(query.limit)
+    return dataframe.reset_index(drop=True)
+
+
+def import_detections(path, store=None):
+    """
+    Читает таблицу детекций и переносит её изображения в хранилище store. Возвращает pd.DataFrame со столбцами
+    image_hash и META_COLUMNS, как в ImageGUIDetect, для записи в базу данных.
+    """
+    store = store or ImageStore()
+    if stored_images(path) == 'store':
+        return read_detections(path, load_images=False)
+
+    dataframe = read_detections(path)
+    hashes, stored = [], set()
+    for data in dataframe['image']:
+        digest = image_hash(data)
+        if digest not in stored:
+            store.put_bytes(data)
+            stored.add(digest)
+        hashes.append(digest)
+    dataframe = dataframe.drop(columns='image')
+    dataframe.insert(0, 'image_hash', hashes)
+    return dataframe
@@ -1,8 +1,26 @@
 import customtkinter as ctk
+import threading
+from datetime import timedelta
 import tkinter as tk
 import tkinter.messagebox as mb
+from tkinter import filedialog
 from utils.database.database_moduls import DatabaseFunctionality
+from utils.database.import_moduls import ArchiveImporter
+from utils.database.partition_moduls import PartitionManager
+from utils.database.image_store_moduls import ImageStore, table_references
+from utils.database.query_moduls import DetectionQuery
 from utils.utils import PasswordEntry, Table, center
+from config import CLASS_LIST, DB_RETENTION_DAYS, IMAGE_OFFLOAD_DAYS
+from logger.logger_config import get_logger
+
+logger = get_logger(__name__)
+
+PERIODS = {'За всё время': None,
+           'Последний час': timedelta(hours=1),
+           'Последние сутки': timedelta(days=1),
+           'Последняя неделя': timedelta(weeks=1),
+           'Последний месяц': timedelta(days=30)}
+
 
 class DatabaseMenu:
 
@@ -129,6 +147,16 @@ class DatabaseMenu:
                 self.selected_db_menu.add_cascade(label="Просмотр таблицы", menu=self.view_menu)
                 self.selected_db_menu.add_cascade(label="Удаление таблицы", menu=self.delete_table_menu)
                 self.selected_db_menu.add_command(label="Создать таблицу", command=self._create_table)
+                self.selected_db_menu.add_command(label="Импорт таблицы (CSV/Parquet/Arrow)",
+                                                  command=self._import_table)
+                store_menu = tk.Menu(self.selected_db_menu, tearoff=0)
+                store_menu.add_command(label="Статистика", command=self._image_store_stats)
+                store_menu.add_command(label="Очистка", command=self._image_store_gc)
+                self.selected_db_menu.add_cascade(label="Хранилище изображений", menu=store_menu)
+                self.selected_db_menu.add_command(label="Секции и срок хранения", command=self._partitions_info)
+                # Секции вперёд, перенос старых изображений в архив и удаление по сроку хранения - в фоне,
+                # чтобы не задерживать подключение
+                self._start_maintenance()
                 # self.selected_db_menu.add_command(label="Удалить базу данных", command=self._delete_db)
 
         if type_event == 'connect':
@@ -186,6 +214,140 @@ class DatabaseMenu:
         topframe.geometry(f"{topframe.winfo_reqwidth() + 30}x{topframe.winfo_reqheight() + 30}")
         center(topframe)
 
+    def _import_table(self):
+        path = filedialog.askopenfilename(title="Импорт таблицы",
+                                          filetypes=[("parquet file(*.parquet)", "*.parquet"),
+                                                     ("arrow file(*.arrow *.feather)", "*.arrow *.feather"),
+                                                     ("csv file(*.csv)", "*.csv")])
+        if not path:
+            return
+        if len(self.table_names) == 0:
+            mb.showwarning('Предупреждение', f'В базе данных {self.db_info["db_name"]} нет таблиц!')
+            return
+
+        topframe = ctk.CTkToplevel(self.root)
+        topframe.resizable(width=False, height=False)
+        topframe.title('Импорт таблицы')
+
+        frame = ctk.CTkFrame(topframe)
+        frame.pack(expand=True)
+
+        ctk.CTkLabel(frame, text='Имя таблицы', anchor=ctk.CENTER, width=20).pack(pady=5)
+        combo = ctk.CTkComboBox(frame, width=200, values=self.table_names, state="readonly")
+        combo.pack(pady=5)
+        progress_bar = ctk.CTkProgressBar(frame, width=200)
+        progress_bar.set(0)
+        progress_bar.pack(pady=5)
+        progress_label = ctk.CTkLabel(frame, text='')
+        progress_label.pack(pady=5)
+
+        # Импорт идёт в отдельном потоке, окно опрашивает его состояние через after
+        state = {'rows': 0, 'fraction': 0.0, 'result': None, 'error': None, 'importer': None, 'stopped': False}
+
+        def run_import(table_name):
+            try:
+                state['importer'] = ArchiveImporter(self.db_funtional.engine, table_name, path,
+                                                    progress=lambda rows, fraction: state.update(rows=rows,
+                                                                                                 fraction=fraction))
+                state['result'] = state['importer'].run()
+            except Exception as exc:
+                state['error'] = exc
+
+        def poll():
+            progress_bar.set(state['fraction'])
+            progress_label.configure(text=f"Импортировано строк: {state['rows']}")
+            if state['error'] is not None:
+                mb.showerror('Ошибка', f'Ошибка при импорте {path}: {state["error"]}')
+                topframe.destroy()
+            elif state['result'] is not None:
+                if state['stopped']:
+                    mb.showinfo('Импорт остановлен', f'Импортировано {state["rows"]} строк. Повторный импорт того же '
+                                                      f'файла продолжится с места остановки')
+                else:
+                    mb.showinfo('Успех', f'Импортировано {state["result"]} строк в таблицу {combo.get()}')
+                topframe.destroy()
+            else:
+                topframe.after(200, poll)
+
+        def stop_import():
+            if state['importer'] is not None:
+                state['stopped'] = True
+                state['importer'].stop()
+
+        def get_info():
+            table_name = combo.get()
+            if not table_name:
+                mb.showwarning('Предупреждение', 'Вы не выбрали таблицу!')
+                return
+            choice_but.configure(text='Остановить', command=stop_import)
+            threading.Thread(target=run_import, args=(table_name,), daemon=True).start()
+            poll()
+
+        choice_but = ctk.CTkButton(frame, text='Импортировать', command=get_info)
+        choice_but.pack(pady=5)
+
+        topframe.update()
+        topframe.geometry(f"{topframe.winfo_reqwidth() + 30}x{topframe.winfo_reqheight() + 30}")
+        center(topframe)
+
+    @staticmethod
+    def _image_store_stats():
+        stats = ImageStore().stats()
+        mb.showinfo('Хранилище изображений',
+                    f"Изображений: {stats['blobs']} ({stats['stored_bytes'] / 2 ** 20:.1f} МБ)\n"
+                    f"Сохранений: {stats['puts']}, из них повторных: {stats['deduplicated']}\n"
+                    f"Сэкономлено: {stats['saved_bytes'] / 2 ** 20:.1f} МБ (x{stats['dedup_ratio']:.2f})\n"
+                    f"В архивах: {stats['archived']} ({stats['archive_bytes'] / 2 ** 20:.1f} МБ)")
+
+    def _start_maintenance(self):
+        # У фонового потока свой PartitionManager со своими MetaData: MetaData подключения интерфейса
+        # не потокобезопасны
+        manager = PartitionManager(self.db_funtional.engine)
+        summary = {}
+        thread = threading.Thread(target=self._maintain_partitions, args=(manager, summary), daemon=True)
+        thread.start()
+        self._poll_maintenance(thread, summary)
+
+    def _maintain_partitions(self, manager, summary):
+        try:
+            summary.update(manager.maintain())
+        except Exception as exc:
+            logger.error(f'Ошибка обслуживания секций базы данных {self.db_info["db_name"]}: {exc}')
+
+    def _poll_maintenance(self, thread, summary):
+        if thread.is_alive():
+            self.root.after(200, self._poll_maintenance, thread, summary)
+            return
+        # Удалённые секции не должны оставаться в отражённых метаданных; очистка - в потоке интерфейса
+        if summary.get('dropped') and self.db_funtional is not None:
+            self.db_funtional.metadata.clear()
+
+    def _partitions_info(self):
+        partitions = self.db_funtional.get_partitions()
+        if not partitions:
+            mb.showinfo('Секции', 'В базе данных нет таблиц, хранящихся по месяцам')
+            return
+        lines = [f'{row.table_name}: {row.period_start:%Y-%m}' +
+                 (' (изображения в архиве)' if row.images_offloaded else '') for row in partitions]
+        retention = f'{DB_RETENTION_DAYS} дней' if DB_RETENTION_DAYS else 'без ограничения'
+        offload = f'через {IMAGE_OFFLOAD_DAYS} дней' if IMAGE_OFFLOAD_DAYS is not None else 'отключён'
+        mb.showinfo('Секции', f'Срок хранения: {retention}, перенос изображений в архив: {offload}\n\n' +
+                    '\n'.join(lines))
+
+    def _image_store_gc(self):
+        store = ImageStore()
+        referenced = table_references() | self.db_funtional.get_image_hashes()
+        removed, freed = store.gc(referenced, dry_run=True)
+        if removed == 0:
+            mb.showinfo('Хранилище изображений', 'Неиспользуемых изображений нет')
+            return
+        ask_gc = mb.askyesno('Очистка хранилища',
+                             f'Изображений, на которые не ссылаются таблицы базы данных {self.db_info["db_name"]} '
+                             f'и файлы таблиц saved_data/tables: {removed} ({freed / 2 ** 20:.1f} МБ). Удалить их?')
+        if ask_gc:
+            removed, freed = store.gc(referenced)
+            mb.showinfo('Успех', f'Удалено {removed} изображений, освобождено {freed / 2 ** 20:.1f} МБ')
+
     def _view_table(self, name_table):
         topframe = tk.Toplevel(self.root)
         topframe.config(bg='black')
@@ -193,10 +355,55 @@ class DatabaseMenu:
         topframe.resizable(width=False, height=False)
         topframe.title(f'Таблица {name_table}')
 
-        df_table = self.db_funtional.get_table(name_table)
-        table_widget = Table(topframe, df_table)
+        filter_bar = ctk.CTkFrame(topframe)
+        filter_bar.pack(fill=tk.X)
+        ctk.CTkLabel(filter_bar, text='Класс').grid(column=0, row=0, padx=2)
+        class_menu = ctk.CTkOptionMenu(filter_bar, values=['Все', *CLASS_LIST], width=100)
+        class_menu.grid(column=0, row=1, padx=2)
+        ctk.CTkLabel(filter_bar, text='Уверенность от/до').grid(column=1, row=0, columnspan=2, padx=2)
+        min_conf_ent = ctk.CTkEntry(filter_bar, width=50)
+        min_conf_ent.grid(column=1, row=1, padx=2)
+        max_conf_ent = ctk.CTkEntry(filter_bar, width=50)
+        max_conf_ent.grid(column=2, row=1, padx=2)
+        ctk.CTkLabel(filter_bar, text='Период').grid(column=3, row=0, padx=2)
+        period_menu = ctk.CTkOptionMenu(filter_bar, values=list(PERIODS), width=120)
+        period_menu.grid(column=3, row=1, padx=2)
+        ctk.CTkLabel(filter_bar, text='Источник').grid(column=4, row=0, padx=2)
+        source_ent = ctk.CTkEntry(filter_bar, width=100)
+        source_ent.grid(column=4, row=1, padx=2)
+        ctk.CTkLabel(filter_bar, text='Площадь от/до').grid(column=5, row=0, columnspan=2, padx=2)
+        min_area_ent = ctk.CTkEntry(filter_bar, width=60)
+        min_area_ent.grid(column=5, row=1, padx=2)
+        max_area_ent = ctk.CTkEntry(filter_bar, width=60)
+        max_area_ent.grid(column=6, row=1, padx=2)
+        count_label = ctk.CTkLabel(topframe, text='')
+        count_label.pack()
+
+        query = DetectionQuery()
+        table_widget = Table(topframe, self.db_funtional.query_table(name_table, query))
         table_widget.table.configure(height=20)
         table_widget.pack()
+        count_label.configure(text=f'Найдено строк: {self.db_funtional.count(name_table, query)}')
+
+        def number(entry, cast=float):
+            value = entry.get().strip().replace(',', '.')
+            return cast(value) if value else None
+
+        def apply_filters():
+            try:
+                query = DetectionQuery(classes=None if class_menu.get() == 'Все' else [class_menu.get()],
+                                       min_confidence=number(min_conf_ent), max_confidence=number(max_conf_ent),
+                                       since=PERIODS[period_menu.get()],
+                                       sources=[source.strip() for source in source_ent.get().split(',')
+                                                if source.strip()],
+                                       min_area=number(min_area_ent, int), max_area=number(max_area_ent, int))
+                table_widget.update_rows(self.db_funtional.query_table(name_table, query))
+                count_label.configure(text=f'Найдено строк: {self.db_funtional.count(name_table, query)} '
+                                           f'(показано не более {query.limit})')
+            except ValueError as exc:
+                mb.showerror('Ошибка', f'Невозможно применить фильтры: {exc}')
+
+        ctk.CTkButton(filter_bar, text='Применить', command=apply_filters, width=90).grid(column=7, row=1, padx=4)
 
         topframe.update()
         topframe.geometry(f"{topframe.winfo_reqwidth()}x{topframe.winfo_reqheight()}")
@@ -1,8 +1,38 @@
 import pandas as pd
-from sqlalchemy import inspect, create_engine, Table, Column, Integer, String, Float, LargeBinary, MetaData
+from sqlalchemy import inspect, create_engine, select, update, bindparam, func, text, Table, Column, Index, Integer, \
+    String, Float, DateTime, MetaData
 from sqlalchemy.exc import OperationalError, ProgrammingError, InvalidRequestError
 from sqlalchemy_utils import create_database, database_exists, drop_database
-from logger.logger_config import logger
+from config import QUERY_CHUNK_SIZE, DB_PARTITIONED
+from utils.database.query_moduls import DetectionQuery
+from utils.database.image_store_moduls import ImageStore
+from logger.logger_config import get_logger
+
+logger = get_logger(__name__)
+
+
+def detection_table(table_name, metadata, partition_key=False, **kwargs):
+    """
+    Описание таблицы детекций.
+    :param partition_key: Включить detected_at в первичный ключ: секционированная таблица PostgreSQL требует, чтобы
+    ключ секционирования входил в каждый уникальный индекс.
+    :param kwargs: Параметры sqlalchemy.Table, например postgresql_partition_by.
+    """
+    return Table(table_name, metadata,
+                 Column('id', Integer, primary_key=True, autoincrement=True),
+                 Column('image_hash', String(64), nullable=False, index=True),
+                 Column('class_obj', String(20), nullable=False, index=True),
+                 Column('confidence', Float, nullable=False, index=True),
+                 Column('x_min', Integer, nullable=False),
+                 Column('y_min', Integer, nullable=False),
+                 Column('x_max', Integer, nullable=False),
+                 Column('y_max', Integer, nullable=False),
+                 Column('detected_at', DateTime, nullable=False, server_default=func.now(), index=True,
+                        primary_key=partition_key),
+                 Column('source', String(512), index=True),
+                 # Типичный запрос: класс за период, отсортированный по времени
+                 Index(f'ix_{table_name}_class_obj_detected_at', 'class_obj', 'detected_at'),
+                 **kwargs)
 
 
 class DatabaseFunctionality:
@@ -32,6 +62,7 @@ class DatabaseFunctionality:
         self.engine = None
         self.inspector = None
         self.metadata = None
+        self.partitions = None
 
     def create_database(self):
         db_url = f"://{self.db_user}:{self.db_password}@{self.db_host}:{self.db_port}/{self.db_name}"
@@ -78,25 +109,31 @@ class DatabaseFunctionality:
             logger.error(f'Базы данных {self.db_name} не существует')
             return False  # Такая БД уже есть, либо неправильно введены данные
 
-    def create_table(self, table_name):
+    def _partitions(self):
+        # Импорт здесь: partition_moduls сам использует detection_table и DatabaseFunctionality из этого модуля
+        from utils.database.partition_moduls import PartitionManager
+
+        if self.partitions is None or self.partitions.engine is not self.engine:
+            self.partitions = PartitionManager(self.engine)
+        return self.partitions
+
+    def create_table(self, table_name, partitioned=DB_PARTITIONED):
+        """
+        Создаёт таблицу детекций.
+        :param partitioned: Хранить таблицу по месяцам (utils.database.partition_moduls), чтобы старые данные
+        удалялись целыми секциями.
+        """
         assert isinstance(table_name, str), "Переменная table_name должна иметь тип str"
 
+        if partitioned:
+            return self._partitions().create_table(table_name)
+
         # if self.inspector.has_table(table_name):
         #     logger.error(f'В базе данных {self.db_name} уже имеется таблица с именем {table_name}')
         #     return False
         # else:
         try:
-            Table(table_name, self.metadata,
-                  Column('id', Integer, primary_key=True, autoincrement=True),
-                  Column('image', LargeBinary, nullable=False),
-                  Column('class_obj', String(20), nullable=False),
-                  Column('confidence', Float, nullable=False),
-                  Column('x_min', Integer, nullable=False),
-                  Column('y_min', Integer, nullable=False),
-                  Column('x_max', Integer, nullable=False),
-                  Column('y_max', Integer, nullable=False),
-                  )
-
+            detection_table(table_name, self.metadata)
             self.metadata.create_all(self.engine)
             self.metadata.reflect(bind=self.engine)
 
@@ -111,10 +148,18 @@ class DatabaseFunctionality:
         assert isinstance(df_data, pd.DataFrame), \
             "Переменная df_data должна иметь тип pd.DataFrame и включать в себя данные для внесения в таблицу"
 
+        if self.is_legacy_table(table_name):
+            logger.error(f'Таблица {table_name} базы данных {self.db_name} имеет старую схему (изображение в столбце '
+                         f'image вместо ссылки image_hash на хранилище изображений), данные не внесены. Обновите '
+                         f'её методом upgrade_table')
+            return False
         try:
-            with self.engine.connect() as conn:
-                df_data.to_sql(table_name, conn, if_exists="append", index=False)
-                conn.commit()
+            if self._partitions().is_partitioned(table_name):
+                self.partitions.insert(table_name, df_data)
+            else:
+                with self.engine.connect() as conn:
+                    df_data.to_sql(table_name, conn, if_exists="append", index=False)
+                    conn.commit()
 
             logger.info(f'Успешно внесение данных в таблицу {table_name} из базы данных {self.db_name}')
             return True
@@ -123,6 +168,69 @@ class DatabaseFunctionality:
                 f'Возникла ошибка {exc}. Ошибка при внесении данных в таблицу {table_name} из базы данных {self.db_name}')
             return False
 
+    def is_legacy_table(self, table_name):
+        """
+        Таблица схемы до хранилища изображений: кадр хранится в самой таблице (столбец image), а не ссылкой
+        image_hash на ImageStore.
+        """
+        inspector = inspect(self.engine)
+        if not inspector.has_table(table_name):
+            return False
+        columns = {column['name'] for column in inspector.get_columns(table_name)}
+        return 'image' in columns and 'image_hash' not in columns
+
+    def legacy_tables(self):
+        return [name for name in inspect(self.engine).get_table_names() if self.is_legacy_table(name)]
+
+    def upgrade_table(self, table_name, store=None, chunksize=QUERY_CHUNK_SIZE):
+        """
+        Переводит таблицу старой схемы на текущую: кадры из столбца image переносятся в хранилище изображений,
+        вместо них записывается image_hash, недостающие столбцы detected_at и source добавляются, столбец image
+        удаляется. Время детекции старых строк неизвестно, поэтому detected_at заполняется временем обновления.
+        Возвращает число перенесённых кадров.
+        """
+        assert isinstance(table_name, str), "Переменная table_name должна иметь тип str и обозначать имя таблицы"
+
+        if not self.is_legacy_table(table_name):
+            return 0
+        store = store or ImageStore()
+        dialect = self.engine.dialect
+        quote = dialect.identifier_preparer.quote
+        existing = {column['name'] for column in inspect(self.engine).get_columns(table_name)}
+        # Типы новых столбцов берутся из текущей схемы таблицы детекций
+        current = detection_table(table_name, MetaData())
+        with self.engine.begin() as conn:
+            for name in ('image_hash', 'detected_at', 'source'):
+                if name not in existing:
+                    conn.execute(text(f'ALTER TABLE {quote(table_name)} ADD {quote(name)} '
+                                      f'{current.c[name].type.compile(dialect=dialect)}'))
+
+        table = Table(table_name, MetaData(), autoload_with=self.engine)
+        statement = update(table).where(table.c.id == bindparam('row_id')).values(image_hash=bindparam('digest'))
+        moved = 0
+        while True:
+            with self.engine.connect() as conn:
+                rows = conn.execute(select(table.c.id, table.c.image).where(table.c.image_hash.is_(None))
+                                    .order_by(table.c.id).limit(chunksize)).fetchall()
+            if not rows:
+                break
+            values = [{'row_id': row_id, 'digest': store.put_bytes(image)} for row_id, image in rows]
+            with self.engine.begin() as conn:
+                conn.execute(statement, values)
+            moved += len(values)
+
+        with self.engine.begin() as conn:
+            conn.execute(update(table).where(table.c.detected_at.is_(None)).values(detected_at=func.now()))
+            conn.execute(text(f'ALTER TABLE {quote(table_name)} DROP COLUMN {quote("image")}'))
+            for index in current.indexes:
+                if any(column.name in ('image_hash', 'detected_at', 'source') for column in index.columns):
+                    index.create(conn, checkfirst=True)
+        if table_name in self.metadata.tables:
+            self.metadata.remove(self.metadata.tables[table_name])
+        logger.info(f'Таблица {table_name} базы данных {self.db_name} обновлена до текущей схемы: {moved} кадров '
+                    f'перенесено в хранилище изображений')
+        return moved
+
     def get_table(self, table_name):
         assert isinstance(table_name, str), "Переменная table_name должна иметь тип str и обозначать имя таблицы"
 
@@ -131,16 +239,83 @@ class DatabaseFunctionality:
         table_df = pd.read_sql_query(query, self.engine.connect())
         return table_df
 
+    def _reflect_table(self, table_name):
+        assert isinstance(table_name, str), "Переменная table_name должна иметь тип str и обозначать имя таблицы"
+
+        if table_name in self.metadata.tables:
+            return self.metadata.tables[table_name]
+        return Table(table_name, self.metadata, autoload_with=self.engine)
+
+    def iter_query(self, table_name, query=None, chunksize=QUERY_CHUNK_SIZE):
+        """
+        Выполняет выборку с фильтрами query на стороне базы данных и отдаёт результат частями по chunksize строк
+        через потоковый курсор, не загружая всю выборку в память.
+        :param table_name: Имя таблицы.
+        :param query: Экземпляр DetectionQuery или None - вся таблица.
+        :param chunksize: Число строк в одной части (pd.DataFrame).
+        """
+        assert query is None or isinstance(query, DetectionQuery), "query должен иметь тип DetectionQuery"
+
+        table = self._reflect_table(table_name)
+        statement = (query or DetectionQuery(limit=None)).select(table)
+        with self.engine.connect().execution_options(stream_results=True, max_row_buffer=chunksize) as conn:
+            for chunk in pd.read_sql_query(statement, conn, chunksize=chunksize):
+                yield chunk
+
+    def query_table(self, table_name, query=None, chunksize=QUERY_CHUNK_SIZE):
+        """
+        Выборка с фильтрами query одним pd.DataFrame (число строк ограничено query.limit).
+        """
+        chunks = list(self.iter_query(table_name, query, chunksize))
+        if not chunks:
+            return pd.DataFrame(columns=self._reflect_table(table_name).columns.keys())
+        table_df = pd.concat(chunks, ignore_index=True)
+        logger.info(f'Выборка из таблицы {table_name} базы данных {self.db_name}: {len(table_df)} строк')
+        return table_df
+
+    def count(self, table_name, query=None):
+        """
+        Число строк таблицы, удовлетворяющих фильтрам query, без их загрузки.
+        """
+        table = self._reflect_table(table_name)
+        statement = select(func.count()).select_from(table)
+        clauses = query.where(table) if query is not None else []
+        if clauses:
+            statement = statement.where(*clauses)
+        with self.engine.connect() as conn:
+            return conn.execute(statement).scalar()
+
+    def get_image_hashes(self):
+        """
+        Хеши изображений хранилища, на которые ссылаются таблицы базы данных (столбец image_hash).
+        """
+        self.metadata.reflect(bind=self.engine)
+        hashes = set()
+        with self.engine.connect() as conn:
+            for table in self.metadata.tables.values():
+                if 'image_hash' in table.columns:
+                    hashes.update(row[0] for row in conn.execute(select(table.c.image_hash).distinct()))
+        return hashes
+
     def get_table_names(self):
         # result = self.inspector.get_table_names()
-        self.metadata.reflect(bind=self.engine)
-        result = list(self.metadata.tables.keys())
+        # Представления нужны для таблиц, хранящихся по месяцам вне PostgreSQL
+        self.metadata.reflect(bind=self.engine, views=True)
+        # Служебные таблицы потокового импорта (utils.database.import_moduls) и секций, а также сами секции
+        # (utils.database.partition_moduls) не показываются
+        hidden = {'detection_imports', 'detection_partitions'} | self._partitions().partition_names()
+        result = [name for name in self.metadata.tables.keys() if name not in hidden]
         return result
 
     def delete_table(self, table_name):
         assert isinstance(table_name, str), "Переменная table_name должна иметь тип str и обозначать имя таблицы"
 
         try:
+            if self._partitions().is_partitioned(table_name):
+                result = self.partitions.drop_table(table_name)
+                # Удалённые секции не должны оставаться в отражённых метаданных
+                self.metadata.clear()
+                return result
             self.metadata.reflect(bind=self.engine)
             table_to_drop = self.metadata.tables[table_name]
             self.metadata.drop_all(bind=self.engine, tables=[table_to_drop])
@@ -153,6 +328,22 @@ class DatabaseFunctionality:
                 f'Возникла ошибка {exc}. Не получилось удалить таблицу {table_name} из базы данных {self.db_name}')
             return False
 
+    def get_partitions(self):
+        """
+        Секции таблиц, хранящихся по месяцам (строки служебной таблицы detection_partitions).
+        """
+        return self._partitions().partitions()
+
+    def maintain_partitions(self):
+        """
+        Создаёт секции вперёд, удаляет секции по сроку хранения и переносит старые изображения в архив.
+        """
+        summary = self._partitions().maintain()
+        # Удалённые секции не должны оставаться в отражённых метаданных
+        if summary['dropped']:
+            self.metadata.clear()
+        return summary
+
     def get_datbase_names(self):
         self.metadata.reflect(bind=self.engine)
         # schema_names = self.engine.dialect.get_schema_names(connection=self.engine.connect())
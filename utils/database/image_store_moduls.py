@@ -0,0 +1,389 @@
+"""
+Хранилище сохранённых кадров с адресацией по содержимому. Кадр кодируется один раз, файл называется SHA-256 хешем
+закодированных байт и раскладывается по подпапкам по первым символам хеша (saved_data/store/ab/cd/abcd....jpg).
+Таблицы (CSV, Parquet, SQL) хранят только хеш, поэтому один и тот же кадр на диске лежит в одном экземпляре.
+Изображения старых секций базы данных переносятся в сжатые архивы (utils.database.partition_moduls), и хранилище
+читает их оттуда так же, как из своих файлов.
+
+Команды:
+python -m utils.database.image_store_moduls stats
+python -m utils.database.image_store_moduls gc (--name DB [DB ...] --user U [--password P] | --no-db)
+    [--db-type postgresql] [--tables saved_data/tables] [--dry-run]
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import zipfile
+import cv2
+import numpy as np
+import pandas as pd
+from config import IMAGE_STORE_DIR, IMAGE_STORE_FORMAT, IMAGE_STORE_QUALITY, TABLES_DIR, IMAGE_ARCHIVE_DIR
+from logger.logger_config import get_logger
+
+logger = get_logger(__name__)
+
+# Формат: (расширение, флаг качества OpenCV или None)
+STORE_FORMATS = {'jpeg': ('.jpg', cv2.IMWRITE_JPEG_QUALITY),
+                 'webp': ('.webp', cv2.IMWRITE_WEBP_QUALITY),
+                 'png': ('.png', None),
+                 'jxl': ('.jxl', getattr(cv2, 'IMWRITE_JPEGXL_QUALITY', None))}
+STATS_FILE = 'stats.json'
+ARCHIVE_EXTENSION = '.zip'
+SHARD_DEPTH = 2
+TABLE_EXTENSIONS = ('.csv', '.parquet', '.arrow', '.feather')
+# Сигнатуры начала файла для определения формата уже закодированных изображений
+MAGIC_EXTENSIONS = ((b'\xff\xd8', '.jpg'), (b'\x89PNG', '.png'), (b'RIFF', '.webp'), (b'\xff\x0a', '.jxl'),
+                    (b'\x00\x00\x00\x0cJXL', '.jxl'))
+
+
+class ImageStore:
+
+    def __init__(self, root=IMAGE_STORE_DIR, image_format=IMAGE_STORE_FORMAT, quality=IMAGE_STORE_QUALITY,
+                 archive_dir=IMAGE_ARCHIVE_DIR):
+        """
+        Класс хранилища изображений с адресацией по содержимому.
+        :param root: Папка хранилища.
+        :param image_format: Формат кодирования кадров: "jpeg", "webp", "png" или "jxl" (JPEG XL, если OpenCV собран
+        с его поддержкой, иначе используется WebP).
+        :param quality: Качество кодирования (0-100) для форматов с потерями.
+        :param archive_dir: Папка архивов, из которых читаются изображения, перенесённые из хранилища.
+        """
+        assert image_format in STORE_FORMATS, f"image_format должен быть одним из {tuple(STORE_FORMATS)}"
+        assert isinstance(quality, int) and 0 <= quality <= 100, "quality должен иметь тип int и быть от 0 до 100"
+
+        if image_format == 'jxl' and not (STORE_FORMATS['jxl'][1] is not None and cv2.haveImageWriter('x.jxl')):
+            logger.warning('OpenCV собран без поддержки JPEG XL, кадры будут сохраняться в формате WebP')
+            image_format = 'webp'
+        self.root = root
+        self.image_format = image_format
+        self.quality = quality
+        self.extension = STORE_FORMATS[image_format][0]
+        self.archive_dir = archive_dir
+        self._lock = threading.Lock()
+        self._archive_index = {}
+        self._archive_mtime = None
+
+    def encode(self, image):
+        """
+        Кодирует кадр RGB (np.ndarray) в формат хранилища.
+        """
+        assert isinstance(image, np.ndarray), "image должен иметь тип np.ndarray"
+
+        flag = STORE_FORMATS[self.image_format][1]
+        params = [flag, self.quality] if flag is not None else []
+        bgr = cv2.cvtColor(image, cv2.COLOR_RGB2BGR) if image.ndim == 3 else image
+        ok, data = cv2.imencode(self.extension, bgr, params)
+        if not ok:
+            raise IOError(f'Не удалось закодировать кадр в формат {self.image_format}')
+        return data.tobytes()
+
+    def path(self, digest, extension=None):
+        shards = [digest[2 * i:2 * i + 2] for i in range(SHARD_DEPTH)]
+        return os.path.join(self.root, *shards, digest + (extension or self.extension))
+
+    def find(self, digest):
+        """
+        Путь к файлу с хешем digest в любом из форматов хранилища или None.
+        """
+        for extension, _ in STORE_FORMATS.values():
+            path = self.path(digest, extension)
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def __contains__(self, digest):
+        return self.find(digest) is not None
+
+    def __iter__(self):
+        """
+        Перебирает (хеш, путь) всех файлов хранилища.
+        """
+        if not os.path.isdir(self.root):
+            return
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                digest, extension = os.path.splitext(name)
+                if len(digest) == 64 and extension:
+                    yield digest, os.path.join(directory, name)
+
+    def put(self, image):
+        """
+        Кодирует кадр и сохраняет его, если такого содержимого в хранилище ещё нет. Возвращает хеш.
+        """
+        return self.put_bytes(self.encode(image))
+
+    def put_bytes(self, data, extension=None):
+        """
+        Сохраняет уже закодированное изображение. Возвращает SHA-256 хеш байт data.
+        :param extension: Расширение файла; по умолчанию определяется по сигнатуре data.
+        """
+        data = bytes(data)
+        digest = hashlib.sha256(data).hexdigest()
+        if extension is None:
+            extension = next((ext for magic, ext in MAGIC_EXTENSIONS if data.startswith(magic)), self.extension)
+        with self._lock:
+            stored = self.find(digest) is not None
+            if not stored:
+                path = self.path(digest, extension)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = path + '.tmp'
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            self._count(len(data), stored)
+        return digest
+
+    def get_bytes(self, digest):
+        path = self.find(digest)
+        if path is not None:
+            with open(path, 'rb') as f:
+                return f.read()
+        archived = self._archives().get(digest)
+        if archived is None:
+            raise KeyError(f'Изображения {digest} нет в хранилище {self.root} и в архивах {self.archive_dir}')
+        archive_path, entry = archived
+        with zipfile.ZipFile(archive_path) as archive:
+            return archive.read(entry)
+
+    def _archives(self):
+        """
+        Индекс {хеш: (путь к архиву, имя файла в архиве)}. Перестраивается только при изменении папки архивов.
+        """
+        try:
+            mtime = os.stat(self.archive_dir).st_mtime_ns
+        except OSError:
+            return {}
+        with self._lock:
+            if mtime != self._archive_mtime:
+                index = {}
+                for name in sorted(os.listdir(self.archive_dir)):
+                    if not name.endswith(ARCHIVE_EXTENSION):
+                        continue
+                    path = os.path.join(self.archive_dir, name)
+                    try:
+                        with zipfile.ZipFile(path) as archive:
+                            for entry in archive.namelist():
+                                index[os.path.splitext(entry)[0]] = (path, entry)
+                    except (OSError, zipfile.BadZipFile) as exc:
+                        logger.warning(f'Не удалось прочитать архив изображений {path}: {exc}')
+                self._archive_index, self._archive_mtime = index, mtime
+            return self._archive_index
+
+    def archive(self, name, digests):
+        """
+        Записывает изображения digests в сжатый архив archive_dir/name.zip, не удаляя их из хранилища. Изображения,
+        уже перенесённые в другие архивы, тоже копируются, чтобы архив можно было удалить независимо от остальных.
+        Возвращает путь к архиву, число изображений в нём и его объём в байтах.
+        """
+        os.makedirs(self.archive_dir, exist_ok=True)
+        path = os.path.join(self.archive_dir, name + ARCHIVE_EXTENSION)
+        tmp_path = path + '.tmp'
+        count = 0
+        with zipfile.ZipFile(tmp_path, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=9) as archive:
+            for digest in sorted(set(digests)):
+                stored = self.find(digest)
+                if stored is not None:
+                    archive.write(stored, os.path.basename(stored))
+                else:
+                    try:
+                        data = self.get_bytes(digest)
+                    except KeyError:
+                        logger.warning(f'Изображения {digest} нет ни в хранилище, ни в архивах')
+                        continue
+                    extension = next((ext for magic, ext in MAGIC_EXTENSIONS if data.startswith(magic)),
+                                     self.extension)
+                    archive.writestr(digest + extension, data)
+                count += 1
+        os.replace(tmp_path, path)
+        return path, count, os.path.getsize(path)
+
+    def drop_archive(self, name):
+        path = os.path.join(self.archive_dir, name + ARCHIVE_EXTENSION)
+        if os.path.isfile(path):
+            os.remove(path)
+            logger.info(f'Удалён архив изображений {path}')
+
+    def remove(self, digests):
+        """
+        Удаляет файлы изображений digests из хранилища (архивы не затрагиваются).
+        Возвращает число удалённых файлов и освобождённый объём в байтах.
+        """
+        removed, freed = 0, 0
+        with self._lock:
+            for digest in set(digests):
+                path = self.find(digest)
+                if path is None:
+                    continue
+                removed += 1
+                freed += os.path.getsize(path)
+                os.remove(path)
+            self._remove_empty_directories()
+        return removed, freed
+
+    def _remove_empty_directories(self):
+        for directory, subdirectories, files in os.walk(self.root, topdown=False):
+            if directory != self.root and not subdirectories and not files:
+                os.rmdir(directory)
+
+    def load(self, digest):
+        """
+        Декодированный кадр RGB по хешу.
+        """
+        image = cv2.imdecode(np.frombuffer(self.get_bytes(digest), np.uint8), cv2.IMREAD_COLOR)
+        return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+    def _stats_path(self):
+        return os.path.join(self.root, STATS_FILE)
+
+    def _read_counters(self):
+        try:
+            with open(self._stats_path(), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'puts': 0, 'put_bytes': 0, 'deduplicated': 0, 'deduplicated_bytes': 0}
+
+    def _count(self, size, deduplicated):
+        counters = self._read_counters()
+        counters['puts'] += 1
+        counters['put_bytes'] += size
+        counters['deduplicated'] += int(deduplicated)
+        counters['deduplicated_bytes'] += size if deduplicated else 0
+        os.makedirs(self.root, exist_ok=True)
+        with open(self._stats_path(), 'w', encoding='utf-8') as f:
+            json.dump(counters, f)
+
+    def stats(self):
+        """
+        Статистика хранилища: число файлов и их объём, число сохранений, сколько из них пришлось на уже
+        сохранённое содержимое и сколько байт благодаря этому не записано.
+        """
+        counters = self._read_counters()
+        blobs, stored_bytes = 0, 0
+        for _, path in self:
+            blobs += 1
+            stored_bytes += os.path.getsize(path)
+        archives = set(path for path, _ in self._archives().values())
+        return {'blobs': blobs,
+                'stored_bytes': stored_bytes,
+                'archived': len(self._archives()),
+                'archive_bytes': sum(os.path.getsize(path) for path in archives if os.path.isfile(path)),
+                'puts': counters['puts'],
+                'put_bytes': counters['put_bytes'],
+                'deduplicated': counters['deduplicated'],
+                'saved_bytes': counters['deduplicated_bytes'],
+                'dedup_ratio': counters['put_bytes'] / max(counters['put_bytes'] - counters['deduplicated_bytes'],
+                                                           1)}
+
+    def gc(self, referenced, dry_run=False):
+        """
+        Удаляет файлы, хеши которых не входят в referenced.
+        :param referenced: Множество хешей, на которые ссылаются таблицы.
+        :param dry_run: Только подсчитать, ничего не удаляя.
+        Возвращает число удалённых файлов и освобождённый объём в байтах.
+        """
+        referenced = set(referenced)
+        removed, freed = 0, 0
+        with self._lock:
+            for digest, path in list(self):
+                if digest in referenced:
+                    continue
+                removed += 1
+                freed += os.path.getsize(path)
+                if not dry_run:
+                    os.remove(path)
+            if not dry_run:
+                self._remove_empty_directories()
+        logger.info(f'Очистка хранилища {self.root}: {"найдено" if dry_run else "удалено"} {removed} '
+                    f'неиспользуемых изображений, {freed} байт')
+        return removed, freed
+
+
+def table_references(paths=(TABLES_DIR,)):
+    """
+    Хеши изображений, на которые ссылаются таблицы (столбец image_hash) в файлах CSV, Parquet и Arrow.
+    :param paths: Файлы таблиц или папки, в которых они ищутся рекурсивно.
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(directory, name) for directory, _, names in os.walk(path) for name in names)
+        elif os.path.isfile(path):
+            files.append(path)
+
+    referenced = set()
+    for path in files:
+        extension = os.path.splitext(path)[1].lower()
+        if extension not in TABLE_EXTENSIONS:
+            continue
+        try:
+            if extension == '.csv':
+                df = pd.read_csv(path, usecols=lambda column: column == 'image_hash')
+            elif extension == '.parquet':
+                df = pd.read_parquet(path, columns=['image_hash'])
+            else:
+                df = pd.read_feather(path, columns=['image_hash'])
+        except (OSError, ValueError, KeyError) as exc:
+            logger.warning(f'Не удалось прочитать ссылки на изображения из {path}: {exc}')
+            continue
+        if 'image_hash' in df:
+            referenced.update(df['image_hash'].dropna().astype(str))
+    return referenced
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Хранилище сохранённых кадров')
+    parser.add_argument('command', choices=('stats', 'gc'))
+    parser.add_argument('--root', default=IMAGE_STORE_DIR)
+    parser.add_argument('--archive-dir', default=IMAGE_ARCHIVE_DIR)
+    parser.add_argument('--tables', nargs='+', default=[TABLES_DIR],
+                        help='Файлы или папки таблиц, ссылки из которых сохраняются при очистке')
+    parser.add_argument('--db-type', default='postgresql', choices=('postgresql', 'mysql', 'mssql', 'oracle'))
+    parser.add_argument('--user', default=None)
+    parser.add_argument('--password', default='')
+    parser.add_argument('--name', nargs='+', default=[],
+                        help='Базы данных, ссылки из таблиц которых сохраняются при очистке')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', default='5432')
+    parser.add_argument('--no-db', action='store_true',
+                        help='Очистка только по файлам таблиц: изображения строк баз данных будут удалены')
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args(argv)
+    if args.name and args.user is None:
+        parser.error('для --name нужен --user')
+
+    store = ImageStore(args.root, archive_dir=args.archive_dir)
+    if args.command == 'gc':
+        referenced = table_references(args.tables)
+        if args.name:
+            # Импорт здесь: для статистики хранилища драйверы баз данных не нужны
+            from utils.database.database_moduls import DatabaseFunctionality
+
+            for name in args.name:
+                database = DatabaseFunctionality(args.db_type, {'db_user': args.user, 'db_password': args.password,
+                                                                'db_name': name, 'db_host': args.host,
+                                                                'db_port': args.port})
+                if database.connect_database() is False:
+                    print(f'Не удалось подключиться к базе данных {name}, очистка отменена')
+                    return 1
+                referenced |= database.get_image_hashes()
+        elif not args.no_db:
+            # Строки таблиц баз данных хранят только image_hash: без их ссылок очистка удалила бы их изображения
+            print('Укажите базы данных, ссылки из которых нужно сохранить (--name DB --user U ...), '
+                  'или --no-db, если изображения строк баз данных можно удалить')
+            return 2
+        removed, freed = store.gc(referenced, args.dry_run)
+        print(f'{"Будет удалено" if args.dry_run else "Удалено"} {removed} изображений, {freed / 1024:.1f} КБ')
+    stats = store.stats()
+    print(f"Изображений: {stats['blobs']}, {stats['stored_bytes'] / 1024:.1f} КБ; сохранений: {stats['puts']}, "
+          f"из них повторных: {stats['deduplicated']}; сэкономлено {stats['saved_bytes'] / 1024:.1f} КБ "
+          f"(x{stats['dedup_ratio']:.2f})")
+    if stats['archived']:
+        print(f"В архивах {args.archive_dir}: {stats['archived']} изображений, {stats['archive_bytes'] / 1024:.1f} КБ")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
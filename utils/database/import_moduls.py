@@ -0,0 +1,265 @@
+"""
+Потоковый импорт архивов детекций (CSV из ImageGUIDetect._save_table_csv, Parquet и Arrow из write_detections)
+в таблицу базы данных. Файл читается частями по IMPORT_CHUNK_SIZE строк, изображения из файла переносятся в
+хранилище ImageStore, а в таблицу записывается только их хеш, поэтому расход памяти не зависит от размера файла.
+Каждая часть записывается одной транзакцией вместе с отметкой о числе импортированных строк в служебной таблице
+detection_imports, поэтому прерванный импорт продолжается с первой незаписанной строки без повторов.
+
+Запуск: python -m utils.database.import_moduls PATH --table NAME --db-type postgresql --user U --password P
+--name DB --host H --port 5432
+"""
+import argparse
+import ast
+import os
+import sys
+import threading
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import Table, Column, String, BigInteger, Boolean, DateTime, MetaData, func, select, update
+from config import IMPORT_CHUNK_SIZE
+from utils.database.database_moduls import DatabaseFunctionality
+from utils.database.image_store_moduls import ImageStore
+from utils.database.partition_moduls import PartitionManager
+from utils.database.columnar_moduls import sidecar_dir, stored_images, is_arrow_file
+from logger.logger_config import get_logger
+
+logger = get_logger(__name__)
+
+IMPORT_PROGRESS_TABLE = 'detection_imports'
+IMPORT_EXTENSIONS = ('.csv', '.parquet', '.arrow', '.feather')
+# Parquet читается потоком через буфер этого размера, а не целыми столбцами группы строк
+PARQUET_BUFFER_SIZE = 2 ** 20
+
+
+def progress_table(metadata):
+    """
+    Служебная таблица с числом уже импортированных строк каждого файла.
+    """
+    if IMPORT_PROGRESS_TABLE in metadata.tables:
+        return metadata.tables[IMPORT_PROGRESS_TABLE]
+    return Table(IMPORT_PROGRESS_TABLE, metadata,
+                 Column('source', String(512), primary_key=True),
+                 Column('table_name', String(128), primary_key=True),
+                 Column('file_size', BigInteger, nullable=False),
+                 Column('rows_done', BigInteger, nullable=False),
+                 Column('finished', Boolean, nullable=False),
+                 Column('updated_at', DateTime, server_default=func.now(), onupdate=func.now()))
+
+
+class ArchiveImporter:
+
+    def __init__(self, engine, table_name, path, store=None, chunksize=IMPORT_CHUNK_SIZE, progress=None):
+        """
+        Класс потокового импорта файла детекций в таблицу базы данных.
+        :param engine: Подключение sqlalchemy.Engine.
+        :param table_name: Имя таблицы, созданной DatabaseFunctionality.create_table.
+        :param path: Путь к файлу CSV, Parquet или Arrow.
+        :param store: Хранилище изображений (по умолчанию ImageStore()).
+        :param chunksize: Число строк, записываемых одной транзакцией.
+        :param progress: Функция progress(rows_done, fraction), вызываемая после каждой части; fraction - доля
+        прочитанного файла от 0 до 1.
+        """
+        assert isinstance(table_name, str), "table_name должен иметь тип str"
+        assert os.path.splitext(path)[1].lower() in IMPORT_EXTENSIONS, \
+            f"Файл должен иметь одно из расширений {IMPORT_EXTENSIONS}"
+        assert isinstance(chunksize, int) and chunksize > 0, "chunksize должен иметь тип int и быть больше 0"
+
+        self.engine = engine
+        self.table_name = table_name
+        self.path = path
+        self.source = os.path.abspath(path)
+        self.file_size = os.path.getsize(path)
+        self.store = store or ImageStore()
+        self.chunksize = chunksize
+        self.progress = progress
+
+        self.metadata = MetaData()
+        self.table = Table(table_name, self.metadata, autoload_with=engine)
+        self.columns = [name for name in self.table.columns.keys() if name != 'id']
+        self.progress_table = progress_table(self.metadata)
+        # Таблицу, хранящуюся по месяцам, вне PostgreSQL нельзя дополнять через представление: строки
+        # раскладываются по таблицам месяцев
+        self.partitions = PartitionManager(engine, store=self.store)
+        self.partitioned = self.partitions.is_partitioned(table_name)
+        self.progress_table.create(engine, checkfirst=True)
+        self._stop = threading.Event()
+        self._last_image = None
+        self._last_hash = None
+
+    def stop(self):
+        """
+        Останавливает импорт после записи текущей части; позже его можно продолжить повторным вызовом run.
+        """
+        self._stop.set()
+
+    def _checkpoint(self):
+        key = (self.progress_table.c.source == self.source) & (self.progress_table.c.table_name == self.table_name)
+        with self.engine.begin() as conn:
+            row = conn.execute(select(self.progress_table).where(key)).first()
+            if row is None:
+                conn.execute(self.progress_table.insert().values(source=self.source, table_name=self.table_name,
+                                                                 file_size=self.file_size, rows_done=0,
+                                                                 finished=False))
+                return 0, False
+        if row.file_size != self.file_size:
+            raise ValueError(f'Файл {self.path} изменился после начала импорта в таблицу {self.table_name} '
+                             f'({row.rows_done} строк уже импортировано)')
+        return row.rows_done, row.finished
+
+    def _commit(self, chunk, rows_done, finished=False):
+        key = (self.progress_table.c.source == self.source) & (self.progress_table.c.table_name == self.table_name)
+        columns = [name for name in self.columns if name in chunk]
+        records = [dict(zip(columns, values)) for values in zip(*(chunk[name].tolist() for name in columns))]
+        routed = self.partitions.route(self.table_name, records) if self.partitioned else {self.table: records}
+        with self.engine.begin() as conn:
+            if self.partitioned:
+                self.partitions.allocate_ids(conn, self.table_name, records)
+            for table, rows in routed.items():
+                if rows:
+                    conn.execute(table.insert(), rows)
+            conn.execute(update(self.progress_table).where(key).values(rows_done=rows_done, finished=finished))
+
+    def _image_from_text(self, value):
+        """
+        Хеш изображения из CSV, где байты записаны строкой "b'...'". Подряд идущие строки одного снимка содержат
+        одинаковое изображение, поэтому строка разбирается и сохраняется в хранилище только при его смене.
+        """
+        if value != self._last_image:
+            self._last_hash = self.store.put_bytes(ast.literal_eval(value))
+            self._last_image = value
+        return self._last_hash
+
+    def _csv_chunks(self, start):
+        with open(self.path, 'rb') as f:
+            reader = pd.read_csv(f, chunksize=self.chunksize, skiprows=range(1, start + 1))
+            for chunk in reader:
+                chunk = chunk.drop(columns=[name for name in chunk if name.startswith('Unnamed')])
+                if 'image' in chunk:
+                    chunk['image_hash'] = [self._image_from_text(value) for value in chunk.pop('image')]
+                if 'detected_at' in chunk:
+                    chunk['detected_at'] = pd.to_datetime(chunk['detected_at'])
+                yield chunk, min(f.tell() / max(self.file_size, 1), 1.0)
+
+    def _arrow_batches(self, start):
+        """
+        Пакеты строк Parquet/Arrow начиная со строки start вместе с долей прочитанного файла.
+        """
+        if is_arrow_file(self.path):
+            reader = pa.ipc.open_file(pa.OSFile(self.path))
+            groups = reader.num_record_batches
+            offset = 0
+            batches = ((reader.get_batch(i), (i + 1) / groups) for i in range(groups))
+        else:
+            parquet = pq.ParquetFile(self.path, pre_buffer=False, buffer_size=PARQUET_BUFFER_SIZE)
+            groups = parquet.num_row_groups
+            total = parquet.metadata.num_rows
+            # Группы строк, целиком импортированные раньше, не читаются
+            first_group, offset = 0, 0
+            while first_group < groups and offset + parquet.metadata.row_group(first_group).num_rows <= start:
+                offset += parquet.metadata.row_group(first_group).num_rows
+                first_group += 1
+            batches = parquet.iter_batches(batch_size=self.chunksize, row_groups=range(first_group, groups))
+            batches = self._with_fraction(batches, offset, total)
+
+        position = offset
+        for batch, fraction in batches:
+            # Позиция сдвигается на полную длину пакета, а не на длину его непрочитанной части
+            rows = batch.num_rows
+            if position + rows > start:
+                batch = batch.slice(max(start - position, 0))
+                for i in range(0, batch.num_rows, self.chunksize):
+                    yield batch.slice(i, self.chunksize), fraction
+            position += rows
+
+    @staticmethod
+    def _with_fraction(batches, offset, total):
+        position = offset
+        for batch in batches:
+            position += batch.num_rows
+            yield batch, position / max(total, 1)
+
+    def _columnar_chunks(self, start):
+        storage = stored_images(self.path)
+        for batch, fraction in self._arrow_batches(start):
+            hashes = batch.column('image_hash').to_pylist()
+            if storage == 'blob':
+                for data in batch.column('image').to_pylist():
+                    if data is not None:
+                        self.store.put_bytes(data)
+            elif storage == 'sidecar':
+                for digest in set(hashes):
+                    if digest not in self.store:
+                        with open(os.path.join(sidecar_dir(self.path), digest + '.jpg'), 'rb') as f:
+                            self.store.put_bytes(f.read())
+            chunk = pd.DataFrame({name: batch.column(name).to_pandas() for name in batch.schema.names
+                                  if name != 'image'})
+            for name in ('class_obj', 'source'):
+                if name in chunk:
+                    chunk[name] = chunk[name].astype(str)
+            yield chunk, fraction
+
+    def run(self):
+        """
+        Импортирует файл с места остановки. Возвращает число строк, записанных при этом вызове.
+        """
+        rows_done, finished = self._checkpoint()
+        if finished:
+            logger.info(f'Файл {self.path} уже импортирован в таблицу {self.table_name}')
+            return 0
+        if rows_done:
+            logger.info(f'Продолжение импорта {self.path} в таблицу {self.table_name} со строки {rows_done}')
+
+        self._stop.clear()
+        chunks = self._csv_chunks(rows_done) if self.path.lower().endswith('.csv') else \
+            self._columnar_chunks(rows_done)
+        imported = 0
+        for chunk, fraction in chunks:
+            rows_done += len(chunk)
+            imported += len(chunk)
+            self._commit(chunk, rows_done)
+            if self.progress is not None:
+                self.progress(rows_done, fraction)
+            if self._stop.is_set():
+                logger.info(f'Импорт {self.path} остановлен на строке {rows_done}')
+                return imported
+        self._commit(pd.DataFrame(), rows_done, finished=True)
+        logger.info(f'Файл {self.path} импортирован в таблицу {self.table_name}: {rows_done} строк')
+        return imported
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Потоковый импорт архива детекций в базу данных')
+    parser.add_argument('path')
+    parser.add_argument('--table', required=True)
+    parser.add_argument('--db-type', default='postgresql', choices=('postgresql', 'mysql', 'mssql', 'oracle'))
+    parser.add_argument('--user', required=True)
+    parser.add_argument('--password', default='')
+    parser.add_argument('--name', required=True)
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', default='5432')
+    parser.add_argument('--chunksize', type=int, default=IMPORT_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    database = DatabaseFunctionality(args.db_type, {'db_user': args.user, 'db_password': args.password,
+                                                    'db_name': args.name, 'db_host': args.host,
+                                                    'db_port': args.port})
+    if database.connect_database() is False:
+        print(f'Не удалось подключиться к базе данных {args.name}')
+        return 1
+
+    def report(rows_done, fraction):
+        print(f'\r{rows_done} строк ({fraction:.1%})', end='', flush=True)
+
+    importer = ArchiveImporter(database.engine, args.table, args.path, chunksize=args.chunksize, progress=report)
+    try:
+        importer.run()
+    except KeyboardInterrupt:
+        print('\nИмпорт прерван, при повторном запуске он продолжится с места остановки')
+        return 1
+    print()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
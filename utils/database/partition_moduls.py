@@ -0,0 +1,437 @@
+"""
+Хранение таблиц детекций по месяцам, чтобы старые данные удалялись целыми секциями, а не построчно.
+
+PostgreSQL: декларативное секционирование PARTITION BY RANGE (detected_at), одна секция на месяц. Остальные СУБД:
+отдельная таблица на месяц <таблица>_pГГГГММ и представление <таблица> (UNION ALL всех месяцев), через которое
+работают выборки DatabaseFunctionality и DetectionQuery; строки при вставке раскладываются по таблицам месяцев,
+а id строк выдаёт счётчик служебной таблицы detection_ids, чтобы они не повторялись в представлении.
+Секции учитываются в служебной таблице detection_partitions.
+
+Обслуживание (maintain, вызывается при подключении к базе данных и из командной строки):
+- секции создаются на DB_PARTITION_MONTHS_AHEAD месяцев вперёд, а также при вставке строк за месяц без секции;
+- секции, закончившиеся больше DB_RETENTION_DAYS дней назад, удаляются DROP TABLE вместе с их архивом;
+- изображения секций, закончившихся больше IMAGE_OFFLOAD_DAYS дней назад, переносятся из хранилища ImageStore
+  в архив IMAGE_ARCHIVE_DIR/<секция>.zip, из которого хранилище читает их прозрачно.
+None в DB_RETENTION_DAYS и IMAGE_OFFLOAD_DAYS отключает соответствующее правило.
+
+Запуск: python -m utils.database.partition_moduls maintain --db-type postgresql --user U --password P --name DB
+--host H --port 5432 [--retention-days 365] [--offload-days 90]
+"""
+import argparse
+import sys
+from datetime import datetime
+import pandas as pd
+from sqlalchemy import Table, Column, String, Boolean, BigInteger, DateTime, MetaData, func, inspect, select, delete, \
+    update, union_all, text
+from sqlalchemy.exc import IntegrityError
+from config import DB_PARTITION_MONTHS_AHEAD, DB_RETENTION_DAYS, IMAGE_OFFLOAD_DAYS
+from utils.database.database_moduls import DatabaseFunctionality, detection_table
+from utils.database.image_store_moduls import ImageStore
+from logger.logger_config import get_logger
+
+logger = get_logger(__name__)
+
+PARTITION_REGISTRY_TABLE = 'detection_partitions'
+ID_COUNTER_TABLE = 'detection_ids'
+# Число хешей в одном условии IN при поиске изображений, на которые ссылаются другие секции
+HASH_BATCH_SIZE = 1000
+# Создание или замена представления; для остальных диалектов представление удаляется и создаётся заново
+VIEW_STATEMENTS = {'postgresql': 'CREATE OR REPLACE VIEW', 'mysql': 'CREATE OR REPLACE VIEW',
+                   'oracle': 'CREATE OR REPLACE VIEW', 'mssql': 'CREATE OR ALTER VIEW'}
+
+
+def month_start(moment):
+    return datetime(moment.year, moment.month, 1)
+
+
+def add_months(start, months):
+    month = start.month - 1 + months
+    return datetime(start.year + month // 12, month % 12 + 1, 1)
+
+
+def partition_name(table_name, start):
+    return f'{table_name}_p{start:%Y%m}'
+
+
+def registry_table(metadata):
+    """
+    Служебная таблица секций: месяц каждой секции и признак переноса её изображений в архив.
+    """
+    if PARTITION_REGISTRY_TABLE in metadata.tables:
+        return metadata.tables[PARTITION_REGISTRY_TABLE]
+    return Table(PARTITION_REGISTRY_TABLE, metadata,
+                 Column('partition_name', String(128), primary_key=True),
+                 Column('table_name', String(128), nullable=False, index=True),
+                 Column('period_start', DateTime, nullable=False),
+                 Column('period_end', DateTime, nullable=False),
+                 Column('images_offloaded', Boolean, nullable=False, default=False),
+                 Column('created_at', DateTime, server_default=func.now()))
+
+
+def id_counter_table(metadata):
+    """
+    Служебная таблица со следующим свободным id каждой таблицы, хранящейся по месяцам вне PostgreSQL.
+    """
+    if ID_COUNTER_TABLE in metadata.tables:
+        return metadata.tables[ID_COUNTER_TABLE]
+    return Table(ID_COUNTER_TABLE, metadata,
+                 Column('table_name', String(128), primary_key=True),
+                 Column('next_id', BigInteger, nullable=False))
+
+
+class PartitionManager:
+
+    def __init__(self, engine, retention_days=DB_RETENTION_DAYS, offload_days=IMAGE_OFFLOAD_DAYS,
+                 months_ahead=DB_PARTITION_MONTHS_AHEAD, store=None):
+        """
+        Класс, создающий, обслуживающий и удаляющий помесячные секции таблиц детекций.
+        :param engine: Подключение sqlalchemy.Engine.
+        :param retention_days: Срок хранения: секции, закончившиеся раньше, удаляются; None - хранить всё.
+        :param offload_days: Через сколько дней после окончания секции её изображения переносятся в архив;
+        None - не переносить.
+        :param months_ahead: На сколько месяцев вперёд создаются секции.
+        :param store: Хранилище изображений (по умолчанию ImageStore()).
+        """
+        assert retention_days is None or retention_days > 0, "retention_days должен быть больше 0 или None"
+        assert offload_days is None or offload_days >= 0, "offload_days должен быть неотрицательным или None"
+        assert isinstance(months_ahead, int) and months_ahead >= 0, \
+            "months_ahead должен иметь тип int и быть неотрицательным"
+
+        self.engine = engine
+        self.retention_days = retention_days
+        self.offload_days = offload_days
+        self.months_ahead = months_ahead
+        self.store = store or ImageStore()
+        # Родная поддержка секций есть только у PostgreSQL, остальные СУБД получают таблицы по месяцам
+        self.native = engine.dialect.name == 'postgresql'
+
+        self.metadata = MetaData()
+        self.registry = registry_table(self.metadata)
+        self.counters = id_counter_table(self.metadata)
+        self._seeded = set()
+
+    def _quote(self, name):
+        return self.engine.dialect.identifier_preparer.quote(name)
+
+    def _has_registry(self):
+        return inspect(self.engine).has_table(PARTITION_REGISTRY_TABLE)
+
+    def partitions(self, table_name=None):
+        """
+        Секции таблицы table_name (или всех таблиц), упорядоченные по месяцу.
+        """
+        if not self._has_registry():
+            return []
+        statement = select(self.registry).order_by(self.registry.c.table_name, self.registry.c.period_start)
+        if table_name is not None:
+            statement = statement.where(self.registry.c.table_name == table_name)
+        with self.engine.connect() as conn:
+            return conn.execute(statement).fetchall()
+
+    def partition_names(self):
+        return {row.partition_name for row in self.partitions()}
+
+    def table_names(self):
+        return sorted({row.table_name for row in self.partitions()})
+
+    def is_partitioned(self, table_name):
+        return bool(self.partitions(table_name))
+
+    def _table(self, name):
+        if name in self.metadata.tables:
+            return self.metadata.tables[name]
+        return Table(name, self.metadata, autoload_with=self.engine)
+
+    def create_table(self, table_name):
+        """
+        Создаёт таблицу, хранящуюся по месяцам, с секциями от текущего месяца на months_ahead месяцев вперёд.
+        """
+        assert isinstance(table_name, str), "Переменная table_name должна иметь тип str"
+
+        if inspect(self.engine).has_table(table_name) or table_name in inspect(self.engine).get_view_names():
+            logger.error(f'В базе данных уже имеется таблица с именем {table_name}')
+            return False
+        self.registry.create(self.engine, checkfirst=True)
+        if self.native:
+            detection_table(table_name, self.metadata, partition_key=True,
+                            postgresql_partition_by='RANGE (detected_at)').create(self.engine)
+        self.ensure(table_name)
+        logger.info(f'Успешное создание таблицы {table_name}, хранящейся по месяцам')
+        return True
+
+    def ensure(self, table_name, months=()):
+        """
+        Создаёт недостающие секции для месяцев months (datetime внутри месяца) и для месяцев от текущего на
+        months_ahead вперёд. Возвращает имена созданных секций.
+        """
+        current = month_start(datetime.now())
+        starts = {add_months(current, i) for i in range(self.months_ahead + 1)}
+        starts.update(month_start(moment) for moment in months)
+        existing = {row.period_start for row in self.partitions(table_name)}
+        created = []
+        for start in sorted(starts - existing):
+            name = partition_name(table_name, start)
+            end = add_months(start, 1)
+            with self.engine.begin() as conn:
+                if self.native:
+                    conn.execute(text(f'CREATE TABLE IF NOT EXISTS {self._quote(name)} PARTITION OF '
+                                      f'{self._quote(table_name)} FOR VALUES FROM '
+                                      f"('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"))
+                else:
+                    table = self.metadata.tables.get(name)
+                    (table if table is not None else detection_table(name, self.metadata)).create(conn, checkfirst=True)
+                conn.execute(self.registry.insert().values(partition_name=name, table_name=table_name,
+                                                           period_start=start, period_end=end,
+                                                           images_offloaded=False))
+            created.append(name)
+        if created:
+            if not self.native:
+                self._refresh_view(table_name)
+            logger.info(f'Созданы секции таблицы {table_name}: {", ".join(created)}')
+        if not self.native:
+            self._seed_ids(table_name)
+        return created
+
+    def _refresh_view(self, table_name):
+        """
+        Пересоздаёт представление table_name над таблицами месяцев (только вне PostgreSQL).
+        """
+        names = [row.partition_name for row in self.partitions(table_name)]
+        statement = union_all(*(select(self._table(name)) for name in names)) if len(names) > 1 else \
+            select(self._table(names[0]))
+        body = str(statement.compile(self.engine, compile_kwargs={'literal_binds': True}))
+        view = self._quote(table_name)
+        with self.engine.begin() as conn:
+            if self.engine.dialect.name in VIEW_STATEMENTS:
+                conn.execute(text(f'{VIEW_STATEMENTS[self.engine.dialect.name]} {view} AS {body}'))
+            else:
+                conn.execute(text(f'DROP VIEW IF EXISTS {view}'))
+                conn.execute(text(f'CREATE VIEW {view} AS {body}'))
+
+    def _seed_ids(self, table_name):
+        """
+        Заводит счётчик id таблицы, если его ещё нет: счёт продолжает наибольший id всех месяцев (таблицы,
+        созданные до появления счётчика). Если счётчик одновременно завёл другой процесс, его значение остаётся.
+        """
+        if table_name in self._seeded:
+            return
+        self.counters.create(self.engine, checkfirst=True)
+        key = self.counters.c.table_name == table_name
+        with self.engine.connect() as conn:
+            exists = conn.execute(select(self.counters.c.next_id).where(key)).first() is not None
+        if not exists:
+            names = [row.partition_name for row in self.partitions(table_name)]
+            try:
+                with self.engine.begin() as conn:
+                    last = max((conn.execute(select(func.max(self._table(name).c.id))).scalar() or 0
+                                for name in names), default=0)
+                    conn.execute(self.counters.insert().values(table_name=table_name, next_id=last + 1))
+            except IntegrityError:
+                pass
+        self._seeded.add(table_name)
+
+    def allocate_ids(self, conn, table_name, records):
+        """
+        Назначает id строкам records без id в транзакции conn, в которой они вставляются (только вне PostgreSQL:
+        у каждой таблицы месяца свой автоинкремент). UPDATE счётчика блокирует его строку до конца транзакции,
+        поэтому одновременные записи из интерфейса и импорта получают разные id, а при откате транзакции
+        выданные id возвращаются.
+        """
+        missing = [record for record in records if record.get('id') is None]
+        if self.native or not missing:
+            return
+        key = self.counters.c.table_name == table_name
+        conn.execute(update(self.counters).where(key).values(next_id=self.counters.c.next_id + len(missing)))
+        first = conn.execute(select(self.counters.c.next_id).where(key)).scalar() - len(missing)
+        for i, record in enumerate(missing):
+            record['id'] = first + i
+
+    def route(self, table_name, records):
+        """
+        Создаёт недостающие секции для строк records (список словарей) и раскладывает строки по таблицам, в которые
+        их нужно вставлять: {sqlalchemy.Table: строки}. В PostgreSQL строки вставляются в саму таблицу, и по
+        секциям их раскладывает СУБД. Строкам без detected_at проставляется текущее время. Вне PostgreSQL id строкам
+        назначает allocate_ids в транзакции вставки.
+        """
+        now = datetime.now()
+        for record in records:
+            moment = record.get('detected_at')
+            record['detected_at'] = now if moment is None or pd.isna(moment) else pd.Timestamp(moment).to_pydatetime()
+        self.ensure(table_name, {record['detected_at'] for record in records})
+        if self.native:
+            return {self._table(table_name): records} if records else {}
+        routed = {}
+        for record in records:
+            name = partition_name(table_name, month_start(record['detected_at']))
+            routed.setdefault(name, []).append(record)
+        return {self._table(name): rows for name, rows in routed.items()}
+
+    def insert(self, table_name, df_data):
+        """
+        Вносит строки pd.DataFrame в таблицу, хранящуюся по месяцам. Возвращает число внесённых строк.
+        """
+        # tolist переводит значения numpy в типы Python, которые принимают драйверы СУБД
+        columns = list(df_data.columns)
+        records = [dict(zip(columns, values)) for values in zip(*(df_data[name].tolist() for name in columns))]
+        routed = self.route(table_name, records)
+        with self.engine.begin() as conn:
+            self.allocate_ids(conn, table_name, records)
+            for table, rows in routed.items():
+                conn.execute(table.insert(), rows)
+        return len(records)
+
+    def _expired(self, table_name, days, now):
+        if days is None:
+            return []
+        return [row for row in self.partitions(table_name)
+                if (now - row.period_end).total_seconds() > days * 86400]
+
+    def _hashes(self, name, among=None):
+        table = self._table(name)
+        statement = select(table.c.image_hash).distinct()
+        with self.engine.connect() as conn:
+            if among is None:
+                return {row[0] for row in conn.execute(statement)}
+            among = sorted(among)
+            found = set()
+            for i in range(0, len(among), HASH_BATCH_SIZE):
+                batch = among[i:i + HASH_BATCH_SIZE]
+                found.update(row[0] for row in conn.execute(statement.where(table.c.image_hash.in_(batch))))
+            return found
+
+    def offload_images(self, table_name=None, now=None):
+        """
+        Переносит изображения секций старше offload_days в сжатые архивы. Изображения, на которые ещё ссылаются
+        строки секций, не перенесённых в архив, остаются и в хранилище. Возвращает число перенесённых секций и
+        освобождённый в хранилище объём в байтах.
+        """
+        now = now or datetime.now()
+        offloaded, freed = 0, 0
+        for row in self._expired(table_name, self.offload_days, now):
+            if row.images_offloaded:
+                continue
+            hashes = self._hashes(row.partition_name)
+            path, count, size = self.store.archive(row.partition_name, hashes)
+            with self.engine.begin() as conn:
+                conn.execute(update(self.registry).where(self.registry.c.partition_name == row.partition_name)
+                             .values(images_offloaded=True))
+            keep = set()
+            for other in self.partitions():
+                if not other.images_offloaded and other.partition_name != row.partition_name:
+                    keep |= self._hashes(other.partition_name, hashes - keep)
+            removed, removed_bytes = self.store.remove(hashes - keep)
+            offloaded += 1
+            freed += removed_bytes
+            logger.info(f'Изображения секции {row.partition_name} перенесены в архив {path}: {count} изображений, '
+                        f'{size / 2 ** 20:.1f} МБ; из хранилища удалено {removed} ({removed_bytes / 2 ** 20:.1f} МБ)')
+        return offloaded, freed
+
+    def _drop_partition(self, table_name, name):
+        if not self.native:
+            # Сначала представление перестаёт ссылаться на таблицу месяца, потом она удаляется
+            with self.engine.begin() as conn:
+                conn.execute(delete(self.registry).where(self.registry.c.partition_name == name))
+            if self.partitions(table_name):
+                self._refresh_view(table_name)
+            else:
+                with self.engine.begin() as conn:
+                    conn.execute(text(f'DROP VIEW {self._quote(table_name)}'))
+        with self.engine.begin() as conn:
+            conn.execute(text(f'DROP TABLE {self._quote(name)}'))
+            if self.native:
+                conn.execute(delete(self.registry).where(self.registry.c.partition_name == name))
+        if name in self.metadata.tables:
+            self.metadata.remove(self.metadata.tables[name])
+        self.store.drop_archive(name)
+
+    def apply_retention(self, table_name=None, now=None):
+        """
+        Удаляет секции, закончившиеся больше retention_days дней назад. Возвращает имена удалённых секций.
+        """
+        now = now or datetime.now()
+        dropped = []
+        for row in self._expired(table_name, self.retention_days, now):
+            self._drop_partition(row.table_name, row.partition_name)
+            dropped.append(row.partition_name)
+        if dropped:
+            logger.info(f'По сроку хранения {self.retention_days} дней удалены секции: {", ".join(dropped)}')
+        return dropped
+
+    def drop_table(self, table_name):
+        """
+        Удаляет таблицу со всеми секциями и их архивами изображений.
+        """
+        try:
+            names = [row.partition_name for row in self.partitions(table_name)]
+            if self.native:
+                with self.engine.begin() as conn:
+                    conn.execute(text(f'DROP TABLE {self._quote(table_name)}'))
+                    conn.execute(delete(self.registry).where(self.registry.c.table_name == table_name))
+                for name in names:
+                    self.store.drop_archive(name)
+            else:
+                for name in names:
+                    self._drop_partition(table_name, name)
+                if inspect(self.engine).has_table(ID_COUNTER_TABLE):
+                    with self.engine.begin() as conn:
+                        conn.execute(delete(self.counters).where(self.counters.c.table_name == table_name))
+                self._seeded.discard(table_name)
+            for name in (table_name, *names):
+                if name in self.metadata.tables:
+                    self.metadata.remove(self.metadata.tables[name])
+            logger.info(f'Успешное удаление таблицы {table_name} и её {len(names)} секций')
+            return True
+        except Exception as exc:
+            logger.error(f'Возникла ошибка {exc}. Не получилось удалить таблицу {table_name}')
+            return False
+
+    def maintain(self, now=None):
+        """
+        Создаёт секции вперёд, переносит старые изображения в архив и удаляет секции по сроку хранения для всех
+        таблиц, хранящихся по месяцам. Возвращает {'created': [...], 'offloaded': n, 'freed': байт, 'dropped': [...]}.
+        """
+        now = now or datetime.now()
+        summary = {'created': [], 'offloaded': 0, 'freed': 0, 'dropped': []}
+        for table_name in self.table_names():
+            summary['created'] += self.ensure(table_name)
+            # Сначала удаляются секции по сроку хранения, чтобы не переносить в архив их изображения
+            summary['dropped'] += self.apply_retention(table_name, now)
+            offloaded, freed = self.offload_images(table_name, now)
+            summary['offloaded'] += offloaded
+            summary['freed'] += freed
+        return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Обслуживание таблиц детекций, хранящихся по месяцам')
+    parser.add_argument('command', choices=('maintain', 'list'))
+    parser.add_argument('--db-type', default='postgresql', choices=('postgresql', 'mysql', 'mssql', 'oracle'))
+    parser.add_argument('--user', required=True)
+    parser.add_argument('--password', default='')
+    parser.add_argument('--name', required=True)
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', default='5432')
+    parser.add_argument('--retention-days', type=float, default=DB_RETENTION_DAYS)
+    parser.add_argument('--offload-days', type=float, default=IMAGE_OFFLOAD_DAYS)
+    args = parser.parse_args(argv)
+
+    database = DatabaseFunctionality(args.db_type, {'db_user': args.user, 'db_password': args.password,
+                                                    'db_name': args.name, 'db_host': args.host,
+                                                    'db_port': args.port})
+    if database.connect_database() is False:
+        print(f'Не удалось подключиться к базе данных {args.name}')
+        return 1
+
+    manager = PartitionManager(database.engine, args.retention_days, args.offload_days)
+    if args.command == 'maintain':
+        summary = manager.maintain()
+        print(f"Создано секций: {len(summary['created'])}, изображения перенесены в архив: {summary['offloaded']} "
+              f"секций ({summary['freed'] / 2 ** 20:.1f} МБ), удалено секций: {len(summary['dropped'])}")
+    for row in manager.partitions():
+        print(f'{row.table_name}: {row.partition_name} {row.period_start:%Y-%m-%d} - {row.period_end:%Y-%m-%d}'
+              f'{" (изображения в архиве)" if row.images_offloaded else ""}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
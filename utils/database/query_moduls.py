@@ -0,0 +1,141 @@
+from datetime import datetime, timedelta
+import pyarrow.compute as pc
+from sqlalchemy import select, and_
+from config import QUERY_MAX_ROWS
+
+ORDER_COLUMNS = ('detected_at', 'confidence', 'class_obj', 'source', 'id')
+
+
+class DetectionQuery:
+
+    def __init__(self, classes=None, min_confidence=None, max_confidence=None, since=None, until=None, sources=None,
+                 min_area=None, max_area=None, order_by='detected_at', descending=True, limit=QUERY_MAX_ROWS):
+        """
+        Класс, описывающий выборку детекций с фильтрами, которые выполняются на стороне базы данных
+        (или при чтении Parquet), а не после загрузки всей таблицы в pandas. Незаданный фильтр не применяется.
+        :param classes: Список классов (class_obj).
+        :param min_confidence: Нижняя граница уверенности (включительно).
+        :param max_confidence: Верхняя граница уверенности (включительно).
+        :param since: Начало временного окна (datetime или timedelta - отступ назад от текущего момента).
+        :param until: Конец временного окна (datetime).
+        :param sources: Список источников (камера, линия досмотра, файл).
+        :param min_area: Нижняя граница площади бокса в пикселях.
+        :param max_area: Верхняя граница площади бокса в пикселях.
+        :param order_by: Столбец сортировки.
+        :param descending: Сортировка по убыванию.
+        :param limit: Наибольшее число строк или None - без ограничения.
+        """
+        assert classes is None or isinstance(classes, list | tuple), "classes должен иметь тип list или tuple"
+        assert sources is None or isinstance(sources, list | tuple), "sources должен иметь тип list или tuple"
+        assert since is None or isinstance(since, datetime | timedelta), "since должен иметь тип datetime или timedelta"
+        assert until is None or isinstance(until, datetime), "until должен иметь тип datetime"
+        assert order_by in ORDER_COLUMNS, f"order_by должен быть одним из {ORDER_COLUMNS}"
+        assert limit is None or isinstance(limit, int) and limit > 0, "limit должен иметь тип int и быть больше 0"
+
+        self.classes = list(classes) if classes else None
+        self.min_confidence = min_confidence
+        self.max_confidence = max_confidence
+        self.since = since
+        self.until = until
+        self.sources = list(sources) if sources else None
+        self.min_area = min_area
+        self.max_area = max_area
+        self.order_by = order_by
+        self.descending = descending
+        self.limit = limit
+
+    @property
+    def start_time(self):
+        if isinstance(self.since, timedelta):
+            return datetime.now() - self.since
+        return self.since
+
+    def _required_columns(self):
+        columns = set()
+        if self.classes:
+            columns.add('class_obj')
+        if self.min_confidence is not None or self.max_confidence is not None:
+            columns.add('confidence')
+        if self.since is not None or self.until is not None:
+            columns.add('detected_at')
+        if self.sources:
+            columns.add('source')
+        if self.min_area is not None or self.max_area is not None:
+            columns.update(('x_max', 'y_max'))
+        return columns
+
+    def check_columns(self, columns):
+        missing = self._required_columns() - set(columns)
+        if missing:
+            raise ValueError(f'В таблице нет столбцов {sorted(missing)}, необходимых для фильтрации')
+
+    def where(self, table):
+        """
+        Условия выборки для таблицы sqlalchemy.Table.
+        """
+        self.check_columns(table.columns.keys())
+        c = table.c
+        clauses = []
+        if self.classes:
+            clauses.append(c.class_obj.in_(self.classes))
+        if self.min_confidence is not None:
+            clauses.append(c.confidence >= self.min_confidence)
+        if self.max_confidence is not None:
+            clauses.append(c.confidence <= self.max_confidence)
+        if self.since is not None:
+            clauses.append(c.detected_at >= self.start_time)
+        if self.until is not None:
+            clauses.append(c.detected_at <= self.until)
+        if self.sources:
+            clauses.append(c.source.in_(self.sources))
+        # Столбцы x_max и y_max таблицы детекций хранят ширину и высоту бокса, поэтому площадь - их произведение
+        if self.min_area is not None:
+            clauses.append(c.x_max * c.y_max >= self.min_area)
+        if self.max_area is not None:
+            clauses.append(c.x_max * c.y_max <= self.max_area)
+        return clauses
+
+    def select(self, table):
+        """
+        Запрос SELECT с фильтрами, сортировкой и ограничением числа строк.
+        """
+        statement = select(table)
+        clauses = self.where(table)
+        if clauses:
+            statement = statement.where(and_(*clauses))
+        order_column = self.order_by if self.order_by in table.c else 'id'
+        if order_column in table.c:
+            column = table.c[order_column]
+            statement = statement.order_by(column.desc() if self.descending else column.asc())
+        if self.limit is not None:
+            statement = statement.limit(self.limit)
+        return statement
+
+    def arrow_filter(self, columns):
+        """
+        Выражение pyarrow.compute для фильтрации при чтении Parquet/Arrow или None, если фильтров нет.
+        """
+        self.check_columns(columns)
+        expressions = []
+        if self.classes:
+            expressions.append(pc.field('class_obj').isin(self.classes))
+        if self.min_confidence is not None:
+            expressions.append(pc.field('confidence') >= self.min_confidence)
+        if self.max_confidence is not None:
+            expressions.append(pc.field('confidence') <= self.max_confidence)
+        if self.since is not None:
+            expressions.append(pc.field('detected_at') >= self.start_time)
+        if self.until is not None:
+            expressions.append(pc.field('detected_at') <= self.until)
+        if self.sources:
+            expressions.append(pc.field('source').isin(self.sources))
+        if self.min_area is not None:
+            expressions.append(pc.multiply(pc.field('x_max'), pc.field('y_max')) >= self.min_area)
+        if self.max_area is not None:
+            expressions.append(pc.multiply(pc.field('x_max'), pc.field('y_max')) <= self.max_area)
+        if not expressions:
+            return None
+        expression = expressions[0]
+        for other in expressions[1:]:
+            expression = expression & other
+        return expression
@@ -0,0 +1,386 @@
+"""
+Оценка точности и скорости детектора на размеченном наборе в формате YOLO без графического интерфейса.
+
+Снимки проходят тот же путь, что и в приложении: _format_yolo, прямой проход cv2.dnn и _wrap_detection с NMS.
+Разметка переводится в координаты кадра после letterbox, и для каждого класса CLASS_LIST считается AP при IoU 0.5
+и средний по IoU 0.5:0.95. Замеряются перцентили задержки этапов и пропускная способность.
+
+Сырые выходы сети (строки с уверенностью не ниже наименьшего порога перебора) сохраняются в EVAL_CACHE_DIR, поэтому
+перебор порогов уверенности и NMS выполняется без повторных прямых проходов, параллельно в нескольких процессах.
+
+Набор: DATASET/images/*.jpg и DATASET/labels/*.txt (или .txt рядом со снимком) со строками "класс cx cy w h"
+в долях размера снимка.
+
+Запуск: python -m utils.evaluation.evaluation_moduls DATASET --model PATH [--sizes 320 640] [--conf 0.3 0.6]
+        [--nms 0.45 0.55] [--score ...] [--jobs 4] [--output report.json]
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing as mp
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+import cv2
+import numpy as np
+from config import YOLOv7_PATH, SIZE, CLASS_LIST, EVAL_CACHE_DIR, EVAL_JOBS
+from utils.neural_network.neuralnet_moduls import RealTimeObjectDetection
+from logger.logger_config import get_logger, process_log_queue, setup_process_logging
+
+logger = get_logger(__name__)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+IOU_THRESHOLDS = tuple(np.round(np.arange(0.5, 0.96, 0.05), 2))
+LATENCY_STAGES = ('preprocess', 'forward', 'decode', 'total')
+
+
+def find_samples(root):
+    """
+    Список (путь к снимку, путь к разметке или None). Разметка ищется в labels/ с тем же относительным путём,
+    что и снимок в images/, или рядом со снимком.
+    """
+    images_dir = os.path.join(root, 'images')
+    base = images_dir if os.path.isdir(images_dir) else root
+    samples = []
+    for directory, _, names in os.walk(base):
+        for name in sorted(names):
+            if os.path.splitext(name)[1].lower() not in IMAGE_EXTENSIONS:
+                continue
+            image_path = os.path.join(directory, name)
+            stem = os.path.splitext(os.path.relpath(image_path, base))[0]
+            candidates = [os.path.join(root, 'labels', stem + '.txt'), os.path.splitext(image_path)[0] + '.txt']
+            label_path = next((path for path in candidates if os.path.isfile(path)), None)
+            samples.append((image_path, label_path))
+    return sorted(samples)
+
+
+def read_labels(path, width, height):
+    """
+    Классы (N,) и боксы (N, 4) в формате (left, top, width, height) в пикселях снимка.
+    """
+    rows = np.loadtxt(path, ndmin=2) if path and os.path.getsize(path) else np.zeros((0, 5))
+    classes = rows[:, 0].astype(np.int64)
+    boxes = np.empty((len(rows), 4))
+    boxes[:, 0] = (rows[:, 1] - rows[:, 3] / 2) * width
+    boxes[:, 1] = (rows[:, 2] - rows[:, 4] / 2) * height
+    boxes[:, 2] = rows[:, 3] * width
+    boxes[:, 3] = rows[:, 4] * height
+    return classes, boxes
+
+
+def letterbox_boxes(boxes, shape, size):
+    """
+    Переводит боксы снимка формы shape в координаты кадра размера size после _format_yolo: снимок вписывается
+    с сохранением пропорций и дополняется полями поровну с двух сторон.
+    """
+    height, width = shape[:2]
+    scale = min(size[0] / width, size[1] / height)
+    pad_x, pad_y = (size[0] - width * scale) / 2, (size[1] - height * scale) / 2
+    boxes = boxes * scale
+    boxes[:, 0] += pad_x
+    boxes[:, 1] += pad_y
+    return boxes
+
+
+def box_iou(box, boxes):
+    x0 = np.maximum(box[0], boxes[:, 0])
+    y0 = np.maximum(box[1], boxes[:, 1])
+    x1 = np.minimum(box[0] + box[2], boxes[:, 0] + boxes[:, 2])
+    y1 = np.minimum(box[1] + box[3], boxes[:, 1] + boxes[:, 3])
+    inter = np.clip(x1 - x0, 0, None) * np.clip(y1 - y0, 0, None)
+    union = box[2] * box[3] + boxes[:, 2] * boxes[:, 3] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-9), 0.0)
+
+
+def _interpolated_ap(recall, precision):
+    recall = np.concatenate(([0.0], recall, [1.0]))
+    precision = np.concatenate(([1.0], precision, [0.0]))
+    precision = np.flip(np.maximum.accumulate(np.flip(precision)))
+    changes = np.where(recall[1:] != recall[:-1])[0]
+    return float(np.sum((recall[changes + 1] - recall[changes]) * precision[changes + 1]))
+
+
+def average_precision(detections, ground_truth, num_classes, iou_thresholds=IOU_THRESHOLDS):
+    """
+    AP по классам и порогам IoU.
+    :param detections: Список по снимкам: (class_ids, confidences, boxes).
+    :param ground_truth: Список по снимкам: (classes, boxes).
+    Возвращает массив AP формы (num_classes, len(iou_thresholds)) (nan для классов без разметки), число
+    объектов разметки по классам и число верных и всех детекций при первом пороге IoU.
+    """
+    ap = np.full((num_classes, len(iou_thresholds)), np.nan)
+    counts = np.zeros(num_classes, np.int64)
+    true_positives, total = 0, 0
+    for class_id in range(num_classes):
+        gt = [boxes[classes == class_id] for classes, boxes in ground_truth]
+        counts[class_id] = sum(len(boxes) for boxes in gt)
+        records = [(confidence, i, box) for i, (class_ids, confidences, boxes) in enumerate(detections)
+                   for c, confidence, box in zip(class_ids, confidences, boxes) if c == class_id]
+        records.sort(key=lambda record: -record[0])
+        total += len(records)
+        if not counts[class_id]:
+            continue
+        ious = [box_iou(np.asarray(box, np.float64), gt[i]) if len(gt[i]) else np.zeros(0)
+                for _, i, box in records]
+        for t, threshold in enumerate(iou_thresholds):
+            matched = [np.zeros(len(boxes), bool) for boxes in gt]
+            hits = np.zeros(len(records), bool)
+            for k, (_, i, _) in enumerate(records):
+                candidates = np.where((ious[k] >= threshold) & ~matched[i])[0]
+                if len(candidates):
+                    matched[i][candidates[np.argmax(ious[k][candidates])]] = True
+                    hits[k] = True
+            tp = np.cumsum(hits)
+            recall = tp / counts[class_id]
+            precision = tp / np.arange(1, len(records) + 1)
+            ap[class_id, t] = _interpolated_ap(recall, precision) if len(records) else 0.0
+            if t == 0:
+                true_positives += int(hits.sum())
+    return ap, counts, true_positives, total
+
+
+def percentiles(values):
+    values = np.asarray(values) * 1000
+    return {'p50_ms': float(np.percentile(values, 50)), 'p90_ms': float(np.percentile(values, 90)),
+            'p99_ms': float(np.percentile(values, 99)), 'mean_ms': float(values.mean())}
+
+
+class PredictionCache:
+
+    def __init__(self, directory=EVAL_CACHE_DIR):
+        """
+        Кэш сырых выходов сети и разметки в координатах letterbox для набора, модели и размера входа.
+        """
+        self.directory = directory
+
+    @staticmethod
+    def key(model_path, size, samples, min_confidence):
+        stat = os.stat(model_path)
+        digest = hashlib.sha256(f'{os.path.abspath(model_path)}|{stat.st_size}|{stat.st_mtime_ns}|{tuple(size)}|'
+                                f'{min_confidence}'.encode())
+        # Кэш хранит и разметку, поэтому исправленный файл разметки тоже делает кэш устаревшим
+        for image_path, label_path in samples:
+            label_mtime = os.path.getmtime(label_path) if label_path else None
+            digest.update(f'{image_path}|{os.path.getmtime(image_path)}|{label_path}|{label_mtime}'.encode())
+        return digest.hexdigest()[:32]
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.npz')
+
+    def load(self, key):
+        path = self.path(key)
+        if not os.path.isfile(path):
+            return None
+        with np.load(path) as data:
+            return {name: data[name] for name in data.files}
+
+    def save(self, key, data):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self.path(key) + '.tmp.npz'
+        np.savez_compressed(tmp_path, **data)
+        os.replace(tmp_path, self.path(key))
+        return self.path(key)
+
+
+def collect_predictions(detector, net, output_layers, samples, min_confidence):
+    """
+    Прогоняет снимки через детектор приложения. Возвращает словарь массивов для PredictionCache: сырые строки
+    выхода с уверенностью не ниже min_confidence, разметку в координатах letterbox (смещения по снимкам в
+    *_offsets) и задержки этапов.
+    """
+    rows, row_offsets, gt_classes, gt_boxes, gt_offsets = [], [0], [], [], [0]
+    latencies = {stage: [] for stage in LATENCY_STAGES}
+    for image_path, label_path in samples:
+        image = cv2.imread(image_path, cv2.IMREAD_COLOR)
+        if image is None:
+            logger.warning(f'Не удалось прочитать снимок {image_path}')
+            image = np.zeros((*detector.SIZE[::-1], 3), np.uint8)
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        start = time.perf_counter()
+        img = detector._format_yolo(image)
+        formatted = time.perf_counter()
+        outs = detector._detect(img, net, output_layers)
+        forwarded = time.perf_counter()
+        detector._wrap_detection(img, outs[0])
+        decoded = time.perf_counter()
+        for stage, value in zip(LATENCY_STAGES, (formatted - start, forwarded - formatted, decoded - forwarded,
+                                                 decoded - start)):
+            latencies[stage].append(value)
+
+        output = outs[0].reshape(-1, outs[0].shape[-1])
+        rows.append(output[output[:, 4] >= min_confidence].astype(np.float32))
+        row_offsets.append(row_offsets[-1] + len(rows[-1]))
+        classes, boxes = read_labels(label_path, image.shape[1], image.shape[0])
+        gt_classes.append(classes)
+        gt_boxes.append(letterbox_boxes(boxes, image.shape, detector.SIZE))
+        gt_offsets.append(gt_offsets[-1] + len(classes))
+
+    width = 5 + len(detector.CLASS_LIST)
+    return {'rows': np.concatenate(rows) if rows else np.zeros((0, width), np.float32),
+            'row_offsets': np.asarray(row_offsets),
+            'gt_classes': np.concatenate(gt_classes) if gt_classes else np.zeros(0, np.int64),
+            'gt_boxes': np.concatenate(gt_boxes) if gt_boxes else np.zeros((0, 4)),
+            'gt_offsets': np.asarray(gt_offsets),
+            'size': np.asarray(detector.SIZE),
+            **{f'latency_{stage}': np.asarray(values) for stage, values in latencies.items()}}
+
+
+# Состояние процесса перебора порогов: кэш загружается один раз при запуске процесса
+_sweep_state = {}
+
+
+def _init_sweep(cache_path, class_list, log_queue=None):
+    if log_queue is not None:
+        setup_process_logging(log_queue)
+    with np.load(cache_path) as data:
+        _sweep_state.update({name: data[name] for name in data.files})
+    size = tuple(int(side) for side in _sweep_state['size'])
+    _sweep_state['detector'] = RealTimeObjectDetection('', class_list, size=size, remote_url=None, workers=0,
+                                                       screening_model_path=None)
+
+
+def _split(values, offsets):
+    return [values[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+
+
+def evaluate_thresholds(confidence_threshold, score_threshold, nms_threshold):
+    """
+    Точность при заданных порогах по сырым выходам из кэша процесса. Разбор и NMS - те же, что в приложении.
+    """
+    state = _sweep_state
+    detector = state['detector']
+    # _wrap_detection берёт из кадра только его размер
+    frame = np.broadcast_to(np.uint8(0), (detector.SIZE[1], detector.SIZE[0], 3))
+    detections = []
+    start = time.perf_counter()
+    for rows in _split(state['rows'], state['row_offsets']):
+        class_ids, confidences, boxes = detector._wrap_detection(frame, rows, score_threshold, nms_threshold,
+                                                                 confidence_threshold)
+        detections.append((np.asarray(class_ids, np.int64), np.asarray(confidences), np.asarray(boxes)))
+    decode_time = time.perf_counter() - start
+    ground_truth = list(zip(_split(state['gt_classes'], state['gt_offsets']),
+                            _split(state['gt_boxes'], state['gt_offsets'])))
+    ap, counts, true_positives, total = average_precision(detections, ground_truth, len(detector.CLASS_LIST))
+    present = counts > 0
+    return {'confidence_threshold': confidence_threshold, 'score_threshold': score_threshold,
+            'nms_threshold': nms_threshold,
+            'map50': float(np.mean(ap[present, 0])) if present.any() else 0.0,
+            'map50_95': float(np.mean(ap[present])) if present.any() else 0.0,
+            'precision': true_positives / total if total else 0.0,
+            'recall': true_positives / int(counts.sum()) if counts.sum() else 0.0,
+            'detections_per_image': total / max(len(detections), 1),
+            'decode_ms': decode_time / max(len(detections), 1) * 1000,
+            'ap50': {name: (None if np.isnan(ap[i, 0]) else float(ap[i, 0]))
+                     for i, name in enumerate(detector.CLASS_LIST)},
+            'ap50_95': {name: (None if np.isnan(ap[i, 0]) else float(np.mean(ap[i])))
+                        for i, name in enumerate(detector.CLASS_LIST)}}
+
+
+def sweep(cache_path, grid, class_list=CLASS_LIST, jobs=EVAL_JOBS):
+    """
+    Перебор порогов grid (список (confidence, score, nms)) в jobs процессах (0 - по числу ядер).
+    """
+    jobs = min(jobs or os.cpu_count() or 1, len(grid))
+    if jobs <= 1:
+        _init_sweep(cache_path, class_list)
+        return [evaluate_thresholds(*params) for params in grid]
+    with ProcessPoolExecutor(jobs, mp_context=mp.get_context('spawn'), initializer=_init_sweep,
+                             initargs=(cache_path, class_list, process_log_queue())) as executor:
+        return list(executor.map(evaluate_thresholds, *zip(*grid)))
+
+
+def evaluate(dataset, model_path=YOLOv7_PATH, sizes=(SIZE,), confidences=(0.6,), scores=None, nms_thresholds=(0.55,),
+             class_list=CLASS_LIST, jobs=EVAL_JOBS, cache=None):
+    """
+    Оценивает модель на наборе для каждого размера входа из sizes и каждой комбинации порогов. Возвращает отчёт
+    {размер: {'images', 'latency', 'throughput_fps', 'cache', 'sweep': [...]}}; перебор отсортирован по mAP@0.5.
+    :param scores: Пороги score_threshold; None - равен порогу уверенности в каждой комбинации.
+    """
+    samples = find_samples(dataset)
+    if not samples:
+        raise ValueError(f'В {dataset} нет снимков с расширениями {IMAGE_EXTENSIONS}')
+    cache = cache or PredictionCache()
+    grid = [(confidence, confidence if score is None else score, nms)
+            for confidence, score, nms in product(confidences, scores or (None,), nms_thresholds)]
+    min_confidence = min(min(confidence, score) for confidence, score, _ in grid)
+
+    report = {}
+    for size in sizes:
+        size = tuple(size)
+        key = PredictionCache.key(model_path, size, samples, min_confidence)
+        data = cache.load(key)
+        cached = data is not None
+        if not cached:
+            detector = RealTimeObjectDetection(model_path, class_list, size=size, remote_url=None, workers=0,
+                                               screening_model_path=None)
+            model = detector._build_model()
+            if model is None:
+                raise IOError(f'Невозможно загрузить модель {model_path}')
+            if detector.SIZE != size:
+                logger.warning(f'Модель не принимает вход {size[0]}x{size[1]}, размер пропущен')
+                continue
+            net, output_layers = model
+            logger.info(f'Оценка {model_path} на {len(samples)} снимках из {dataset}, вход {size[0]}x{size[1]}')
+            data = collect_predictions(detector, net, output_layers, samples, min_confidence)
+            cache.save(key, data)
+        latency = {stage: percentiles(data[f'latency_{stage}']) for stage in LATENCY_STAGES}
+        results = sweep(cache.path(key), grid, class_list, jobs)
+        report[f'{size[0]}x{size[1]}'] = {
+            'images': len(samples),
+            'latency': latency,
+            'throughput_fps': len(samples) / float(data['latency_total'].sum()),
+            'cache': 'hit' if cached else 'miss',
+            'sweep': sorted(results, key=lambda result: -result['map50'])}
+    return report
+
+
+def print_report(report, class_list=CLASS_LIST, top=10):
+    for size, result in report.items():
+        latency = result['latency']
+        print(f'Вход {size}: {result["images"]} снимков, {result["throughput_fps"]:.1f} снимков/с '
+              f'(кэш: {result["cache"]})')
+        for stage in LATENCY_STAGES:
+            print(f'  {stage:>10}: p50 {latency[stage]["p50_ms"]:7.2f} мс, p90 {latency[stage]["p90_ms"]:7.2f} мс, '
+                  f'p99 {latency[stage]["p99_ms"]:7.2f} мс')
+        print('  conf  score  nms   mAP@.5  mAP@.5:.95  precision  recall  боксов/снимок  разбор, мс')
+        for row in result['sweep'][:top]:
+            print(f'  {row["confidence_threshold"]:.2f}  {row["score_threshold"]:.2f}   {row["nms_threshold"]:.2f}  '
+                  f'{row["map50"]:7.3f}  {row["map50_95"]:10.3f}  {row["precision"]:9.3f}  {row["recall"]:6.3f}  '
+                  f'{row["detections_per_image"]:13.1f}  {row["decode_ms"]:10.3f}')
+        best = result['sweep'][0]
+        print(f'  AP по классам (conf {best["confidence_threshold"]}, nms {best["nms_threshold"]}):')
+        for name in class_list:
+            ap50, ap50_95 = best['ap50'][name], best['ap50_95'][name]
+            if ap50 is None:
+                print(f'    {name:>10}: нет в разметке')
+            else:
+                print(f'    {name:>10}: AP@.5 {ap50:.3f}, AP@.5:.95 {ap50_95:.3f}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Оценка точности и скорости детектора на размеченном наборе YOLO')
+    parser.add_argument('dataset')
+    parser.add_argument('--model', default=YOLOv7_PATH)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[SIZE[0]], help='Размеры входа (квадратные)')
+    parser.add_argument('--conf', type=float, nargs='+', default=[0.25, 0.4, 0.5, 0.6, 0.7])
+    parser.add_argument('--score', type=float, nargs='+', default=None,
+                        help='Пороги score_threshold (по умолчанию равны порогу уверенности)')
+    parser.add_argument('--nms', type=float, nargs='+', default=[0.45, 0.55, 0.65])
+    parser.add_argument('--jobs', type=int, default=EVAL_JOBS, help='Процессы перебора порогов (0 - по числу ядер)')
+    parser.add_argument('--cache-dir', default=EVAL_CACHE_DIR)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args(argv)
+
+    report = evaluate(args.dataset, args.model, [(side, side) for side in args.sizes], args.conf, args.score,
+                      args.nms, jobs=args.jobs, cache=PredictionCache(args.cache_dir))
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,80 @@
+import tkinter as tk
+import tkinter.messagebox as mb
+import pandas as pd
+from utils.metrics.metrics_moduls import monitor, MetricsServer
+from utils.utils import Table, center
+
+
+class MetricsMenu:
+
+    def __init__(self, root, menu, refresh_ms=1000):
+        """
+        Класс, который представляет собой графическое взаимодействие со статистикой задержек конвейера детекции
+        путем создания меню, определяемого в библиотеке tkinter. Он графически реализует методы из класса
+        PerformanceMonitor и управляет сервером метрик MetricsServer.
+        :param root: Главное окно, которое представляет собой экземпляр класса tkinter.Tk.
+        :param menu: Главное меню, которое представляет собой экземпляр класса tkinter.Menu.
+        :param refresh_ms: Период обновления панели статистики в миллисекундах.
+        """
+        assert isinstance(root, tk.Tk), "Параметр root должен быть объектом класса tkinter.Tk"
+        assert isinstance(menu, tk.Menu), "Параметр menu должен быть объектом класса tkinter.Menu"
+        assert isinstance(refresh_ms, int) and refresh_ms > 0, "refresh_ms должен иметь тип int и быть больше 0"
+
+        self.root = root
+        self.menu = menu
+        self.refresh_ms = refresh_ms
+        self.server = MetricsServer(monitor)
+        self.stats_frame = None
+
+    def __call__(self, *args, **kwargs):
+        self.metrics_menu = tk.Menu(self.menu, tearoff=0)
+        self.menu.add_cascade(label="Производительность", menu=self.metrics_menu)
+        self.metrics_menu.add_command(label="Статистика задержек", command=self._view_stats)
+        self.metrics_menu.add_command(label="Сбросить статистику", command=monitor.reset)
+        self.metrics_menu.add_command(label="Запустить сервер метрик", command=self._toggle_server)
+
+    @staticmethod
+    def _stats_df():
+        rows = []
+        for stage, stats in monitor.snapshot().items():
+            rows.append([stage, stats['count'], f"{stats['p50'] * 1000:.2f}", f"{stats['p95'] * 1000:.2f}",
+                         f"{stats['p99'] * 1000:.2f}", f"{stats['mean'] * 1000:.2f}", f"{stats['fps']:.1f}"])
+        return pd.DataFrame(rows, columns=['stage', 'count', 'p50, мс', 'p95, мс', 'p99, мс', 'mean, мс', 'кадр/с'])
+
+    def _view_stats(self):
+        if self.stats_frame is not None and self.stats_frame.winfo_exists():
+            self.stats_frame.lift()
+            return
+        self.stats_frame = tk.Toplevel(self.root)
+        self.stats_frame.config(bg='black')
+        self.stats_frame.iconbitmap("MAI.ico")
+        self.stats_frame.resizable(width=False, height=False)
+        self.stats_frame.title('Статистика задержек')
+
+        table_widget = Table(self.stats_frame, self._stats_df())
+        table_widget.table.configure(height=len(monitor.STAGES) + 2)
+        table_widget.pack()
+
+        def refresh():
+            if self.stats_frame.winfo_exists():
+                table_widget.update_rows(self._stats_df())
+                self.stats_frame.after(self.refresh_ms, refresh)
+
+        self.stats_frame.after(self.refresh_ms, refresh)
+        self.stats_frame.update()
+        center(self.stats_frame)
+
+    def _toggle_server(self):
+        index = self.metrics_menu.index(tk.END)
+        if self.server.is_running:
+            self.server.stop()
+            self.metrics_menu.entryconfigure(index, label="Запустить сервер метрик")
+            mb.showinfo('Успех', 'Сервер метрик остановлен')
+        else:
+            try:
+                url = self.server.start()
+            except OSError as exc:
+                mb.showerror('Ошибка', f'Невозможно запустить сервер метрик: {exc}')
+                return
+            self.metrics_menu.entryconfigure(index, label="Остановить сервер метрик")
+            mb.showinfo('Успех', f'Метрики в формате Prometheus доступны по адресу {url}')
@@ -0,0 +1,194 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logger.logger_config import get_logger
+from config import METRICS_WINDOW, METRICS_HOST, METRICS_PORT
+
+logger = get_logger(__name__)
+
+
+class LatencyHistogram:
+
+    def __init__(self, window=METRICS_WINDOW):
+        """
+        Класс, хранящий скользящее окно последних измерений задержки одного этапа и вычисляющий по нему перцентили.
+        :param window: Количество последних измерений, по которым считаются перцентили.
+        """
+        assert isinstance(window, int) and window > 0, "window должен иметь тип int и быть больше 0"
+
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self.samples.append(seconds)
+            self.count += 1
+            self.total += seconds
+
+    def percentiles(self, quantiles=(0.5, 0.95, 0.99)):
+        with self._lock:
+            samples = sorted(self.samples)
+        if not samples:
+            return {q: 0.0 for q in quantiles}
+        last = len(samples) - 1
+        return {q: samples[min(last, int(round(q * last)))] for q in quantiles}
+
+    def snapshot(self):
+        p50, p95, p99 = self.percentiles().values()
+        with self._lock:
+            count, total = self.count, self.total
+        return {'count': count,
+                'sum': total,
+                'mean': total / count if count else 0.0,
+                'fps': count / total if total else 0.0,
+                'p50': p50,
+                'p95': p95,
+                'p99': p99}
+
+    def reset(self):
+        with self._lock:
+            self.samples.clear()
+            self.count = 0
+            self.total = 0.0
+
+
+class PerformanceMonitor:
+    STAGES = ('capture', 'letterbox', 'forward', 'decode_nms', 'drawing', 'render')
+
+    def __init__(self, window=METRICS_WINDOW, enabled=True):
+        """
+        Класс, собирающий задержки этапов конвейера детекции: захват кадра, letterbox (_format_yolo),
+        blob и прямой проход сети (_detect), декодирование и NMS (_wrap_detection), отрисовка боксов и вывод в Tk.
+        :param window: Размер скользящего окна гистограммы каждого этапа.
+        :param enabled: Флаг, при снятии которого измерения не записываются.
+        """
+        self.window = window
+        self.enabled = enabled
+        self.histograms = {}
+        self._lock = threading.Lock()
+        for stage in self.STAGES:
+            self.histograms[stage] = LatencyHistogram(window)
+
+    def histogram(self, stage):
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(stage, LatencyHistogram(self.window))
+        return histogram
+
+    def observe(self, stage, seconds):
+        if self.enabled:
+            self.histogram(stage).observe(seconds)
+
+    @contextmanager
+    def measure(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def timed(self, stage):
+        def decorator(fu):
+            @wraps(fu)
+            def inner(*a, **kw):
+                start = time.perf_counter()
+                try:
+                    return fu(*a, **kw)
+                finally:
+                    self.observe(stage, time.perf_counter() - start)
+
+            return inner
+
+        return decorator
+
+    def snapshot(self):
+        return {stage: histogram.snapshot() for stage, histogram in list(self.histograms.items())}
+
+    def reset(self):
+        for histogram in list(self.histograms.values()):
+            histogram.reset()
+
+    def to_prometheus(self, prefix='baggage'):
+        name = f'{prefix}_stage_latency_seconds'
+        lines = [f'# HELP {name} Задержка этапов конвейера детекции в секундах (скользящее окно {self.window})',
+                 f'# TYPE {name} summary']
+        for stage, stats in self.snapshot().items():
+            for quantile, key in (('0.5', 'p50'), ('0.95', 'p95'), ('0.99', 'p99')):
+                lines.append(f'{name}{{stage="{stage}",quantile="{quantile}"}} {stats[key]:.9f}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {stats["sum"]:.9f}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {stats["count"]}')
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsServer:
+
+    def __init__(self, monitor, host=METRICS_HOST, port=METRICS_PORT):
+        """
+        Класс, отдающий метрики PerformanceMonitor в текстовом формате Prometheus по адресу http://host:port/metrics.
+        Сервер работает в фоновом потоке и не блокирует графический интерфейс.
+        :param monitor: Экземпляр класса PerformanceMonitor.
+        :param host: Адрес, на котором слушает сервер.
+        :param port: Порт, на котором слушает сервер.
+        """
+        assert isinstance(monitor, PerformanceMonitor), "monitor должен быть объектом класса PerformanceMonitor"
+        assert isinstance(host, str), "host должен иметь тип str"
+        assert isinstance(port, int), "port должен иметь тип int"
+
+        self.monitor = monitor
+        self.host = host
+        self.port = port
+        self.httpd = None
+        self.thread = None
+
+    @property
+    def url(self):
+        return f'http://{self.host}:{self.port}/metrics'
+
+    @property
+    def is_running(self):
+        return self.httpd is not None
+
+    def start(self):
+        if self.is_running:
+            return self.url
+        monitor = self.monitor
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = monitor.to_prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.port = self.httpd.server_address[1]
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        logger.info(f'Сервер метрик запущен по адресу {self.url}')
+        return self.url
+
+    def stop(self):
+        if self.is_running:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.thread.join()
+            self.httpd = None
+            self.thread = None
+            logger.info('Сервер метрик остановлен')
+
+
+monitor = PerformanceMonitor()
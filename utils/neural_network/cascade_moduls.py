@@ -0,0 +1,125 @@
+"""
+Двухступенчатый каскад детекции. Маленькая модель низкого разрешения (SCREENING_MODEL_PATH, SCREENING_SIZE)
+просматривает каждый кадр, и только кадры, где она нашла объект с уверенностью не ниже SCREENING_THRESHOLD,
+передаются полной модели. В режиме "frame" полная модель обрабатывает весь кадр, в режиме "region" - только
+область вокруг найденных объектов, увеличенную до размера входа сети. Результат имеет тот же формат, что и у
+полной модели, поэтому каскад подставляется вместо cv2.dnn.Net, как RemoteDetectionClient и DetectionWorkerPool.
+"""
+import cv2
+import numpy as np
+from logger.logger_config import get_logger, frame_log_limiter
+from config import SCREENING_THRESHOLD, CASCADE_MODE, CASCADE_REGION_MARGIN, CASCADE_REGION_MAX_FRACTION
+
+logger = get_logger(__name__)
+
+CASCADE_MODES = ('frame', 'region')
+
+
+class ScreeningCascade:
+
+    def __init__(self, detector, net, output_layers, screener, screening_net, screening_layers,
+                 threshold=SCREENING_THRESHOLD, mode=CASCADE_MODE, margin=CASCADE_REGION_MARGIN,
+                 max_fraction=CASCADE_REGION_MAX_FRACTION):
+        """
+        Класс каскада из отсеивающей и полной модели.
+        :param detector: Экземпляр RealTimeObjectDetection с полной моделью.
+        :param net: cv2.dnn.Net полной модели.
+        :param output_layers: Выходные слои полной модели.
+        :param screener: Экземпляр RealTimeObjectDetection с отсеивающей моделью (её размер входа и пороги).
+        :param screening_net: cv2.dnn.Net отсеивающей модели.
+        :param screening_layers: Выходные слои отсеивающей модели.
+        :param threshold: Уверенность отсеивающей модели, начиная с которой кадр передаётся полной модели.
+        :param mode: "frame" - полная модель обрабатывает весь кадр, "region" - область найденных объектов.
+        :param margin: Запас вокруг области найденных объектов в долях её размера.
+        :param max_fraction: Если область занимает большую долю кадра, обрабатывается весь кадр.
+        """
+        assert mode in CASCADE_MODES, f"mode должен быть одним из {CASCADE_MODES}"
+        assert 0 <= threshold <= 1, "threshold должен быть от 0 до 1"
+        assert 0 < max_fraction <= 1, "max_fraction должен быть больше 0 и не больше 1"
+
+        self.detector = detector
+        self.net = net
+        self.output_layers = output_layers
+        self.screener = screener
+        self.screening_net = screening_net
+        self.screening_layers = screening_layers
+        self.threshold = threshold
+        self.mode = mode
+        self.margin = margin
+        self.max_fraction = max_fraction
+
+        self.frames = 0
+        self.escalated = 0
+        self.regions = 0
+
+    @property
+    def escalation_rate(self):
+        return self.escalated / self.frames if self.frames else 0.0
+
+    def stats(self):
+        return {'frames': self.frames, 'escalated': self.escalated, 'regions': self.regions,
+                'escalation_rate': self.escalation_rate}
+
+    def screen(self, img):
+        """
+        Боксы отсеивающей модели в координатах кадра img (после _format_yolo полной модели).
+        """
+        small = cv2.resize(img, self.screener.SIZE, interpolation=cv2.INTER_AREA)
+        outs = self.screener._detect(small, self.screening_net, self.screening_layers)
+        # Разбор выхода с кадром полного размера сразу переводит боксы в его координаты
+        _, confidences, boxes = self.screener._wrap_detection(img, outs[0], self.threshold,
+                                                              self.screener.NMS_THRESHOLD, self.threshold)
+        return [box for confidence, box in zip(confidences, boxes) if confidence >= self.threshold]
+
+    def _region(self, img, boxes):
+        """
+        Область (x0, y0, x1, y1), охватывающая боксы с запасом, или None, если она почти равна кадру.
+        """
+        height, width = img.shape[:2]
+        boxes = np.asarray(boxes)
+        x0, y0 = boxes[:, 0].min(), boxes[:, 1].min()
+        x1, y1 = (boxes[:, 0] + boxes[:, 2]).max(), (boxes[:, 1] + boxes[:, 3]).max()
+        dx, dy = (x1 - x0) * self.margin, (y1 - y0) * self.margin
+        x0, y0 = int(max(x0 - dx, 0)), int(max(y0 - dy, 0))
+        x1, y1 = int(min(x1 + dx, width)), int(min(y1 + dy, height))
+        if x1 <= x0 or y1 <= y0 or (x1 - x0) * (y1 - y0) > self.max_fraction * width * height:
+            return None
+        return x0, y0, x1, y1
+
+    def _detect_region(self, img, region):
+        """
+        Полная модель на области кадра: область увеличивается с сохранением пропорций до размера входа, боксы
+        переводятся обратно в координаты кадра.
+        """
+        x0, y0, x1, y1 = region
+        crop = img[y0:y1, x0:x1]
+        scale = min(self.detector.SIZE[0] / crop.shape[1], self.detector.SIZE[1] / crop.shape[0])
+        resized = cv2.resize(crop, (max(int(crop.shape[1] * scale), 1), max(int(crop.shape[0] * scale), 1)))
+        padded = cv2.copyMakeBorder(resized, 0, self.detector.SIZE[1] - resized.shape[0], 0,
+                                    self.detector.SIZE[0] - resized.shape[1], cv2.BORDER_CONSTANT, value=(0, 0, 0))
+        outs = self.detector._detect(padded, self.net, self.output_layers)
+        class_ids, confidences, boxes = self.detector._wrap_detection(padded, outs[0])
+        boxes = [np.array([x0 + box[0] / scale, y0 + box[1] / scale, box[2] / scale, box[3] / scale],
+                          dtype=np.int64) for box in boxes]
+        return class_ids, confidences, boxes
+
+    def detect(self, img):
+        """
+        Детекция кадра после _format_yolo. Возвращает class_ids, confidences, boxes, как
+        RealTimeObjectDetection._infer; для кадров, отсеянных первой моделью, - пустые списки.
+        """
+        self.frames += 1
+        if frame_log_limiter('cascade_escalation'):
+            logger.info(f'Каскад: полной модели передано {self.escalated} из {self.frames} кадров '
+                        f'({self.escalation_rate:.1%})')
+        boxes = self.screen(img)
+        if not boxes:
+            return [], [], []
+        self.escalated += 1
+        if self.mode == 'region':
+            region = self._region(img, boxes)
+            if region is not None:
+                self.regions += 1
+                return self._detect_region(img, region)
+        outs = self.detector._detect(img, self.net, self.output_layers)
+        return self.detector._wrap_detection(img, outs[0])
@@ -0,0 +1,221 @@
+"""
+Замена модели без остановки потока. Новая модель загружается в фоновом потоке, прогревается и проверяется на
+контрольных снимках (HOTSWAP_REFERENCE_DIR), после чего одним присваиванием подставляется вместо текущей: кадр,
+который уже обрабатывается, досчитывается старой моделью, следующий - новой. Старая модель остаётся в памяти для
+мгновенного отката.
+
+HotSwapModel передаётся вместо cv2.dnn.Net во все методы детектора (get_detected_frame, get_detected_frames,
+autotune_size), и _infer на каждом кадре берёт текущую модель.
+"""
+import os
+import threading
+import time
+import cv2
+import numpy as np
+from logger.logger_config import get_logger
+from utils.neural_network.nms_moduls import nms
+from config import HOTSWAP_REFERENCE_DIR, HOTSWAP_WARMUP
+
+logger = get_logger(__name__)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+# Сколько контрольных снимков используется при проверке
+REFERENCE_LIMIT = 8
+
+
+def reference_images(directory=HOTSWAP_REFERENCE_DIR, limit=REFERENCE_LIMIT):
+    """
+    Контрольные снимки RGB из папки directory (не больше limit) или пустой список, если папки нет.
+    """
+    if not os.path.isdir(directory):
+        return []
+    images = []
+    for name in sorted(os.listdir(directory)):
+        if name.lower().endswith(IMAGE_EXTENSIONS):
+            image = cv2.imread(os.path.join(directory, name))
+            if image is not None:
+                images.append(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+        if len(images) >= limit:
+            break
+    return images
+
+
+def swappable(detector, net, output_layers):
+    """
+    HotSwapModel для модели, загруженной в процесс, или net без изменений: модели сервера детекции, процессов
+    детекции и каскада так не заменяются.
+    """
+    if isinstance(net, cv2.dnn.Net):
+        return HotSwapModel(detector, net, output_layers)
+    return net
+
+
+class HotSwapModel:
+
+    def __init__(self, detector, net, output_layers, model_path=None):
+        """
+        Класс модели детектора, которую можно заменить, не останавливая обработку кадров.
+        :param detector: Детектор (RealTimeObjectDetection), для которого загружена модель.
+        :param net: Текущая модель cv2.dnn.Net.
+        :param output_layers: Имена выходных слоёв текущей модели.
+        :param model_path: Путь к файлу текущей модели (по умолчанию detector.MODEL_PATH).
+        """
+        assert isinstance(net, cv2.dnn.Net), "net должен иметь тип cv2.dnn.Net"
+
+        self.detector = detector
+        # Модель, слои и путь меняются одним присваиванием кортежа, поэтому кадр всегда видит согласованную тройку
+        self._active = (net, output_layers, model_path or detector.MODEL_PATH)
+        self._previous = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._last_frame = None
+        self._swapped_at = None
+        self._interval = None
+        self.swaps = 0
+        self.status = {'state': 'active', 'model_path': self.model_path}
+
+    @property
+    def model_path(self):
+        return self._active[2]
+
+    @property
+    def can_rollback(self):
+        return self._previous is not None
+
+    @property
+    def busy(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def current(self):
+        """
+        Текущая модель и её выходные слои для обработки очередного кадра. Заодно замеряется интервал между кадрами
+        и промежуток между последним кадром старой модели и первым кадром новой.
+        """
+        net, output_layers, _ = self._active
+        now = time.perf_counter()
+        if self._last_frame is not None:
+            if self._swapped_at is not None:
+                self.status['frame_gap'] = now - self._last_frame
+                self.status['frame_interval'] = self._interval
+                self._swapped_at = None
+                logger.info(f'Первый кадр новой модели через {self.status["frame_gap"] * 1000:.1f} мс после '
+                            f'последнего кадра старой (обычный интервал {(self._interval or 0) * 1000:.1f} мс)')
+            else:
+                interval = now - self._last_frame
+                self._interval = interval if self._interval is None else 0.9 * self._interval + 0.1 * interval
+        self._last_frame = now
+        return net, output_layers
+
+    def prepare(self, model_path, images=None, warmup=HOTSWAP_WARMUP):
+        """
+        Загружает модель model_path, прогревает её и проверяет на контрольных снимках images (по умолчанию снимки
+        из HOTSWAP_REFERENCE_DIR, а если их нет - серый кадр). Модель должна принимать текущее разрешение входа
+        детектора и выдавать по 5 + число классов значений на бокс без NaN и бесконечностей.
+        Возвращает (net, output_layers, отчёт) или вызывает ValueError, если модель не прошла проверку.
+        """
+        detector = self.detector
+        report = {'model_path': model_path}
+        start = time.perf_counter()
+        try:
+            net, output_layers = detector.load_net(model_path)
+        except cv2.error as exc:
+            raise ValueError(f'Не удалось загрузить модель {model_path}: {exc}')
+        report['load_time'] = time.perf_counter() - start
+        if not detector._accepts_size(net, output_layers, detector.SIZE):
+            raise ValueError(f'Модель {model_path} не принимает вход {detector.SIZE[0]}x{detector.SIZE[1]}, '
+                             f'на котором работает детектор')
+
+        start = time.perf_counter()
+        blob = np.zeros((1, 3, detector.SIZE[1], detector.SIZE[0]), np.float32)
+        for _ in range(warmup):
+            net.setInput(blob)
+            net.forward(output_layers)
+        report['warmup_time'] = time.perf_counter() - start
+
+        images = images if images is not None else reference_images()
+        if not images:
+            images = [np.full((detector.SIZE[1], detector.SIZE[0], 3), 128, np.uint8)]
+        columns = 5 + len(detector.CLASS_LIST)
+        detections = []
+        start = time.perf_counter()
+        for image in images:
+            img = detector._letterbox(image)
+            net.setInput(cv2.dnn.blobFromImage(img, 1 / 255.0, detector.SIZE, swapRB=True, crop=False))
+            out = net.forward(output_layers)[0]
+            if out.shape[-1] != columns:
+                raise ValueError(f'Модель {model_path} выдаёт {out.shape[-1]} значений на бокс, а для '
+                                 f'{len(detector.CLASS_LIST)} классов нужно {columns}')
+            if not np.isfinite(out).all():
+                raise ValueError(f'Модель {model_path} выдаёт NaN или бесконечность на контрольных снимках')
+            class_ids, confidences, boxes = detector._decode(img, out, detector.CONFIDENCE_THRESHOLD)
+            indexes, _ = nms(boxes, confidences, detector.SCORE_THRESHOLD, detector.NMS_THRESHOLD)
+            detections.append(len(indexes))
+        report['latency'] = (time.perf_counter() - start) / len(images)
+        report['reference_images'] = len(images)
+        report['detections'] = detections
+        return net, output_layers, report
+
+    def swap(self, net, output_layers, model_path):
+        """
+        Подставляет подготовленную модель вместо текущей; текущая сохраняется для отката.
+        Возвращает время самой замены в секундах.
+        """
+        with self._lock:
+            start = time.perf_counter()
+            self._previous = self._active
+            self._active = (net, output_layers, model_path)
+            self._swapped_at = start
+            swap_time = time.perf_counter() - start
+            self.swaps += 1
+            # Экспорт и копии детектора создаются с текущей моделью
+            self.detector.MODEL_PATH = model_path
+        self.status.update(state='swapped', model_path=model_path, swap_time=swap_time, frame_gap=None)
+        logger.info(f'Модель заменена на {model_path} за {swap_time * 1e6:.1f} мкс, '
+                    f'предыдущая {self._previous[2]} сохранена для отката')
+        return swap_time
+
+    def rollback(self):
+        """
+        Возвращает предыдущую модель; заменённая становится предыдущей, поэтому откат можно отменить.
+        """
+        with self._lock:
+            if self._previous is None:
+                logger.warning('Откат невозможен: предыдущей модели нет')
+                return False
+            start = time.perf_counter()
+            self._active, self._previous = self._previous, self._active
+            self._swapped_at = start
+            swap_time = time.perf_counter() - start
+            self.detector.MODEL_PATH = self.model_path
+        self.status.update(state='rolled_back', model_path=self.model_path, swap_time=swap_time, frame_gap=None)
+        logger.info(f'Откат на модель {self.model_path} за {swap_time * 1e6:.1f} мкс')
+        return True
+
+    def _load_and_swap(self, model_path, images, warmup):
+        try:
+            net, output_layers, report = self.prepare(model_path, images, warmup)
+            self.status = {'state': 'validated', **report}
+            self.swap(net, output_layers, model_path)
+        except Exception as exc:
+            self.status = {'state': 'rejected', 'model_path': model_path, 'error': str(exc)}
+            logger.error(f'Модель {model_path} не подставлена: {exc}')
+
+    def load(self, model_path, images=None, warmup=HOTSWAP_WARMUP):
+        """
+        Загружает, проверяет и подставляет модель в фоновом потоке; кадры тем временем обрабатываются текущей
+        моделью. Ход замены и её результат - в self.status ('loading', 'swapped' или 'rejected').
+        """
+        assert isinstance(model_path, str), "model_path должен иметь тип str"
+
+        if self.busy:
+            logger.warning(f'Модель уже загружается, {model_path} пропущена')
+            return False
+        self.status = {'state': 'loading', 'model_path': model_path}
+        self._thread = threading.Thread(target=self._load_and_swap, args=(model_path, images, warmup), daemon=True)
+        self._thread.start()
+        return True
+
+    def wait(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.status
@@ -0,0 +1,196 @@
+import time
+import cv2
+from logger.logger_config import get_logger, frame_log_limiter
+from utils.metrics.metrics_moduls import monitor
+from utils.neural_network.neuralnet_moduls import RealTimeObjectDetection, MODEL_TYPES, MODEL_TYPES_MESSAGE
+from utils.video.video_moduls import CaptureOptions, PrefetchingCapture, open_capture
+from utils.neural_network.workers_moduls import DetectionWorkerPool
+from utils.neural_network.cascade_moduls import ScreeningCascade
+from utils.neural_network.hotswap_moduls import HotSwapModel
+from utils.server.client_moduls import RemoteDetectionClient
+from config import YOLOv7_PATH, SIZE, CLASS_LIST, CAMERA_SOURCES, CAMERA_BATCH_SIZE, CAPTURE_PREFETCH, \
+    DETECTION_SERVER_URL, DETECTION_WORKERS, SCREENING_MODEL_PATH
+
+logger = get_logger(__name__)
+
+
+def parse_source(source):
+    if isinstance(source, str) and source.isdigit():
+        return int(source)
+    return source
+
+
+class FairScheduler:
+
+    def __init__(self, camera_ids, weights=None):
+        """
+        Класс, выбирающий камеры для очередного пакета инференса. Среди камер, у которых готов кадр, первыми
+        обслуживаются камеры с наименьшим числом обработанных кадров с учётом веса, а при равенстве - те,
+        что дольше всего ждали. Так быстрая камера не может вытеснить медленные из общего пакета.
+        :param camera_ids: Список идентификаторов камер.
+        :param weights: Словарь {идентификатор камеры: вес}. Камера с весом 2 получает вдвое больше кадров.
+        """
+        assert isinstance(camera_ids, list | tuple), "camera_ids должен иметь тип list или tuple"
+
+        weights = weights or {}
+        self.weights = {camera_id: float(weights.get(camera_id, 1.0)) for camera_id in camera_ids}
+        self.served = {camera_id: 0 for camera_id in camera_ids}
+        self.last_served = {camera_id: 0.0 for camera_id in camera_ids}
+
+    def select(self, ready_ids, batch_size):
+        order = sorted(ready_ids, key=lambda c: (self.served[c] / self.weights[c], self.last_served[c]))
+        selected = order[:batch_size]
+        now = time.monotonic()
+        for camera_id in selected:
+            self.served[camera_id] += 1
+            self.last_served[camera_id] = now
+        return selected
+
+
+class MultiCameraDetection(RealTimeObjectDetection):
+
+    def __init__(self,
+                 sources=CAMERA_SOURCES,
+                 model_path=YOLOv7_PATH,
+                 class_list=CLASS_LIST,
+                 score_threshold=0.6,
+                 nms_threshold=0.55,
+                 confidence_threshold=0.6,
+                 size=SIZE,
+                 batch_size=CAMERA_BATCH_SIZE,
+                 weights=None,
+                 remote_url=DETECTION_SERVER_URL,
+                 workers=DETECTION_WORKERS,
+                 screening_model_path=SCREENING_MODEL_PATH):
+        """
+        Класс, реализующий обнаружение объектов одновременно на нескольких камерах (лентах досмотра) одной моделью.
+        Кадры разных камер собираются в один пакет и обрабатываются одним прямым проходом сети. Если модель
+        экспортирована с фиксированным размером пакета 1, кадры пакета обрабатываются по одному.
+        :param sources: Список источников: индексы веб-камер, пути к видео или URL потоков.
+        :param model_path: Путь, по которому была сохранена модель нейронной сети.
+        :param class_list: Список классов, которые должны быть обнаружены.
+        :param score_threshold: Порог, используемый для фильтрации боксов.
+        :param nms_threshold: Порог, используемый при не максимальном подавлении.
+        :param confidence_threshold: Порог, при котором объект считается распознанным.
+        :param size: Кортеж с шириной и высотой входа сети.
+        :param batch_size: Максимальное количество кадров в одном пакете.
+        :param weights: Словарь {индекс источника: вес} для планировщика FairScheduler.
+        :param remote_url: Адрес локального сервера детекции. Если задан, кадры отправляются на сервер, который
+        сам собирает их в пакеты.
+        :param workers: Число процессов детекции. Если больше 0, кадры камер обрабатываются в процессах
+        параллельно, а пакет заменяется очередью из кадров, ожидающих свободного процесса.
+        :param screening_model_path: Путь к отсеивающей модели каскада или None. С каскадом кадры пакета
+        обрабатываются по одному: полной модели передаются только кадры, отобранные отсеивающей.
+        """
+        assert isinstance(sources, list | tuple) and len(sources) > 0, \
+            "sources должен иметь тип list или tuple и содержать хотя бы один источник"
+        assert isinstance(batch_size, int) and batch_size > 0, "batch_size должен иметь тип int и быть больше 0"
+
+        super().__init__(model_path, class_list, score_threshold, nms_threshold, confidence_threshold, size,
+                         remote_url, workers, screening_model_path)
+        self.sources = [parse_source(source) for source in sources]
+        self.batch_size = batch_size
+        self.scheduler = FairScheduler(list(range(len(self.sources))), weights)
+        # Кадры, отправленные в процессы детекции и ожидающие результата: {номер кадра: кадр}
+        self._submitted = {}
+
+    def init_model(self):
+        net, output_layers = self._build_model()
+        captures = self.load_capture()
+        return net, output_layers, captures
+
+    def load_capture(self, options=None):
+        options = options or CaptureOptions(prefetch=max(CAPTURE_PREFETCH, 1))
+        assert options.prefetch > 0, "Для нескольких камер нужно чтение кадров с предвыборкой (prefetch > 0)"
+
+        captures = []
+        for source in self.sources:
+            capture = open_capture(source, options)
+            if not capture.isOpened():
+                for opened in captures:
+                    opened.release()
+                logger.error(f'Невозможно открыть источник {source}')
+                raise IOError(f'Невозможно открыть источник {source}')
+            logger.info(f'Успешное открытие источника {source}')
+            captures.append(capture)
+        return captures
+
+    def get_detected_frames(self, net, output_layers, captures):
+        """
+        Берёт готовые кадры камер, выбранных планировщиком, и обрабатывает их одним пакетом.
+        Возвращает словарь {индекс камеры: (кадр с боксами, meta)}; камеры без нового кадра в него не попадают.
+        """
+        assert isinstance(net, MODEL_TYPES), MODEL_TYPES_MESSAGE
+        assert isinstance(captures, list), "Переменная captures должна иметь тип list"
+
+        if isinstance(net, DetectionWorkerPool):
+            return self._get_detected_frames_pool(net, captures)
+        if isinstance(net, HotSwapModel):
+            net, output_layers = net.current()
+
+        camera_ids, images = self._read_ready(captures, self.batch_size)
+        if not images:
+            return {}
+
+        if isinstance(net, RemoteDetectionClient):
+            detections = [self._detect_remote(img, net) for img in images]
+        elif isinstance(net, ScreeningCascade):
+            detections = [net.detect(img) for img in images]
+        else:
+            outs = self._detect_batch(images, net, output_layers)
+            detections = self._wrap_detections(images, outs)
+        results = {}
+        for camera_id, img, (class_ids, confidences, boxes) in zip(camera_ids, images, detections):
+            meta = list(zip(class_ids, confidences, boxes))
+            if self.alerts is not None:
+                self.alerts.publish(img, meta, self.sources[camera_id])
+            results[camera_id] = (self._draw(img, meta, camera_id), meta)
+
+        frames = frame_log_limiter('multicam_detected_frames')
+        if frames:
+            logger.info('Успешное применение модели к пакету кадров с камер (пакетов с прошлого сообщения: %d)',
+                        frames)
+        return results
+
+    def _read_ready(self, captures, limit):
+        ready = [i for i, capture in enumerate(captures) if capture.ready()]
+        selected = self.scheduler.select(ready, limit)
+        camera_ids, images = [], []
+        for camera_id in selected:
+            with monitor.measure('capture'):
+                ret, frame = captures[camera_id].read()
+            if ret:
+                camera_ids.append(camera_id)
+                images.append(self._format_yolo(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)))
+        return camera_ids, images
+
+    def _get_detected_frames_pool(self, pool, captures):
+        """
+        Отправляет готовые кадры камер в свободные ячейки пула процессов и забирает уже обработанные, не дожидаясь
+        кадров, отправленных на этом вызове: пока процессы считают, интерфейс читает и показывает следующие кадры.
+        """
+        camera_ids, images = self._read_ready(captures, pool.slots - pool.pending)
+        for camera_id, img in zip(camera_ids, images):
+            self._submitted[pool.submit(img, camera_id)] = img
+        results = {}
+        for seq, camera_id, meta in pool.collect():
+            img = self._submitted.pop(seq)
+            if self.alerts is not None:
+                self.alerts.publish(img, meta, self.sources[camera_id])
+            # Если у камеры готово несколько кадров, показывается последний
+            results[camera_id] = (self._draw(img, meta, camera_id), meta)
+        if results:
+            frames = frame_log_limiter('multicam_detected_frames')
+            if frames:
+                logger.info('Успешное применение модели к кадрам с камер в процессах детекции (вызовов с прошлого '
+                            'сообщения: %d)', frames)
+        return results
+
+    @staticmethod
+    def release(captures):
+        for capture in captures:
+            capture.release()
+
+    @staticmethod
+    def dropped_frames(captures):
+        return {i: capture.dropped for i, capture in enumerate(captures) if isinstance(capture, PrefetchingCapture)}
@@ -1,22 +1,138 @@
 import tkinter as tk
 import tkinter.messagebox as mb
+import threading
 from tkinter import filedialog
 import time
+from datetime import datetime
 import cv2
 import pandas as pd
 import os
+import math
 import mimetypes
-from io import BytesIO
+import shutil
+import numpy as np
 from PIL import ImageTk, Image, UnidentifiedImageError
-from config import YOLOv7_PATH, SIZE, CLASS_LIST
+from config import YOLOv7_PATH, SIZE, CLASS_LIST, DISPLAY_MAX_SIZE, CAMERA_SOURCES, DETECTION_SERVER_URL, INPUT_SIZES, \
+    DETECTION_WORKERS, WORKER_COUNTS
 from utils.utils import center, Table
-from logger.logger_config import logger
+from logger.logger_config import get_logger
+from utils.metrics.metrics_moduls import monitor
 from utils.neural_network.neuralnet_moduls import RealTimeObjectDetection, VideoObjectDetection, ImageObjectDetection
+from utils.neural_network.multicam_moduls import MultiCameraDetection
+from utils.neural_network.hotswap_moduls import HotSwapModel, swappable
+from utils.video.export_moduls import VideoExporter
+from utils.video.prebuffer_moduls import PreEventBuffer
 from utils.database.database_gui import DatabaseMenu
+from utils.database.columnar_moduls import write_detections
+from utils.database.image_store_moduls import ImageStore
 import customtkinter as ctk
 
+logger = get_logger(__name__)
 
-class RealTimeGUIDetect(RealTimeObjectDetection):
+
+class FrameDisplay:
+
+    def __init__(self, panel, max_size=DISPLAY_MAX_SIZE):
+        """
+        Класс, выводящий поток кадров в tkinter.Label через один постоянный PhotoImage. Кадр один раз уменьшается
+        средствами OpenCV до размера панели, оборачивается в PIL.Image без копирования (Image.frombuffer) и
+        копируется прямо в существующее изображение Tk методом paste, без создания нового PhotoImage на каждый кадр.
+        :param panel: Экземпляр класса tkinter.Label, в котором отображаются кадры.
+        :param max_size: Кортеж с максимальной шириной и высотой выводимого кадра.
+        """
+        assert isinstance(panel, tk.Label), "Параметр panel должен быть объектом класса tkinter.Label"
+        assert isinstance(max_size, list | tuple) and len(max_size) == 2, \
+            "Список/кортёж max_size должен иметь 2 элемента"
+
+        self.panel = panel
+        self.max_size = max_size
+        self.photo = None
+
+    def _fit(self, frame):
+        h, w = frame.shape[:2]
+        ratio = min(self.max_size[0] / w, self.max_size[1] / h)
+        if ratio < 1:
+            frame = cv2.resize(frame, (int(w * ratio), int(h * ratio)), interpolation=cv2.INTER_AREA)
+        return np.ascontiguousarray(frame)
+
+    def show(self, frame):
+        assert isinstance(frame, np.ndarray), "Переменная frame должна иметь тип numpy.ndarray"
+
+        with monitor.measure('render'):
+            frame = self._fit(frame)
+            h, w = frame.shape[:2]
+            image = Image.frombuffer('RGB', (w, h), frame, 'raw', 'RGB', 0, 1)
+            if self.photo is None or self.photo.width() != w or self.photo.height() != h:
+                self.photo = ImageTk.PhotoImage(image=image)
+                self.panel.configure(image=self.photo)
+                self.panel.image = self.photo
+            else:
+                self.photo.paste(image)
+
+    @staticmethod
+    def render_fps():
+        return monitor.histogram('render').snapshot()['fps']
+
+
+class ModelSwapControls:
+    """
+    Кнопки замены и отката модели без остановки потока (utils.neural_network.hotswap_moduls) для вкладок
+    с self.win, self.frame_buts и self.net.
+    """
+
+    def _create_model_buttons(self):
+        """
+        Кнопки замены и отката модели без остановки потока (только для модели, загруженной в процесс интерфейса).
+        """
+        if not isinstance(self.net, HotSwapModel):
+            # Кнопки, оставшиеся от модели, загруженной в процесс раньше, скрываются: сервер и процессы детекции
+            # так модель не меняют
+            for button in (self.swap_model_but, self.rollback_model_but):
+                if button is not None:
+                    button.destroy()
+            self.swap_model_but = self.rollback_model_but = None
+            return
+        if self.swap_model_but is None:
+            self.swap_model_but = ctk.CTkButton(self.frame_buts, text='Сменить модель', command=self._swap_model)
+            self.rollback_model_but = ctk.CTkButton(self.frame_buts, text='Откатить модель',
+                                                    command=self._rollback_model)
+            self.swap_model_but.pack(side=ctk.BOTTOM, pady=5)
+            self.rollback_model_but.pack(side=ctk.BOTTOM, pady=5)
+        self.rollback_model_but.configure(state='disabled')
+
+    def _swap_model(self):
+        if not isinstance(self.net, HotSwapModel):
+            return
+        model_path = filedialog.askopenfilename(title='Выбор модели', initialdir='.',
+                                                filetypes=[("onnx model(*.onnx)", "*.onnx")])
+        if not model_path or not self.net.load(model_path):
+            return
+        self.swap_model_but.configure(state='disabled')
+        self._poll_swap()
+
+    def _poll_swap(self):
+        # Модель загружается и проверяется в фоновом потоке, поток кадров тем временем не останавливается
+        if self.net.busy:
+            self.win.after(200, self._poll_swap)
+            return
+        self.swap_model_but.configure(state='normal')
+        status = self.net.status
+        if status['state'] == 'rejected':
+            mb.showerror('Ошибка', f"Модель не заменена: {status['error']}")
+            return
+        self.rollback_model_but.configure(state='normal')
+        mb.showinfo('Модель заменена',
+                    f"{os.path.basename(status['model_path'])}: загрузка {status['load_time']:.2f} с, прогрев "
+                    f"{status['warmup_time']:.2f} с, проверка на {status['reference_images']} снимках "
+                    f"({status['latency'] * 1000:.0f} мс на кадр), замена {status['swap_time'] * 1e6:.0f} мкс.\n"
+                    f"Промежуток между кадрами старой и новой модели записывается в журнал после первого кадра.")
+
+    def _rollback_model(self):
+        if self.net.rollback():
+            mb.showinfo('Откат модели', f'Используется модель {os.path.basename(self.net.model_path)}')
+
+
+class RealTimeGUIDetect(ModelSwapControls, RealTimeObjectDetection):
 
     def __init__(self,
                  win,
@@ -41,6 +157,14 @@ class RealTimeGUIDetect(RealTimeObjectDetection):
         self.win = win
         self.class_list = class_list
         self.size = size
+        # Последние секунды живого потока, которые сохраняются клипом по детекции или кнопке оператора
+        self.prebuffer = None
+        # Окно скриншота и кнопки паузы создаются один раз и переиспользуются
+        self.screenshot = None
+        self.continue_display_but = None
+        self.apply_model_but = None
+        self.swap_model_but = None
+        self.rollback_model_but = None
 
     def __call__(self):
         self.frame_buts = ctk.CTkFrame(self.win)
@@ -63,23 +187,55 @@ class RealTimeGUIDetect(RealTimeObjectDetection):
         ctk.CTkSlider(topframe, variable=scroe_threshold, from_=1, to=100).grid(column=1, row=0)
         ctk.CTkSlider(topframe, variable=nms_threshold, from_=1, to=100).grid(column=1, row=1)
         ctk.CTkSlider(topframe, variable=confidence_threshold, from_=1, to=100).grid(column=1, row=2)
-        return topframe, scroe_threshold, nms_threshold, confidence_threshold
+        # Пустой адрес - модель загружается в процесс интерфейса, иначе кадры отправляются на сервер детекции
+        server_url = tk.StringVar(value=DETECTION_SERVER_URL or '')
+        ctk.CTkLabel(topframe, text='Сервер детекции', anchor="w", width=20).grid(column=0, row=3)
+        ctk.CTkEntry(topframe, textvariable=server_url, placeholder_text='http://127.0.0.1:8765').grid(column=1,
+                                                                                                      row=3)
+        # "Авто" - подбор наибольшего разрешения входа, при котором модель успевает за AUTOTUNE_TARGET_FPS
+        input_size = tk.StringVar(value=str(SIZE[0]))
+        ctk.CTkLabel(topframe, text='Разрешение входа', anchor="w", width=20).grid(column=0, row=4)
+        ctk.CTkOptionMenu(topframe, variable=input_size,
+                          values=['Авто'] + [str(side) for side in INPUT_SIZES]).grid(column=1, row=4)
+        # 0 - модель в процессе интерфейса, иначе кадры обрабатываются в отдельных процессах детекции
+        workers = tk.StringVar(value=str(DETECTION_WORKERS))
+        ctk.CTkLabel(topframe, text='Процессы детекции', anchor="w", width=20).grid(column=0, row=5)
+        ctk.CTkOptionMenu(topframe, variable=workers,
+                          values=[str(count) for count in WORKER_COUNTS]).grid(column=1, row=5)
+        return topframe, scroe_threshold, nms_threshold, confidence_threshold, server_url, input_size, workers
+
+    @staticmethod
+    def chosen_size(input_size, default):
+        return default if input_size == 'Авто' else (int(input_size), int(input_size))
 
     def _start_display(self):
-        topframe, scroe_threshold, nms_threshold, confidence_threshold = self.model_choice_frame(self.win)
+        topframe, scroe_threshold, nms_threshold, confidence_threshold, server_url, input_size, workers = \
+            self.model_choice_frame(self.win)
 
         def get_model():
             topframe.destroy()
+            self.release_model(getattr(self, 'net', None))
             try:
                 super(RealTimeGUIDetect, self).__init__(YOLOv7_PATH, self.class_list, scroe_threshold.get() / 100,
                                                         nms_threshold.get() / 100, confidence_threshold.get() / 100,
-                                                        self.size)
+                                                        self.chosen_size(input_size.get(), self.size),
+                                                        server_url.get().strip() or None, int(workers.get()))
                 self.net, self.output_layers, self.capture = self.init_model()
+                if input_size.get() == 'Авто':
+                    self.autotune_size(self.net, self.output_layers)
+                self.net = swappable(self, self.net, self.output_layers)
+                self._create_model_buttons()
                 self.width, self.height = self.capture.get(cv2.CAP_PROP_FRAME_WIDTH), \
                                           self.capture.get(cv2.CAP_PROP_FRAME_HEIGHT)
+                if self.prebuffer is not None:
+                    self.prebuffer.close()
+                self.prebuffer = PreEventBuffer()
                 self.stop_display_but = ctk.CTkButton(self.frame_buts, text='Остановить поток',
                                                       command=self._stop_display)
                 self.stop_display_but.pack(side=ctk.BOTTOM, pady=5)
+                self.prebuffer_but = ctk.CTkButton(self.frame_buts, text='Сохранить предысторию',
+                                                   command=self._save_prebuffer)
+                self.prebuffer_but.pack(side=ctk.BOTTOM, pady=5)
                 self.start_display_but.pack_forget()
                 self.frame_buts.pack_configure(expand=False)
                 self._create_widgets_and_start_display()
@@ -87,7 +243,7 @@ class RealTimeGUIDetect(RealTimeObjectDetection):
                 mb.showerror('Невозможно открыть веб-камеру')
 
         choice_but = ctk.CTkButton(topframe, text='Подтвердить', command=get_model)
-        choice_but.grid(column=0, row=5, columnspan=2)
+        choice_but.grid(column=0, row=6, columnspan=2)
 
         topframe.update()
         topframe.geometry(f"{topframe.winfo_reqwidth()}x{topframe.winfo_reqheight()}")
@@ -96,39 +252,75 @@ class RealTimeGUIDetect(RealTimeObjectDetection):
     def _stop_display(self):
         self.stop_display_but.pack_forget()
         self.win.after_cancel(self.performance_control)
-        self.continue_display_but = ctk.CTkButton(self.frame_buts, text='Продолжить поток',
-                                                  command=self._continue_display)
+        if self.continue_display_but is None:
+            self.continue_display_but = ctk.CTkButton(self.frame_buts, text='Продолжить поток',
+                                                      command=self._continue_display)
+            self.apply_model_but = ctk.CTkButton(self.frame_buts, text='Детектировать объекты',
+                                                 command=self._apply_model)
         self.continue_display_but.pack(side=ctk.TOP, pady=5)
-        self.apply_model_but = ctk.CTkButton(self.frame_buts, text='Детектировать объекты', command=self._apply_model)
         self.apply_model_but.pack(side=ctk.TOP, pady=5)
 
+    def _save_prebuffer(self):
+        path = self.prebuffer.trigger('operator')
+        if path is None:
+            mb.showwarning('Предупреждение', 'Буфер предыстории пуст!')
+        else:
+            mb.showinfo('Успех', f'Последние {self.prebuffer.seconds:g} с потока сохраняются в {path}')
+
     def _apply_model(self):
+        try:
+            frame, meta = self.get_detected_frame(self.net, self.output_layers, self.frame)
+        except IOError as exc:
+            logger.error(f'Детекция кадра не выполнена. Возникла ошибка {exc}')
+            mb.showerror('Ошибка', str(exc))
+            return
         self.apply_model_but.pack_forget()
-        self.frame, self.meta = self.get_detected_frame(self.net, self.output_layers, self.frame)
+        self.frame, self.meta = frame, meta
+        if self.prebuffer is not None and self.meta:
+            self.prebuffer.trigger('detection', self.meta, force=False)
 
-        topframe = tk.Toplevel(self.win)
-        topframe.iconbitmap("MAI.ico")
-        topframe.resizable(width=False, height=False)
-        topframe.title('Скриншот')
-        image_toplvl = ImageGUIDetect(topframe, self.menu)
-        image_toplvl()
-        image_toplvl.start_display_but.pack_forget()
+        image_toplvl = self._screenshot_window()
+        topframe = image_toplvl.win
         if self.video_name:
             image_toplvl.initialfilename = f"{self.video_name}_frame{self.count_frames}"
         else:
             image_toplvl.initialfilename = "frame_" + time.strftime("%d-%m-%Y_%H-%M-%S")
         image_toplvl.img_path = self.frame
+        image_toplvl.source = self.video_name or 'camera'
         image_toplvl.create_image_panel(self.frame, self.meta)
 
         topframe.update()
         topframe.geometry(f"{topframe.winfo_reqwidth()}x{topframe.winfo_reqheight()}")
         center(topframe)
 
+    def _screenshot_window(self):
+        """
+        Окно скриншота создаётся при первом обращении и дальше переиспользуется: следующий скриншот заменяет
+        изображение и таблицу в том же окне. Закрытие окна уничтожает его вместе с содержимым.
+        """
+        if self.screenshot is not None and self.screenshot.win.winfo_exists():
+            return self.screenshot
+        topframe = tk.Toplevel(self.win)
+        try:
+            topframe.iconbitmap("MAI.ico")
+        except tk.TclError:
+            # Значок .ico поддерживается только в Windows
+            pass
+        topframe.resizable(width=False, height=False)
+        topframe.title('Скриншот')
+        topframe.protocol('WM_DELETE_WINDOW', self._close_screenshot)
+        self.screenshot = ImageGUIDetect(topframe, self.menu)
+        return self.screenshot
+
+    def _close_screenshot(self):
+        if self.screenshot is not None:
+            self.screenshot.clear()
+            self.screenshot.win.destroy()
+            self.screenshot = None
+
     def _continue_display(self):
         self.continue_display_but.pack_forget()
         self.apply_model_but.pack_forget()
-        self.stop_display_but = ctk.CTkButton(self.frame_buts, text='Остановить поток',
-                                              command=self._stop_display)
         self.stop_display_but.pack(side=ctk.TOP, pady=5)
         self._update()
 
@@ -137,6 +329,7 @@ class RealTimeGUIDetect(RealTimeObjectDetection):
         self.count_frames = 0
         self.panel = tk.Label(self.win, width=int(self.width), height=int(self.height))
         self.panel.pack(side=ctk.TOP)
+        self.display = FrameDisplay(self.panel)
         self.starting_time = time.time()
         self.frame_timer = int(self.capture.get(cv2.CAP_PROP_FPS))
         self._update()
@@ -145,9 +338,9 @@ class RealTimeGUIDetect(RealTimeObjectDetection):
         self.frame = self.get_frame(self.capture, self.starting_time)
         if self.frame is not None:
             self.count_frames += 1
-            frame = ImageTk.PhotoImage(Image.fromarray(self.frame))
-            self.panel.configure(image=frame)
-            self.panel.image = frame
+            self.display.show(self.frame)
+            if self.prebuffer is not None:
+                self.prebuffer.push(self.frame)
 
         self.performance_control = self.win.after(self.frame_timer, self._update)
 
@@ -178,6 +371,16 @@ class VideoGUIDetect(RealTimeGUIDetect, VideoObjectDetection):
         self.size = size
         self.menu = menu
         self.win = win
+        self.prebuffer = None
+        self.screenshot = None
+        self.panel = None
+        self.stop_display_but = None
+        self.continue_display_but = None
+        self.apply_model_but = None
+        self.export_but = None
+        self.swap_model_but = None
+        self.rollback_model_but = None
+        self.performance_control = None
 
     def __call__(self):
         self.frame_buts = ctk.CTkFrame(self.win)
@@ -198,53 +401,286 @@ class VideoGUIDetect(RealTimeGUIDetect, VideoObjectDetection):
             self.stop_display_but.pack_forget()
         except:
             pass
-        topframe, scroe_threshold, nms_threshold, confidence_threshold = self.model_choice_frame(self.win)
+        try:
+            self.export_but.pack_forget()
+        except:
+            pass
+        topframe, scroe_threshold, nms_threshold, confidence_threshold, server_url, input_size, workers = \
+            self.model_choice_frame(self.win)
 
         def get_model():
             topframe.destroy()
+            self.release_model(getattr(self, 'net', None))
             super(RealTimeGUIDetect, self).__init__(YOLOv7_PATH, self.class_list, scroe_threshold.get() / 100,
                                                     nms_threshold.get() / 100, confidence_threshold.get() / 100,
-                                                    self.size)
+                                                    self.chosen_size(input_size.get(), self.size),
+                                                    server_url.get().strip() or None, int(workers.get()))
             self.net, self.output_layers = self.init_model()
+            if input_size.get() == 'Авто':
+                self.autotune_size(self.net, self.output_layers)
+            self.net = swappable(self, self.net, self.output_layers)
+            self._create_model_buttons()
 
             video_path = filedialog.askopenfilename(title='Выбор видео', defaultextension='mp4', initialdir='.')
             if not mimetypes.guess_type(video_path)[0].startswith('video'):
                 mb.showwarning('Предупреждение!', 'Вы пытаетесь открыть не видео!')
             else:
-                video_name = video_path.split('/')[-1]
-                try:
-                    logger.info(f"Успешное открытие {video_path.split('/')[-1]} видео")
-                    widget_list = self.win.winfo_children()
-                    if len(widget_list) > 1:
-                        self.win.after_cancel(self.performance_control)
-                        for i in range(1, len(widget_list)):
-                            widget_list[i].pack_forget()
-                    self.capture = self.load_capture(video_path)
-                    self.width, self.height = self.capture.get(cv2.CAP_PROP_FRAME_WIDTH), \
-                                              self.capture.get(cv2.CAP_PROP_FRAME_HEIGHT)
-
-                    self.save_frame_but.pack_forget()
-                    self.stop_display_but.pack_forget()
-                    self.continue_display_but.pack_forget()
-                except AttributeError:
-                    pass
-                except IOError:
-                    mb.showerror(f"Невозможно открыть видео {video_path.split('/')[-1]}")
-                    exit()
-                finally:
-                    self.frame_buts.pack_configure(expand=False)
-                    self.stop_display_but = ctk.CTkButton(self.frame_buts, text='Остановить поток',
-                                                          command=self._stop_display)
-                    self.stop_display_but.pack(side=ctk.BOTTOM, pady=5)
-                    self._create_widgets_and_start_display(video_name)
+                self._open_video(video_path)
 
         choice_but = ctk.CTkButton(topframe, text='Подтвердить', command=get_model)
-        choice_but.grid(column=0, row=5, columnspan=2)
+        choice_but.grid(column=0, row=6, columnspan=2)
 
         topframe.update()
         topframe.geometry(f"{topframe.winfo_reqwidth()}x{topframe.winfo_reqheight()}")
         center(topframe)
 
+    def _open_video(self, video_path):
+        """
+        Открывает видео в уже загруженной модели: уничтожает панель и кнопки предыдущего видео и начинает показ.
+        """
+        video_name = video_path.split('/')[-1]
+        try:
+            logger.info(f"Успешное открытие {video_path.split('/')[-1]} видео")
+            self._clear_display()
+            if getattr(self, 'capture', None) is not None:
+                self.capture.release()
+            self.capture = self.load_capture(video_path)
+            self.video_path = video_path
+            self.width, self.height = self.capture.get(cv2.CAP_PROP_FRAME_WIDTH), \
+                                      self.capture.get(cv2.CAP_PROP_FRAME_HEIGHT)
+        except AttributeError:
+            pass
+        except IOError:
+            mb.showerror(f"Невозможно открыть видео {video_path.split('/')[-1]}")
+            exit()
+        finally:
+            self.frame_buts.pack_configure(expand=False)
+            self.stop_display_but = ctk.CTkButton(self.frame_buts, text='Остановить поток',
+                                                  command=self._stop_display)
+            self.stop_display_but.pack(side=ctk.BOTTOM, pady=5)
+            self.export_but = ctk.CTkButton(self.frame_buts, text='Экспорт видео', command=self._export_video)
+            self.export_but.pack(side=ctk.BOTTOM, pady=5)
+            self._create_widgets_and_start_display(video_name)
+
+    def _clear_display(self):
+        """
+        Останавливает показ и уничтожает панель и кнопки предыдущего видео вместе с их изображениями, чтобы они не
+        накапливались в окне при открытии следующих видео.
+        """
+        if self.performance_control is not None:
+            self.win.after_cancel(self.performance_control)
+            self.performance_control = None
+        for name in ('panel', 'stop_display_but', 'continue_display_but', 'apply_model_but', 'export_but'):
+            widget = getattr(self, name)
+            if widget is not None:
+                widget.destroy()
+                setattr(self, name, None)
+
+    def _export_video(self):
+        topframe = ctk.CTkToplevel(self.win)
+        topframe.resizable(width=False, height=False)
+        topframe.title('Экспорт видео')
+
+        frame = ctk.CTkFrame(topframe)
+        frame.pack(expand=True)
+
+        # Пустые поля - экспорт с начала и до конца видео
+        start, end = tk.StringVar(), tk.StringVar()
+        only_detections = tk.BooleanVar(value=False)
+        ctk.CTkLabel(frame, text='Начало, с', anchor="w", width=20).grid(column=0, row=0, padx=5, pady=5)
+        ctk.CTkEntry(frame, textvariable=start, placeholder_text='0').grid(column=1, row=0, padx=5, pady=5)
+        ctk.CTkLabel(frame, text='Конец, с', anchor="w", width=20).grid(column=0, row=1, padx=5, pady=5)
+        ctk.CTkEntry(frame, textvariable=end).grid(column=1, row=1, padx=5, pady=5)
+        ctk.CTkCheckBox(frame, text='Только фрагменты с детекциями',
+                        variable=only_detections).grid(column=0, row=2, columnspan=2, pady=5)
+        progress_bar = ctk.CTkProgressBar(frame, width=200)
+        progress_bar.set(0)
+        progress_bar.grid(column=0, row=3, columnspan=2, pady=5)
+        progress_label = ctk.CTkLabel(frame, text='')
+        progress_label.grid(column=0, row=4, columnspan=2, pady=5)
+
+        # Экспорт идёт в отдельном потоке со своей копией модели, окно опрашивает его состояние через after
+        state = {'frames': 0, 'fraction': 0.0, 'result': None, 'error': None, 'exporter': None, 'stopped': False}
+
+        def run_export(exporter):
+            try:
+                state['result'] = exporter.run()
+            except Exception as exc:
+                state['error'] = exc
+
+        def poll():
+            progress_bar.set(state['fraction'])
+            progress_label.configure(text=f"Обработано кадров: {state['frames']}")
+            if state['error'] is not None:
+                mb.showerror('Ошибка', f'Ошибка при экспорте {self.video_path}: {state["error"]}')
+                topframe.destroy()
+            elif state['result'] is not None:
+                result = state['result']
+                message = f'Записано {result["written"]} из {result["frames"]} кадров ' \
+                          f'(x{result["realtime"]:.1f} от скорости воспроизведения)'
+                if state['stopped']:
+                    mb.showinfo('Экспорт остановлен', message)
+                else:
+                    mb.showinfo('Успех', f'{message}, фрагментов: {len(result["segments"])}')
+                topframe.destroy()
+            else:
+                topframe.after(200, poll)
+
+        def stop_export():
+            if state['exporter'] is not None:
+                state['stopped'] = True
+                state['exporter'].stop()
+
+        def get_info():
+            try:
+                start_s = float(start.get()) if start.get().strip() else None
+                end_s = float(end.get()) if end.get().strip() else None
+            except ValueError:
+                mb.showwarning('Предупреждение', 'Начало и конец задаются числом секунд!')
+                return
+            if start_s is not None and end_s is not None and end_s <= start_s:
+                mb.showwarning('Предупреждение', 'Конец фрагмента должен быть позже начала!')
+                return
+            output_path = filedialog.asksaveasfilename(title='Экспорт видео', defaultextension='.mp4',
+                                                       initialfile=f"{os.path.splitext(self.video_name)[0]}"
+                                                                   f"_detections.mp4",
+                                                       filetypes=[("mp4 file(*.mp4)", "*.mp4"),
+                                                                  ("avi file(*.avi)", "*.avi")])
+            if not output_path:
+                return
+            detector = VideoObjectDetection(self.MODEL_PATH, self.CLASS_LIST, self.SCORE_THRESHOLD,
+                                            self.NMS_THRESHOLD, self.CONFIDENCE_THRESHOLD, self.SIZE,
+                                            self.REMOTE_URL, self.WORKERS, self.SCREENING_MODEL_PATH)
+            state['exporter'] = VideoExporter(detector, self.video_path, output_path, start_s, end_s,
+                                              only_detections.get(),
+                                              progress=lambda frames, fraction: state.update(frames=frames,
+                                                                                            fraction=fraction))
+            choice_but.configure(text='Остановить', command=stop_export)
+            threading.Thread(target=run_export, args=(state['exporter'],), daemon=True).start()
+            poll()
+
+        choice_but = ctk.CTkButton(frame, text='Экспортировать', command=get_info)
+        choice_but.grid(column=0, row=5, columnspan=2, pady=5)
+
+        topframe.update()
+        topframe.geometry(f"{topframe.winfo_reqwidth() + 30}x{topframe.winfo_reqheight() + 30}")
+        center(topframe)
+
+
+class MultiCameraGUIDetect(ModelSwapControls, MultiCameraDetection):
+
+    def __init__(self,
+                 win,
+                 menu,
+                 sources=CAMERA_SOURCES,
+                 class_list=CLASS_LIST,
+                 size=SIZE):
+        """
+        Класс, который представляет собой графическое взаимодействие с моделью нейронной сети для детекции объектов
+        одновременно на нескольких камерах. Кадры всех камер выводятся сеткой. Он графически реализует методы
+        из класса MultiCameraDetection.
+        :param win: Главное окно, которое представляет собой экземпляр класса tkinter.Tk.
+        :param menu: Главное меню, которое представляет собой экземпляр класса tkinter.Menu.
+        :param sources: Список источников: индексы веб-камер, пути к видео или URL потоков.
+        :param class_list: Список классов, которые должны быть обнаружены.
+        :param size: Кортеж с шириной и высотой входа сети.
+        """
+        assert isinstance(menu, DatabaseMenu), "Параметр menu должен быть объектом класса DatabaseMenu"
+        assert isinstance(sources, list | tuple) and len(sources) > 0, \
+            "sources должен иметь тип list или tuple и содержать хотя бы один источник"
+        assert isinstance(class_list, list | tuple), "class_list должен иметь тип list или tuple"
+        assert isinstance(size, list | tuple), "Размеры должны иметь тип list или tuple"
+        assert len(size) == 2 and isinstance(size[0], int) and isinstance(size[1], int), \
+            "Список/кортёж size должен иметь 2 элемента, и эти элементы должны иметь тип int"
+
+        self.menu = menu
+        self.win = win
+        self.camera_sources = sources
+        self.class_list = class_list
+        self.size = size
+        self.swap_model_but = None
+        self.rollback_model_but = None
+
+    def __call__(self):
+        self.frame_buts = ctk.CTkFrame(self.win)
+        self.start_display_but = ctk.CTkButton(self.frame_buts, text='Начать потоки', command=self._start_display)
+        self.frame_buts.pack(expand=True)
+        self.start_display_but.pack()
+
+    def _start_display(self):
+        topframe, scroe_threshold, nms_threshold, confidence_threshold, server_url, input_size, workers = \
+            RealTimeGUIDetect.model_choice_frame(self.win)
+
+        def get_model():
+            topframe.destroy()
+            try:
+                super(MultiCameraGUIDetect, self).__init__(self.camera_sources, YOLOv7_PATH, self.class_list,
+                                                           scroe_threshold.get() / 100, nms_threshold.get() / 100,
+                                                           confidence_threshold.get() / 100,
+                                                           RealTimeGUIDetect.chosen_size(input_size.get(), self.size),
+                                                           remote_url=server_url.get().strip() or None,
+                                                           workers=int(workers.get()))
+                self.net, self.output_layers, self.captures = self.init_model()
+                if input_size.get() == 'Авто':
+                    self.autotune_size(self.net, self.output_layers)
+                self.net = swappable(self, self.net, self.output_layers)
+            except IOError as exc:
+                mb.showerror('Ошибка', str(exc))
+                return
+            self.start_display_but.pack_forget()
+            self.stop_display_but = ctk.CTkButton(self.frame_buts, text='Остановить потоки',
+                                                  command=self._stop_display)
+            self.stop_display_but.pack(side=ctk.BOTTOM, pady=5)
+            self._create_model_buttons()
+            self.frame_buts.pack_configure(expand=False)
+            self._create_grid()
+            self._update()
+
+        choice_but = ctk.CTkButton(topframe, text='Подтвердить', command=get_model)
+        choice_but.grid(column=0, row=6, columnspan=2)
+
+        topframe.update()
+        topframe.geometry(f"{topframe.winfo_reqwidth()}x{topframe.winfo_reqheight()}")
+        center(topframe)
+
+    def _create_grid(self):
+        count = len(self.captures)
+        columns = math.ceil(math.sqrt(count))
+        rows = math.ceil(count / columns)
+        cell_size = (DISPLAY_MAX_SIZE[0] // columns, DISPLAY_MAX_SIZE[1] // rows)
+
+        self.grid_frame = tk.Frame(self.win, bg='black')
+        self.grid_frame.pack(side=ctk.TOP)
+        self.displays = []
+        for i in range(count):
+            panel = tk.Label(self.grid_frame, bg='black')
+            panel.grid(row=i // columns, column=i % columns, padx=2, pady=2)
+            self.displays.append(FrameDisplay(panel, cell_size))
+
+    def _update(self):
+        try:
+            results = self.get_detected_frames(self.net, self.output_layers, self.captures)
+        except IOError as exc:
+            # Процессы детекции или сервер перестали отвечать: показ останавливается с сообщением, а не замирает
+            logger.error(f'Детекция кадров с камер остановлена. Возникла ошибка {exc}')
+            mb.showerror('Ошибка', str(exc))
+            self._stop_display()
+            return
+        for camera_id, (image, meta) in results.items():
+            self.displays[camera_id].show(image)
+        # Если ни одна камера не дала новый кадр, следующий опрос откладывается, чтобы не занимать поток Tk
+        self.performance_control = self.win.after(1 if results else 5, self._update)
+
+    def _stop_display(self):
+        self.win.after_cancel(self.performance_control)
+        self.release(self.captures)
+        self.release_model(self.net)
+        self.grid_frame.destroy()
+        self.displays = []
+        self.stop_display_but.destroy()
+        self.start_display_but.pack()
+        self.frame_buts.pack_configure(expand=True)
+
 
 class ImageGUIDetect(ImageObjectDetection):
 
@@ -271,13 +707,20 @@ class ImageGUIDetect(ImageObjectDetection):
         self.size = size
         self.menu = menu
         self.win = win
+        self.image_store = ImageStore()
+        self._stored_frame = None
+        self.source = None
+        self.detected_at = None
+        self.panel = None
+        self.frame_table_buts = None
 
     def __call__(self):
         self.start_display_but = ctk.CTkButton(self.win, text='Выбрать изображение', command=self._open_img)
         self.start_display_but.pack(expand=True)
 
     def _open_img(self):
-        topframe, scroe_threshold, nms_threshold, confidence_threshold = RealTimeGUIDetect.model_choice_frame(self.win)
+        topframe, scroe_threshold, nms_threshold, confidence_threshold, server_url, input_size, workers = \
+            RealTimeGUIDetect.model_choice_frame(self.win)
 
 
         def get_model():
@@ -290,18 +733,18 @@ class ImageGUIDetect(ImageObjectDetection):
                 img = img.resize((640, 640), Image.LANCZOS)
                 img = ImageTk.PhotoImage(img)
                 self.initialfilename = f"detected_{self.img_path.split('/')[-1].split('.')[0]}"
+                self.source = self.img_path.split('/')[-1]
                 logger.info(f"Успешное открытие {self.img_path.split('/')[-1]} изображения")
 
+                self.release_model(getattr(self, 'net', None))
                 super(ImageGUIDetect, self).__init__(YOLOv7_PATH, self.class_list, scroe_threshold.get() / 100,
                                                      nms_threshold.get() / 100, confidence_threshold.get() / 100,
-                                                     self.size)
+                                                     RealTimeGUIDetect.chosen_size(input_size.get(), self.size),
+                                                     server_url.get().strip() or None, int(workers.get()))
                 self.net, self.output_layers = self.init_model()
+                if input_size.get() == 'Авто':
+                    self.autotune_size(self.net, self.output_layers)
                 self.capture = self.load_capture(self.img_path)
-
-                widget_list = self.win.winfo_children()
-                if len(widget_list) > 1:
-                    for i in range(1, len(widget_list)):
-                        widget_list[i].pack_forget()
                 self.create_image_panel()
             except UnidentifiedImageError:
                 mb.showwarning('Предупреждение', 'Вы пытаетесь открыть не изображение!')
@@ -309,31 +752,54 @@ class ImageGUIDetect(ImageObjectDetection):
                 pass
 
         choice_but = ctk.CTkButton(topframe, text='Подтвердить', command=get_model)
-        choice_but.grid(column=0, row=5, columnspan=2)
+        choice_but.grid(column=0, row=6, columnspan=2)
 
         topframe.update()
         topframe.geometry(f"{topframe.winfo_reqwidth()}x{topframe.winfo_reqheight()}")
         center(topframe)
 
+    def _store_frame(self, tk_img):
+        """
+        Сохраняет кадр в хранилище изображений и возвращает его хеш. Кадр кодируется один раз: повторные сохранения
+        того же кадра (изображение, CSV, Parquet, SQL) используют уже полученный хеш.
+        """
+        if self._stored_frame is None or self._stored_frame[0] is not tk_img:
+            img = np.asarray(ImageTk.getimage(tk_img).convert('RGB'))
+            self._stored_frame = (tk_img, self.image_store.put(img))
+        return self._stored_frame[1]
+
     def _save_img(self, img):
-        if not os.path.isdir('saved_data'):
-            os.mkdir('saved_data')
-        if not os.path.isdir('saved_data/images'):
-            os.mkdir('saved_data/images')
+        os.makedirs('saved_data/images', exist_ok=True)
         result = filedialog.asksaveasfilename(title="Сохранение изображения", filetypes=(
             ('JPEG', ('*.jpg', '*.jpeg', '*.jpe')), ('PNG', '*.png'), ('BMP', ('*.bmp', '*.jdib')),
             ('GIF', '*.gif')), initialdir=os.path.join(os.getcwd(), 'saved_data/images'),
                                               initialfile=self.initialfilename + ".jpg")
         if result:
-            img = ImageTk.getimage(img)
-            img = img.convert('RGB')
-            img.save(result)
+            stored_path = self.image_store.find(self._store_frame(img))
+            if mimetypes.guess_type(result)[0] == mimetypes.guess_type(stored_path)[0]:
+                # Файл хранилища уже закодирован в нужном формате
+                shutil.copyfile(stored_path, result)
+            else:
+                img = ImageTk.getimage(img)
+                img = img.convert('RGB')
+                img.save(result)
             try:
                 logger.info(f"Успешное сохранения {self.img_path.split('/')[-1]} изображения")
             except AttributeError:
                 logger.info(f"Успешное сохранения кадра")
 
+    def clear(self):
+        """
+        Уничтожает панель и таблицу предыдущего изображения вместе с PhotoImage и таблицей детекций.
+        """
+        for widget in (self.panel, self.frame_table_buts):
+            if widget is not None:
+                widget.destroy()
+        self.panel = self.frame_table_buts = None
+        self._stored_frame = None
+
     def create_image_panel(self, image=None, frame=None):
+        self.clear()
         self.panel = tk.Label(self.win)
         self.panel.pack()
         self.starting_time = time.time()
@@ -342,16 +808,18 @@ class ImageGUIDetect(ImageObjectDetection):
     def _update(self, image=None, meta=None):
         if image is None and meta is None:
             image, meta = self.get_detected_frame(self.capture, self.net, self.output_layers, )
-        frame_table_buts = ctk.CTkFrame(self.win)
+        self.detected_at = datetime.now()
+        self.frame_table_buts = frame_table_buts = ctk.CTkFrame(self.win)
         frame_table_buts.pack()
 
         save_img_but = ctk.CTkButton(frame_table_buts, text='Сохранить изображение',
                                      command=lambda: self._save_img(image))
         save_img_but.pack(side=ctk.TOP, pady=5)
         if image is not None:
-            image = ImageTk.PhotoImage(Image.fromarray(image))
-            self.panel.configure(image=image)
-            self.panel.image = image
+            with monitor.measure('render'):
+                image = ImageTk.PhotoImage(Image.fromarray(image))
+                self.panel.configure(image=image)
+                self.panel.image = image
             meta_dict = {'class_obj': [],
                          'confidence': [],
                          'x_min': [],
@@ -381,6 +849,11 @@ class ImageGUIDetect(ImageObjectDetection):
                                                    command=lambda: self._save_table_csv(df_meta, image))
                 save_table_csv_but.pack(padx=4, side=ctk.RIGHT)
 
+                save_table_parquet_but = ctk.CTkButton(save_table_buts_frame,
+                                                       text='Сохранить таблицу в формате Parquet',
+                                                       command=lambda: self._save_table_parquet(df_meta, image))
+                save_table_parquet_but.pack(padx=4, side=ctk.RIGHT)
+
                 save_table_sql_but = ctk.CTkButton(save_table_buts_frame, text='Сохранить таблицу в формате SQL',
                                                    command=lambda: self._save_table_sql(df_meta, image))
                 save_table_sql_but.pack(padx=4, side=ctk.RIGHT)
@@ -388,20 +861,10 @@ class ImageGUIDetect(ImageObjectDetection):
             return image, meta
 
     def _make_full_df(self, dataframe, tk_img):
-        img = ImageTk.getimage(tk_img)
-        img = img.convert('RGB')
-        img_byte_arr = BytesIO()
-        img.save(img_byte_arr, format='JPEG')
-        img_bytes = img_byte_arr.getvalue()
-
-        # --------------------------------------------------------------------------------------------------------------
-        # Код для вывода на экран байтового изображения
-        # image = Image.open(BytesIO(img_bytes))
-        # image.show()
-        # --------------------------------------------------------------------------------------------------------------
-
-        image_df = pd.DataFrame(columns=['image'], data=[[img_bytes]] * len(dataframe))
+        image_df = pd.DataFrame(columns=['image_hash'], data=[[self._store_frame(tk_img)]] * len(dataframe))
         full_df = pd.merge(image_df, dataframe, left_index=True, right_index=True)
+        full_df['detected_at'] = self.detected_at
+        full_df['source'] = self.source
 
         return full_df
 
@@ -420,6 +883,19 @@ class ImageGUIDetect(ImageObjectDetection):
             table_df.to_csv(result)
             logger.info("Успешное сохранения таблицы в формате csv")
 
+    def _save_table_parquet(self, dataframe, tk_img):
+        table_df = self._make_full_df(dataframe, tk_img)
+        os.makedirs('saved_data/tables', exist_ok=True)
+        result = filedialog.asksaveasfilename(title="Сохранение таблицы",
+                                              filetypes=[("parquet file(*.parquet)", "*.parquet"),
+                                                         ("arrow file(*.arrow)", "*.arrow")],
+                                              initialdir=os.path.join(os.getcwd(), 'saved_data/tables'),
+                                              initialfile=self.initialfilename + ".parquet",
+                                              defaultextension=".parquet")
+        if result:
+            write_detections(result, table_df)
+            logger.info("Успешное сохранения таблицы в формате Parquet")
+
     def _save_table_sql(self, dataframe, tk_img):
         if self.menu.db_funtional == None or self.menu.db_funtional.engine == None:
             mb.showerror('Ошибка', 'Вы не подключились к базе данных!')
@@ -445,7 +921,20 @@ class ImageGUIDetect(ImageObjectDetection):
                     if not table_name:
                         mb.showwarning('Предупреждение', 'Вы не выбрали таблицу!')
                     else:
-                        result = self.menu.db_funtional.insert_data(table_name, table_df)
+                        db_funtional = self.menu.db_funtional
+                        if db_funtional.is_legacy_table(table_name):
+                            if not mb.askyesno('Старая схема таблицы',
+                                               f'Таблица {table_name} создана до хранилища изображений и хранит '
+                                               f'кадры в самой таблице. Перенести её кадры в хранилище и обновить '
+                                               f'схему, чтобы записать данные?'):
+                                return
+                            try:
+                                db_funtional.upgrade_table(table_name)
+                            except Exception as exc:
+                                logger.error(f'Не удалось обновить схему таблицы {table_name}: {exc}')
+                                mb.showerror('Ошибка', f'Не удалось обновить схему таблицы {table_name}: {exc}')
+                                return
+                        result = db_funtional.insert_data(table_name, table_df)
                         if result:
                             mb.showinfo('Успех', f'Вы успешно записали данные в таблицу {table_name}!')
                             topframe.destroy()
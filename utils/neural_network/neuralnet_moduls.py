@@ -1,9 +1,30 @@
+import os
 import cv2
 import time
 import numpy as np
-from logger.logger_config import logger
+from logger.logger_config import get_logger, frame_log_limiter
 from utils.utils import counter_decorator
-from config import YOLOv7_PATH, SIZE, CLASS_LIST
+from utils.metrics.metrics_moduls import monitor
+from utils.video.video_moduls import CaptureOptions, PrefetchingCapture, open_capture
+from utils.server.client_moduls import RemoteDetectionClient
+from utils.neural_network.nms_moduls import nms, batched_nms
+from utils.neural_network.overlay_moduls import OverlayRenderer
+from utils.neural_network.workers_moduls import DetectionWorkerPool
+from utils.neural_network.cascade_moduls import ScreeningCascade
+from utils.neural_network.hotswap_moduls import HotSwapModel
+from utils.threads.threads_moduls import governor
+from utils.alerts.alert_moduls import get_alert_bus
+from config import YOLOv7_PATH, SIZE, CLASS_LIST, DETECTION_SERVER_URL, INPUT_SIZES, AUTOTUNE_TARGET_FPS, \
+    AUTOTUNE_FRAMES, NMS_PER_CLASS, NMS_METHOD, SOFT_NMS_SIGMA, DETECTION_WORKERS, SCREENING_MODEL_PATH, \
+    SCREENING_SIZE, SCREENING_THRESHOLD, LIVE_SOURCE
+
+logger = get_logger(__name__)
+
+# Модели, которые принимают методы детектора: сеть в процессе, клиент сервера детекции, пул процессов детекции,
+# каскад и заменяемая без остановки модель
+MODEL_TYPES = (cv2.dnn.Net, RemoteDetectionClient, DetectionWorkerPool, ScreeningCascade, HotSwapModel)
+MODEL_TYPES_MESSAGE = 'Переменная net должна иметь один из типов: ' + ', '.join(
+    'cv2.dnn.Net' if model_type is cv2.dnn.Net else model_type.__name__ for model_type in MODEL_TYPES)
 
 
 class RealTimeObjectDetection:
@@ -14,7 +35,10 @@ class RealTimeObjectDetection:
                  score_threshold=0.6,
                  nms_threshold=0.55,
                  confidence_threshold=0.6,
-                 size=SIZE):
+                 size=SIZE,
+                 remote_url=DETECTION_SERVER_URL,
+                 workers=DETECTION_WORKERS,
+                 screening_model_path=SCREENING_MODEL_PATH):
         """
         Класс, реализующий обнаружение объектов в реальном времени с помощью библиотеки компьютерного зрения OpenCV
         и предобученной модели нейронной сети формата ONNX. Он содержит несколько методов, которые обрабатывают
@@ -24,7 +48,15 @@ class RealTimeObjectDetection:
         :param score_threshold: Порог, используемый для фильтрации боксов.
         :param nms_threshold: Порог, используемый при не максимальном подавлении.
         :param confidence_threshold: Порог, при котором объект считается распознанным.
-        :param size: Кортеж с шириной и высотой видео.
+        :param size: Кортеж с шириной и высотой входа сети (например, 320, 416, 512 или 640). Размер, отличный от
+        размера экспорта, требует модели с динамическими осями.
+        :param remote_url: Адрес локального сервера детекции (utils.server.server_moduls). Если задан, модель не
+        загружается в процесс, а кадры отправляются на сервер.
+        :param workers: Число процессов детекции (utils.neural_network.workers_moduls). Если больше 0, модель
+        загружается в каждый из процессов, а в текущем процессе остаются только захват и отображение кадров.
+        :param screening_model_path: Путь к отсеивающей модели низкого разрешения для каскада
+        (utils.neural_network.cascade_moduls) или None. Если задан, полная модель применяется только к кадрам,
+        в которых отсеивающая модель нашла объект.
         """
         assert isinstance(score_threshold, int | float) and score_threshold >= 0 and score_threshold <= 1, \
             "score_threshold должен иметь тип int или float и его значение должно быть в пределах от 0 до 1"
@@ -38,15 +70,29 @@ class RealTimeObjectDetection:
         assert isinstance(size, list | tuple), "Размеры должны иметь тип list или tuple"
         assert len(size) == 2 and isinstance(size[0], int) and isinstance(size[1], int), \
             "Список/кортёж size должен иметь 2 элемента, и эти элементы должны иметь тип int"
+        assert remote_url is None or isinstance(remote_url, str), "remote_url должен иметь тип str или None"
+        assert isinstance(workers, int) and workers >= 0, "workers должен иметь тип int и быть не меньше 0"
 
         self.MODEL_PATH = model_path
         self.SCORE_THRESHOLD = score_threshold
         self.NMS_THRESHOLD = nms_threshold
         self.CONFIDENCE_THRESHOLD = confidence_threshold
         self.CLASS_LIST = class_list
-        self.SIZE = size
+        self.SIZE = tuple(size)
+        self.REMOTE_URL = remote_url or None
+        self.WORKERS = workers
+        self.SCREENING_MODEL_PATH = screening_model_path or None
+        # Потоки и ядра этапов обработки кадра, выделенные детектору (utils.threads.threads_moduls)
+        self.thread_allocation = governor.register(self)
+        self.NMS_PER_CLASS = NMS_PER_CLASS
+        self.NMS_METHOD = NMS_METHOD
+        self.batch_supported = True
 
         self.colors = np.random.uniform(0, 255, size=(len(self.CLASS_LIST), 3))
+        self.renderer = OverlayRenderer(self.CLASS_LIST, self.colors)
+        # Шина оповещений о детекциях опасных классов (utils.alerts.alert_moduls) или None, если приёмники не заданы
+        self.alerts = get_alert_bus()
+        self.alert_source = None
 
     def init_model(self):
         net, output_layers = self._build_model()
@@ -54,24 +100,67 @@ class RealTimeObjectDetection:
         return net, output_layers, capture
 
     def _build_model(self):
+        if self.REMOTE_URL:
+            logger.info(f'Использование сервера детекции {self.REMOTE_URL}')
+            return RemoteDetectionClient(self.REMOTE_URL), []
+        if self.WORKERS > 0:
+            try:
+                pool = DetectionWorkerPool(self, self.WORKERS).start()
+                self.SIZE = pool.size
+                return pool, []
+            except IOError as exc:
+                logger.error(f'Возникла ошибка {exc}')
+                return None
         try:
-            net = cv2.dnn.readNet(self.MODEL_PATH)
-            layer_names = net.getLayerNames()
-            output_layers = [layer_names[i - 1] for i in net.getUnconnectedOutLayers()]
-            is_cuda = cv2.cuda.getCudaEnabledDeviceCount()
-            if is_cuda:
-                logger.info('Использование CUDA')
-                net.setPreferableBackend(cv2.dnn.DNN_BACKEND_CUDA)
-                net.setPreferableTarget(cv2.dnn.DNN_TARGET_CUDA_FP16)
-            else:
-                logger.info('Использование CPU')
-                net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
-                net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+            net, output_layers = self.load_net(self.MODEL_PATH)
+            self._check_input_size(net, output_layers)
+            if self.SCREENING_MODEL_PATH:
+                return self._build_cascade(net, output_layers), output_layers
             return net, output_layers
 
         except Exception as exc:
             logger.error(f'Возникла ошибка {exc}')
 
+    @staticmethod
+    def load_net(model_path):
+        """
+        Загружает ONNX-модель в cv2.dnn.Net на CUDA, если она доступна, иначе на CPU.
+        Возвращает сеть и имена её выходных слоёв.
+        """
+        net = cv2.dnn.readNet(model_path)
+        layer_names = net.getLayerNames()
+        output_layers = [layer_names[i - 1] for i in net.getUnconnectedOutLayers()]
+        is_cuda = cv2.cuda.getCudaEnabledDeviceCount()
+        if is_cuda:
+            logger.info('Использование CUDA')
+            net.setPreferableBackend(cv2.dnn.DNN_BACKEND_CUDA)
+            net.setPreferableTarget(cv2.dnn.DNN_TARGET_CUDA_FP16)
+        else:
+            logger.info('Использование CPU')
+            net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+            net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        return net, output_layers
+
+    def _build_cascade(self, net, output_layers):
+        """
+        Загружает отсеивающую модель и возвращает каскад ScreeningCascade или полную модель, если отсеивающую
+        загрузить не удалось.
+        """
+        screener = RealTimeObjectDetection(self.SCREENING_MODEL_PATH, self.CLASS_LIST, SCREENING_THRESHOLD,
+                                           self.NMS_THRESHOLD, SCREENING_THRESHOLD, SCREENING_SIZE, None, 0, None)
+        # Обе модели работают по очереди в одном потоке, поэтому делят потоки детектора, а не получают свои
+        governor.release(screener)
+        screener.thread_allocation = self.thread_allocation
+        screening = screener._build_model()
+        if screening is None:
+            logger.error(f'Не удалось загрузить отсеивающую модель {self.SCREENING_MODEL_PATH}, каскад отключён')
+            return net
+        logger.info(f'Каскад: отсеивающая модель {self.SCREENING_MODEL_PATH} '
+                    f'({screener.SIZE[0]}x{screener.SIZE[1]}), полная модель {self.MODEL_PATH}')
+        return ScreeningCascade(self, net, output_layers, screener, *screening)
+
+    @monitor.timed('forward')
+    @governor.governed('forward')
     def _detect(self, image, net, output_layers):
         assert isinstance(image, np.ndarray), "Переменная image должна иметь тип numpy.ndarray"
         assert isinstance(net, cv2.dnn.Net), "Переменная net должна иметь тип cv2.dnn.Net"
@@ -85,59 +174,216 @@ class RealTimeObjectDetection:
         except Exception as exc:
             logger.error(f'Возникла ошибка {exc}')
 
-    def load_capture(self):
-        capture = cv2.VideoCapture(0)
+    @staticmethod
+    def _accepts_size(net, output_layers, size):
+        try:
+            net.setInput(np.zeros((1, 3, size[1], size[0]), np.float32))
+            net.forward(output_layers)
+            return True
+        except cv2.error:
+            return False
+
+    def _check_input_size(self, net, output_layers):
+        """
+        Проверяет, что модель принимает вход размера self.SIZE. ONNX-экспорт без динамических осей принимает только
+        размер, с которым был экспортирован, поэтому в этом случае детектор переключается на config.SIZE.
+        """
+        if self._accepts_size(net, output_layers, self.SIZE):
+            return
+        if self.SIZE != tuple(SIZE) and self._accepts_size(net, output_layers, SIZE):
+            logger.warning(f'Модель не поддерживает вход {self.SIZE[0]}x{self.SIZE[1]} (нет динамических осей), '
+                           f'используется {SIZE[0]}x{SIZE[1]}')
+            self.SIZE = tuple(SIZE)
+            return
+        logger.error(f'Модель {self.MODEL_PATH} не принимает вход {self.SIZE[0]}x{self.SIZE[1]}')
+
+    def autotune_size(self, net, output_layers, target_fps=AUTOTUNE_TARGET_FPS, candidates=INPUT_SIZES,
+                      frames=AUTOTUNE_FRAMES, frame=None):
+        """
+        Подбирает разрешение входа на текущем процессоре: для каждого кандидата, который принимает модель, замеряет
+        letterbox, прямой проход и NMS на frames кадрах и выбирает наибольшее разрешение, дающее target_fps. Если
+        целевая частота недостижима, выбирается самое быстрое разрешение. Выбранный размер записывается в self.SIZE.
+        Возвращает выбранный размер и словарь {размер: кадр/с}.
+        :param frame: Кадр для замера (по умолчанию серый кадр 1280x720).
+        """
+        assert isinstance(target_fps, int | float) and target_fps > 0, \
+            "target_fps должен иметь тип int или float и быть больше 0"
+
+        if isinstance(net, RemoteDetectionClient):
+            logger.info('Разрешение входа определяется сервером детекции, подбор пропущен')
+            return self.SIZE, {}
+        if isinstance(net, DetectionWorkerPool):
+            logger.warning('Подбор разрешения входа не выполняется для процессов детекции: буферы кадров создаются '
+                           'под размер входа при запуске')
+            return self.SIZE, {}
+        if isinstance(net, ScreeningCascade):
+            # Подбирается разрешение полной модели; отсеивающая работает со своим SCREENING_SIZE
+            net, output_layers = net.net, net.output_layers
+        if isinstance(net, HotSwapModel):
+            net, output_layers = net.current()
+        frame = np.full((720, 1280, 3), 128, np.uint8) if frame is None else frame
+        original = self.SIZE
+        results = {}
+        for side in sorted(candidates):
+            size = (side, side)
+            if not self._accepts_size(net, output_layers, size):
+                continue
+            self.SIZE = size
+            self._infer(self._format_yolo(frame), net, output_layers)
+            start = time.perf_counter()
+            for _ in range(frames):
+                self._infer(self._format_yolo(frame), net, output_layers)
+            results[size] = frames / (time.perf_counter() - start)
+
+        if not results:
+            self.SIZE = original
+            logger.warning('Ни один из размеров входа для подбора не поддерживается моделью')
+            return self.SIZE, results
+        suitable = [size for size, fps in results.items() if fps >= target_fps]
+        self.SIZE = max(suitable) if suitable else max(results, key=results.get)
+        logger.info('Подбор разрешения входа: ' + ', '.join(f'{size[0]} - {fps:.1f} кадр/с'
+                                                            for size, fps in results.items()) +
+                    f'; выбрано {self.SIZE[0]}x{self.SIZE[1]} (цель {target_fps} кадр/с)')
+        return self.SIZE, results
+
+    @monitor.timed('forward')
+    @governor.governed('forward')
+    def _detect_batch(self, images, net, output_layers):
+        if self.batch_supported and len(images) > 1:
+            try:
+                blob = cv2.dnn.blobFromImages(images, 1 / 255.0, self.SIZE, swapRB=True, crop=False)
+                net.setInput(blob)
+                preds = net.forward(output_layers)[0]
+                if preds.shape[0] == len(images):
+                    return [preds[i:i + 1] for i in range(len(images))]
+            except cv2.error as exc:
+                logger.warning(f'Модель не поддерживает пакетный вход, кадры обрабатываются по одному: {exc}')
+            self.batch_supported = False
+        outs = []
+        for image in images:
+            blob = cv2.dnn.blobFromImage(image, 1 / 255.0, self.SIZE, swapRB=True, crop=False)
+            net.setInput(blob)
+            outs.append(net.forward(output_layers)[0])
+        return outs
+
+    @monitor.timed('forward')
+    def _detect_remote(self, image, client):
+        return client.detect(image, self.SCORE_THRESHOLD, self.NMS_THRESHOLD, self.CONFIDENCE_THRESHOLD)
+
+    def _infer(self, img, net, output_layers):
+        """
+        Применяет модель к кадру после _format_yolo и возвращает class_ids, confidences, boxes - локально, через
+        сервер детекции, если вместо cv2.dnn.Net передан RemoteDetectionClient, в пуле процессов, если передан
+        DetectionWorkerPool, или каскадом, если передан ScreeningCascade. Для HotSwapModel применяется модель,
+        текущая на момент вызова.
+        """
+        if isinstance(net, HotSwapModel):
+            net, output_layers = net.current()
+        if isinstance(net, RemoteDetectionClient):
+            return self._detect_remote(img, net)
+        if isinstance(net, DetectionWorkerPool):
+            with monitor.measure('forward'):
+                return net.detect(img)
+        if isinstance(net, ScreeningCascade):
+            return net.detect(img)
+        outs = self._detect(img, net, output_layers)
+        return self._wrap_detection(img, outs[0])
+
+    @staticmethod
+    def release_model(net):
+        """
+        Освобождает модель, возвращённую _build_model: останавливает процессы детекции или закрывает соединение
+        с сервером.
+        """
+        if isinstance(net, DetectionWorkerPool):
+            net.stop()
+        elif isinstance(net, RemoteDetectionClient):
+            net.close()
+
+    def load_capture(self, source=LIVE_SOURCE):
+        """
+        Открывает источник живого режима: индекс веб-камеры, URL потока или воспроизводимый источник
+        replay:ПУТЬ?fps=30 (utils.video.replay_moduls) для работы без камеры.
+        """
+        capture = cv2.VideoCapture(source) if isinstance(source, int) else open_capture(source)
         if not capture.isOpened():
-            logger.error("Невозможно открыть веб-камеру")
+            logger.error(f"Невозможно открыть веб-камеру {source}")
             raise IOError('Невозможно открыть веб-камеру')
         else:
-            logger.info('Успешное открытие веб-камеры')
+            logger.info(f'Успешное открытие веб-камеры {source}')
+            self.alert_source = str(source)
             return capture
 
-    def _wrap_detection(self, input_image, output_data):
+    def _decode(self, input_image, output_data, confidence_threshold):
+        """
+        Отбирает строки выхода сети с уверенностью не ниже confidence_threshold и переводит их в массивы
+        class_ids (N,), confidences (N,) и boxes (N, 4) в формате (left, top, width, height).
+        """
+        rows = output_data.reshape(-1, output_data.shape[-1])
+        rows = rows[rows[:, 4] >= confidence_threshold]
+        image_height, image_width = input_image.shape[:2]
+        x_factor = image_width / self.SIZE[0]
+        y_factor = image_height / self.SIZE[1]
+        class_ids = rows[:, 5:].argmax(axis=1)
+        confidences = rows[:, 4]
+        boxes = np.empty((len(rows), 4), dtype=np.int64)
+        boxes[:, 0] = (rows[:, 0] - 0.5 * rows[:, 2]) * x_factor
+        boxes[:, 1] = (rows[:, 1] - 0.5 * rows[:, 3]) * y_factor
+        boxes[:, 2] = rows[:, 2] * x_factor
+        boxes[:, 3] = rows[:, 3] * y_factor
+        return class_ids, confidences, boxes
+
+    @monitor.timed('decode_nms')
+    @governor.governed('decode')
+    def _wrap_detection(self, input_image, output_data, score_threshold=None, nms_threshold=None,
+                        confidence_threshold=None):
         assert isinstance(input_image, np.ndarray), "Переменная input_image должна иметь тип numpy.ndarray"
         assert isinstance(output_data, np.ndarray), "Переменная output_data должна иметь тип numpy.ndarray"
 
-        class_ids = []
-        confidences = []
-        boxes = []
-        rows = output_data.shape[1]
-        image_width, image_height, _ = input_image.shape
-        x_factor = image_width / self.SIZE[0]
-        y_factor = image_height / self.SIZE[1]
+        score_threshold = self.SCORE_THRESHOLD if score_threshold is None else score_threshold
+        nms_threshold = self.NMS_THRESHOLD if nms_threshold is None else nms_threshold
+        confidence_threshold = self.CONFIDENCE_THRESHOLD if confidence_threshold is None else confidence_threshold
         try:
-            for r in range(rows):
-                row = output_data[0, r]
-                confidence = row[4]
-                if confidence >= self.CONFIDENCE_THRESHOLD:
-                    classes_scores = row[5:]
-                    class_id = np.argmax(classes_scores)
-                    confidences.append(confidence)
-
-                    class_ids.append(class_id)
-                    x, y, w, h = row[0].tolist(), row[1].tolist(), row[2].tolist(), row[3].tolist()
-                    left = int((x - 0.5 * w) * x_factor)
-                    top = int((y - 0.5 * h) * y_factor)
-                    width = int(w * x_factor)
-                    height = int(h * y_factor)
-                    box = np.array([left, top, width, height])
-                    boxes.append(box)
-            indexes = cv2.dnn.NMSBoxes(boxes, confidences, self.SCORE_THRESHOLD, self.NMS_THRESHOLD)
-            result_class_ids = []
-            result_confidences = []
-            result_boxes = []
-            for i in indexes:
-                result_confidences.append(confidences[i])
-                result_class_ids.append(class_ids[i])
-                result_boxes.append(boxes[i])
-
-            # logger.info('Successful wrap')
-            return result_class_ids, result_confidences, result_boxes
+            class_ids, confidences, boxes = self._decode(input_image, output_data, confidence_threshold)
+            indexes, scores = nms(boxes, confidences, score_threshold, nms_threshold,
+                                  class_ids if self.NMS_PER_CLASS else None, self.NMS_METHOD, SOFT_NMS_SIGMA)
+            return list(class_ids[indexes]), list(scores), list(boxes[indexes])
 
         except Exception as exc:
             logger.error(f"Невозможно применить модель к кадру! Возникла ошибка {exc}")
 
+    @monitor.timed('decode_nms')
+    @governor.governed('decode')
+    def _wrap_detections(self, images, outs):
+        """
+        Разбор выходов сети для пакета кадров с одним вызовом NMS на весь пакет: боксы разных кадров друг друга
+        не подавляют. Возвращает список (class_ids, confidences, boxes) по кадрам.
+        """
+        decoded = [self._decode(image, out, self.CONFIDENCE_THRESHOLD) for image, out in zip(images, outs)]
+        class_ids = np.concatenate([d[0] for d in decoded])
+        confidences = np.concatenate([d[1] for d in decoded])
+        boxes = np.concatenate([d[2] for d in decoded])
+        batch_ids = np.repeat(np.arange(len(decoded)), [len(d[0]) for d in decoded])
+        indexes, scores = batched_nms(boxes, confidences, batch_ids, class_ids if self.NMS_PER_CLASS else None,
+                                      self.SCORE_THRESHOLD, self.NMS_THRESHOLD, self.NMS_METHOD, SOFT_NMS_SIGMA,
+                                      len(self.CLASS_LIST))
+        results = []
+        for i in range(len(decoded)):
+            mask = batch_ids[indexes] == i
+            kept = indexes[mask]
+            results.append((list(class_ids[kept]), list(scores[mask]), list(boxes[kept])))
+        return results
+
+    @monitor.timed('letterbox')
+    @governor.governed('preprocess')
     def _format_yolo(self, image, COLOUR=[0, 0, 0]):
+        return self._letterbox(image, COLOUR)
+
+    def _letterbox(self, image, COLOUR=[0, 0, 0]):
+        """
+        Вписывает кадр в размер входа сети без замера времени и выделения потоков: используется вне потока кадров,
+        например при проверке новой модели, чтобы не искажать метрики и число потоков работающего детектора.
+        """
         assert isinstance(image, np.ndarray), "Переменная image должна иметь тип numpy.ndarray"
         assert isinstance(COLOUR, list | tuple), "Переменная COLOUR должна иметь тип list или tuple"
 
@@ -170,43 +416,48 @@ class RealTimeObjectDetection:
 
         return image
 
+    @monitor.timed('drawing')
+    def _draw(self, img, meta, key=None):
+        return self.renderer.render(img, meta, key)
+
     # ---------------------------------------------------------------------
     @counter_decorator
     def get_frame(self, capture, starting_time):
-        assert isinstance(capture, cv2.VideoCapture), "Переменная capture должна иметь тип cv2.VideoCapture"
+        assert isinstance(capture, cv2.VideoCapture | PrefetchingCapture), \
+            "Переменная capture должна иметь тип cv2.VideoCapture или PrefetchingCapture"
         assert isinstance(starting_time, float), "Переменная starting_time должна иметь тип float"
 
         if capture.isOpened():
-            ret, img = capture.read()
+            with monitor.measure('capture'):
+                ret, img = capture.read()
             if ret:
                 img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
                 img = self._format_yolo(img)
                 return img
-            logger.error('Возникла ошибка при чтении кадра')
+            if frame_log_limiter('get_frame_error'):
+                logger.error('Возникла ошибка при чтении кадра')
             return None
         else:
-            logger.warning('Поток закрыт')
+            if frame_log_limiter('get_frame_closed'):
+                logger.warning('Поток закрыт')
             return None
 
+    @governor.governed()
     def get_detected_frame(self, net, output_layers, frame):
-        assert isinstance(net, cv2.dnn.Net), "Переменная net должна иметь тип cv2.dnn.Net"
+        assert isinstance(net, MODEL_TYPES), MODEL_TYPES_MESSAGE
         assert isinstance(output_layers, list), "Переменная output_layers должна иметь тип list"
 
         img = self._format_yolo(frame)
-        outs = self._detect(img, net, output_layers)
-        class_ids, confidences, boxes = self._wrap_detection(img, outs[0])
+        class_ids, confidences, boxes = self._infer(img, net, output_layers)
         meta = list(zip(class_ids, confidences, boxes))
-
-        for (classid, confidence, box) in meta:
-            color = self.colors[int(classid) % len(self.colors)]
-            cv2.rectangle(img, box, color, 2)
-            cv2.rectangle(img, (box[0], box[1] - 20), (box[0] + box[2], box[1]), color, -1)
-            cv2.putText(img, f'{self.CLASS_LIST[classid]}:{str(round(confidence, 2))}',
-                        (box[0], box[1] - 10),
-                        cv2.FONT_HERSHEY_SIMPLEX, .5, (0, 0, 0))
+        if self.alerts is not None:
+            self.alerts.publish(img, meta, self.alert_source)
+        img = self._draw(img, meta)
 
         # img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        logger.info('Успешное применение модели к кадру')
+        frames = frame_log_limiter('realtime_detected_frame')
+        if frames:
+            logger.info('Успешное применение модели к кадру (кадров с прошлого сообщения: %d)', frames)
         return img, meta
 
 
@@ -219,7 +470,10 @@ class ImageObjectDetection(RealTimeObjectDetection):
                  score_threshold=0.6,
                  nms_threshold=0.55,
                  confidence_threshold=0.6,
-                 size=SIZE):
+                 size=SIZE,
+                 remote_url=DETECTION_SERVER_URL,
+                 workers=DETECTION_WORKERS,
+                 screening_model_path=SCREENING_MODEL_PATH):
         """
         Класс, реализующий обнаружение объектов на изображении с помощью библиотеки компьютерного зрения OpenCV
         и предобученной модели нейронной сети формата ONNX. Он содержит несколько методов, которые обрабатывают
@@ -230,8 +484,12 @@ class ImageObjectDetection(RealTimeObjectDetection):
         :param nms_threshold: Порог, используемый при не максимальном подавлении.
         :param confidence_threshold: Порог, при котором объект считается распознанным.
         :param size: Кортеж с шириной и высотой изображения.
+        :param remote_url: Адрес локального сервера детекции. Если задан, кадры отправляются на сервер.
+        :param workers: Число процессов детекции; 0 - модель в текущем процессе.
+        :param screening_model_path: Путь к отсеивающей модели каскада или None - только полная модель.
         """
-        super().__init__(model_path, class_list, score_threshold, nms_threshold, confidence_threshold, size)
+        super().__init__(model_path, class_list, score_threshold, nms_threshold, confidence_threshold, size,
+                         remote_url, workers, screening_model_path)
 
     def init_model(self):
         net, output_layers = self._build_model()
@@ -243,29 +501,30 @@ class ImageObjectDetection(RealTimeObjectDetection):
         try:
             capture = cv2.imread(image_path)
             logger.info(f'Успешное октрытие изображения {image_path}')
+            self.alert_source = os.path.basename(image_path)
             return capture
         except Exception as exc:
             logger.error(f'Ошибка при открытии изображения {image_path}. Возникла ошибка {exc}')
             raise IOError(f'Невозможно открыть изображения {image_path}')
 
+    @governor.governed()
     def get_detected_frame(self, capture, net, output_layers):
         assert isinstance(capture, np.ndarray), "Переменная capture должна иметь тип numpy.ndarray"
-        assert isinstance(net, cv2.dnn.Net), "Переменная net должна иметь тип cv2.dnn.Net"
+        assert isinstance(net, MODEL_TYPES), MODEL_TYPES_MESSAGE
         assert isinstance(output_layers, list), "Переменная output_layers должна иметь тип list"
 
         try:
             img = self._format_yolo(capture)
-            outs = self._detect(img, net, output_layers)
-            class_ids, confidences, boxes = self._wrap_detection(img, outs[0])
+            class_ids, confidences, boxes = self._infer(img, net, output_layers)
             meta = list(zip(class_ids, confidences, boxes))
-            for (classid, confidence, box) in zip(class_ids, confidences, boxes):
-                color = self.colors[int(classid) % len(self.colors)]
-                cv2.rectangle(img, box, color, 2)
-                cv2.rectangle(img, (box[0], box[1] - 20), (box[0] + box[2], box[1]), color, -1)
-                cv2.putText(img, f'{self.CLASS_LIST[classid]}:{str(round(confidence, 2))}', (box[0], box[1] - 10),
-                            cv2.FONT_HERSHEY_SIMPLEX, .5, (0, 0, 0))
-            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-            logger.info("Успешное применение модели к изображению")
+            if self.alerts is not None:
+                # Изображение прочитано cv2.imread в BGR, а миниатюры оповещений вырезаются из кадров RGB
+                self.alerts.publish(img[..., ::-1], meta, self.alert_source)
+            # cvtColor создаёт новый массив, поэтому для подписей можно переиспользовать буфер отображения
+            img = cv2.cvtColor(self._draw(img, meta, 'image'), cv2.COLOR_BGR2RGB)
+            images = frame_log_limiter('image_detected_frame')
+            if images:
+                logger.info('Успешное применение модели к изображению (изображений с прошлого сообщения: %d)', images)
             return img, meta
         except Exception as exc:
             logger.error(f'Неудачная попытка применить модель к изображению. Произошла ошибка {exc}')
@@ -279,7 +538,10 @@ class VideoObjectDetection(RealTimeObjectDetection):
                  score_threshold=0.6,
                  nms_threshold=0.55,
                  confidence_threshold=0.6,
-                 size=SIZE):
+                 size=SIZE,
+                 remote_url=DETECTION_SERVER_URL,
+                 workers=DETECTION_WORKERS,
+                 screening_model_path=SCREENING_MODEL_PATH):
         """
         Класс, реализующий обнаружение объектов на видео с помощью библиотеки компьютерного зрения OpenCV
         и предобученной модели нейронной сети формата ONNX. Он содержит несколько методов, которые обрабатывают
@@ -290,24 +552,31 @@ class VideoObjectDetection(RealTimeObjectDetection):
         :param nms_threshold: Порог, используемый при не максимальном подавлении.
         :param confidence_threshold: Порог, при котором объект считается распознанным.
         :param size: Кортеж с шириной и высотой видео.
+        :param remote_url: Адрес локального сервера детекции. Если задан, кадры отправляются на сервер.
+        :param workers: Число процессов детекции; 0 - модель в текущем процессе.
+        :param screening_model_path: Путь к отсеивающей модели каскада или None - только полная модель.
         """
-        super().__init__(model_path, class_list, score_threshold, nms_threshold, confidence_threshold, size)
+        super().__init__(model_path, class_list, score_threshold, nms_threshold, confidence_threshold, size,
+                         remote_url, workers, screening_model_path)
 
     def init_model(self):
         net, output_layers = self._build_model()
         return net, output_layers
 
-    def load_capture(self, video_path):
+    def load_capture(self, video_path, options=None):
         assert isinstance(video_path, str), "Переменная video_path должна иметь тип str"
+        assert options is None or isinstance(options, CaptureOptions), \
+            "Переменная options должна быть объектом класса CaptureOptions"
 
         try:
-            capture = cv2.VideoCapture(video_path)
+            capture = open_capture(video_path, options)
 
             if not capture.isOpened():
                 logger.error(f'Поток видео {video_path} закрыт')
                 raise IOError(f'Невозможно открыть видео {video_path}')
             else:
                 logger.info(f'Успешное открытие видео {video_path}')
+                self.alert_source = os.path.basename(video_path)
                 return capture
         except Exception as exc:
             logger.error(f'cv2 не может открыть видео {video_path}. Произошла ошибка {exc}')
@@ -0,0 +1,141 @@
+import numpy as np
+
+NMS_METHODS = ('hard', 'soft')
+# До этого количества боксов в группе IoU считается сразу матрицей, что быстрее поочерёдного отбора
+MATRIX_NMS_LIMIT = 512
+
+
+def xywh_to_xyxy(boxes):
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    xyxy = boxes.copy()
+    xyxy[:, 2:] += boxes[:, :2]
+    return xyxy
+
+
+def box_iou(box, boxes):
+    """
+    IoU одного бокса с массивом боксов. Боксы в формате (x1, y1, x2, y2).
+    """
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter / np.maximum(area + areas - inter, np.finfo(np.float32).eps)
+
+
+def _overlap_matrix(xyxy, iou_threshold):
+    x1 = np.maximum(xyxy[:, None, 0], xyxy[None, :, 0])
+    y1 = np.maximum(xyxy[:, None, 1], xyxy[None, :, 1])
+    x2 = np.minimum(xyxy[:, None, 2], xyxy[None, :, 2])
+    y2 = np.minimum(xyxy[:, None, 3], xyxy[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    areas = (xyxy[:, 2] - xyxy[:, 0]) * (xyxy[:, 3] - xyxy[:, 1])
+    return inter > iou_threshold * (areas[:, None] + areas[None, :] - inter)
+
+
+def _hard_nms(xyxy, scores, iou_threshold):
+    order = np.argsort(-scores, kind='stable')
+    if order.size <= MATRIX_NMS_LIMIT:
+        # Строка i матрицы - боксы с меньшей уверенностью, которые подавляет бокс i, если он сам оставлен
+        suppresses = np.triu(_overlap_matrix(xyxy[order], iou_threshold), 1)
+        keep = np.ones(order.size, dtype=bool)
+        for i in range(order.size):
+            if keep[i]:
+                keep &= ~suppresses[i]
+        return order[keep]
+
+    x1, y1, x2, y2 = (np.ascontiguousarray(xyxy[:, k]) for k in range(4))
+    areas = (x2 - x1) * (y2 - y1)
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        inter = np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None) * \
+            np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None)
+        order = rest[inter <= iou_threshold * (areas[i] + areas[rest] - inter)]
+    return np.array(keep, dtype=np.int64)
+
+
+def _soft_nms(xyxy, scores, score_threshold, sigma):
+    scores = scores.astype(np.float32)
+    indexes = np.arange(len(scores))
+    keep, kept_scores = [], []
+    while indexes.size:
+        best = np.argmax(scores[indexes])
+        i = indexes[best]
+        keep.append(i)
+        kept_scores.append(scores[i])
+        indexes = np.delete(indexes, best)
+        if not indexes.size:
+            break
+        iou = box_iou(xyxy[i], xyxy[indexes])
+        scores[indexes] *= np.exp(-(iou * iou) / sigma)
+        indexes = indexes[scores[indexes] >= score_threshold]
+    return np.array(keep, dtype=np.int64), np.array(kept_scores, dtype=np.float32)
+
+
+def _group_nms(xyxy, scores, score_threshold, iou_threshold, method, sigma):
+    if method == 'soft':
+        return _soft_nms(xyxy, scores, score_threshold, sigma)
+    keep = _hard_nms(xyxy, scores, iou_threshold)
+    return keep, scores[keep]
+
+
+def nms(boxes, scores, score_threshold, iou_threshold, groups=None, method='hard', sigma=0.5):
+    """
+    Не максимальное подавление на массивах NumPy, замена cv2.dnn.NMSBoxes.
+    Боксы разных групп (классов, кадров пакета или их сочетаний) не подавляют друг друга: подавление выполняется
+    в каждой группе отдельно, что к тому же уменьшает число попарных сравнений.
+    :param boxes: Массив (N, 4) боксов в формате (x, y, w, h), как у cv2.dnn.NMSBoxes.
+    :param scores: Массив (N,) уверенностей.
+    :param score_threshold: Боксы с меньшей уверенностью отбрасываются (для Soft-NMS - и после понижения).
+    :param iou_threshold: Порог IoU, выше которого бокс подавляется (для метода "hard").
+    :param groups: Массив (N,) целых идентификаторов групп или None - подавление без учёта групп.
+    :param method: "hard" - классическое подавление, "soft" - Soft-NMS с гауссовым понижением уверенности.
+    :param sigma: Параметр гауссова понижения Soft-NMS.
+    Возвращает индексы оставленных боксов по убыванию уверенности и их уверенности (для Soft-NMS - пониженные).
+    """
+    assert method in NMS_METHODS, f"method должен быть одним из {NMS_METHODS}"
+
+    scores = np.asarray(scores, dtype=np.float32).reshape(-1)
+    candidates = np.flatnonzero(scores >= score_threshold)
+    if not candidates.size:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+    xyxy = xywh_to_xyxy(boxes)[candidates]
+    scores = scores[candidates]
+    if groups is None:
+        keep, kept_scores = _group_nms(xyxy, scores, score_threshold, iou_threshold, method, sigma)
+        return candidates[keep], kept_scores
+
+    groups = np.asarray(groups).reshape(-1)[candidates]
+    keeps, kept_scores = [], []
+    for group in np.unique(groups):
+        members = np.flatnonzero(groups == group)
+        keep, group_scores = _group_nms(xyxy[members], scores[members], score_threshold, iou_threshold, method,
+                                        sigma)
+        keeps.append(members[keep])
+        kept_scores.append(group_scores)
+    keep, kept_scores = np.concatenate(keeps), np.concatenate(kept_scores)
+    order = np.argsort(-kept_scores, kind='stable')
+    return candidates[keep[order]], kept_scores[order]
+
+
+def batched_nms(boxes, scores, batch_ids, class_ids=None, score_threshold=0.5, iou_threshold=0.5, method='hard',
+                sigma=0.5, num_classes=None):
+    """
+    NMS для боксов нескольких кадров пакета за один вызов. Боксы разных кадров не подавляют друг друга, а при
+    заданных class_ids - и боксы разных классов одного кадра.
+    Возвращает индексы оставленных боксов и их уверенности.
+    """
+    batch_ids = np.asarray(batch_ids, dtype=np.int64).reshape(-1)
+    groups = batch_ids
+    if class_ids is not None:
+        class_ids = np.asarray(class_ids, dtype=np.int64).reshape(-1)
+        num_classes = num_classes or int(class_ids.max(initial=0)) + 1
+        groups = batch_ids * num_classes + class_ids
+    return nms(boxes, scores, score_threshold, iou_threshold, groups, method, sigma)
@@ -0,0 +1,101 @@
+import cv2
+import numpy as np
+from config import OVERLAY_HEADLESS, OVERLAY_CONFIDENCE_STEP, OVERLAY_MAX_BUFFERS
+
+LABEL_HEIGHT = 20
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+FONT_SCALE = .5
+
+
+class OverlayRenderer:
+
+    def __init__(self, class_list, colors, headless=OVERLAY_HEADLESS, confidence_step=OVERLAY_CONFIDENCE_STEP,
+                 thickness=2, max_buffers=OVERLAY_MAX_BUFFERS):
+        """
+        Класс, рисующий боксы и подписи детекций на отдельном буфере отображения, не изменяя кадр, поданный в сеть.
+        Подписи "класс:уверенность" растеризуются один раз для каждого класса и шага уверенности и дальше
+        копируются в кадр готовым фрагментом вместо cv2.putText на каждом кадре.
+        :param class_list: Список классов.
+        :param colors: Массив цветов классов формы (len(class_list), 3).
+        :param headless: Режим без отображения: render возвращает исходный кадр и ничего не рисует.
+        :param confidence_step: Шаг округления уверенности в подписи (0.01 - два знака после запятой).
+        :param thickness: Толщина рамки бокса.
+        :param max_buffers: Число буферов отображения потоков; при превышении удаляется самый старый.
+        """
+        assert isinstance(class_list, list | tuple), "class_list должен иметь тип list или tuple"
+        assert isinstance(confidence_step, int | float) and 0 < confidence_step <= 1, \
+            "confidence_step должен иметь тип int или float и быть в пределах (0, 1]"
+
+        self.class_list = class_list
+        self.colors = [tuple(float(c) for c in color) for color in colors]
+        self.headless = headless
+        self.confidence_step = confidence_step
+        self.thickness = thickness
+        self.max_buffers = max_buffers
+        self._labels = {}
+        self._buffers = {}
+
+    def label(self, class_id, confidence):
+        """
+        Фрагмент подписи (текст на фоне цвета класса, высота LABEL_HEIGHT) из кэша; создаётся при первом обращении.
+        """
+        bucket = int(round(float(confidence) / self.confidence_step))
+        key = (int(class_id), bucket)
+        sprite = self._labels.get(key)
+        if sprite is None:
+            text = f'{self.class_list[key[0]]}:{round(bucket * self.confidence_step, 2)}'
+            (width, _), _ = cv2.getTextSize(text, FONT, FONT_SCALE, 1)
+            sprite = np.empty((LABEL_HEIGHT, width + 2, 3), np.uint8)
+            sprite[:] = np.round(self.colors[key[0] % len(self.colors)])
+            cv2.putText(sprite, text, (0, LABEL_HEIGHT // 2), FONT, FONT_SCALE, (0, 0, 0))
+            self._labels[key] = sprite
+        return sprite
+
+    @staticmethod
+    def _blit(out, sprite, x, y):
+        height, width = out.shape[:2]
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + sprite.shape[1], width), min(y + sprite.shape[0], height)
+        if x0 < x1 and y0 < y1:
+            out[y0:y1, x0:x1] = sprite[y0 - y:y1 - y, x0 - x:x1 - x]
+
+    def _buffer(self, image, key):
+        """
+        Буфер отображения: для потока с ключом key переиспользуется между кадрами, иначе создаётся новый.
+        """
+        if key is None:
+            return image.copy()
+        buffer = self._buffers.get(key)
+        if buffer is None or buffer.shape != image.shape or buffer.dtype != image.dtype:
+            if buffer is None and len(self._buffers) >= self.max_buffers:
+                del self._buffers[next(iter(self._buffers))]
+            buffer = self._buffers[key] = np.empty_like(image)
+        np.copyto(buffer, image)
+        return buffer
+
+    def render(self, image, meta, key=None):
+        """
+        Возвращает кадр с нарисованными детекциями. Кадр image не изменяется.
+        :param image: Кадр, поданный в сеть.
+        :param meta: Список (class_id, confidence, box) с боксами (x, y, w, h).
+        :param key: Ключ потока (например, индекс камеры). Буфер потока переиспользуется, поэтому кадр, возвращённый
+        для ключа, действителен до следующего вызова с тем же ключом. Без ключа возвращается новый массив.
+        """
+        if self.headless:
+            return image
+        out = self._buffer(image, key)
+        if not meta:
+            return out
+
+        for class_id, confidence, box in meta:
+            x, y, w, h = (int(v) for v in box)
+            color = self.colors[int(class_id) % len(self.colors)]
+            cv2.rectangle(out, (x, y, w, h), color, self.thickness)
+            sprite = self.label(class_id, confidence)
+            if w > sprite.shape[1]:
+                cv2.rectangle(out, (x + sprite.shape[1], y - LABEL_HEIGHT), (x + w, y), color, -1)
+            self._blit(out, sprite, x, y - LABEL_HEIGHT)
+        return out
+
+    def clear(self):
+        self._buffers.clear()
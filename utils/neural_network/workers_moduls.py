@@ -0,0 +1,310 @@
+"""
+Пул процессов детекции. Каждый процесс держит свой cv2.dnn.Net, поэтому прямые проходы разных кадров идут
+параллельно и не упираются в GIL процесса интерфейса, которому остаются только захват и отображение.
+
+Кадры и результаты передаются через кольцевые буферы multiprocessing.shared_memory: кадр копируется в свободную
+ячейку буфера кадров, а через очереди передаются только номера ячеек. Процесс пишет найденные боксы в ту же
+ячейку буфера результатов в виде строк (class_id, confidence, x, y, w, h).
+"""
+import multiprocessing as mp
+import os
+import queue
+import time
+from multiprocessing import shared_memory
+import numpy as np
+from logger.logger_config import get_logger, process_log_queue, setup_process_logging
+from utils.threads.threads_moduls import governor
+from config import DETECTION_WORKERS, WORKER_MAX_DETECTIONS, WORKER_START_TIMEOUT
+
+logger = get_logger(__name__)
+
+RESULT_COLUMNS = 6
+
+
+class SharedRing:
+
+    def __init__(self, slots, shape, dtype, name=None):
+        """
+        Кольцевой буфер из slots ячеек формы shape в разделяемой памяти.
+        :param name: Имя существующего буфера для подключения к нему из другого процесса; None - создать новый.
+        """
+        self.slots = slots
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        size = int(np.prod(self.shape)) * self.dtype.itemsize * slots
+        self.owner = name is None
+        # Процессы пула запускаются через spawn и используют resource_tracker создателя, поэтому подключение
+        # к буферу не снимает его с учёта: буфер удаляет только создатель в close
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=size if self.owner else 0)
+        self.array = np.ndarray((slots, *self.shape), self.dtype, buffer=self.shm.buf)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def __getitem__(self, slot):
+        return self.array[slot]
+
+    def close(self):
+        del self.array
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _worker_main(worker_id, params, frame_name, result_name, slots, frame_shape, max_detections, threads, cores,
+                 tasks, done, log_queue):
+    # Импорт здесь, а не в начале модуля: neuralnet_moduls сам импортирует этот модуль
+    import cv2
+    from utils.neural_network.neuralnet_moduls import RealTimeObjectDetection
+
+    setup_process_logging(log_queue)
+
+    # Потоки процесса выделены пулом в родительском процессе, собственное распределение здесь не нужно
+    governor.configure(enabled=False)
+    cv2.setNumThreads(threads)
+    if cores:
+        os.sched_setaffinity(0, cores)
+    frames = SharedRing(slots, frame_shape, np.uint8, frame_name)
+    results = SharedRing(slots, (max_detections + 1, RESULT_COLUMNS), np.float32, result_name)
+    detector = RealTimeObjectDetection(**params, remote_url=None, workers=0)
+    model = detector._build_model()
+    if model is None:
+        done.put(('error', worker_id, f'Не удалось загрузить модель {params["model_path"]}'))
+        return
+    net, output_layers = model
+    # Размер входа мог смениться в _check_input_size, если модель не принимает запрошенный
+    done.put(('ready', worker_id, detector.SIZE))
+
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            seq, slot = task
+            try:
+                class_ids, confidences, boxes = detector._infer(frames[slot], net, output_layers)
+                count = min(len(class_ids), max_detections)
+                out = results[slot]
+                out[0, 0] = count
+                if count:
+                    out[1:count + 1, 0] = class_ids[:count]
+                    out[1:count + 1, 1] = confidences[:count]
+                    out[1:count + 1, 2:] = np.asarray(boxes[:count])
+                done.put(('done', seq, slot))
+            except Exception as exc:
+                results[slot][0, 0] = -1
+                done.put(('failed', seq, slot, str(exc)))
+    finally:
+        frames.close()
+        results.close()
+
+
+class DetectionWorkerPool:
+
+    def __init__(self, detector, workers=DETECTION_WORKERS, slots=None, max_detections=WORKER_MAX_DETECTIONS,
+                 threads_per_worker=None):
+        """
+        Класс пула процессов детекции для RealTimeObjectDetection.
+        :param detector: Экземпляр RealTimeObjectDetection, параметры которого (модель, классы, пороги, размер входа)
+        получают процессы.
+        :param workers: Число процессов.
+        :param slots: Число ячеек кольцевых буферов - наибольшее число кадров в обработке (по умолчанию 2 на
+        процесс, чтобы процесс не простаивал, пока интерфейс забирает результат).
+        :param max_detections: Наибольшее число боксов на кадр, передаваемых из процесса.
+        :param threads_per_worker: Число потоков OpenCV в каждом процессе (по умолчанию ядра, выделенные пулу
+        распределителем потоков, поровну; если распределитель отключён - все ядра поровну).
+        """
+        assert isinstance(workers, int) and workers > 0, "workers должен иметь тип int и быть больше 0"
+        assert slots is None or isinstance(slots, int) and slots >= workers, \
+            "slots должен иметь тип int и быть не меньше workers"
+
+        self.params = {'model_path': detector.MODEL_PATH, 'class_list': list(detector.CLASS_LIST),
+                       'score_threshold': detector.SCORE_THRESHOLD, 'nms_threshold': detector.NMS_THRESHOLD,
+                       'confidence_threshold': detector.CONFIDENCE_THRESHOLD, 'size': detector.SIZE,
+                       'screening_model_path': detector.SCREENING_MODEL_PATH}
+        self.size = detector.SIZE
+        self.workers = workers
+        self.slots = slots or 2 * workers
+        self.max_detections = max_detections
+        self.threads_per_worker = threads_per_worker
+
+        self._processes = []
+        self._frames = None
+        self._results = None
+        self._free = list(range(self.slots))
+        self._seq = 0
+        self._next = 0
+        self._tags = {}
+        self._ready = {}
+        self._taken = set()
+        self.failed = 0
+
+    @property
+    def frame_shape(self):
+        return self.size[1], self.size[0], 3
+
+    @property
+    def pending(self):
+        return self.slots - len(self._free)
+
+    @property
+    def is_running(self):
+        return bool(self._processes) and all(process.is_alive() for process in self._processes)
+
+    def start(self, timeout=WORKER_START_TIMEOUT):
+        """
+        Создаёт буферы и запускает процессы; ждёт, пока каждый загрузит модель. Возвращает пул.
+        """
+        context = mp.get_context('spawn')
+        self._frames = SharedRing(self.slots, self.frame_shape, np.uint8)
+        self._results = SharedRing(self.slots, (self.max_detections + 1, RESULT_COLUMNS), np.float32)
+        self._tasks = context.Queue()
+        self._done = context.Queue()
+        shares = self._shares()
+        for worker_id, (threads, cores) in enumerate(shares):
+            process = context.Process(target=_worker_main, name=f'detection-worker-{worker_id}', daemon=True,
+                                      args=(worker_id, self.params, self._frames.name, self._results.name,
+                                            self.slots, self.frame_shape, self.max_detections, threads, cores,
+                                            self._tasks, self._done, process_log_queue()))
+            with governor.environment(threads):
+                process.start()
+            self._processes.append(process)
+
+        deadline = time.monotonic() + timeout
+        sizes = set()
+        while len(sizes) < self.workers:
+            try:
+                message = self._done.get(timeout=max(deadline - time.monotonic(), 0.01))
+            except queue.Empty:
+                self.stop()
+                raise IOError(f'Процессы детекции не запустились за {timeout} с')
+            if message[0] == 'error':
+                self.stop()
+                raise IOError(message[2])
+            sizes.add((message[1], tuple(message[2])))
+        size = next(iter(sizes))[1]
+        if size != self.size:
+            # Процессы перезапускаются с буферами под размер, который принимает модель
+            self.stop()
+            self.size = self.params['size'] = size
+            return self.start(timeout)
+        logger.info(f'Запущено процессов детекции: {self.workers} (потоков OpenCV: '
+                    f'{[threads for threads, _ in shares]}, ячеек буфера: {self.slots})')
+        return self
+
+    def _shares(self):
+        """
+        Число потоков OpenCV и ядра для привязки (None - без привязки) каждого процесса.
+        """
+        if self.threads_per_worker is None and governor.enabled:
+            shares = governor.register(self, self.workers, persistent=True).split(self.workers)
+            return [(threads, cores if governor.pinning else None) for threads, cores in shares]
+        threads = self.threads_per_worker or max(1, (os.cpu_count() or 1) // self.workers)
+        return [(threads, None)] * self.workers
+
+    def submit(self, frame, tag=None):
+        """
+        Отправляет кадр размера входа сети (после _format_yolo) на детекцию. Возвращает порядковый номер кадра или
+        None, если все ячейки буфера заняты - тогда сначала нужно забрать результаты через collect.
+        :param tag: Произвольная метка кадра, возвращаемая вместе с результатом (например, индекс камеры).
+        """
+        assert isinstance(frame, np.ndarray) and frame.shape == self.frame_shape, \
+            f"frame должен иметь тип numpy.ndarray и форму {self.frame_shape}"
+
+        if not self._free:
+            return None
+        slot = self._free.pop()
+        np.copyto(self._frames[slot], frame)
+        seq = self._seq
+        self._seq += 1
+        self._tags[seq] = tag
+        self._tasks.put((seq, slot))
+        return seq
+
+    def _receive(self, timeout):
+        try:
+            message = self._done.get(timeout=timeout) if timeout else self._done.get_nowait()
+        except queue.Empty:
+            return False
+        kind, seq, slot = message[:3]
+        meta = []
+        if kind == 'done':
+            rows = self._results[slot]
+            count = int(rows[0, 0])
+            meta = [(int(row[0]), float(row[1]), row[2:].astype(np.int64)) for row in rows[1:count + 1]]
+        else:
+            self.failed += 1
+            logger.error(f'Ошибка в процессе детекции: {message[3]}')
+        self._free.append(slot)
+        self._ready[seq] = meta
+        return True
+
+    def collect(self, timeout=0.0):
+        """
+        Забирает готовые результаты в порядке отправки кадров. Возвращает список (номер кадра, метка, meta), где
+        meta - список (class_id, confidence, box), как в get_detected_frame.
+        :param timeout: Сколько секунд ждать первого результата, если готовых нет.
+        Если процесс детекции завершился с кадрами в обработке, их результаты не придут никогда, поэтому вызывается
+        IOError, как в detect, а не возвращается пустой список при каждом вызове.
+        """
+        if self._next not in self._ready:
+            self._receive(timeout)
+        while self._receive(0):
+            pass
+        if self._next not in self._ready and self.pending and not self.is_running:
+            raise IOError('Процессы детекции завершились')
+        results = []
+        while self._next in self._ready:
+            results.append((self._next, self._tags.pop(self._next), self._ready.pop(self._next)))
+            self._next += 1
+            self._advance()
+        return results
+
+    def _advance(self):
+        # Пропускает номера кадров, результаты которых уже забрал detect
+        while self._next in self._taken:
+            self._taken.remove(self._next)
+            self._next += 1
+
+    def detect(self, frame):
+        """
+        Синхронная детекция одного кадра; результаты кадров, отправленных раньше через submit, сохраняются для
+        следующего collect. Возвращает class_ids, confidences, boxes, как RealTimeObjectDetection._infer.
+        """
+        seq = self.submit(frame)
+        while seq is None:
+            if not self._receive(1.0) and not self.is_running:
+                raise IOError('Процессы детекции завершились')
+            seq = self.submit(frame)
+        while seq not in self._ready:
+            if not self._receive(1.0) and not self.is_running:
+                raise IOError('Процессы детекции завершились')
+        meta = self._ready.pop(seq)
+        self._tags.pop(seq)
+        self._taken.add(seq)
+        self._advance()
+        class_ids = [class_id for class_id, _, _ in meta]
+        confidences = [confidence for _, confidence, _ in meta]
+        boxes = [box for _, _, box in meta]
+        return class_ids, confidences, boxes
+
+    def stop(self):
+        for _ in self._processes:
+            self._tasks.put(None)
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self._processes = []
+        for ring in (self._frames, self._results):
+            if ring is not None:
+                ring.close()
+        self._frames = self._results = None
+        governor.release(self)
+
+    def __enter__(self):
+        return self if self._processes else self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
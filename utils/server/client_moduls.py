@@ -0,0 +1,108 @@
+import http.client
+import json
+import threading
+import time
+from urllib.parse import urlsplit, urlencode
+import cv2
+import numpy as np
+from logger.logger_config import get_logger
+
+logger = get_logger(__name__)
+
+
+class ServerBusyError(IOError):
+    pass
+
+
+class RemoteDetectionClient:
+
+    def __init__(self, url, timeout=10.0, encoding='jpeg', quality=95, retries=3):
+        """
+        Класс-клиент локального сервера детекции (utils.server.server_moduls.DetectionServer). Детектор использует
+        его вместо cv2.dnn.Net, если задан адрес сервера: кадр после _format_yolo отправляется на сервер, а в ответ
+        приходит meta в том же виде, что и при локальном инференсе. Соединение с сервером переиспользуется.
+        :param url: Адрес сервера, например http://127.0.0.1:8765.
+        :param timeout: Таймаут запроса в секундах.
+        :param encoding: Формат передачи кадра ("jpeg", "png" или "raw" - несжатый массив).
+        :param quality: Качество JPEG.
+        :param retries: Количество повторов, если сервер перегружен (HTTP 503).
+        """
+        assert isinstance(url, str) and url.startswith('http://'), "url должен иметь тип str и начинаться с http://"
+        assert encoding in ('jpeg', 'png', 'raw'), 'encoding должен быть "jpeg", "png" или "raw"'
+
+        parts = urlsplit(url)
+        self.url = url
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.timeout = timeout
+        self.encoding = encoding
+        self.quality = quality
+        self.retries = retries
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def _encode(self, image):
+        if self.encoding == 'raw':
+            image = np.ascontiguousarray(image)
+            headers = {'Content-Type': 'application/octet-stream',
+                       'X-Width': str(image.shape[1]),
+                       'X-Height': str(image.shape[0]),
+                       'X-Channels': str(image.shape[2] if image.ndim == 3 else 1)}
+            return image.tobytes(), headers
+        if self.encoding == 'png':
+            return cv2.imencode('.png', image)[1].tobytes(), {'Content-Type': 'image/png'}
+        return cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, self.quality])[1].tobytes(), \
+            {'Content-Type': 'image/jpeg'}
+
+    def _request(self, method, path, body=None, headers=None):
+        for attempt in range(2):
+            if self._connection is None:
+                self._connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                self._connection.request(method, path, body=body, headers=headers or {})
+                response = self._connection.getresponse()
+                return response.status, response.getheader('Retry-After'), response.read()
+            except (http.client.HTTPException, OSError) as exc:
+                # Сервер мог закрыть простаивающее соединение - переподключаемся один раз. OSError включает
+                # ConnectionError и TimeoutError: соединение после них непригодно и тоже сбрасывается
+                self._connection.close()
+                self._connection = None
+                if attempt:
+                    raise IOError(f'Сервер детекции {self.url} недоступен: {exc}') from exc
+
+    def detect(self, image, score_threshold=None, nms_threshold=None, confidence_threshold=None):
+        assert isinstance(image, np.ndarray), "Переменная image должна иметь тип numpy.ndarray"
+
+        body, headers = self._encode(image)
+        params = {name: value for name, value in (('score', score_threshold), ('nms', nms_threshold),
+                                                  ('confidence', confidence_threshold)) if value is not None}
+        path = '/detect' + ('?' + urlencode(params) if params else '')
+        with self._lock:
+            for attempt in range(self.retries + 1):
+                status, retry_after, data = self._request('POST', path, body, headers)
+                if status != 503:
+                    break
+                time.sleep(float(retry_after or 0.05) * (attempt + 1))
+        if status == 503:
+            raise ServerBusyError(f'Сервер детекции {self.url} перегружен')
+        if status != 200:
+            raise IOError(f'Сервер детекции {self.url} вернул ошибку {status}: {data[:200]!r}')
+
+        result = json.loads(data)
+        class_ids = [int(class_id) for class_id, _, _ in result['meta']]
+        confidences = [float(confidence) for _, confidence, _ in result['meta']]
+        # Боксы приходят в координатах входа модели сервера, который может отличаться от размера кадра клиента
+        x_factor = image.shape[1] / result['size'][0]
+        y_factor = image.shape[0] / result['size'][1]
+        boxes = [(np.array(box) * (x_factor, y_factor, x_factor, y_factor)).astype(int) for _, _, box in result['meta']]
+        return class_ids, confidences, boxes
+
+    def health(self):
+        with self._lock:
+            status, _, data = self._request('GET', '/health')
+        return json.loads(data) if status == 200 else None
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
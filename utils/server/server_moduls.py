@@ -0,0 +1,322 @@
+"""
+Локальный сервер детекции: одна загруженная модель обслуживает все вкладки интерфейса и внешние клиенты.
+
+Запросы от разных клиентов собираются в пакеты (micro-batching): пакет отправляется в сеть, когда набрано
+max_batch кадров или с момента прихода первого кадра прошло max_wait_ms. Очередь ожидающих кадров ограничена:
+при переполнении сервер отвечает 503 с заголовком Retry-After, чтобы клиенты снизили нагрузку.
+
+API:
+    POST /detect[?score=..&nms=..&confidence=..]   тело - JPEG (image/jpeg), PNG (image/png) или несжатый кадр
+                                                   (application/octet-stream с заголовками X-Width, X-Height,
+                                                   X-Channels); ответ - {"meta": [[class_id, confidence,
+                                                   [x, y, w, h]], ...], "size": [w, h]}
+    GET  /health                                   состояние сервера и статистика пакетов
+
+Запуск: python -m utils.server.server_moduls [--model PATH] [--port 8765] [--max-batch 8] [--max-wait-ms 5]
+"""
+import argparse
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+import cv2
+import numpy as np
+from logger.logger_config import get_logger, frame_log_limiter
+from utils.neural_network.neuralnet_moduls import ImageObjectDetection
+from config import YOLOv7_PATH, SIZE, CLASS_LIST, SERVER_HOST, SERVER_PORT, SERVER_MAX_BATCH, SERVER_MAX_WAIT_MS, \
+    SERVER_MAX_PENDING, SERVER_MAX_CONCURRENCY
+
+logger = get_logger(__name__)
+
+
+class MicroBatcher:
+
+    def __init__(self, detector, net, output_layers, max_batch=SERVER_MAX_BATCH, max_wait_ms=SERVER_MAX_WAIT_MS,
+                 max_pending=SERVER_MAX_PENDING):
+        """
+        Класс, собирающий кадры из разных запросов в пакеты и выполняющий их одним прямым проходом сети
+        в отдельном потоке.
+        :param detector: Экземпляр класса RealTimeObjectDetection (или наследника) с загруженной моделью.
+        :param net: Модель cv2.dnn.Net.
+        :param output_layers: Список выходных слоёв модели.
+        :param max_batch: Максимальное количество кадров в пакете.
+        :param max_wait_ms: Сколько ждать добора пакета после прихода первого кадра, мс.
+        :param max_pending: Максимальное количество кадров в очереди.
+        """
+        assert isinstance(max_batch, int) and max_batch > 0, "max_batch должен иметь тип int и быть больше 0"
+        assert isinstance(max_wait_ms, int | float) and max_wait_ms >= 0, \
+            "max_wait_ms должен иметь тип int или float и быть неотрицательным"
+        assert isinstance(max_pending, int) and max_pending > 0, "max_pending должен иметь тип int и быть больше 0"
+
+        self.detector = detector
+        self.net = net
+        self.output_layers = output_layers
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.batches = 0
+        self.frames = 0
+        self.rejected = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+
+    @property
+    def pending(self):
+        return self._queue.qsize()
+
+    def submit(self, image, thresholds):
+        """
+        Ставит кадр (уже приведённый _format_yolo) в очередь. Возвращает Future с (class_ids, confidences, boxes).
+        Если очередь заполнена, вызывает queue.Full.
+        """
+        future = Future()
+        try:
+            self._queue.put_nowait((image, thresholds, future))
+        except queue.Full:
+            self.rejected += 1
+            raise
+        return future
+
+    def _collect(self):
+        try:
+            batch = [self._queue.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _worker(self):
+        while not self._stop.is_set():
+            batch = self._collect()
+            if not batch:
+                continue
+            images = [image for image, _, _ in batch]
+            try:
+                outs = self.detector._detect_batch(images, self.net, self.output_layers)
+                for (image, thresholds, future), out in zip(batch, outs):
+                    future.set_result(self.detector._wrap_detection(image, out, **thresholds))
+            except Exception as exc:
+                logger.error(f'Ошибка при обработке пакета из {len(batch)} кадров: {exc}')
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+            self.batches += 1
+            self.frames += len(batch)
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        while True:
+            try:
+                _, _, future = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            future.set_exception(RuntimeError('Сервер детекции остановлен'))
+
+
+class DetectionServer:
+
+    def __init__(self,
+                 detector=None,
+                 host=SERVER_HOST,
+                 port=SERVER_PORT,
+                 max_batch=SERVER_MAX_BATCH,
+                 max_wait_ms=SERVER_MAX_WAIT_MS,
+                 max_pending=SERVER_MAX_PENDING,
+                 max_concurrency=SERVER_MAX_CONCURRENCY,
+                 timeout=30.0):
+        """
+        Класс локального HTTP-сервера детекции, оборачивающий ImageObjectDetection. Сервер работает в фоновом потоке.
+        :param detector: Экземпляр класса ImageObjectDetection. По умолчанию модель из config.YOLOv7_PATH.
+        :param host: Адрес, на котором слушает сервер.
+        :param port: Порт, на котором слушает сервер (0 - любой свободный).
+        :param max_batch: Максимальное количество кадров в пакете.
+        :param max_wait_ms: Сколько ждать добора пакета после прихода первого кадра, мс.
+        :param max_pending: Максимальное количество кадров в очереди, после которого сервер отвечает 503.
+        :param max_concurrency: Максимальное количество одновременно обрабатываемых запросов.
+        :param timeout: Сколько запрос ждёт результата инференса, с.
+        """
+        detector = detector or ImageObjectDetection(YOLOv7_PATH, CLASS_LIST, size=SIZE, remote_url=None, workers=0,
+                                                    screening_model_path=None)
+        assert isinstance(detector, ImageObjectDetection), "detector должен быть объектом класса ImageObjectDetection"
+        assert detector.REMOTE_URL is None, "Детектор сервера должен использовать локальную модель"
+        # Сервер собирает кадры в пакеты для одного прямого прохода, что несовместимо с пулом процессов и каскадом
+        assert detector.WORKERS == 0 and detector.SCREENING_MODEL_PATH is None, \
+            "Детектор сервера должен использовать одну модель в процессе сервера"
+        assert isinstance(host, str), "host должен иметь тип str"
+        assert isinstance(port, int), "port должен иметь тип int"
+        assert isinstance(max_concurrency, int) and max_concurrency > 0, \
+            "max_concurrency должен иметь тип int и быть больше 0"
+
+        self.detector = detector
+        self.host = host
+        self.port = port
+        self.max_batch = max_batch
+        self.max_wait_ms = max_wait_ms
+        self.max_pending = max_pending
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.batcher = None
+        self.httpd = None
+        self.thread = None
+
+    @property
+    def url(self):
+        return f'http://{self.host}:{self.port}'
+
+    @property
+    def is_running(self):
+        return self.httpd is not None
+
+    def stats(self):
+        batcher = self.batcher
+        return {'status': 'ok' if self.is_running else 'stopped',
+                'model': self.detector.MODEL_PATH,
+                'size': list(self.detector.SIZE),
+                'classes': list(self.detector.CLASS_LIST),
+                'batches': batcher.batches if batcher else 0,
+                'frames': batcher.frames if batcher else 0,
+                'mean_batch': batcher.frames / batcher.batches if batcher and batcher.batches else 0.0,
+                'pending': batcher.pending if batcher else 0,
+                'rejected': batcher.rejected if batcher else 0,
+                'batch_supported': self.detector.batch_supported}
+
+    @staticmethod
+    def decode_image(body, headers):
+        content_type = (headers.get('Content-Type') or '').split(';')[0].strip()
+        if content_type == 'application/octet-stream':
+            width, height = int(headers['X-Width']), int(headers['X-Height'])
+            channels = int(headers.get('X-Channels', 3))
+            image = np.frombuffer(body, dtype=np.uint8).reshape(height, width, channels)
+            return image if channels == 3 else cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        if content_type in ('image/jpeg', 'image/png'):
+            image = cv2.imdecode(np.frombuffer(body, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if image is None:
+                raise ValueError('Невозможно декодировать изображение')
+            return image
+        raise ValueError(f'Неподдерживаемый Content-Type: {content_type}')
+
+    def start(self):
+        if self.is_running:
+            return self.url
+        model = self.detector._build_model()
+        if model is None:
+            raise IOError(f'Невозможно загрузить модель {self.detector.MODEL_PATH}')
+        net, output_layers = model
+        self.batcher = MicroBatcher(self.detector, net, output_layers, self.max_batch, self.max_wait_ms,
+                                    self.max_pending)
+        server = self
+        slots = threading.BoundedSemaphore(self.max_concurrency)
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _send_json(self, status, data, headers=None):
+                body = json.dumps(data).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if urlsplit(self.path).path != '/health':
+                    self._send_json(404, {'error': 'not found'})
+                    return
+                self._send_json(200, server.stats())
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                parts = urlsplit(self.path)
+                if parts.path != '/detect':
+                    self._send_json(404, {'error': 'not found'})
+                    return
+                if not slots.acquire(blocking=False):
+                    self._send_json(503, {'error': 'too many requests'}, {'Retry-After': '0.05'})
+                    return
+                try:
+                    query = parse_qs(parts.query)
+                    thresholds = {name: float(query[key][0]) for key, name in
+                                  (('score', 'score_threshold'), ('nms', 'nms_threshold'),
+                                   ('confidence', 'confidence_threshold')) if key in query}
+                    image = server.detector._format_yolo(server.decode_image(body, self.headers))
+                    future = server.batcher.submit(image, thresholds)
+                    class_ids, confidences, boxes = future.result(server.timeout)
+                    meta = [[int(class_id), float(confidence), [int(v) for v in box]]
+                            for class_id, confidence, box in zip(class_ids, confidences, boxes)]
+                    self._send_json(200, {'meta': meta, 'size': list(server.detector.SIZE)})
+                except queue.Full:
+                    if frame_log_limiter('server_queue_full'):
+                        logger.warning('Очередь сервера детекции переполнена, запросы отклоняются')
+                    self._send_json(503, {'error': 'queue is full'}, {'Retry-After': '0.05'})
+                except (ValueError, KeyError) as exc:
+                    self._send_json(400, {'error': str(exc)})
+                except Exception as exc:
+                    logger.error(f'Ошибка сервера детекции: {exc}')
+                    self._send_json(500, {'error': str(exc)})
+                finally:
+                    slots.release()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        logger.info(f'Сервер детекции запущен по адресу {self.url} (пакет до {self.max_batch} кадров, '
+                    f'ожидание {self.max_wait_ms} мс)')
+        return self.url
+
+    def stop(self):
+        if self.is_running:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.thread.join()
+            self.batcher.stop()
+            self.httpd = None
+            self.thread = None
+            self.batcher = None
+            logger.info('Сервер детекции остановлен')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Локальный сервер детекции запрещённых предметов')
+    parser.add_argument('--model', default=YOLOv7_PATH)
+    parser.add_argument('--size', type=int, nargs=2, default=SIZE, metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument('--host', default=SERVER_HOST)
+    parser.add_argument('--port', type=int, default=SERVER_PORT)
+    parser.add_argument('--max-batch', type=int, default=SERVER_MAX_BATCH)
+    parser.add_argument('--max-wait-ms', type=float, default=SERVER_MAX_WAIT_MS)
+    parser.add_argument('--max-pending', type=int, default=SERVER_MAX_PENDING)
+    parser.add_argument('--max-concurrency', type=int, default=SERVER_MAX_CONCURRENCY)
+    args = parser.parse_args(argv)
+
+    detector = ImageObjectDetection(args.model, CLASS_LIST, size=tuple(args.size), remote_url=None, workers=0,
+                                    screening_model_path=None)
+    server = DetectionServer(detector, args.host, args.port, args.max_batch, args.max_wait_ms, args.max_pending,
+                             args.max_concurrency)
+    print(f'Сервер детекции: {server.start()}')
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    main()
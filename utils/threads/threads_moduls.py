@@ -0,0 +1,272 @@
+"""
+Распределение потоков процессора между детекторами и этапами обработки кадра. Без него каждый детектор (живой
+поток, видео, скриншот, процессы детекции) запускает OpenCV на всех ядрах, потоки разных вкладок вытесняют друг
+друга, и задержка отдельных кадров резко растёт.
+
+Ядра из бюджета THREAD_BUDGET делятся на зарезервированные (THREAD_RESERVED - интерфейс и декодирование видео) и
+вычислительные, которые делятся пропорционально весу между детекторами, занятыми обработкой кадра. Созданные, но
+простаивающие детекторы (скриншот, экспорт, проверка новой модели) ядер не получают. Методы детектора, отмеченные
+декоратором governor.governed(этап), выполняются с числом потоков OpenCV, выделенным этому этапу, а при
+THREAD_PINNING - ещё и на выделенных ядрах.
+"""
+import os
+import threading
+import weakref
+from contextlib import contextmanager
+from functools import wraps
+import cv2
+from logger.logger_config import get_logger
+from config import THREAD_GOVERNOR, THREAD_BUDGET, THREAD_RESERVED, THREAD_PINNING
+
+logger = get_logger(__name__)
+
+STAGES = ('capture', 'preprocess', 'forward', 'decode')
+# Переменные окружения, ограничивающие потоки BLAS/OpenMP; читаются библиотеками только при загрузке
+BLAS_VARIABLES = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'NUMEXPR_NUM_THREADS',
+                  'VECLIB_MAXIMUM_THREADS')
+
+
+def available_cores():
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+class ThreadAllocation:
+
+    def __init__(self, name, weight):
+        """
+        Потоки и ядра, выделенные одному детектору: словари {этап: число потоков} и {этап: кортеж ядер}.
+        Объект обновляется на месте при каждом перераспределении, поэтому детектор хранит ссылку на него.
+        """
+        self.name = name
+        self.weight = weight
+        # Число блоков governor.active, выполняемых детектором сейчас; persistent - ядра заняты всё время до release
+        self.active = 0
+        self.persistent = False
+        self.threads = dict.fromkeys(STAGES, 1)
+        self.cores = dict.fromkeys(STAGES, ())
+
+    def split(self, parts):
+        """
+        Делит ядра этапа forward между parts процессами. Возвращает список (число потоков, ядра).
+        """
+        cores = self.cores['forward']
+        shares = []
+        for i in range(parts):
+            part = cores[i::parts] or (cores[i % len(cores)],)
+            shares.append((len(part), part))
+        return shares
+
+    def __repr__(self):
+        return f'{self.name}: ' + ', '.join(f'{stage} {self.threads[stage]} {list(self.cores[stage])}'
+                                            for stage in STAGES)
+
+
+class ThreadGovernor:
+
+    def __init__(self, budget=THREAD_BUDGET, reserved=THREAD_RESERVED, pinning=THREAD_PINNING,
+                 enabled=THREAD_GOVERNOR):
+        """
+        Класс, распределяющий ядра процессора между детекторами и этапами обработки кадра.
+        :param budget: Число ядер, которые можно занять (0 - все доступные процессу).
+        :param reserved: Число ядер, оставляемых интерфейсу и декодированию видео.
+        :param pinning: Привязывать потоки этапов к выделенным ядрам (os.sched_setaffinity, только Linux).
+        :param enabled: False - потоки не ограничиваются, OpenCV использует своё значение по умолчанию.
+        """
+        assert isinstance(budget, int) and budget >= 0, "budget должен иметь тип int и быть неотрицательным"
+        assert isinstance(reserved, int) and reserved >= 0, "reserved должен иметь тип int и быть неотрицательным"
+
+        self.budget = budget
+        self.reserved = reserved
+        self.pinning = pinning and hasattr(os, 'sched_setaffinity')
+        self.enabled = enabled
+        self.default_threads = cv2.getNumThreads()
+        self.cores = ()
+        self._allocations = {}
+        self._lock = threading.RLock()
+        self._cv2_threads = None
+        self._split = None
+        self._set_cores()
+
+    def _set_cores(self):
+        self.cores = tuple(available_cores()[:self.budget or None])
+
+    @property
+    def reserved_cores(self):
+        return self.cores[:self.reserved] if len(self.cores) > self.reserved else ()
+
+    def configure(self, enabled=None, budget=None, reserved=None, pinning=None):
+        """
+        Меняет параметры и перераспределяет потоки. При отключении OpenCV возвращается число потоков по умолчанию.
+        """
+        with self._lock:
+            if enabled is not None:
+                self.enabled = enabled
+            if budget is not None:
+                self.budget = budget
+                self._set_cores()
+            if reserved is not None:
+                self.reserved = reserved
+            if pinning is not None:
+                self.pinning = pinning and hasattr(os, 'sched_setaffinity')
+            if not self.enabled and self._cv2_threads is not None:
+                cv2.setNumThreads(self.default_threads)
+                self._cv2_threads = None
+            self._split = None
+            self._rebalance()
+
+    def register(self, owner, weight=1, persistent=False):
+        """
+        Регистрирует детектор (или пул процессов) с весом weight. Ядра выделяются детектору только на время блоков
+        active и stage, а при persistent=True (пул процессов, занимающий ядра всё время работы) - сразу и до release.
+        Повторная регистрация того же объекта возвращает прежнее выделение с новым весом. Выделение снимается release
+        или при удалении объекта.
+        """
+        assert isinstance(weight, int) and weight > 0, "weight должен иметь тип int и быть больше 0"
+
+        key = id(owner)
+        with self._lock:
+            allocation = self._allocations.get(key)
+            if allocation is None:
+                allocation = ThreadAllocation(f'{type(owner).__name__}-{key:x}', weight)
+                self._allocations[key] = allocation
+                weakref.finalize(owner, self._release, key)
+            allocation.weight = weight
+            allocation.persistent = persistent
+            self._rebalance()
+        return allocation
+
+    def release(self, owner):
+        self._release(id(owner))
+
+    def _release(self, key):
+        with self._lock:
+            if self._allocations.pop(key, None) is not None:
+                self._rebalance()
+
+    def _rebalance(self):
+        reserved = self.reserved_cores
+        compute = self.cores[len(reserved):]
+        allocations = [allocation for allocation in self._allocations.values()
+                       if allocation.active or allocation.persistent]
+        if not allocations:
+            return
+        total = sum(allocation.weight for allocation in allocations)
+        position = 0
+        for allocation in allocations:
+            # Если детекторов больше, чем ядер, каждый получает одно ядро и ядра используются повторно по кругу
+            count = max(1, len(compute) * allocation.weight // total)
+            cores = tuple(compute[(position + i) % len(compute)] for i in range(count))
+            position += count
+            # Разбор выхода и NMS почти не распараллеливаются, но то же число потоков, что у прямого прохода, не
+            # заставляет OpenCV пересоздавать пул потоков на каждом этапе
+            allocation.threads.update(capture=max(len(reserved), 1), preprocess=count, forward=count, decode=count)
+            allocation.cores.update(capture=reserved or compute, preprocess=cores, forward=cores, decode=cores)
+        # Занятость меняется на каждом кадре, а распределение - только при смене состава работающих детекторов
+        split = tuple((allocation.name, allocation.threads['forward']) for allocation in allocations)
+        if split != self._split:
+            self._split = split
+            logger.debug('Распределение потоков: ' + '; '.join(repr(allocation) for allocation in allocations))
+
+    def _set_cv2_threads(self, threads):
+        # cv2.setNumThreads действует на весь процесс и пересоздаёт пул потоков, поэтому вызывается только при смене.
+        # Этапы выполняются в потоках интерфейса, экспорта, замены модели и сервера, поэтому проверка и установка
+        # выполняются под блокировкой
+        with self._lock:
+            if threads != self._cv2_threads:
+                cv2.setNumThreads(threads)
+                self._cv2_threads = threads
+
+    def _activate(self, allocation, delta):
+        with self._lock:
+            allocation.active += delta
+            # Ядра перераспределяются, только когда детектор начинает или заканчивает работу, а не на вложенных блоках
+            if allocation.active == (1 if delta > 0 else 0):
+                self._rebalance()
+
+    @contextmanager
+    def active(self, allocation):
+        """
+        Отмечает детектор allocation занятым на время блока: ядра делятся только между занятыми детекторами.
+        """
+        if not self.enabled or allocation is None:
+            yield
+            return
+        self._activate(allocation, 1)
+        try:
+            yield
+        finally:
+            self._activate(allocation, -1)
+
+    @contextmanager
+    def stage(self, allocation, stage):
+        """
+        Выполняет блок с потоками и ядрами, выделенными этапу stage детектора allocation. При stage=None блок только
+        отмечает детектор занятым (см. active).
+        """
+        with self.active(allocation):
+            if not self.enabled or allocation is None or stage is None:
+                yield
+                return
+            self._set_cv2_threads(allocation.threads[stage])
+            if not self.pinning:
+                yield
+                return
+            previous = os.sched_getaffinity(0)
+            os.sched_setaffinity(0, allocation.cores[stage])
+            try:
+                yield
+            finally:
+                os.sched_setaffinity(0, previous)
+
+    def governed(self, stage=None):
+        """
+        Декоратор метода детектора: метод выполняется в пределах выделения self.thread_allocation для этапа stage.
+        Без stage метод (полный цикл кадра) только держит детектор занятым, чтобы ядра не перераспределялись
+        между его этапами.
+        """
+        assert stage is None or stage in STAGES, f"stage должен быть одним из {STAGES}"
+
+        def decorator(fu):
+            @wraps(fu)
+            def inner(obj, *a, **kw):
+                with self.stage(getattr(obj, 'thread_allocation', None), stage):
+                    return fu(obj, *a, **kw)
+
+            return inner
+
+        return decorator
+
+    def capture_threads(self):
+        """
+        Число потоков декодера видео или 0 (значение декодера по умолчанию), если распределение отключено.
+        """
+        return max(len(self.reserved_cores), 1) if self.enabled else 0
+
+    def pin_capture_thread(self):
+        """
+        Привязывает текущий поток (поток предвыборки кадров) к зарезервированным ядрам.
+        """
+        if self.enabled and self.pinning and self.reserved_cores:
+            os.sched_setaffinity(0, self.reserved_cores)
+
+    @staticmethod
+    @contextmanager
+    def environment(threads):
+        """
+        Временно ограничивает потоки BLAS/OpenMP в переменных окружения, которые унаследует запускаемый процесс.
+        """
+        previous = {name: os.environ.get(name) for name in BLAS_VARIABLES}
+        os.environ.update({name: str(threads) for name in BLAS_VARIABLES})
+        try:
+            yield
+        finally:
+            for name, value in previous.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+
+
+governor = ThreadGovernor()
@@ -49,6 +49,11 @@ class Table(tk.Frame):
         self.table.pack(expand=tk.YES, fill=tk.BOTH)
         self.table.configure(height=5)
 
+    def update_rows(self, df):
+        self.table.delete(*self.table.get_children())
+        for index, row in df.iterrows():
+            self.table.insert('', tk.END, values=tuple(row))
+
 
 def center(win):
     win.update_idletasks()
@@ -0,0 +1,290 @@
+"""
+Экспорт видео с нарисованными детекциями. Декодирование, детекция и кодирование выполняются параллельно: кадры
+декодируются в отдельном потоке, детектор обрабатывает их в потоке экспорта, а готовые кадры кодируются ещё одним
+потоком через cv2.VideoWriter (бэкенд FFmpeg). Этапы связаны очередями ограниченного размера, поэтому память не
+растёт, а скорость экспорта определяется самым медленным этапом, а не их суммой.
+
+Запуск: python -m utils.video.export_moduls VIDEO OUTPUT [--model PATH] [--start 10] [--end 70] [--only-detections]
+                                            [--padding 1.0] [--fourcc mp4v]
+"""
+import argparse
+import collections
+import queue
+import sys
+import threading
+import time
+import cv2
+import numpy as np
+from logger.logger_config import get_logger, frame_log_limiter
+from utils.video.video_moduls import CaptureOptions, open_capture
+from config import YOLOv7_PATH, EXPORT_FOURCC, EXPORT_QUEUE_SIZE, EXPORT_SEGMENT_PADDING
+
+logger = get_logger(__name__)
+
+# Признак конца потока кадров в очередях между этапами
+_END = None
+
+
+def original_boxes(boxes, shape, size):
+    """
+    Переводит боксы из координат кадра после _format_yolo (размер size) в координаты исходного кадра формы shape.
+    """
+    height, width = shape[:2]
+    scale = min(size[0] / width, size[1] / height)
+    pad_x, pad_y = (size[0] - width * scale) / 2, (size[1] - height * scale) / 2
+    result = []
+    for box in boxes:
+        x, y, w, h = (float(v) for v in box)
+        result.append(np.array([(x - pad_x) / scale, (y - pad_y) / scale, w / scale, h / scale], dtype=np.int64))
+    return result
+
+
+class VideoExporter:
+
+    def __init__(self,
+                 detector,
+                 source_path,
+                 output_path,
+                 start=None,
+                 end=None,
+                 only_detections=False,
+                 padding=EXPORT_SEGMENT_PADDING,
+                 fourcc=EXPORT_FOURCC,
+                 queue_size=EXPORT_QUEUE_SIZE,
+                 progress=None):
+        """
+        Класс, экспортирующий видео или его фрагмент с нарисованными детекциями.
+        :param detector: Экземпляр VideoObjectDetection. Модель загружается заново в потоке экспорта, поэтому модель
+        отображения не используется из двух потоков.
+        :param source_path: Путь к исходному видео.
+        :param output_path: Путь к создаваемому видео.
+        :param start: Начало фрагмента в секундах или None - с начала видео.
+        :param end: Конец фрагмента в секундах или None - до конца видео.
+        :param only_detections: Записывать только фрагменты, в которых есть детекции.
+        :param padding: Сколько секунд до и после детекций записывается вместе с фрагментом.
+        :param fourcc: Код кодека cv2.VideoWriter (например, "mp4v", "avc1", "MJPG").
+        :param queue_size: Размер очередей между этапами в кадрах.
+        :param progress: Функция progress(кадров, доля), вызываемая после каждого кадра.
+        """
+        assert isinstance(source_path, str), "source_path должен иметь тип str"
+        assert isinstance(output_path, str), "output_path должен иметь тип str"
+        assert start is None or start >= 0, "start должен быть неотрицательным или None"
+        assert end is None or start is None or end > start, "end должен быть больше start"
+        assert padding >= 0, "padding должен быть неотрицательным"
+        assert isinstance(fourcc, str) and len(fourcc) == 4, "fourcc должен быть строкой из 4 символов"
+        assert isinstance(queue_size, int) and queue_size > 0, "queue_size должен иметь тип int и быть больше 0"
+
+        self.detector = detector
+        self.source_path = source_path
+        self.output_path = output_path
+        self.start = start
+        self.end = end
+        self.only_detections = only_detections
+        self.padding = padding
+        self.fourcc = fourcc
+        self.queue_size = queue_size
+        self.progress = progress
+
+        self.frames = 0
+        self.written = 0
+        self.segments = []
+        self._stop = threading.Event()
+        self._error = None
+
+    def stop(self):
+        self._stop.set()
+
+    def _put(self, target, item):
+        # Ожидание с таймаутом, чтобы остановка не зависала на заполненной очереди
+        while not self._stop.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _decoder(self, capture, first, last, decoded):
+        try:
+            index = first
+            while not self._stop.is_set() and index < last:
+                ret, frame = capture.read()
+                if not ret:
+                    break
+                if not self._put(decoded, (index, frame)):
+                    break
+                index += 1
+        except Exception as exc:
+            self._error = exc
+        finally:
+            capture.release()
+            self._put(decoded, _END)
+
+    def _encoder(self, writer, encoded):
+        try:
+            while True:
+                frame = encoded.get()
+                if frame is _END:
+                    break
+                # Кадр рисуется в RGB, как в окне программы, а VideoWriter ожидает BGR
+                writer.write(cv2.cvtColor(frame, cv2.COLOR_RGB2BGR, dst=frame))
+                self.written += 1
+        except Exception as exc:
+            self._error = exc
+            self._stop.set()
+        finally:
+            writer.release()
+
+    def _annotate(self, net, output_layers, frame):
+        """
+        Детекция кадра BGR исходного размера. Возвращает кадр RGB с нарисованными боксами и число детекций.
+        """
+        image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        class_ids, confidences, boxes = self.detector._infer(self.detector._format_yolo(image), net, output_layers)
+        boxes = original_boxes(boxes, image.shape, self.detector.SIZE)
+        meta = list(zip(class_ids, confidences, boxes))
+        if meta:
+            image = self.detector.renderer.render(image, meta)
+        return image, len(meta)
+
+    def _open_segment(self, index):
+        if not self.segments or self.segments[-1][1] is not None:
+            self.segments.append([index, None])
+
+    def _close_segment(self, index):
+        if self.segments and self.segments[-1][1] is None:
+            self.segments[-1][1] = index
+
+    def run(self):
+        """
+        Выполняет экспорт и возвращает словарь со статистикой: frames - обработано кадров, written - записано,
+        segments - записанные фрагменты [(начало, конец)] в секундах исходного видео, fps - скорость экспорта,
+        realtime - во сколько раз экспорт быстрее воспроизведения.
+        """
+        capture = open_capture(self.source_path, CaptureOptions(prefetch=0))
+        if not capture.isOpened():
+            raise IOError(f'Невозможно открыть видео {self.source_path}')
+        fps = capture.get(cv2.CAP_PROP_FPS) or 25.0
+        total = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        width, height = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH)), int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        first = int(round((self.start or 0) * fps))
+        last = int(round(self.end * fps)) if self.end is not None else total if total > 0 else sys.maxsize
+        if first:
+            capture.set(cv2.CAP_PROP_POS_FRAMES, first)
+
+        writer = cv2.VideoWriter(self.output_path, cv2.CAP_FFMPEG, cv2.VideoWriter_fourcc(*self.fourcc), fps,
+                                 (width, height))
+        if not writer.isOpened():
+            writer = cv2.VideoWriter(self.output_path, cv2.VideoWriter_fourcc(*self.fourcc), fps, (width, height))
+        if not writer.isOpened():
+            capture.release()
+            raise IOError(f'Невозможно создать видео {self.output_path} с кодеком {self.fourcc}')
+
+        model = self.detector._build_model()
+        if model is None:
+            capture.release()
+            writer.release()
+            raise IOError(f'Невозможно загрузить модель {self.detector.MODEL_PATH}')
+        net, output_layers = model
+
+        logger.info(f'Экспорт {self.source_path} в {self.output_path}: кадры {first}-{last if total else "конец"}, '
+                    f'{"только фрагменты с детекциями" if self.only_detections else "всё видео"}')
+        decoded, encoded = queue.Queue(self.queue_size), queue.Queue(self.queue_size)
+        decoder = threading.Thread(target=self._decoder, args=(capture, first, last, decoded), daemon=True)
+        encoder = threading.Thread(target=self._encoder, args=(writer, encoded), daemon=True)
+        decoder.start()
+        encoder.start()
+
+        padding = int(round(self.padding * fps))
+        preroll = collections.deque(maxlen=padding)
+        remaining = 0
+        count = max(min(last, total if total > 0 else last) - first, 1)
+        if not self.only_detections:
+            self._open_segment(first)
+        started = time.perf_counter()
+        try:
+            while not self._stop.is_set():
+                try:
+                    item = decoded.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if item is _END:
+                    break
+                index, frame = item
+                image, detections = self._annotate(net, output_layers, frame)
+                self.frames += 1
+                if not self.only_detections:
+                    self._put(encoded, image)
+                elif detections:
+                    # Фрагмент начинается за padding кадров до первой детекции и заканчивается через padding после
+                    # последней
+                    self._open_segment(preroll[0][0] if preroll else index)
+                    while preroll:
+                        self._put(encoded, preroll.popleft()[1])
+                    self._put(encoded, image)
+                    remaining = padding
+                elif remaining:
+                    self._put(encoded, image)
+                    remaining -= 1
+                else:
+                    self._close_segment(index)
+                    if padding:
+                        preroll.append((index, image))
+                if self.progress is not None:
+                    self.progress(self.frames, min(self.frames / count, 1.0))
+                frames = frame_log_limiter('export_frame')
+                if frames:
+                    logger.info(f'Экспорт: обработано {self.frames} кадров (кадров с прошлого сообщения: {frames})')
+        finally:
+            self._close_segment(first + self.frames)
+            # Кодировщик дописывает кадры, уже стоящие в очереди, поэтому остановленный экспорт остаётся читаемым
+            while encoder.is_alive():
+                try:
+                    encoded.put(_END, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+            encoder.join()
+            self._stop.set()
+            decoder.join()
+            self.detector.release_model(net)
+
+        if self._error is not None:
+            raise IOError(f'Ошибка при экспорте {self.source_path}: {self._error}')
+        elapsed = time.perf_counter() - started
+        export_fps = self.frames / elapsed if elapsed > 0 else 0.0
+        segments = [(start / fps, end / fps) for start, end in self.segments]
+        logger.info(f'Экспорт {self.output_path} завершён: обработано {self.frames} кадров, записано {self.written}, '
+                    f'{export_fps:.1f} кадр/с (x{export_fps / fps:.2f} от скорости воспроизведения)')
+        return {'frames': self.frames, 'written': self.written, 'segments': segments, 'fps': export_fps,
+                'realtime': export_fps / fps}
+
+
+def main(argv=None):
+    from utils.neural_network.neuralnet_moduls import VideoObjectDetection
+
+    parser = argparse.ArgumentParser(description='Экспорт видео с нарисованными детекциями')
+    parser.add_argument('video', help='Исходное видео')
+    parser.add_argument('output', help='Создаваемое видео')
+    parser.add_argument('--model', default=YOLOv7_PATH, help='Путь к ONNX-модели')
+    parser.add_argument('--start', type=float, default=None, help='Начало фрагмента, с')
+    parser.add_argument('--end', type=float, default=None, help='Конец фрагмента, с')
+    parser.add_argument('--only-detections', action='store_true', help='Записывать только фрагменты с детекциями')
+    parser.add_argument('--padding', type=float, default=EXPORT_SEGMENT_PADDING,
+                        help='Запас до и после детекций, с')
+    parser.add_argument('--fourcc', default=EXPORT_FOURCC)
+    args = parser.parse_args(argv)
+
+    detector = VideoObjectDetection(args.model, remote_url=None, workers=0)
+    exporter = VideoExporter(detector, args.video, args.output, args.start, args.end, args.only_detections,
+                             args.padding, args.fourcc)
+    stats = exporter.run()
+    print(f'Обработано кадров: {stats["frames"]}, записано: {stats["written"]}, {stats["fps"]:.1f} кадр/с '
+          f'(x{stats["realtime"]:.2f} от скорости воспроизведения)')
+    for start, end in stats['segments']:
+        print(f'  фрагмент {start:.2f}-{end:.2f} с')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
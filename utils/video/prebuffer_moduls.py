@@ -0,0 +1,169 @@
+"""
+Кольцевой буфер последних секунд живого потока. Кадры хранятся сжатыми в JPEG, поэтому память ограничена и не растёт
+со временем; сжатие выполняется в отдельном потоке, чтобы не задерживать отображение. По срабатыванию (детекция или
+команда оператора) содержимое буфера сохраняется на диск клипом с JSON-файлом, в котором записаны время каждого
+кадра и детекции.
+"""
+import collections
+import json
+import os
+import queue
+import threading
+import time
+import cv2
+from logger.logger_config import get_logger, frame_log_limiter
+from config import PREBUFFER_SECONDS, PREBUFFER_QUALITY, PREBUFFER_MAX_MB, PREBUFFER_DIR, PREBUFFER_COOLDOWN, \
+    EXPORT_FOURCC
+
+logger = get_logger(__name__)
+
+
+def serialize_meta(meta):
+    """
+    Детекции [(class_id, confidence, box)] в виде, пригодном для JSON, как в ответе сервера детекции.
+    """
+    return [[int(class_id), float(confidence), [int(v) for v in box]] for class_id, confidence, box in meta or ()]
+
+
+class PreEventBuffer:
+
+    def __init__(self,
+                 seconds=PREBUFFER_SECONDS,
+                 quality=PREBUFFER_QUALITY,
+                 max_mb=PREBUFFER_MAX_MB,
+                 directory=PREBUFFER_DIR,
+                 cooldown=PREBUFFER_COOLDOWN,
+                 fourcc=EXPORT_FOURCC):
+        """
+        Класс кольцевого буфера кадров перед событием.
+        :param seconds: Сколько последних секунд потока хранится.
+        :param quality: Качество JPEG (1-100).
+        :param max_mb: Предел памяти буфера в мегабайтах; при превышении удаляются самые старые кадры.
+        :param directory: Папка, в которую сохраняются клипы.
+        :param cooldown: Минимальный интервал между клипами, сохраняемыми по детекциям, в секундах.
+        :param fourcc: Код кодека cv2.VideoWriter для клипов.
+        """
+        assert seconds > 0, "seconds должен быть больше 0"
+        assert isinstance(quality, int) and 1 <= quality <= 100, "quality должен иметь тип int и быть от 1 до 100"
+        assert max_mb > 0, "max_mb должен быть больше 0"
+        assert cooldown >= 0, "cooldown должен быть неотрицательным"
+
+        self.seconds = seconds
+        self.quality = quality
+        self.max_bytes = int(max_mb * 2 ** 20)
+        self.directory = directory
+        self.cooldown = cooldown
+        self.fourcc = fourcc
+
+        self.nbytes = 0
+        self.dropped = 0
+        self.clips = 0
+        self._frames = collections.deque()
+        self._lock = threading.Lock()
+        self._last_trigger = float('-inf')
+        # Очередь на сжатие невелика: если сжатие не успевает, кадр пропускается, а не задерживает отображение
+        self._pending = queue.Queue(maxsize=4)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._encoder, daemon=True)
+        self._thread.start()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._frames)
+
+    def push(self, frame, meta=None, timestamp=None):
+        """
+        Добавляет кадр в буфер. Кадр сжимается в фоновом потоке, поэтому после вызова его нельзя изменять.
+        :param frame: Кадр RGB (numpy.ndarray).
+        :param meta: Детекции кадра [(class_id, confidence, box)] или None.
+        :param timestamp: Время кадра (time.time()) или None - текущее время.
+        """
+        try:
+            self._pending.put_nowait((time.time() if timestamp is None else timestamp, frame, meta))
+        except queue.Full:
+            self.dropped += 1
+            if frame_log_limiter('prebuffer_dropped'):
+                logger.warning(f'Буфер предыстории не успевает сжимать кадры, пропущено {self.dropped}')
+
+    def _encoder(self):
+        while not self._stop.is_set():
+            try:
+                timestamp, frame, meta = self._pending.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            ok, data = cv2.imencode('.jpg', cv2.cvtColor(frame, cv2.COLOR_RGB2BGR),
+                                    [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+            if not ok:
+                continue
+            with self._lock:
+                self._frames.append((timestamp, data, serialize_meta(meta), frame.shape[1::-1]))
+                self.nbytes += data.nbytes
+                self._evict(timestamp)
+
+    def _evict(self, now):
+        while self._frames and (now - self._frames[0][0] > self.seconds or self.nbytes > self.max_bytes):
+            self.nbytes -= self._frames.popleft()[1].nbytes
+
+    def snapshot(self):
+        with self._lock:
+            return list(self._frames)
+
+    def trigger(self, reason='operator', meta=None, force=True):
+        """
+        Сохраняет содержимое буфера клипом в отдельном потоке и возвращает путь к клипу или None, если буфер пуст
+        или с прошлого клипа прошло меньше cooldown секунд (только при force=False, то есть для детекций).
+        :param reason: Причина сохранения, записывается в имя файла и в JSON.
+        :param meta: Детекции, по которым сохраняется клип.
+        """
+        now = time.time()
+        if not force and now - self._last_trigger < self.cooldown:
+            return None
+        frames = self.snapshot()
+        if not frames:
+            return None
+        self._last_trigger = now
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, time.strftime('clip_%Y%m%d_%H%M%S', time.localtime(now)) +
+                            f'_{int(now * 1000) % 1000:03d}_{reason}.mp4')
+        threading.Thread(target=self._write_clip, args=(path, frames, reason, serialize_meta(meta), now),
+                         daemon=True).start()
+        return path
+
+    def _write_clip(self, path, frames, reason, meta, created):
+        try:
+            duration = frames[-1][0] - frames[0][0]
+            fps = (len(frames) - 1) / duration if duration > 0 else 25.0
+            writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*self.fourcc), fps, frames[0][3])
+            if not writer.isOpened():
+                raise IOError(f'Невозможно создать видео {path} с кодеком {self.fourcc}')
+            for _, data, _, size in frames:
+                image = cv2.imdecode(data, cv2.IMREAD_COLOR)
+                if tuple(size) != tuple(frames[0][3]):
+                    image = cv2.resize(image, frames[0][3])
+                writer.write(image)
+            writer.release()
+            with open(os.path.splitext(path)[0] + '.json', 'w', encoding='utf-8') as f:
+                json.dump({'reason': reason, 'created': created, 'fps': fps, 'meta': meta,
+                           'frames': [{'time': timestamp, 'meta': frame_meta}
+                                      for timestamp, _, frame_meta, _ in frames]}, f, ensure_ascii=False)
+            self.clips += 1
+            logger.info(f'Сохранён клип {path}: {len(frames)} кадров, {duration:.1f} с до события ({reason})')
+        except Exception as exc:
+            logger.error(f'Не удалось сохранить клип {path}. Возникла ошибка {exc}')
+
+    def stats(self):
+        with self._lock:
+            frames = len(self._frames)
+            seconds = self._frames[-1][0] - self._frames[0][0] if frames > 1 else 0.0
+        return {'frames': frames, 'seconds': seconds, 'mb': self.nbytes / 2 ** 20, 'dropped': self.dropped,
+                'clips': self.clips}
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+            self.nbytes = 0
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        self.clear()
@@ -0,0 +1,193 @@
+"""
+Воспроизводимый источник кадров вместо камеры: видеофайл или папка с изображениями выдаются с частотой настоящей
+камеры (или в speed раз быстрее) с дрожанием времени прихода кадров и потерей части кадров. Так живой режим,
+несколько камер и бенчмарки работают на машине без камеры и без GPU.
+
+Источник открывается через open_capture по адресу вида
+    replay:ПУТЬ?fps=30&speed=1&jitter=0.005&drop=0.01&loop=1&seed=0
+и имеет интерфейс cv2.VideoCapture: isOpened, read, get, set, release.
+"""
+import os
+import time
+from urllib.parse import parse_qs, urlencode
+import cv2
+import numpy as np
+from logger.logger_config import get_logger
+from config import REPLAY_FPS
+
+logger = get_logger(__name__)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def replay_url(path, fps=None, speed=1.0, jitter=0.0, drop=0.0, loop=True, seed=0):
+    """
+    Адрес воспроизводимого источника для open_capture с параметрами ReplaySource.
+    """
+    params = {'speed': speed, 'jitter': jitter, 'drop': drop, 'loop': int(loop), 'seed': seed}
+    if fps is not None:
+        params['fps'] = fps
+    return f'replay:{path}?{urlencode(params)}'
+
+
+def parse_replay_url(url):
+    """
+    Разбирает адрес replay:ПУТЬ?параметры и возвращает (путь, словарь параметров для ReplaySource).
+    """
+    assert url.startswith('replay:'), "Адрес должен начинаться с replay:"
+
+    path, _, query = url[len('replay:'):].partition('?')
+    params = {name: values[-1] for name, values in parse_qs(query).items()}
+    kwargs = {}
+    for name in ('fps', 'speed', 'jitter', 'drop'):
+        if name in params:
+            kwargs[name] = float(params[name])
+    if 'loop' in params:
+        kwargs['loop'] = params['loop'].lower() not in ('0', 'false', 'no')
+    if 'seed' in params:
+        kwargs['seed'] = int(params['seed'])
+    return path, kwargs
+
+
+class ReplaySource:
+
+    def __init__(self, path, fps=None, speed=1.0, jitter=0.0, drop=0.0, loop=True, seed=0):
+        """
+        Класс, выдающий кадры видеофайла или папки с изображениями с частотой камеры.
+        :param path: Путь к видеофайлу или папке с изображениями.
+        :param fps: Частота кадров камеры или None - частота видео (REPLAY_FPS для папки).
+        :param speed: Ускорение относительно реального времени (2 - кадры приходят вдвое чаще).
+        :param jitter: Среднеквадратичное отклонение задержки прихода кадра в секундах.
+        :param drop: Вероятность потери кадра камерой: кадр декодируется, но не выдаётся.
+        :param loop: Начинать сначала после последнего кадра, как бесконечный поток камеры.
+        :param seed: Зерно генератора дрожания и потерь, чтобы прогоны повторялись.
+        """
+        assert isinstance(path, str), "path должен иметь тип str"
+        assert fps is None or fps > 0, "fps должен быть больше 0 или None"
+        assert speed > 0, "speed должен быть больше 0"
+        assert jitter >= 0, "jitter должен быть неотрицательным"
+        assert 0 <= drop < 1, "drop должен быть от 0 до 1"
+
+        self.path = path
+        self.speed = speed
+        self.jitter = jitter
+        self.drop = drop
+        self.loop = loop
+        self.lost = 0
+        self.late = 0
+
+        self._rng = np.random.default_rng(seed)
+        self._images = None
+        self._capture = None
+        if os.path.isdir(path):
+            self._images = sorted(os.path.join(path, name) for name in os.listdir(path)
+                                  if name.lower().endswith(IMAGE_EXTENSIONS))
+            native_fps = REPLAY_FPS
+        else:
+            self._capture = cv2.VideoCapture(path)
+            native_fps = self._capture.get(cv2.CAP_PROP_FPS) or REPLAY_FPS
+        self.fps = fps or native_fps
+        self._position = 0
+        self._index = 0
+        self._start = None
+        self._opened = bool(self._images) or (self._capture is not None and self._capture.isOpened())
+        self._shape = None
+        if self._opened:
+            ret, frame = self._next_frame()
+            self._opened = ret
+            self._shape = frame.shape if ret else None
+            self._rewind()
+        self._released = False
+
+    @classmethod
+    def from_url(cls, url):
+        path, kwargs = parse_replay_url(url)
+        return cls(path, **kwargs)
+
+    @property
+    def rate(self):
+        return self.fps * self.speed
+
+    def _rewind(self, position=0, restart=True):
+        self._position = position
+        if self._capture is not None:
+            self._capture.set(cv2.CAP_PROP_POS_FRAMES, position)
+        if restart:
+            self._start = None
+
+    def _next_frame(self, image=None):
+        if self._images is not None:
+            if self._position >= len(self._images):
+                return False, None
+            frame = cv2.imread(self._images[self._position])
+            return frame is not None, frame
+        return self._capture.read(image) if image is not None else self._capture.read()
+
+    def isOpened(self):
+        return self._opened and not self._released
+
+    def read(self, image=None):
+        """
+        Возвращает следующий кадр не раньше времени его прихода по расписанию камеры.
+        """
+        if not self.isOpened():
+            return False, None
+        if self._start is None:
+            self._start = time.perf_counter()
+            self._index = 0
+        while True:
+            ret, frame = self._next_frame(image)
+            if not ret:
+                if not self.loop or self._position == 0:
+                    return False, None
+                # Расписание продолжается без паузы, как у камеры, которая не останавливается
+                self._rewind(restart=False)
+                continue
+            self._position += 1
+            # Время прихода считается от начала воспроизведения, поэтому дрожание не накапливается
+            due = self._start + self._index / self.rate
+            if self.jitter:
+                due += abs(self._rng.normal(0.0, self.jitter))
+            self._index += 1
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            elif delay < -1 / self.rate:
+                self.late += 1
+            if self.drop and self._rng.random() < self.drop:
+                self.lost += 1
+                continue
+            return True, frame
+
+    def get(self, prop_id):
+        if prop_id == cv2.CAP_PROP_FPS:
+            return float(self.rate)
+        if prop_id == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self._shape[1]) if self._shape else 0.0
+        if prop_id == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self._shape[0]) if self._shape else 0.0
+        if prop_id == cv2.CAP_PROP_POS_FRAMES:
+            return float(self._position)
+        if prop_id == cv2.CAP_PROP_FRAME_COUNT:
+            if self._images is not None:
+                return float(len(self._images))
+            return self._capture.get(cv2.CAP_PROP_FRAME_COUNT)
+        return 0.0
+
+    def set(self, prop_id, value):
+        if prop_id != cv2.CAP_PROP_POS_FRAMES:
+            return False
+        self._rewind(int(value))
+        return True
+
+    def getBackendName(self):
+        return 'replay'
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        if self._capture is not None:
+            self._capture.release()
+        logger.info(f'Воспроизведение {self.path} завершено: потеряно кадров {self.lost}, '
+                    f'выдано с опозданием {self.late}')
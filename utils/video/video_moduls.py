@@ -0,0 +1,249 @@
+import atexit
+import queue
+import threading
+import weakref
+import cv2
+from logger.logger_config import get_logger
+from utils.threads.threads_moduls import governor
+from utils.video.replay_moduls import ReplaySource
+from config import CAPTURE_BACKEND, CAPTURE_THREADS, CAPTURE_HW_ACCELERATION, CAPTURE_PREFETCH
+
+logger = get_logger(__name__)
+
+BACKENDS = {'any': cv2.CAP_ANY,
+            'ffmpeg': cv2.CAP_FFMPEG,
+            'msmf': cv2.CAP_MSMF,
+            'dshow': cv2.CAP_DSHOW,
+            'v4l2': cv2.CAP_V4L2,
+            'gstreamer': cv2.CAP_GSTREAMER}
+
+HW_ACCELERATIONS = {'none': getattr(cv2, 'VIDEO_ACCELERATION_NONE', None),
+                    'any': getattr(cv2, 'VIDEO_ACCELERATION_ANY', None),
+                    'd3d11': getattr(cv2, 'VIDEO_ACCELERATION_D3D11', None),
+                    'vaapi': getattr(cv2, 'VIDEO_ACCELERATION_VAAPI', None),
+                    'mfx': getattr(cv2, 'VIDEO_ACCELERATION_MFX', None)}
+
+# Источники кадров, открываемые по адресу вида "схема:...": {схема: функция, возвращающая объект с интерфейсом
+# cv2.VideoCapture}. Такие источники считаются живыми и всегда читаются с предвыборкой
+SOURCE_SCHEMES = {'replay': ReplaySource.from_url}
+
+# Потоки декодирования, которые нужно остановить до завершения интерпретатора, пока они не находятся внутри cv2
+_active_captures = weakref.WeakSet()
+
+
+class CaptureOptions:
+
+    def __init__(self,
+                 backend=CAPTURE_BACKEND,
+                 threads=CAPTURE_THREADS,
+                 hw_acceleration=CAPTURE_HW_ACCELERATION,
+                 prefetch=CAPTURE_PREFETCH):
+        """
+        Класс, описывающий параметры открытия видеопотока в cv2.VideoCapture.
+        :param backend: Бэкенд OpenCV для чтения видео ("any", "ffmpeg", "msmf", "dshow", "v4l2", "gstreamer").
+        :param threads: Количество потоков декодера (0 - число ядер, зарезервированных распределителем потоков
+        utils.threads.threads_moduls, или выбор декодера по умолчанию, если распределитель отключён).
+        :param hw_acceleration: Аппаратное ускорение декодирования ("none", "any", "d3d11", "vaapi", "mfx").
+        Используется, если текущая сборка OpenCV поддерживает CAP_PROP_HW_ACCELERATION.
+        :param prefetch: Размер кольцевого буфера кадров, которые декодируются заранее в отдельном потоке
+        (0 - декодирование в потоке, который читает кадры).
+        """
+        assert backend in BACKENDS, f"backend должен быть одним из {tuple(BACKENDS)}"
+        assert isinstance(threads, int) and threads >= 0, "threads должен иметь тип int и быть неотрицательным"
+        assert hw_acceleration in HW_ACCELERATIONS, \
+            f"hw_acceleration должен быть одним из {tuple(HW_ACCELERATIONS)}"
+        assert isinstance(prefetch, int) and prefetch >= 0, "prefetch должен иметь тип int и быть неотрицательным"
+
+        self.backend = backend
+        self.threads = threads
+        self.hw_acceleration = hw_acceleration
+        self.prefetch = prefetch
+
+    def params(self):
+        params = []
+        acceleration = HW_ACCELERATIONS[self.hw_acceleration]
+        if acceleration is not None and hasattr(cv2, 'CAP_PROP_HW_ACCELERATION'):
+            params += [cv2.CAP_PROP_HW_ACCELERATION, acceleration]
+        threads = self.threads or governor.capture_threads()
+        if threads and hasattr(cv2, 'CAP_PROP_N_THREADS'):
+            params += [cv2.CAP_PROP_N_THREADS, threads]
+        return params
+
+
+class PrefetchingCapture:
+
+    def __init__(self, capture, buffer_size=CAPTURE_PREFETCH, live=False):
+        """
+        Класс-обёртка над cv2.VideoCapture, который декодирует кадры в отдельном потоке в кольцевой буфер.
+        Кадры декодируются прямо в заранее выделенные массивы (capture.read(image)), поэтому после заполнения
+        буфера чтение не выделяет память. Массив, возвращённый методом read, остаётся действительным до следующего
+        вызова read. Интерфейс совпадает с cv2.VideoCapture: isOpened, read, get, set, release.
+        :param capture: Открытый экземпляр класса cv2.VideoCapture или ReplaySource.
+        :param buffer_size: Количество кадров, декодируемых заранее.
+        :param live: Для живых источников (веб-камера, поток) при заполненном буфере отбрасывается самый старый
+        кадр, чтобы не накапливать задержку. Для файлов декодер ждёт освобождения места.
+        """
+        assert isinstance(capture, cv2.VideoCapture | ReplaySource), \
+            "capture должен быть объектом класса cv2.VideoCapture или ReplaySource"
+        assert isinstance(buffer_size, int) and buffer_size > 0, "buffer_size должен иметь тип int и быть больше 0"
+
+        self.capture = capture
+        self.buffer_size = buffer_size
+        self.live = live
+        self.dropped = 0
+
+        self._lock = threading.Lock()
+        self._free = queue.Queue()
+        self._filled = queue.Queue()
+        for _ in range(buffer_size + 1):
+            self._free.put(None)
+        self._current = None
+        self._generation = 0
+        self._position = int(capture.get(cv2.CAP_PROP_POS_FRAMES))
+        self._eof = threading.Event()
+        self._resume = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._reader, daemon=True)
+        self._thread.start()
+        _active_captures.add(self)
+
+    def _take_slot(self):
+        while not self._stop.is_set():
+            try:
+                return self._free.get(timeout=0.05)
+            except queue.Empty:
+                if self.live:
+                    try:
+                        _, slot = self._filled.get_nowait()
+                        self.dropped += 1
+                        return slot
+                    except queue.Empty:
+                        pass
+        raise StopIteration
+
+    def _reader(self):
+        governor.pin_capture_thread()
+        while not self._stop.is_set():
+            try:
+                slot = self._take_slot()
+            except StopIteration:
+                return
+            with self._lock:
+                ret, frame = self.capture.read(slot) if slot is not None else self.capture.read()
+                generation = self._generation
+            if ret:
+                self._filled.put((generation, frame))
+            else:
+                self._free.put(slot)
+                with self._lock:
+                    # Если после неудачного чтения позицию сменили (set), конец относится к старой позиции
+                    stale = generation != self._generation
+                    if not stale:
+                        self._eof.set()
+                if stale:
+                    self._resume.clear()
+                    continue
+                self._resume.wait()
+                self._resume.clear()
+
+    def _recycle_filled(self):
+        while True:
+            try:
+                _, frame = self._filled.get_nowait()
+            except queue.Empty:
+                return
+            self._free.put(frame)
+
+    def isOpened(self):
+        return not self._stop.is_set() and self.capture.isOpened()
+
+    def ready(self):
+        return not self._filled.empty()
+
+    def exhausted(self):
+        return self._eof.is_set() and self._filled.empty()
+
+    def read(self):
+        if self._current is not None:
+            self._free.put(self._current)
+            self._current = None
+        while True:
+            try:
+                generation, frame = self._filled.get(timeout=0.05)
+            except queue.Empty:
+                if self._stop.is_set() or (self._eof.is_set() and self._filled.empty()):
+                    return False, None
+                continue
+            if generation != self._generation:
+                self._free.put(frame)
+                continue
+            self._current = frame
+            self._position += 1
+            return True, frame
+
+    def get(self, prop_id):
+        if prop_id == cv2.CAP_PROP_POS_FRAMES:
+            return float(self._position)
+        return self.capture.get(prop_id)
+
+    def set(self, prop_id, value):
+        with self._lock:
+            self._generation += 1
+            result = self.capture.set(prop_id, value)
+            self._position = int(self.capture.get(cv2.CAP_PROP_POS_FRAMES))
+            self._recycle_filled()
+            self._eof.clear()
+            self._resume.set()
+        return result
+
+    def release(self):
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._resume.set()
+        self._thread.join()
+        self.capture.release()
+        _active_captures.discard(self)
+
+
+@atexit.register
+def _release_active_captures():
+    for capture in list(_active_captures):
+        capture.release()
+
+
+def open_capture(source, options=None):
+    """
+    Открывает видеофайл, веб-камеру или сетевой поток с параметрами CaptureOptions. Если выбранный бэкенд не смог
+    открыть источник, используется бэкенд OpenCV по умолчанию. Открытый поток оборачивается в PrefetchingCapture,
+    если options.prefetch > 0. Источники из SOURCE_SCHEMES (например, replay:ПУТЬ) открываются своей функцией.
+    :param source: Путь к видео, URL потока, адрес вида replay:ПУТЬ?fps=30 или индекс камеры.
+    :param options: Экземпляр класса CaptureOptions.
+    """
+    assert isinstance(source, str | int), "source должен иметь тип str или int"
+
+    options = options or CaptureOptions()
+    assert isinstance(options, CaptureOptions), "options должен быть объектом класса CaptureOptions"
+
+    scheme = source.partition(':')[0] if isinstance(source, str) else None
+    if scheme in SOURCE_SCHEMES:
+        capture = SOURCE_SCHEMES[scheme](source)
+        if not capture.isOpened():
+            return capture
+        logger.info(f'Открыт источник {source}: {capture.getBackendName()}, {capture.get(cv2.CAP_PROP_FPS):g} кадр/с')
+        return PrefetchingCapture(capture, max(options.prefetch, 1), live=True)
+
+    capture = cv2.VideoCapture(source, BACKENDS[options.backend], options.params())
+    if not capture.isOpened() and options.backend != 'any':
+        logger.warning(f'Бэкенд {options.backend} не открыл {source}, используется бэкенд по умолчанию')
+        capture = cv2.VideoCapture(source)
+    if not capture.isOpened():
+        return capture
+
+    if hasattr(cv2, 'CAP_PROP_HW_ACCELERATION'):
+        acceleration = int(capture.get(cv2.CAP_PROP_HW_ACCELERATION))
+        logger.info(f'Открыт источник {source}: бэкенд {capture.getBackendName()}, '
+                    f'аппаратное ускорение {acceleration}, потоков декодера {options.threads or "по умолчанию"}')
+    if options.prefetch:
+        return PrefetchingCapture(capture, options.prefetch, live=isinstance(source, int) or '://' in source)
+    return capture